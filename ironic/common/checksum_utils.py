@@ -66,25 +66,7 @@ def validate_checksum(path, checksum, checksum_algo=None):
     # TODO(TheJilia): At some point, we likely need to compare
     # the incoming checksum algorithm upfront, ut if one is invoked which
     # is not supported, hashlib will raise ValueError.
-    use_checksum_algo = None
-    if ":" in checksum:
-        # A form of communicating the checksum algorithm is to delimit the
-        # type from the value. See ansible deploy interface where this
-        # is most evident.
-        split_checksum = checksum.split(":")
-        use_checksum = split_checksum[1]
-        use_checksum_algo = split_checksum[0]
-    else:
-        use_checksum = checksum
-    if not use_checksum_algo:
-        use_checksum_algo = checksum_algo
-    # If we have a zero length value, but we split it, we have
-    # invalid input. Also, checksum is what we expect, algorithm is
-    # optional. This guards against the split of a value which is
-    # image_checksum = "sha256:" which is a potential side effect of
-    # splitting the string.
-    if use_checksum == '':
-        raise exception.ImageChecksumError()
+    use_checksum, use_checksum_algo = split_checksum(checksum, checksum_algo)
 
     # Make everything lower case since we don't expect mixed case,
     # but we may have human originated input on the supplied algorithm.
@@ -116,6 +98,38 @@ def validate_checksum(path, checksum, checksum_algo=None):
         raise exception.ImageChecksumError()
 
 
+def split_checksum(checksum, checksum_algo=None):
+    """Split a checksum value into the value and the algorithm.
+
+    :param checksum: The supplied checksum value, a string, optionally
+                     prefixed with the algorithm (algorithm:value).
+    :param checksum_algo: The checksum type of the algorithm, used when the
+                          checksum value does not contain it.
+    :returns: a tuple (checksum value, checksum algorithm or None).
+    :raises: ImageChecksumError if the supplied data cannot be parsed.
+    """
+    use_checksum_algo = None
+    if ":" in checksum:
+        # A form of communicating the checksum algorithm is to delimit the
+        # type from the value. See ansible deploy interface where this
+        # is most evident.
+        split_checksum = checksum.split(":")
+        use_checksum = split_checksum[1]
+        use_checksum_algo = split_checksum[0]
+    else:
+        use_checksum = checksum
+    if not use_checksum_algo:
+        use_checksum_algo = checksum_algo
+    # If we have a zero length value, but we split it, we have
+    # invalid input. Also, checksum is what we expect, algorithm is
+    # optional. This guards against the split of a value which is
+    # image_checksum = "sha256:" which is a potential side effect of
+    # splitting the string.
+    if use_checksum == '':
+        raise exception.ImageChecksumError()
+    return use_checksum, use_checksum_algo
+
+
 def compute_image_checksum(image_path, algorithm='md5'):
     """Compute checksum by given image path and algorithm.
 
@@ -0,0 +1,174 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Building, encoding and decoding configdrive images in bounded memory."""
+
+import base64
+import gzip
+import io
+import shutil
+
+from openstack.baremetal import configdrive as os_configdrive
+from oslo_concurrency import processutils
+
+from ironic.common import exception
+from ironic.common.i18n import _
+
+# NOTE: a multiple of 3 and 4, so that base64 encoded chunks can be
+# concatenated and decoded chunks do not split a base64 quantum.
+_CHUNK_SIZE = 192 * 1024
+
+_ISO_TOOLS = ('genisoimage', 'mkisofs', 'xorrisofs')
+
+
+class _ChunkReader(io.RawIOBase):
+    """A read-only file object over an iterator of byte strings."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._current = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._current:
+            try:
+                self._current = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+
+class _Base64Writer(object):
+    """A write-only file object encoding data to base64 in chunks."""
+
+    def __init__(self, dest):
+        self._dest = dest
+        self._pending = b''
+
+    def write(self, data):
+        size = len(data)
+        data = self._pending + bytes(data)
+        usable = len(data) - len(data) % 3
+        self._dest.write(base64.b64encode(data[:usable]).decode())
+        self._pending = data[usable:]
+        return size
+
+    def flush(self):
+        # NOTE: a partial base64 quantum can only be written at the end.
+        pass
+
+    def close(self):
+        self._dest.write(base64.b64encode(self._pending).decode())
+        self._pending = b''
+
+
+def _iter_encoded_chunks(configdrive):
+    if isinstance(configdrive, str):
+        for position in range(0, len(configdrive), _CHUNK_SIZE):
+            yield configdrive[position:position + _CHUNK_SIZE].encode('ascii')
+    else:
+        yield from iter(lambda: configdrive.read(_CHUNK_SIZE), b'')
+
+
+def _iter_base64_decoded(configdrive):
+    remainder = b''
+    for chunk in _iter_encoded_chunks(configdrive):
+        # NOTE: whitespace (e.g. line breaks) is ignored by the decoder, but
+        # it must not shift the chunk boundaries off base64 quanta.
+        chunk = remainder + b''.join(chunk.split())
+        usable = len(chunk) - len(chunk) % 4
+        remainder = chunk[usable:]
+        if usable:
+            yield base64.b64decode(chunk[:usable])
+    if remainder:
+        yield base64.b64decode(remainder)
+
+
+def decode_configdrive(configdrive, dest):
+    """Decode a gzipped and base64 encoded configdrive into a file.
+
+    The configdrive is decoded and decompressed in chunks, so only a bounded
+    part of the image is held in memory at any time.
+
+    :param configdrive: A gzipped and base64 encoded configdrive as a string
+        or as a binary file object to read it from.
+    :param dest: A binary file object to write the image to.
+    :raises: ValueError (binascii.Error) if the configdrive is not valid
+        base64.
+    :raises: OSError (gzip.BadGzipFile) or EOFError if the configdrive is
+        not valid gzip.
+    """
+    reader = io.BufferedReader(
+        _ChunkReader(_iter_base64_decoded(configdrive)))
+    with gzip.GzipFile(fileobj=reader, mode='rb') as gz:
+        shutil.copyfileobj(gz, dest, _CHUNK_SIZE)
+
+
+def encode_configdrive(source, dest):
+    """Gzip and base64 encode a configdrive image into a text file.
+
+    The image is compressed and encoded in chunks, so only a bounded part
+    of it is held in memory at any time.
+
+    :param source: A binary file object with the image.
+    :param dest: A text file object to write the encoded configdrive to.
+    """
+    encoder = _Base64Writer(dest)
+    with gzip.GzipFile(fileobj=encoder, mode='wb') as gz:
+        shutil.copyfileobj(source, gz, _CHUNK_SIZE)
+    encoder.close()
+
+
+def write_configdrive_image(dest, meta_data, user_data=None,
+                            network_data=None, vendor_data=None):
+    """Write a configdrive ISO image with the provided data to a file.
+
+    :param dest: The path of the file to write the image to.
+    :param meta_data: The meta data as a dictionary.
+    :param user_data: The user data as bytes or None.
+    :param network_data: The network data as a dictionary or None.
+    :param vendor_data: The vendor data as a dictionary or None.
+    :raises: ImageCreationFailed if the image cannot be created.
+    """
+    with os_configdrive.populate_directory(
+            meta_data, user_data=user_data, network_data=network_data,
+            vendor_data=vendor_data) as path:
+        error = None
+        for tool in _ISO_TOOLS:
+            try:
+                processutils.execute(tool,
+                                     '-o', dest,
+                                     '-ldots',
+                                     '-allow-lowercase',
+                                     '-allow-multidot',
+                                     '-l',
+                                     '-publisher', 'Ironic',
+                                     '-quiet', '-J', '-r',
+                                     '-V', 'config-2',
+                                     path, attempts=1)
+            except FileNotFoundError as exc:
+                error = exc
+            except (OSError, processutils.ProcessExecutionError) as exc:
+                raise exception.ImageCreationFailed(image_type='configdrive',
+                                                    error=exc)
+            else:
+                return
+
+    raise exception.ImageCreationFailed(
+        image_type='configdrive',
+        error=_('none of %(tools)s is available: %(error)s')
+        % {'tools': ', '.join(_ISO_TOOLS), 'error': error})
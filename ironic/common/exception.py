@@ -779,6 +779,11 @@ class AgentCommandTimeout(IronicException):
     _msg_fmt = _("Timeout executing command %(command)s on node %(node)s")
 
 
+class BMCRequestCancelled(IronicException):
+    _msg_fmt = _("A request to BMC %(bmc)s was cancelled before it could "
+                 "start, the BMC is busy or the conductor is shutting down")
+
+
 class NodeProtected(HTTPForbidden):
     _msg_fmt = _("Node %(node)s is protected and cannot be undeployed, "
                  "rebuilt or deleted")
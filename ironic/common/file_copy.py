@@ -0,0 +1,123 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Copying of image files with the cheapest strategy available."""
+
+import fcntl
+import os
+import shutil
+
+from oslo_log import log
+
+from ironic.common import metrics_utils
+from ironic.common import utils
+
+LOG = log.getLogger(__name__)
+
+METRICS = metrics_utils.get_metrics_logger(__name__)
+
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+COPY_FILE_RANGE = 'copy_file_range'
+COPY = 'copy'
+
+# NOTE: _IOW(0x94, 9, int) from linux/fs.h, supported by btrfs, XFS (with
+# reflink=1), OCFS2 and other copy-on-write file systems.
+_FICLONE = 0x40049409
+
+
+def _hardlink(source, dest):
+    os.link(source, dest)
+
+
+def _reflink(source, dest):
+    with open(source, 'rb') as src:
+        try:
+            with open(dest, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            utils.unlink_without_raise(dest)
+            raise
+
+
+def _copy_file_range(source, dest):
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError('copy_file_range is not supported on this platform')
+    with open(source, 'rb') as src:
+        try:
+            with open(dest, 'wb') as dst:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(),
+                                                remaining)
+                    if not copied:
+                        raise OSError('copy_file_range stopped with %d '
+                                      'bytes left to copy' % remaining)
+                    remaining -= copied
+        except OSError:
+            utils.unlink_without_raise(dest)
+            raise
+
+
+_STRATEGIES = [(HARDLINK, _hardlink), (REFLINK, _reflink),
+               (COPY_FILE_RANGE, _copy_file_range)]
+
+
+def link_file(source, dest, operation):
+    """Hard link a file, counted like a hard link made by copy_file.
+
+    :param source: Path of the file to link to.
+    :param dest: Path of the link, which must not exist.
+    :param operation: Name of the operation, used as the metric prefix.
+    :raises: OSError if the file cannot be linked.
+    """
+    _hardlink(source, dest)
+    LOG.debug('Linked %(src)s to %(dest)s', {'src': source, 'dest': dest})
+    METRICS.send_counter('%s.%s' % (operation, HARDLINK), 1)
+
+
+def copy_file(source, dest, operation, hardlink=True):
+    """Copy a file with the cheapest strategy available.
+
+    The strategies are tried in order: a hard link (if allowed), a reflink
+    (a copy-on-write clone of the file), an in-kernel copy with
+    copy_file_range and finally a plain copy. The strategy used is counted
+    in the ``<operation>.<strategy>`` metric.
+
+    :param source: Path of the file to copy.
+    :param dest: Path of the destination, which must not exist.
+    :param operation: Name of the operation, used as the metric prefix.
+    :param hardlink: Whether the destination may be a hard link to the
+        source, sharing its inode (and permissions) with it.
+    :returns: the name of the strategy used.
+    :raises: OSError if the file cannot be copied.
+    """
+    for name, strategy in _STRATEGIES:
+        if name == HARDLINK and not hardlink:
+            continue
+        try:
+            strategy(source, dest)
+        except OSError as exc:
+            LOG.debug('Could not copy %(src)s to %(dest)s with %(strategy)s, '
+                      'trying the next strategy. Error: %(exc)s',
+                      {'src': source, 'dest': dest, 'strategy': name,
+                       'exc': exc})
+        else:
+            break
+    else:
+        name = COPY
+        shutil.copyfile(source, dest)
+
+    LOG.debug('Copied %(src)s to %(dest)s with %(strategy)s',
+              {'src': source, 'dest': dest, 'strategy': name})
+    METRICS.send_counter('%s.%s' % (operation, name), 1)
+    return name
@@ -14,6 +14,7 @@
 #    under the License.
 
 import collections
+import copy
 import functools
 import os
 import re
@@ -31,6 +32,7 @@ import tenacity
 from ironic.common import exception
 from ironic.common.glance_service import service_utils
 from ironic.common.i18n import _
+from ironic.common import image_info_cache
 from ironic.common import keystone
 from ironic.common import swift
 from ironic.common import utils
@@ -109,6 +111,9 @@ class GlanceImageService(object):
     # }
     _cache = {}
 
+    # NOTE: image properties, shared by all instances, see show().
+    _info_cache = {}
+
     def __init__(self, client=None, context=None):
         self.client = client
         self.context = context
@@ -154,16 +159,26 @@ class GlanceImageService(object):
     def show(self, image_href):
         """Returns a dict with image data for the given opaque image id.
 
+        The image data is cached for [DEFAULT]image_info_cache_ttl seconds.
+
         :param image_href: The opaque image identifier.
         :returns: A dict containing image metadata.
 
         :raises: ImageNotFound
         :raises: ImageUnacceptable if the image status is not active
         """
-        LOG.debug("Getting image metadata from glance. Image: %s",
-                  image_href)
         image_id = service_utils.parse_image_id(image_href)
+        # NOTE: whether an image is available depends on the requester.
+        cache_key = (image_id,
+                     getattr(self.context, 'project_id', None),
+                     tuple(sorted(getattr(self.context, 'roles', None) or ())),
+                     bool(getattr(self.context, 'auth_token', None)))
+        cached = image_info_cache.get(self._info_cache, cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached.info)
 
+        LOG.debug("Getting image metadata from glance. Image: %s",
+                  image_href)
         image = self.call('get_image', image_id)
 
         if not service_utils.is_image_active(image):
@@ -175,6 +190,7 @@ class GlanceImageService(object):
             raise exception.ImageNotFound(image_id=image_id)
 
         base_image_meta = service_utils.translate_from_glance(image)
+        image_info_cache.put(self._info_cache, cache_key, base_image_meta)
         return base_image_meta
 
     @check_image_service
@@ -434,3 +450,9 @@ class GlanceImageService(object):
         # FIXME(TheJulia): We should look at and see if we wire
         # this up in a future change.
         return None
+
+    def set_expected_checksum(self, checksum, checksum_algo=None):
+        """Set the checksum expected for the next downloaded image.
+
+        Not used, the checksum is verified on the downloaded file.
+        """
@@ -0,0 +1,225 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Segmented downloads of large images over HTTP."""
+
+from http import client as http_client
+import io
+import os
+import stat
+import threading
+import time
+
+import futurist
+from futurist import waiters
+from oslo_log import log
+from oslo_utils import units
+import requests
+
+from ironic.common import exception
+from ironic.common.i18n import _
+from ironic.conf import CONF
+
+LOG = log.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024  # 1mb
+
+
+class SegmentedDownload(object):
+    """Download of an image in parallel segments using range requests.
+
+    The destination file is preallocated as a sparse file and each segment
+    is written at its own offset. A segment whose connection drops resumes
+    from the last received byte instead of restarting.
+
+    Nothing is kept across downloads: the callers open the destination
+    truncated, and the image cache downloads into a new directory each
+    time, so the data of an interrupted download is never found again.
+    """
+
+    def __init__(self, url, image_file, size, validator=None, auth=None,
+                 verify=True):
+        self.url = url
+        self.size = size
+        self.validator = validator
+        self.auth = auth
+        self.verify = verify
+        self.path = image_file.name
+        self._fd = image_file.fileno()
+        self._failed = threading.Event()
+        self.segments = self._plan_segments()
+
+    @classmethod
+    def probe(cls, url, image_file, auth=None, verify=True):
+        """Check if an image can be downloaded in segments.
+
+        :param url: URL of the image.
+        :param image_file: File object to write data to.
+        :param auth: Authentication object for the requests library.
+        :param verify: TLS verification argument for the requests library.
+        :returns: a SegmentedDownload or None if the image has to be
+            downloaded in a single stream.
+        """
+        try:
+            path = image_file.name
+            fd = image_file.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            return None
+        if not isinstance(path, str) or not stat.S_ISREG(
+                os.fstat(fd).st_mode):
+            return None
+
+        response = requests.head(url, verify=verify, auth=auth,
+                                 timeout=CONF.webserver_connection_timeout,
+                                 allow_redirects=True)
+        if response.status_code != http_client.OK:
+            # NOTE: the single stream download reports the error.
+            return None
+        if response.headers.get('Accept-Ranges', '').lower() != 'bytes':
+            LOG.debug('The server does not accept range requests for image '
+                      '%s, downloading it in a single stream', url)
+            return None
+        try:
+            size = int(response.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return None
+        if size < 2 * CONF.image_download_segment_size * units.Mi:
+            return None
+
+        validator = (response.headers.get('ETag')
+                     or response.headers.get('Last-Modified'))
+        return cls(response.url or url, image_file, size,
+                   validator=validator, auth=auth, verify=verify)
+
+    def _plan_segments(self):
+        count = min(CONF.image_download_segments,
+                    self.size // (CONF.image_download_segment_size * units.Mi))
+        bounds = [self.size * i // count for i in range(count + 1)]
+        # Each segment is [start, end, received], end is exclusive.
+        return [[bounds[i], bounds[i + 1], 0] for i in range(count)]
+
+    def _fetch_segment(self, segment):
+        start, end = segment[0], segment[1]
+        failures = 0
+        while start + segment[2] < end:
+            if self._failed.is_set():
+                return
+            offset = start + segment[2]
+            # NOTE: ranges apply to the encoded content, ask for none.
+            headers = {'Range': 'bytes=%d-%d' % (offset, end - 1),
+                       'Accept-Encoding': 'identity'}
+            if self.validator:
+                headers['If-Range'] = self.validator
+            try:
+                response = requests.get(
+                    self.url, headers=headers, stream=True,
+                    verify=self.verify, auth=self.auth,
+                    timeout=CONF.webserver_connection_timeout)
+                if response.status_code != http_client.PARTIAL_CONTENT:
+                    # NOTE: with If-Range, a full response means that the
+                    # image has changed since the download started.
+                    raise exception.ImageDownloadFailed(
+                        image_href=self.url,
+                        reason=_("Got HTTP code %s instead of 206 in "
+                                 "response to a range request.")
+                        % response.status_code)
+
+                with response:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        if self._failed.is_set():
+                            return
+                        chunk = chunk[:end - offset]
+                        os.pwrite(self._fd, chunk, offset)
+                        offset += len(chunk)
+                        segment[2] = offset - start
+                        if offset >= end:
+                            break
+                if offset < end:
+                    raise requests.ConnectionError(
+                        _('Connection closed after %d bytes')
+                        % (offset - start))
+            except (OSError, requests.RequestException) as exc:
+                failures += 1
+                if failures > CONF.image_download_retries:
+                    raise
+                LOG.warning('Download of bytes %(start)d-%(end)d of image '
+                            '%(image)s failed, resuming from byte '
+                            '%(offset)d. Error: %(exc)s',
+                            {'start': start, 'end': end - 1,
+                             'image': self.url, 'exc': exc,
+                             'offset': start + segment[2]})
+
+    def _hash_completed(self, hasher, read_fd, position):
+        """Update the checksum with the segments downloaded in order.
+
+        :returns: the position of the first segment not hashed yet.
+        """
+        while (position < len(self.segments)
+               and self.segments[position][0] + self.segments[position][2]
+               == self.segments[position][1]):
+            offset, end = self.segments[position][:2]
+            while offset < end:
+                chunk = os.pread(read_fd, min(CHUNK_SIZE, end - offset),
+                                 offset)
+                if not chunk:
+                    raise exception.ImageDownloadFailed(
+                        image_href=self.url,
+                        reason=_("Unexpected end of file %s") % self.path)
+                hasher.update(chunk)
+                offset += len(chunk)
+            position += 1
+        return position
+
+    def run(self, hasher=None):
+        """Download the image.
+
+        :param hasher: a hashlib object to update with the image data. The
+            checksum is built over the segments in order, as soon as all
+            the previous segments are downloaded.
+        :raises: ImageDownloadFailed
+        """
+        start_time = time.monotonic()
+        os.ftruncate(self._fd, self.size)
+
+        hashed = 0
+        # NOTE: the destination file object is usually opened write-only.
+        read_fd = os.open(self.path, os.O_RDONLY) if hasher else None
+        executor = futurist.ThreadPoolExecutor(
+            max_workers=len(self.segments))
+        try:
+            pending = {executor.submit(self._fetch_segment, segment)
+                       for segment in self.segments}
+            while pending:
+                done, pending = waiters.wait_for_any(pending)
+                for future in done:
+                    exc = future.exception()
+                    if exc is not None:
+                        self._failed.set()
+                        if isinstance(exc, exception.ImageDownloadFailed):
+                            raise exc
+                        raise exception.ImageDownloadFailed(
+                            image_href=self.url, reason=str(exc))
+                if hasher is not None:
+                    hashed = self._hash_completed(hasher, read_fd, hashed)
+        finally:
+            executor.shutdown(wait=True)
+            if read_fd is not None:
+                os.close(read_fd)
+
+        elapsed = time.monotonic() - start_time
+        LOG.debug('Downloaded %(bytes)d bytes of image %(image)s in '
+                  '%(segments)d segments in %(time).2f seconds '
+                  '(%(rate).2f MiB/s)',
+                  {'bytes': self.size, 'image': self.url,
+                   'segments': len(self.segments), 'time': elapsed,
+                   'rate': self.size / units.Mi
+                   / max(elapsed, 0.001)})
@@ -0,0 +1,84 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Caching of image properties returned by the image services.
+
+The caches are plain dictionaries owned by the image service classes, so
+that they are shared by all instances, and thus by all image caches.
+"""
+
+import collections
+import copy
+import time
+
+from ironic.conf import CONF
+
+CacheElement = collections.namedtuple(
+    'CacheElement', ['info', 'etag', 'last_modified', 'checked_at'])
+
+# NOTE: the image info caches are bounded, the least recently checked
+# entries are dropped first.
+CACHE_SIZE = 1024
+
+
+def get(cache, key, fresh=True):
+    """Get an element from an image info cache.
+
+    :param cache: The cache, a dictionary of CacheElement.
+    :param key: The key of the element.
+    :param fresh: Only return the element if it was checked less than
+        [DEFAULT]image_info_cache_ttl seconds ago. Stale elements are
+        only useful for a conditional request, see conditional_headers.
+    :returns: A CacheElement or None.
+    """
+    element = cache.get(key) if CONF.image_info_cache_ttl else None
+    if (element is not None and fresh
+            and (time.monotonic() - element.checked_at
+                 > CONF.image_info_cache_ttl)):
+        return None
+    return element
+
+
+def conditional_headers(element):
+    """Build the HTTP headers to revalidate a cached element.
+
+    :param element: A CacheElement.
+    :returns: A dictionary with If-None-Match and If-Modified-Since headers.
+    """
+    headers = {}
+    if element.etag:
+        headers['If-None-Match'] = element.etag
+    if element.last_modified:
+        headers['If-Modified-Since'] = element.last_modified
+    return headers
+
+
+def put(cache, key, info, etag=None, last_modified=None):
+    """Store image info in an image info cache.
+
+    :param cache: The cache, a dictionary of CacheElement.
+    :param key: The key of the element.
+    :param info: The image info as returned by the show() call.
+    :param etag: The ETag of the image, if any.
+    :param last_modified: The Last-Modified header of the image, if any.
+    """
+    if not CONF.image_info_cache_ttl:
+        return
+    cache.pop(key, None)
+    cache[key] = CacheElement(copy.deepcopy(info), etag, last_modified,
+                              time.monotonic())
+    while len(cache) > CACHE_SIZE:
+        # NOTE: dictionaries keep the insertion order.
+        try:
+            del cache[next(iter(cache))]
+        except (KeyError, StopIteration, RuntimeError):
+            break
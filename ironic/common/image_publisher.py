@@ -12,18 +12,28 @@
 
 import abc
 import os.path
-import shutil
+import time
 from urllib import parse as urlparse
 
+from oslo_concurrency import lockutils
 from oslo_log import log
+from oslo_utils import fileutils
+from oslo_utils import uuidutils
 
 from ironic.common import exception
+from ironic.common import file_copy
 from ironic.common import swift
 from ironic.common import utils
 from ironic.conf import CONF
 
 LOG = log.getLogger(__name__)
 
+_STORE_DIR = '.store'
+# Suffix of the images being copied into the store
+_PART_SUFFIX = '.part'
+# Age in seconds after which an image being copied is considered left over
+_PART_MAX_AGE = 24 * 3600
+
 
 class AbstractPublisher(metaclass=abc.ABCMeta):
     """Abstract base class for publishing images via HTTP."""
@@ -66,54 +76,149 @@ class LocalPublisher(AbstractPublisher):
         self.file_permission = file_permission
         self.dir_permission = dir_permission
 
+    def _get_public_dir(self):
+        if self.image_subdir:
+            return os.path.join(CONF.deploy.http_root, self.image_subdir)
+        else:
+            return CONF.deploy.http_root
+
+    def _restore_selinux_context(self, public_dir):
+        try:
+            utils.execute(
+                '/usr/sbin/restorecon', '-i', '-R', 'v', public_dir)
+        except FileNotFoundError as exc:
+            LOG.debug(
+                "Could not restore SELinux context on "
+                "%(public_dir)s, restorecon command not found.\n"
+                "Error: %(error)s",
+                {'public_dir': public_dir,
+                    'error': exc})
+
     def publish(self, source_path, file_name=None):
         if not file_name:
             file_name = os.path.basename(source_path)
 
-        if self.image_subdir:
-            public_dir = os.path.join(CONF.deploy.http_root, self.image_subdir)
-        else:
-            public_dir = CONF.deploy.http_root
+        public_dir = self._get_public_dir()
 
         if not os.path.exists(public_dir):
             os.mkdir(public_dir, self.dir_permission)
 
         published_file = os.path.join(public_dir, file_name)
 
-        try:
-            os.link(source_path, published_file)
-            os.chmod(source_path, self.file_permission)
-            try:
-                utils.execute(
-                    '/usr/sbin/restorecon', '-i', '-R', 'v', public_dir)
-            except FileNotFoundError as exc:
-                LOG.debug(
-                    "Could not restore SELinux context on "
-                    "%(public_dir)s, restorecon command not found.\n"
-                    "Error: %(error)s",
-                    {'public_dir': public_dir,
-                        'error': exc})
-
-        except OSError as exc:
-            LOG.debug(
-                "Could not hardlink image file %(image)s to public "
-                "location %(public)s (will copy it over): "
-                "%(error)s", {'image': source_path,
-                              'public': published_file,
-                              'error': exc})
-
-            shutil.copyfile(source_path, published_file)
-            os.chmod(published_file, self.file_permission)
+        if CONF.deploy.content_addressed_publishing:
+            self._publish_to_store(source_path, public_dir, published_file)
+        else:
+            strategy = file_copy.copy_file(source_path, published_file,
+                                           'LocalPublisher.publish')
+            if strategy == file_copy.HARDLINK:
+                os.chmod(source_path, self.file_permission)
+                self._restore_selinux_context(public_dir)
+            else:
+                os.chmod(published_file, self.file_permission)
 
         if self.image_subdir:
             return os.path.join(self.root_url, self.image_subdir, file_name)
         else:
             return os.path.join(self.root_url, file_name)
 
+    def _link_to_store(self, blob, tmp_blob, published_file):
+        """Link a published name to a blob, creating it from tmp_blob.
+
+        :returns: False if the blob does not exist and tmp_blob is None.
+        """
+        # NOTE: protected by the same lock as the removal of unused blobs,
+        # so that a blob is never removed between being checked for and
+        # being linked to.
+        with lockutils.lock('image_publisher_store'):
+            if os.path.exists(blob):
+                LOG.debug("Image file %s is already published", blob)
+            elif tmp_blob is None:
+                return False
+            else:
+                os.rename(tmp_blob, blob)
+                os.chmod(blob, self.file_permission)
+
+            # NOTE: republishing under the same name replaces the previous
+            # image, which may have a different content.
+            utils.unlink_without_raise(published_file)
+            os.link(blob, published_file)
+        return True
+
+    def _publish_to_store(self, source_path, public_dir, published_file):
+        """Publish an image as a hard link to a content-addressed blob.
+
+        The blob is named after the SHA256 checksum of the image, so
+        identical images published for different nodes share one file.
+        The image is hashed and copied without holding the store lock.
+        """
+        store_dir = os.path.join(public_dir, _STORE_DIR)
+        if not os.path.exists(store_dir):
+            os.mkdir(store_dir, self.dir_permission)
+
+        checksum = fileutils.compute_file_checksum(source_path,
+                                                   algorithm='sha256')
+        blob = os.path.join(store_dir, checksum)
+        tmp_blob = None
+        try:
+            while not self._link_to_store(blob, tmp_blob, published_file):
+                # NOTE: the blob is missing, or has been removed since it
+                # was checked for, copy the image under a unique name.
+                tmp_blob = '%s.%s%s' % (blob, uuidutils.generate_uuid(),
+                                        _PART_SUFFIX)
+                file_copy.copy_file(source_path, tmp_blob,
+                                    'LocalPublisher.publish')
+        finally:
+            if tmp_blob is not None:
+                # Still there if another image with the same content has
+                # been published meanwhile.
+                utils.unlink_without_raise(tmp_blob)
+        self._restore_selinux_context(public_dir)
+
+    def _clean_up_store(self, public_dir):
+        """Remove the blobs that are no longer published under any name.
+
+        Blobs with link count > 1 are still linked to by a published name
+        (or by their source file) and are never deleted. Only the removal
+        itself is done under the store lock.
+        """
+        store_dir = os.path.join(public_dir, _STORE_DIR)
+        try:
+            entries = list(os.scandir(store_dir))
+        except FileNotFoundError:
+            return
+
+        for entry in entries:
+            try:
+                if (not entry.is_file(follow_symlinks=False)
+                        or entry.stat().st_nlink > 1):
+                    continue
+                if entry.name.endswith(_PART_SUFFIX):
+                    # Being copied, unless left over by a stopped conductor
+                    if time.time() - entry.stat().st_mtime < _PART_MAX_AGE:
+                        continue
+                    os.unlink(entry.path)
+                else:
+                    with lockutils.lock('image_publisher_store'):
+                        # NOTE: may have been linked to since the scan
+                        if os.stat(entry.path).st_nlink > 1:
+                            continue
+                        os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
+            except OSError as exc:
+                LOG.warning("Unable to delete file %(name)s from the "
+                            "publishing store: %(exc)s",
+                            {'name': entry.path, 'exc': exc})
+            else:
+                LOG.debug("Removed unused image %s from the publishing "
+                          "store", entry.path)
+
     def unpublish(self, file_name):
-        published_file = os.path.join(
-            CONF.deploy.http_root, self.image_subdir, file_name)
+        public_dir = self._get_public_dir()
+        published_file = os.path.join(public_dir, file_name)
         utils.unlink_without_raise(published_file)
+        if CONF.deploy.content_addressed_publishing:
+            self._clean_up_store(public_dir)
 
 
 class SwiftPublisher(AbstractPublisher):
@@ -16,7 +16,9 @@
 
 
 import abc
+import copy
 import datetime
+import hashlib
 from http import client as http_client
 from operator import itemgetter
 import os
@@ -28,9 +30,13 @@ from oslo_utils import strutils
 from oslo_utils import uuidutils
 import requests
 
+from ironic.common import checksum_utils
 from ironic.common import exception
+from ironic.common import file_copy
 from ironic.common.glance_service.image_service import GlanceImageService
+from ironic.common import http_download
 from ironic.common.i18n import _
+from ironic.common import image_info_cache
 from ironic.common import oci_registry
 from ironic.common import utils
 from ironic.conf import CONF
@@ -87,10 +93,28 @@ class BaseImageService(object, metaclass=abc.ABCMeta):
         """The transferred artifact checksum."""
         return None
 
+    def set_expected_checksum(self, checksum, checksum_algo=None):
+        """Set the checksum expected for the next downloaded image.
+
+        Image services which are able to verify the checksum while
+        transferring the image report the verified value with
+        transfer_verified_checksum, otherwise this call has no effect.
+
+        :param checksum: The checksum value, optionally prefixed with the
+            algorithm (algorithm:value).
+        :param checksum_algo: The checksum algorithm.
+        """
+
 
 class HttpImageService(BaseImageService):
     """Provides retrieval of disk images using HTTP."""
 
+    _expected_checksum = None
+    _verified_checksum = None
+
+    # NOTE: image properties, shared by all instances, see show().
+    _info_cache = {}
+
     @staticmethod
     def gen_auth_from_conf_user_pass(image_href):
         """This function is used to pass the credentials to the chosen
@@ -145,12 +169,14 @@ class HttpImageService(BaseImageService):
                          "basic auth config") % missing_creds
             )
 
-    def validate_href(self, image_href, secret=False):
+    def validate_href(self, image_href, secret=False, headers=None):
         """Validate HTTP image reference.
 
         :param image_href: Image reference.
         :param secret: Specify if image_href being validated should not be
             shown in exception message.
+        :param headers: Additional headers for the HEAD request. With
+            conditional headers, a 304 Not Modified response is accepted.
         :raises: exception.ImageRefValidationFailed if HEAD request failed or
             returned response code not equal to 200.
         :raises: exception.ImageRefIsARedirect if the supplied URL is a
@@ -175,9 +201,12 @@ class HttpImageService(BaseImageService):
             # redirects as otherwise we might end up with something like
             # HTTPForbidden or a list of files. Both should be okay to at
             # least know things are okay in a limited fashion.
+            kwargs = {'headers': headers} if headers else {}
             response = requests.head(image_href, verify=verify,
                                      timeout=CONF.webserver_connection_timeout,
-                                     auth=auth)
+                                     auth=auth, **kwargs)
+            if headers and response.status_code == http_client.NOT_MODIFIED:
+                return response
             if response.status_code == http_client.MOVED_PERMANENTLY:
                 # NOTE(TheJulia): In the event we receive a redirect, we need
                 # to notify the caller. Before this we would just fail,
@@ -239,28 +268,90 @@ class HttpImageService(BaseImageService):
         except ValueError:
             verify = CONF.webserver_verify_ca
 
+        hasher = None
+        if self._expected_checksum:
+            try:
+                hasher = hashlib.new(self._expected_checksum[1])
+            except ValueError:
+                # NOTE: the checksum is verified on the downloaded file,
+                # which reports unsupported algorithms.
+                pass
+        self._verified_checksum = None
+
         try:
             auth = HttpImageService.gen_auth_from_conf_user_pass(image_href)
-            response = requests.get(image_href, stream=True, verify=verify,
-                                    timeout=CONF.webserver_connection_timeout,
-                                    auth=auth)
-            if response.status_code != http_client.OK:
-                raise exception.ImageRefValidationFailed(
-                    image_href=image_href,
-                    reason=_("Got HTTP code %s instead of 200 in response "
-                             "to GET request.") % response.status_code)
+            download = None
+            if CONF.image_download_segments > 1:
+                download = http_download.SegmentedDownload.probe(
+                    image_href, image_file, auth=auth, verify=verify)
 
-            with response.raw as input_img:
-                shutil.copyfileobj(input_img, image_file, IMAGE_CHUNK_SIZE)
+            if download is not None:
+                download.run(hasher)
+            else:
+                response = requests.get(
+                    image_href, stream=True, verify=verify,
+                    timeout=CONF.webserver_connection_timeout, auth=auth)
+                if response.status_code != http_client.OK:
+                    raise exception.ImageRefValidationFailed(
+                        image_href=image_href,
+                        reason=_("Got HTTP code %s instead of 200 in "
+                                 "response to GET request.")
+                        % response.status_code)
+
+                with response.raw as input_img:
+                    if hasher is None:
+                        shutil.copyfileobj(input_img, image_file,
+                                           IMAGE_CHUNK_SIZE)
+                    else:
+                        for chunk in iter(
+                                lambda: input_img.read(IMAGE_CHUNK_SIZE),
+                                b''):
+                            hasher.update(chunk)
+                            image_file.write(chunk)
 
         except (OSError, requests.ConnectionError, requests.RequestException,
                 IOError) as e:
             raise exception.ImageDownloadFailed(image_href=image_href,
                                                 reason=str(e))
 
+        if hasher is not None:
+            checksum = self._expected_checksum[0]
+            if hasher.hexdigest() != checksum.lower():
+                LOG.error("We were supplied a checksum value of "
+                          "%(supplied)s, but calculated a value of "
+                          "%(value)s for image %(image)s. This is a fatal "
+                          "error.", {"supplied": checksum,
+                                     "value": hasher.hexdigest(),
+                                     "image": image_href})
+                raise exception.ImageChecksumError()
+            self._verified_checksum = checksum
+
+    @property
+    def transfer_verified_checksum(self):
+        """The checksum verified while downloading the image, if any."""
+        return self._verified_checksum
+
+    def set_expected_checksum(self, checksum, checksum_algo=None):
+        """Set the checksum expected for the next downloaded image.
+
+        :param checksum: The checksum value, optionally prefixed with the
+            algorithm (algorithm:value).
+        :param checksum_algo: The checksum algorithm.
+        """
+        if not checksum:
+            self._expected_checksum = None
+            return
+        value, algo = checksum_utils.split_checksum(checksum, checksum_algo)
+        # NOTE: a bare checksum is an MD5 checksum for backwards
+        # compatibility, see checksum_utils.validate_checksum.
+        self._expected_checksum = (value, (algo or 'md5').lower())
+
     def show(self, image_href):
         """Get dictionary of image properties.
 
+        The properties are cached for [DEFAULT]image_info_cache_ttl seconds
+        and revalidated with a conditional HEAD request afterwards.
+
         :param image_href: Image reference.
         :raises: exception.ImageRefValidationFailed if:
             * HEAD request failed;
@@ -270,7 +361,25 @@ class HttpImageService(BaseImageService):
             'updated_at' and 'properties'. 'updated_at' attribute is a naive
             UTC datetime object.
         """
-        response = self.validate_href(image_href)
+        cached = image_info_cache.get(self._info_cache, image_href)
+        if cached is not None:
+            return copy.deepcopy(cached.info)
+
+        # NOTE: a stale element is revalidated with a conditional request.
+        cached = image_info_cache.get(self._info_cache, image_href,
+                                      fresh=False)
+        headers = (image_info_cache.conditional_headers(cached)
+                   if cached is not None else None)
+
+        response = self.validate_href(image_href, headers=headers)
+        if response.status_code == http_client.NOT_MODIFIED:
+            LOG.debug('Image %s has not been modified, using the cached '
+                      'properties', image_href)
+            image_info_cache.put(self._info_cache, image_href, cached.info,
+                                 etag=cached.etag,
+                                 last_modified=cached.last_modified)
+            return copy.deepcopy(cached.info)
+
         image_size = response.headers.get('Content-Length')
         if image_size is None:
             raise exception.ImageRefValidationFailed(
@@ -297,12 +406,21 @@ class HttpImageService(BaseImageService):
 
         no_cache = 'no-store' in response.headers.get('Cache-Control', '')
 
-        return {
+        info = {
             'size': int(image_size),
             'updated_at': date,
             'properties': {},
             'no_cache': no_cache,
         }
+        etag = response.headers.get('ETag')
+        if no_cache or not (etag or str_date):
+            # NOTE: without validators the cached properties could not be
+            # revalidated once stale.
+            self._info_cache.pop(image_href, None)
+        else:
+            image_info_cache.put(self._info_cache, image_href, info,
+                                 etag=etag, last_modified=str_date)
+        return info
 
     @staticmethod
     def get(image_href):
@@ -861,7 +979,7 @@ class FileImageService(BaseImageService):
         :raises: exception.ImageRefValidationFailed if source image file
             doesn't exist.
         :raises: exception.ImageDownloadFailed if exceptions were raised while
-            writing to file or creating hard link.
+            writing to file or copying the image.
         """
         source_image_path = self.validate_href(image_href)
         dest_image_path = image_file.name
@@ -872,24 +990,8 @@ class FileImageService(BaseImageService):
             # NOTE(dtantsur): os.link is supposed to follow symlinks, but it
             # does not: https://github.com/python/cpython/issues/81793
             real_image_path = os.path.realpath(source_image_path)
-            try:
-                os.link(real_image_path, dest_image_path)
-            except OSError as exc:
-                orig = (f' (real path {real_image_path})'
-                        if real_image_path != source_image_path
-                        else '')
-
-                LOG.debug('Could not create a link from %(src)s%(orig)s to '
-                          '%(dest)s, will copy the content instead. '
-                          'Error: %(exc)s.',
-                          {'src': source_image_path, 'dest': dest_image_path,
-                           'orig': orig, 'exc': exc})
-            else:
-                return
-
-            # NOTE(dtantsur): starting with Python 3.8, copyfile() uses
-            # efficient copying (i.e. sendfile) under the hood.
-            shutil.copyfile(source_image_path, dest_image_path)
+            file_copy.copy_file(real_image_path, dest_image_path,
+                                'FileImageService.download')
         except Exception as e:
             raise exception.ImageDownloadFailed(image_href=image_href,
                                                 reason=str(e))
@@ -19,14 +19,19 @@
 Handling of VM disk images.
 """
 
+import hashlib
 import os
 import shutil
+import threading
 import time
+from urllib import parse as urlparse
 
 from oslo_concurrency import processutils
 from oslo_log import log as logging
 from oslo_utils import fileutils
 from oslo_utils.imageutils import format_inspector as image_format_inspector
+from oslo_utils import importutils
+from oslo_utils import units
 import pycdlib
 
 from ironic.common import checksum_utils
@@ -34,12 +39,36 @@ from ironic.common import exception
 from ironic.common.glance_service import service_utils as glance_utils
 from ironic.common.i18n import _
 from ironic.common import image_service as service
+from ironic.common import metrics_utils
 from ironic.common import qemu_img
 from ironic.common import utils
 from ironic.conf import CONF
 
 LOG = logging.getLogger(__name__)
 
+METRICS = metrics_utils.get_metrics_logger(__name__)
+
+zstandard = importutils.try_import('zstandard')
+
+# Zstandard frame magic number, see
+# https://github.com/facebook/zstd/blob/dev/doc/zstd_compression_format.md
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+# The boot configuration file of boot ISO templates is padded to this size,
+# so that it can be replaced in place by the configuration of a node.
+BOOT_ISO_TEMPLATE_CONFIG_SIZE = 8192
+# The publisher ID of boot ISO templates, replaced in place by the publisher
+# ID of a node. It has the length of the UUIDs used as publisher IDs.
+BOOT_ISO_TEMPLATE_PUBLISHER_ID = '00000000-0000-0000-0000-000000000000'
+
+_ISO_SECTOR_SIZE = 2048
+_ISO_PUBLISHER_OFFSET = 318
+_ISO_PUBLISHER_LENGTH = 128
+
+_ISOLINUX_CFG_OPTIONS = {'kernel': '/vmlinuz', 'ramdisk': '/initrd'}
+_GRUB_CFG_OPTIONS = {'linux': '/vmlinuz', 'initrd': '/initrd'}
+
 
 def _create_root_fs(root_directory, files_info):
     """Creates a filesystem root in given directory.
@@ -164,6 +193,22 @@ def _generate_cfg(kernel_params, template, options):
     return utils.render_template(template, options)
 
 
+def _pad_boot_config(config, size):
+    """Pad a boot configuration to the given size in bytes.
+
+    Empty lines are used as padding, they are ignored by both isolinux and
+    GRUB.
+
+    :raises: ImageCreationFailed if the configuration is larger than size.
+    """
+    length = len(config.encode('utf-8'))
+    if length > size:
+        raise exception.ImageCreationFailed(
+            image_type='iso',
+            error=_('the boot configuration is larger than %d bytes') % size)
+    return config + '\n' * (size - length)
+
+
 def _label(files_info):
     """Get a suitable label for the files.
 
@@ -177,7 +222,7 @@ def _label(files_info):
 
 def create_isolinux_image_for_bios(
         output_file, kernel, ramdisk, kernel_params=None, inject_files=None,
-        publisher_id=None):
+        publisher_id=None, config_size=None):
     """Creates an isolinux image on the specified file.
 
     Copies the provided kernel, ramdisk to a directory, generates the isolinux
@@ -195,6 +240,9 @@ def create_isolinux_image_for_bios(
         on the final ISO image.
     :param publisher_id: A value to set as the publisher identifier string
         in the ISO image to be generated.
+    :param config_size: If set, the size in bytes to pad the isolinux
+        configuration file to.
+    :returns: the path of the isolinux configuration file in the ISO image.
     :raises: ImageCreationFailed, if image creation failed while copying files
         or while running command to generate iso.
     """
@@ -204,7 +252,7 @@ def create_isolinux_image_for_bios(
                         '/usr/share/syslinux']
     LDLINUX_BIN = 'isolinux/ldlinux.c32'
 
-    options = {'kernel': '/vmlinuz', 'ramdisk': '/initrd'}
+    options = dict(_ISOLINUX_CFG_OPTIONS)
 
     with utils.tempdir() as tmpdir:
         files_info = {
@@ -237,6 +285,8 @@ def create_isolinux_image_for_bios(
 
         cfg = _generate_cfg(kernel_params,
                             CONF.isolinux_config_template, options)
+        if config_size:
+            cfg = _pad_boot_config(cfg, config_size)
 
         isolinux_cfg = os.path.join(tmpdir, ISOLINUX_CFG)
         utils.write_to_file(isolinux_cfg, cfg)
@@ -253,10 +303,13 @@ def create_isolinux_image_for_bios(
             LOG.exception("Creating ISO image failed.")
             raise exception.ImageCreationFailed(image_type='iso', error=e)
 
+    return ISOLINUX_CFG
+
 
 def create_esp_image_for_uefi(
         output_file, kernel, ramdisk, deploy_iso=None, esp_image=None,
-        kernel_params=None, inject_files=None, publisher_id=None):
+        kernel_params=None, inject_files=None, publisher_id=None,
+        config_size=None):
     """Creates an ESP image on the specified file.
 
     Copies the provided kernel, ramdisk and EFI system partition image (ESP) to
@@ -280,12 +333,15 @@ def create_esp_image_for_uefi(
         on the final ISO image.
     :param publisher_id: A value to set as the publisher identifier string
         in the ISO image to be generated.
+    :param config_size: If set, the size in bytes to pad the grub
+        configuration file to.
+    :returns: the path of the grub configuration file in the ISO image.
     :raises: ImageCreationFailed, if image creation failed while copying files
         or while running command to generate iso.
     """
     EFIBOOT_LOCATION = 'boot/grub/efiboot.img'
 
-    grub_options = {'linux': '/vmlinuz', 'initrd': '/initrd'}
+    grub_options = dict(_GRUB_CFG_OPTIONS)
 
     with utils.tempdir() as tmpdir:
         files_info = {
@@ -343,6 +399,8 @@ def create_esp_image_for_uefi(
         # Generate and copy grub config file.
         grub_conf = _generate_cfg(kernel_params,
                                   CONF.grub_config_template, grub_options)
+        if config_size:
+            grub_conf = _pad_boot_config(grub_conf, config_size)
         utils.write_to_file(grub_cfg, grub_conf)
 
         # Create the boot_iso.
@@ -363,9 +421,11 @@ def create_esp_image_for_uefi(
             LOG.exception("Creating ISO image failed.")
             raise exception.ImageCreationFailed(image_type='iso', error=e)
 
+    return grub_rel_path
+
 
 def fetch_into(context, image_href, image_file,
-               image_auth_data=None):
+               image_auth_data=None, checksum=None, checksum_algo=None):
     """Fetches image file contents into a file.
 
     :param context: A context object.
@@ -375,6 +435,9 @@ def fetch_into(context, image_href, image_file,
     :param image_auth_data: Optional dictionary for credentials to be conveyed
                             from the original task to the image download
                             process, if required.
+    :param checksum: Optional checksum of the image, verified while
+                     downloading it by the image services supporting it.
+    :param checksum_algo: Optional checksum algorithm.
     :returns: If a value is returned, that value was validated as the checksum.
               Otherwise None indicating the process had been completed.
     """
@@ -397,6 +460,9 @@ def fetch_into(context, image_href, image_file,
         # can differ dramatically by types.
         image_service.set_image_auth(image_href, image_auth_data)
 
+    if checksum:
+        image_service.set_expected_checksum(checksum, checksum_algo)
+
     if isinstance(image_file, str):
         with open(image_file, "wb") as image_file_obj:
             image_service.download(image_href, image_file_obj)
@@ -430,7 +496,7 @@ def _handle_zstd_compression(path):
         # Ensure we're at the start of the file
         comp_check.seek(0)
         read = comp_check.read(4)
-        if read.startswith(b"\x28\xb5\x2f\xfd"):
+        if read.startswith(ZSTD_MAGIC):
             zstd_comp = True
 
     if zstd_comp and not CONF.conductor.disable_zstandard_decompression:
@@ -445,25 +511,272 @@ def _handle_zstd_compression(path):
             shutil.move(temp_path, path)
 
 
+class _ChunkSource(object):
+    """A readable source returning the last chunk of written data."""
+
+    def __init__(self):
+        self.chunk = b''
+
+    def read(self, size):
+        chunk, self.chunk = self.chunk, b''
+        return chunk
+
+
+class ImageIngestHelper(object):
+
+    STAGES = ('checksum', 'decompress', 'inspect', 'write')
+
+    def __init__(self, image_file, image_href, checksum=None,
+                 checksum_algo=None):
+        """Helper class to process image data in a single pass.
+
+        The ImageIngestHelper is a file-like object which can be passed to
+        the download method of an image service. While the data is being
+        written to the destination file, it builds the checksum digest of
+        the downloaded data, decompresses Zstandard compressed data (if the
+        zstandard library is available) and detects the format of the
+        resulting image, so that the file does not need to be read again.
+
+        :param image_file: The file object to write the image contents to.
+        :param image_href: The image reference, used for logging.
+        :param checksum: The expected checksum of the downloaded data, if
+                         any. It may be prefixed with the algorithm.
+        :param checksum_algo: The expected checksum algorithm.
+        :raises: ImageChecksumError if the checksum cannot be parsed.
+        :raises: ImageChecksumAlgorithmFailure if the checksum algorithm is
+                 not supported.
+        """
+        self._file = image_file
+        self._image_href = image_href
+        self._head = b''
+        self._started = None
+        self._finished = False
+        self._decompressor = None
+        self._zstd_compressed = False
+        self._stages = {stage: [0, 0.0] for stage in self.STAGES}
+        self._bytes_received = 0
+
+        self._expected_checksum = None
+        self._hasher = None
+        if checksum:
+            self._expected_checksum, algo = checksum_utils.split_checksum(
+                checksum, checksum_algo)
+            # NOTE: a bare checksum is an MD5 one, like in validate_checksum
+            algo = (algo or 'md5').lower()
+            try:
+                self._hasher = hashlib.new(algo)
+            except ValueError:
+                LOG.error("Failed to generate checksum for image "
+                          "%(image)s, possible invalid checksum algorithm: "
+                          "%(algo)s", {'image': image_href, 'algo': algo})
+                raise exception.ImageChecksumAlgorithmFailure()
+
+        self._source = _ChunkSource()
+        self._wrapper = image_format_inspector.InspectWrapper(self._source)
+        self._inspecting = True
+
+    def _run_stage(self, stage, func, data):
+        start = time.monotonic()
+        result = func(data)
+        self._stages[stage][0] += len(data)
+        self._stages[stage][1] += time.monotonic() - start
+        return result
+
+    def _inspect(self, data):
+        self._source.chunk = data
+        self._wrapper.read(len(data))
+        # NOTE: like detect_file_format, stop as soon as the format is known
+        if self._wrapper.formats:
+            self._inspecting = False
+
+    def _process(self, data):
+        if self._decompressor is not None:
+            data = self._run_stage('decompress',
+                                   self._decompressor.decompress, data)
+            if not data:
+                return
+        if self._inspecting and not self._zstd_compressed:
+            self._run_stage('inspect', self._inspect, data)
+        self._run_stage('write', self._file.write, data)
+
+    def _start(self, head):
+        if head.startswith(ZSTD_MAGIC):
+            if (zstandard is not None
+                    and not CONF.conductor.disable_zstandard_decompression):
+                LOG.debug('Decompressing zstd compressed image %s while '
+                          'downloading it', self._image_href)
+                # NOTE: images compressed by pzstd or concatenated have several
+                # frames, all of them have to be decompressed.
+                self._decompressor = (
+                    zstandard.ZstdDecompressor().decompressobj(
+                        read_across_frames=True))
+            else:
+                # NOTE: decompression is left to _handle_zstd_compression,
+                # the format is only known after it.
+                self._zstd_compressed = True
+        self._process(head)
+
+    def write(self, data):
+        """Process and write a chunk of image data."""
+        if not data:
+            return
+        if isinstance(data, str):
+            data = data.encode()
+        if self._started is None:
+            self._started = time.monotonic()
+        self._bytes_received += len(data)
+        if self._hasher is not None:
+            self._run_stage('checksum', self._hasher.update, data)
+
+        if self._head is not None:
+            # The compression is detected on the first bytes of the data.
+            self._head += data
+            if len(self._head) < len(ZSTD_MAGIC):
+                return
+            head, self._head = self._head, None
+            self._start(head)
+        else:
+            self._process(data)
+
+    def finish(self):
+        """Finish processing after the whole image has been written."""
+        if self._finished:
+            return
+        self._finished = True
+        if self._head:
+            head, self._head = self._head, None
+            self._start(head)
+        self._head = None
+        if self._decompressor is not None:
+            data = self._decompressor.flush()
+            if data:
+                self._process(data)
+        self._wrapper.close()
+        self._log_stats()
+
+    def _log_stats(self):
+        elapsed = time.monotonic() - (self._started or time.monotonic())
+        throughput = {}
+        for stage, (size, seconds) in self._stages.items():
+            if size:
+                throughput[stage] = '%.1f MiB/s' % (
+                    size / max(seconds, 0.000001) / 1024 / 1024)
+        LOG.debug('Ingested image %(image)s in %(elapsed).2f seconds, '
+                  '%(received)d bytes received, %(written)d bytes written. '
+                  'Stage throughput: %(throughput)s',
+                  {'image': self._image_href, 'elapsed': elapsed,
+                   'received': self._bytes_received,
+                   'written': self._stages['write'][0],
+                   'throughput': throughput})
+
+    @property
+    def zstd_compressed(self):
+        """Whether the written data is still zstd compressed."""
+        return self._zstd_compressed
+
+    def verify_checksum(self):
+        """Verify the checksum of the downloaded data.
+
+        :raises: ImageChecksumError if the checksum does not match.
+        """
+        if self._hasher is None:
+            return
+        calculated = self._hasher.hexdigest()
+        if calculated.lower() != self._expected_checksum.lower():
+            LOG.error("We were supplied a checksum value of %(supplied)s, "
+                      "but calculated a value of %(value)s. This is a fatal "
+                      "error.",
+                      {"supplied": self._expected_checksum,
+                       "value": calculated})
+            raise exception.ImageChecksumError()
+
+    @property
+    def image_format(self):
+        """The format inspector matching the written data.
+
+        :returns: a format inspector or None if the format cannot be
+                  determined from the written data.
+        :raises: ImageFormatError if the format inspector failed.
+        """
+        if not self._finished or self._zstd_compressed:
+            return None
+        return _get_inspected_format(self._wrapper, self._image_href)
+
+
+def _can_stream_ingest(image_href):
+    """Whether the image service writes the image data through write()."""
+    scheme = urlparse.urlparse(image_href).scheme.lower()
+    if scheme in ('http', 'https', 'oci'):
+        return True
+    if scheme in ('', 'glance'):
+        # NOTE: Glance images with file locations are copied with sendfile
+        return 'file' not in CONF.glance.allowed_direct_url_schemes
+    return False
+
+
+def _fetch_streaming(context, image_href, path, checksum=None,
+                     checksum_algo=None, image_auth_data=None):
+    if CONF.conductor.disable_file_checksum:
+        checksum = None
+    with fileutils.remove_path_on_error(path):
+        with open(path, "wb") as image_file_obj:
+            ingest = ImageIngestHelper(image_file_obj, image_href,
+                                       checksum=checksum,
+                                       checksum_algo=checksum_algo)
+            transfer_checksum = fetch_into(context, image_href, ingest,
+                                           image_auth_data)
+            ingest.finish()
+        if not transfer_checksum:
+            ingest.verify_checksum()
+    return ingest
+
+
 def fetch(context, image_href, path, force_raw=False,
           checksum=None, checksum_algo=None,
           image_auth_data=None):
-    with fileutils.remove_path_on_error(path):
-        transfer_checksum = fetch_into(context, image_href, path,
-                                       image_auth_data)
-        if (not transfer_checksum
-                and not CONF.conductor.disable_file_checksum
-                and checksum):
-            checksum_utils.validate_checksum(path, checksum, checksum_algo)
-
-    # Check and decompress zstd files, since python-requests realistically
-    # can't do it for us as-is. Also, some OCI container registry artifacts
-    # may generally just be zstd compressed, regardless if it is a raw file
-    # or a qcow2 file.
-    _handle_zstd_compression(path)
+    """Fetch an image into a file.
+
+    :returns: the format inspector of the image if it was determined while
+              downloading the image, otherwise None.
+    """
+    image_class = None
+    if CONF.conductor.stream_image_ingest and _can_stream_ingest(image_href):
+        ingest = _fetch_streaming(context, image_href, path,
+                                  checksum=checksum,
+                                  checksum_algo=checksum_algo,
+                                  image_auth_data=image_auth_data)
+        if ingest.zstd_compressed:
+            _handle_zstd_compression(path)
+        else:
+            try:
+                image_class = ingest.image_format
+            except image_format_inspector.ImageFormatError as exc:
+                # NOTE: the callers will run the inspection on the file and
+                # handle the error.
+                LOG.debug('Could not determine the format of image %(image)s '
+                          'while downloading it: %(exc)s',
+                          {'image': image_href, 'exc': exc})
+    else:
+        if CONF.conductor.disable_file_checksum:
+            checksum = None
+        with fileutils.remove_path_on_error(path):
+            transfer_checksum = fetch_into(context, image_href, path,
+                                           image_auth_data,
+                                           checksum=checksum,
+                                           checksum_algo=checksum_algo)
+            if not transfer_checksum and checksum:
+                checksum_utils.validate_checksum(path, checksum,
+                                                 checksum_algo)
+
+        # Check and decompress zstd files, since python-requests realistically
+        # can't do it for us as-is. Also, some OCI container registry
+        # artifacts may generally just be zstd compressed, regardless if it
+        # is a raw file or a qcow2 file.
+        _handle_zstd_compression(path)
 
     if force_raw:
         image_to_raw(image_href, path, "%s.part" % path)
+    return image_class
 
 
 def detect_file_format(path):
@@ -482,6 +795,10 @@ def detect_file_format(path):
                     break
         finally:
             wrapper.close()
+    return _get_inspected_format(wrapper, path)
+
+
+def _get_inspected_format(wrapper, path):
     try:
         return wrapper.format
     except image_format_inspector.ImageFormatError:
@@ -518,9 +835,113 @@ def force_raw_will_convert(image_href, path_tmp):
     return fmt not in RAW_IMAGE_FORMATS
 
 
-def image_to_raw(image_href, path, path_tmp):
+_conversion_semaphore = None
+_conversion_semaphore_lock = threading.Lock()
+
+
+def _get_conversion_semaphore():
+    """Get the semaphore limiting the number of parallel conversions.
+
+    :returns: a semaphore or None if conversions are not limited.
+    """
+    global _conversion_semaphore
+    if not CONF.image_convert_concurrency:
+        return None
+    with _conversion_semaphore_lock:
+        if _conversion_semaphore is None:
+            _conversion_semaphore = threading.BoundedSemaphore(
+                CONF.image_convert_concurrency)
+    return _conversion_semaphore
+
+
+class _ConversionProgress(object):
+    """Reports the progress and throughput of an image conversion.
+
+    The progress is measured as the space allocated by the raw output file,
+    since qemu-img writes sparse raw images.
+    """
+
+    def __init__(self, image_href, dest):
+        self.image_href = image_href
+        self.dest = dest
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+
+    def _written(self):
+        try:
+            return os.stat(self.dest).st_blocks * 512
+        except FileNotFoundError:
+            return 0
+
+    def _report(self):
+        while not self._stop.wait(CONF.image_convert_progress_interval):
+            written = self._written()
+            LOG.info('Converting image %(image)s to raw format: %(written)d '
+                     'MiB written (%(rate).2f MiB/s)',
+                     {'image': self.image_href,
+                      'written': written // units.Mi,
+                      'rate': written / units.Mi
+                      / (time.monotonic() - self._start)})
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        if CONF.image_convert_progress_interval:
+            self._thread = threading.Thread(target=self._report,
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if exc_type is not None:
+            return
+        elapsed = max(time.monotonic() - self._start, 0.001)
+        written = self._written()
+        rate = written / units.Mi / elapsed
+        LOG.info('Converted image %(image)s to raw format in %(time).2f '
+                 'seconds, %(written)d MiB written (%(rate).2f MiB/s)',
+                 {'image': self.image_href, 'time': elapsed,
+                  'written': written // units.Mi, 'rate': rate})
+        METRICS.send_gauge('images.image_to_raw.bytes_per_second',
+                           written / elapsed)
+
+
+def _convert_to_raw(image_href, source, dest, source_format):
+    """Convert an image to raw format in the conversion pool."""
+    semaphore = _get_conversion_semaphore()
+    if semaphore is not None and not semaphore.acquire(blocking=False):
+        LOG.debug('Waiting for a free conversion slot for image %s',
+                  image_href)
+        semaphore.acquire()
+    try:
+        kwargs = {}
+        if CONF.image_convert_io_class:
+            kwargs = {'io_class': CONF.image_convert_io_class,
+                      'io_priority': CONF.image_convert_io_priority}
+        with _ConversionProgress(image_href, dest):
+            qemu_img.convert_image(source, dest, 'raw',
+                                   source_format=source_format, **kwargs)
+    finally:
+        if semaphore is not None:
+            semaphore.release()
+
+
+def image_to_raw(image_href, path, path_tmp, source_format=None):
+    """Convert an image to raw format if needed.
+
+    :param image_href: The image reference, used for logging.
+    :param path: The destination path.
+    :param path_tmp: The path of the image to convert.
+    :param source_format: The format of the image, if it has already been
+                          safety checked by the caller.
+    """
     with fileutils.remove_path_on_error(path_tmp):
-        if not CONF.conductor.disable_deep_image_inspection:
+        if source_format is not None:
+            fmt = source_format
+        elif not CONF.conductor.disable_deep_image_inspection:
             fmt = safety_check_image(path_tmp)
 
             if not image_format_permitted(fmt):
@@ -551,8 +972,7 @@ def image_to_raw(image_href, path, path_tmp):
             LOG.debug("%(image)s was %(format)s, converting to raw",
                       {'image': image_href, 'format': fmt})
             with fileutils.remove_path_on_error(staged):
-                qemu_img.convert_image(path_tmp, staged, 'raw',
-                                       source_format=fmt)
+                _convert_to_raw(image_href, path_tmp, staged, fmt)
                 os.unlink(path_tmp)
                 new_fmt = get_source_format(image_href, staged)
                 if new_fmt not in RAW_IMAGE_FORMATS:
@@ -637,10 +1057,20 @@ def get_temp_url_for_glance_image(context, image_uuid):
     return glance_service.swift_temp_url(image_properties)
 
 
+def _get_boot_iso_kernel_params(root_uuid=None, kernel_params=None):
+    params = []
+    if root_uuid:
+        params.append('root=UUID=%s' % root_uuid)
+    if kernel_params:
+        params.append(kernel_params)
+    return params
+
+
 def create_boot_iso(context, output_filename, kernel_href,
                     ramdisk_href, deploy_iso_href=None, esp_image_href=None,
                     root_uuid=None, kernel_params=None, boot_mode=None,
-                    inject_files=None, publisher_id=None):
+                    inject_files=None, publisher_id=None, config_size=None,
+                    image_cache=None):
     """Creates a bootable ISO image for a node.
 
     Given the hrefs for kernel, ramdisk, root partition's UUID and
@@ -668,19 +1098,36 @@ def create_boot_iso(context, output_filename, kernel_href,
         on the final ISO image.
     :param publisher_id: A value to set as the publisher identifier string
         in the ISO image to be generated.
+    :param config_size: If set, the size in bytes to pad the boot
+        configuration file to, so that it can be replaced later with
+        create_boot_iso_from_template.
+    :param image_cache: An optional image cache (an ImageCache object) to
+        fetch the kernel, ramdisk, deploy ISO and ESP image through. The
+        images are then hard linked from the master images of the cache
+        instead of being downloaded for each ISO.
+    :returns: the path of the boot configuration file in the ISO image.
     :raises: ImageCreationFailed, if creating boot ISO failed.
     """
-    with utils.tempdir() as tmpdir:
+    if image_cache is not None and image_cache.master_dir:
+        # NOTE: hard links to the master images require the same file
+        # system.
+        tempdir_args = {'dir': image_cache.master_dir}
+
+        def _fetch_image(href, path):
+            image_cache.fetch_image(href, path, ctx=context, force_raw=False)
+    else:
+        tempdir_args = {}
+
+        def _fetch_image(href, path):
+            fetch(context, href, path)
+
+    with utils.tempdir(**tempdir_args) as tmpdir:
         kernel_path = os.path.join(tmpdir, 'kernel')
         ramdisk_path = os.path.join(tmpdir, 'ramdisk')
-        fetch(context, kernel_href, kernel_path)
-        fetch(context, ramdisk_href, ramdisk_path)
+        _fetch_image(kernel_href, kernel_path)
+        _fetch_image(ramdisk_href, ramdisk_path)
 
-        params = []
-        if root_uuid:
-            params.append('root=UUID=%s' % root_uuid)
-        if kernel_params:
-            params.append(kernel_params)
+        params = _get_boot_iso_kernel_params(root_uuid, kernel_params)
 
         if boot_mode == 'uefi':
 
@@ -688,11 +1135,11 @@ def create_boot_iso(context, output_filename, kernel_href,
 
             if deploy_iso_href:
                 deploy_iso_path = os.path.join(tmpdir, 'iso')
-                fetch(context, deploy_iso_href, deploy_iso_path)
+                _fetch_image(deploy_iso_href, deploy_iso_path)
 
             elif esp_image_href:
                 esp_image_path = os.path.join(tmpdir, 'esp')
-                fetch(context, esp_image_href, esp_image_path)
+                _fetch_image(esp_image_href, esp_image_path)
 
             elif CONF.esp_image:
                 esp_image_path = CONF.esp_image
@@ -701,17 +1148,117 @@ def create_boot_iso(context, output_filename, kernel_href,
             # path since they are not mutually exclusive.
             # UEFI boot mode, but Network iPXE -> ISO means bios bootable
             # contents are still required.
-            create_esp_image_for_uefi(
+            return create_esp_image_for_uefi(
                 output_filename, kernel_path, ramdisk_path,
                 deploy_iso=deploy_iso_path, esp_image=esp_image_path,
                 kernel_params=params, inject_files=inject_files,
-                publisher_id=publisher_id)
+                publisher_id=publisher_id, config_size=config_size)
 
         else:
-            create_isolinux_image_for_bios(
+            return create_isolinux_image_for_bios(
                 output_filename, kernel_path, ramdisk_path,
                 kernel_params=params, inject_files=inject_files,
-                publisher_id=publisher_id)
+                publisher_id=publisher_id, config_size=config_size)
+
+
+def _get_iso_publisher_field(publisher_id, joliet=False):
+    """Encode a publisher ID like it is stored in a volume descriptor."""
+    if joliet:
+        value = publisher_id.encode('utf-16-be')
+        padding = ' '.encode('utf-16-be')
+    else:
+        value = publisher_id.encode('ascii')
+        padding = b' '
+    return value + padding * ((_ISO_PUBLISHER_LENGTH - len(value))
+                              // len(padding))
+
+
+def _patch_iso_publisher_id(iso_file, publisher_id):
+    """Replace the template publisher ID in the volume descriptors."""
+    sector = 16
+    patched = False
+    while True:
+        iso_file.seek(sector * _ISO_SECTOR_SIZE)
+        descriptor = iso_file.read(_ISO_SECTOR_SIZE)
+        # 255 is the volume descriptor set terminator
+        if len(descriptor) < _ISO_SECTOR_SIZE or descriptor[0] == 255:
+            break
+        # 1 is the primary volume descriptor, 2 a supplementary one (Joliet)
+        if descriptor[0] in (1, 2):
+            joliet = descriptor[0] == 2
+            template = _get_iso_publisher_field(
+                BOOT_ISO_TEMPLATE_PUBLISHER_ID, joliet=joliet)
+            value = _get_iso_publisher_field(publisher_id, joliet=joliet)
+            current = descriptor[_ISO_PUBLISHER_OFFSET:
+                                 _ISO_PUBLISHER_OFFSET
+                                 + _ISO_PUBLISHER_LENGTH]
+            if current != template:
+                raise exception.ImageCreationFailed(
+                    image_type='iso',
+                    error=_('the ISO template has an unexpected publisher '
+                            'ID'))
+            iso_file.seek(sector * _ISO_SECTOR_SIZE + _ISO_PUBLISHER_OFFSET)
+            iso_file.write(value)
+            patched = True
+        sector += 1
+    if not patched:
+        raise exception.ImageCreationFailed(
+            image_type='iso',
+            error=_('no volume descriptor found in the ISO template'))
+
+
+def create_boot_iso_from_template(template, output_filename, config_path,
+                                  root_uuid=None, kernel_params=None,
+                                  boot_mode=None, publisher_id=None):
+    """Creates a bootable ISO image for a node from a template ISO.
+
+    The template has been created by create_boot_iso with the
+    config_size argument and the BOOT_ISO_TEMPLATE_PUBLISHER_ID publisher
+    ID (if publisher_id is used). Only the boot configuration file and the
+    publisher ID are replaced in a copy of the template, nothing is fetched
+    or built.
+
+    :param template: the path of the template ISO.
+    :param output_filename: the absolute path of the output ISO file
+    :param config_path: the path of the boot configuration file in the
+        template, as returned by create_boot_iso.
+    :param root_uuid: optional uuid of the root partition.
+    :param kernel_params: a string containing whitespace separated values
+        kernel cmdline arguments of the form K=V or K (optional).
+    :param boot_mode: the boot mode in which the deploy is to happen.
+    :param publisher_id: A value to set as the publisher identifier string
+        in the ISO image to be generated.
+    :raises: ImageCreationFailed, if creating boot ISO failed.
+    """
+    params = _get_boot_iso_kernel_params(root_uuid, kernel_params)
+    if boot_mode == 'uefi':
+        config = _generate_cfg(params, CONF.grub_config_template,
+                               dict(_GRUB_CFG_OPTIONS))
+    else:
+        config = _generate_cfg(params, CONF.isolinux_config_template,
+                               dict(_ISOLINUX_CFG_OPTIONS))
+
+    try:
+        iso = pycdlib.PyCdlib()
+        iso.open(template)
+        try:
+            record = iso.get_record(rr_path='/' + config_path.lstrip('/'))
+            offset = record.extent_location() * iso.logical_block_size
+            size = record.get_data_length()
+        finally:
+            iso.close()
+    except pycdlib.pycdlibexception.PyCdlibException as e:
+        LOG.error("Reading the boot ISO template %(template)s failed: "
+                  "%(error)s", {'template': template, 'error': e})
+        raise exception.ImageCreationFailed(image_type='iso', error=e)
+
+    config = _pad_boot_config(config, size).encode('utf-8')
+    shutil.copyfile(template, output_filename)
+    with open(output_filename, 'r+b') as iso_file:
+        iso_file.seek(offset)
+        iso_file.write(config)
+        if publisher_id:
+            _patch_iso_publisher_id(iso_file, publisher_id)
 
 
 IMAGE_TYPE_PARTITION = 'partition'
@@ -928,7 +1475,7 @@ def __node_or_image_cache(node):
         return node.uuid
 
 
-def safety_check_image(image_path, node=None):
+def safety_check_image(image_path, node=None, image_class=None):
     """Performs a safety check on the supplied image.
 
     This method triggers the image format inspector's to both identify the
@@ -941,6 +1488,9 @@ def safety_check_image(image_path, node=None):
     :param node: A Node object, optional. When supplied logging indicates the
                  node which triggered this issue, but the node is not
                  available in all invocation cases.
+    :param image_class: The format inspector of the image, optional. When
+                        supplied, it was already fed with the image contents
+                        and the file is not read again.
     :returns: a string representing the the image type which is used.
     :raises: InvalidImage when the supplied image is detected as unsafe,
              or the image format inspector has failed to parse the supplied
@@ -948,7 +1498,7 @@ def safety_check_image(image_path, node=None):
     """
     id_string = __node_or_image_cache(node)
     try:
-        img_class = detect_file_format(image_path)
+        img_class = image_class or detect_file_format(image_path)
         if img_class is None:
             LOG.error("Security: The requested user image for the "
                       "deployment node %(node)s does not match any known "
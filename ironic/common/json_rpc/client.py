@@ -20,12 +20,12 @@ import logging
 from oslo_config import cfg
 from oslo_utils import importutils
 from oslo_utils import netutils
-from oslo_utils import strutils
 from oslo_utils import uuidutils
 
 from ironic.common import exception
 from ironic.common.i18n import _
 from ironic.common import keystone
+from ironic.common import utils
 from ironic.conf import json_rpc
 
 
@@ -204,14 +204,14 @@ class _CallContext(object):
                               netutils.escape_ipv6(self.host),
                               self.port)
         LOG.debug("RPC %s to %s with %s", method, url,
-                  strutils.mask_dict_password(body))
+                  utils.mask_dict_password_lazy(body))
         try:
             result = _get_session().post(url, json=body)
         except Exception as exc:
             LOG.debug('RPC %s to %s failed with %s', method, url, exc)
             raise
         LOG.debug('RPC %s to %s returned %s', method, url,
-                  strutils.mask_password(result.text or '<None>'))
+                  utils.mask_password_lazy(result.text or '<None>'))
         if not cast:
             result = result.json()
             self._handle_error(result.get('error'))
@@ -25,12 +25,12 @@ import logging
 from keystonemiddleware import auth_token
 from oslo_config import cfg
 import oslo_messaging
-from oslo_utils import strutils
 import webob
 
 from ironic.common import auth_basic
 from ironic.common import exception
 from ironic.common.i18n import _
+from ironic.common import utils
 from ironic.common import wsgi_service
 from ironic.conf import json_rpc
 
@@ -245,7 +245,9 @@ class WSGIService(wsgi_service.BaseWSGIService):
         """
         # TODO(dtantsur): server-side version check?
         params.pop('rpc.version', None)
-        logged_params = strutils.mask_dict_password(params)
+        # NOTE: the context is popped below, make a shallow copy so that it
+        # is still logged.
+        logged_params = utils.mask_dict_password_lazy(dict(params))
 
         try:
             context = params.pop('context')
@@ -276,6 +278,6 @@ class WSGIService(wsgi_service.BaseWSGIService):
             # context, but I'm not sure it's guaranteed to be the case.
             result = self.serializer.serialize_entity(context, result)
         LOG.debug('RPC %s returned %s', name,
-                  strutils.mask_dict_password(result)
+                  utils.mask_dict_password_lazy(result)
                   if isinstance(result, dict) else result)
         return result
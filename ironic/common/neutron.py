@@ -10,8 +10,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import copy
 import ipaddress
+import threading
+import time
 
 import openstack
 from openstack.connection import exceptions as openstack_exc
@@ -32,6 +35,20 @@ LOG = log.getLogger(__name__)
 
 _NEUTRON_SESSION = None
 
+_CachedValue = collections.namedtuple('_CachedValue', ['value', 'stored_at'])
+
+# NOTE: both caches are bounded, the least recently stored entries are
+# dropped first. Connections are keyed by the user token (or None for the
+# service credentials), metadata by the project of the client.
+_CONNECTIONS = {}
+_CONNECTIONS_SIZE = 64
+_METADATA_CACHE = {}
+_METADATA_CACHE_SIZE = 1024
+_CACHE_LOCK = threading.Lock()
+_REFRESHING = set()
+
+_CACHE_SCOPE_ATTR = 'ironic_cache_scope'
+
 VNIC_BAREMETAL = 'baremetal'
 VNIC_SMARTNIC = 'smart-nic'
 
@@ -48,9 +65,29 @@ def _get_neutron_session():
     return _NEUTRON_SESSION
 
 
+def _get_cached(cache, key, max_age):
+    element = cache.get(key)
+    if (element is not None
+            and time.monotonic() - element.stored_at <= max_age):
+        return element
+    return None
+
+
+def _put_cached(cache, key, value, size):
+    with _CACHE_LOCK:
+        cache.pop(key, None)
+        cache[key] = _CachedValue(value, time.monotonic())
+        while len(cache) > size:
+            # NOTE: dictionaries keep the insertion order.
+            del cache[next(iter(cache))]
+
+
 def get_client(token=None, context=None, auth_from_config=False):
     """Retrieve a neutron client connection.
 
+    Connections are reused for [neutron]cache_ttl seconds by requests
+    with the same user token, or using the service credentials.
+
     :param context: request context,
                     instance of ironic.common.context.RequestContext
     :param auth_from_config: (boolean) When True, use auth values from
@@ -59,25 +96,116 @@ def get_client(token=None, context=None, auth_from_config=False):
     """
     if not context:
         context = ironic_context.RequestContext(auth_token=token)
-    session = _get_neutron_session()
-    service_auth = keystone.get_auth('neutron')
-    endpoint = keystone.get_endpoint('neutron', session=session,
-                                     auth=service_auth)
 
-    user_auth = None
-    if (not auth_from_config and CONF.neutron.auth_type != 'none'
-            and context.auth_token and not context.system_scope):
-        # If we have a token, we *should* use the user's auth, however we
-        # can only do so *if* it is a project scoped request. If it is
-        # system scoped, we cannot leverage user auth data to make the next
-        # request.
-        user_auth = keystone.get_service_auth(context, endpoint, service_auth)
+    # If we have a token, we *should* use the user's auth, however we
+    # can only do so *if* it is a project scoped request. If it is
+    # system scoped, we cannot leverage user auth data to make the next
+    # request.
+    use_user_auth = bool(not auth_from_config
+                         and CONF.neutron.auth_type != 'none'
+                         and context.auth_token and not context.system_scope)
+    conn_key = context.auth_token if use_user_auth else None
+
+    element = (_get_cached(_CONNECTIONS, conn_key, CONF.neutron.cache_ttl)
+               if CONF.neutron.cache_ttl else None)
+    if element is not None:
+        conn = element.value
+    else:
+        session = _get_neutron_session()
+        service_auth = keystone.get_auth('neutron')
+        endpoint = keystone.get_endpoint('neutron', session=session,
+                                         auth=service_auth)
+
+        user_auth = None
+        if use_user_auth:
+            user_auth = keystone.get_service_auth(context, endpoint,
+                                                  service_auth)
+
+        sess = keystone.get_session('neutron', timeout=CONF.neutron.timeout,
+                                    auth=user_auth or service_auth)
+        conn = openstack.connection.Connection(session=sess, oslo_conf=CONF)
+        if CONF.neutron.cache_ttl:
+            _put_cached(_CONNECTIONS, conn_key, conn, _CONNECTIONS_SIZE)
+
+    client = conn.global_request(context.global_id).network
+    # The scope of the cached network metadata, see _cached_lookup.
+    setattr(client, _CACHE_SCOPE_ATTR,
+            context.project_id if use_user_auth else None)
+    return client
+
+
+def _refresh_in_background(key, fetch):
+    with _CACHE_LOCK:
+        if key in _REFRESHING:
+            return
+        _REFRESHING.add(key)
+
+    def _refresh():
+        try:
+            _put_cached(_METADATA_CACHE, key, fetch(), _METADATA_CACHE_SIZE)
+        except Exception as exc:
+            # The next lookup will fetch the value again and report the
+            # error, if any.
+            LOG.debug('Could not refresh cached neutron %(kind)s %(id)s, '
+                      'dropping it from the cache: %(exc)s',
+                      {'kind': key[0], 'id': key[2], 'exc': exc})
+            with _CACHE_LOCK:
+                _METADATA_CACHE.pop(key, None)
+        finally:
+            with _CACHE_LOCK:
+                _REFRESHING.discard(key)
+
+    threading.Thread(target=_refresh, daemon=True).start()
+
+
+def _cached_lookup(kind, client, resource_id, fetch):
+    """Look up neutron metadata through the metadata cache.
+
+    Values are cached for [neutron]cache_ttl seconds per project of the
+    client. Expired values are still returned during
+    [neutron]cache_stale_period seconds, while they are refreshed in the
+    background. Errors are never cached.
+
+    :param kind: The kind of the metadata, e.g. 'network'.
+    :param client: The Neutron client used to fetch the metadata.
+    :param resource_id: The identifier of the metadata for this kind.
+    :param fetch: A callable without arguments fetching the metadata.
+    :returns: The cached or fetched metadata. It must not be modified.
+    """
+    ttl = CONF.neutron.cache_ttl
+    if not ttl:
+        return fetch()
+
+    key = (kind, getattr(client, _CACHE_SCOPE_ATTR, None), resource_id)
+    element = _get_cached(_METADATA_CACHE, key,
+                          ttl + CONF.neutron.cache_stale_period)
+    if element is not None:
+        if time.monotonic() - element.stored_at > ttl:
+            _refresh_in_background(key, fetch)
+        return element.value
 
-    sess = keystone.get_session('neutron', timeout=CONF.neutron.timeout,
-                                auth=user_auth or service_auth)
-    conn = openstack.connection.Connection(session=sess, oslo_conf=CONF)
+    value = fetch()
+    _put_cached(_METADATA_CACHE, key, value, _METADATA_CACHE_SIZE)
+    return value
 
-    return conn.global_request(context.global_id).network
+
+def invalidate_cache(resource_id=None):
+    """Drop cached neutron metadata.
+
+    :param resource_id: If provided, only drop the metadata of the network,
+        subnet or security group with this UUID or name. Otherwise drop
+        all the cached metadata, as well as the cached clients.
+    """
+    with _CACHE_LOCK:
+        if resource_id is None:
+            _METADATA_CACHE.clear()
+            _CONNECTIONS.clear()
+            return
+        for key, element in list(_METADATA_CACHE.items()):
+            ids = key[2] if isinstance(key[2], tuple) else (key[2],)
+            if (resource_id in ids
+                    or getattr(element.value, 'id', None) == resource_id):
+                del _METADATA_CACHE[key]
 
 
 def update_neutron_port(context, port_id, attrs, client=None):
@@ -229,6 +357,12 @@ def update_port_address(port_id, address, context=None, client=None):
         raise exception.FailedToUpdateMacOnPort(port_id=port_id)
 
 
+class _MissingSecurityGroups(Exception):
+    def __init__(self, found):
+        super().__init__()
+        self.found = found
+
+
 def _verify_security_groups(security_groups, client):
     """Verify that the security groups exist.
 
@@ -240,9 +374,22 @@ def _verify_security_groups(security_groups, client):
 
     if not security_groups:
         return
-    try:
-        neutron_sec_groups = set(
+
+    def _fetch():
+        neutron_sec_groups = frozenset(
             x.id for x in client.security_groups(id=security_groups))
+        if not set(security_groups).issubset(neutron_sec_groups):
+            # Not cached, so that missing security groups are detected
+            # as soon as they are created.
+            raise _MissingSecurityGroups(neutron_sec_groups)
+        return neutron_sec_groups
+
+    try:
+        neutron_sec_groups = _cached_lookup(
+            'security_groups', client, tuple(sorted(security_groups)),
+            _fetch)
+    except _MissingSecurityGroups as e:
+        neutron_sec_groups = e.found
     except openstack_exc.OpenStackCloudException as e:
         msg = (_("Could not retrieve security groups from neutron: %(exc)s") %
                {'exc': e})
@@ -284,6 +431,130 @@ def _add_ip_addresses_for_ipv6_stateful(context, port, client):
         update_neutron_port(context, port.id, attrs, client=client)
 
 
+def _fail_on_binding_failure(node, is_smart_nic):
+    """Whether a port binding failure is fatal for a port of the node.
+
+    :param node: an Ironic node object.
+    :param is_smart_nic: Whether the port is a Smart NIC port.
+    :returns: Boolean indicating if the port status has to be checked.
+    """
+    binding_fail_fatal = False
+    is_neutron_iface = node.network_interface == 'neutron'
+
+    if is_neutron_iface:
+        binding_fail_fatal = getattr(
+            CONF.neutron, 'fail_on_port_binding_failure', False)
+
+    default_failure_behavior = is_smart_nic or binding_fail_fatal
+
+    return node.driver_info.get('fail_on_binding_failure',
+                                default_failure_behavior)
+
+
+def _create_ports_in_bulk(task, client, network_uuid, requests):
+    """Create the neutron ports for several ironic ports at once.
+
+    The ports are created with a single bulk request. Since Neutron
+    rejects a bulk request as a whole, the ports are created one by one
+    if it fails, so that a single faulty port does not fail the others.
+    The status of the created ports is then checked with a single list
+    request per attempt.
+
+    :param task: a TaskManager instance.
+    :param client: A Neutron client object.
+    :param network_uuid: UUID of a neutron network where ports will be
+        created.
+    :param requests: a list of tuples (ironic port, attributes to create
+        the neutron port with, admin-only attributes to update it with,
+        whether it is a Smart NIC port).
+    :raises: NetworkError
+    :returns: a tuple of a dictionary in the form
+        {port.uuid: neutron_port['id']} and a list of the UUIDs of the
+        ironic ports which could not be handled.
+    """
+    node = task.node
+    failures = []
+
+    # Ports of the same Smart NIC share a host agent, it only needs to be
+    # checked once.
+    for host_id in sorted({update_attrs['binding:host_id']
+                           for _p, _a, update_attrs, is_smart_nic in requests
+                           if is_smart_nic}):
+        wait_for_host_agent(client, host_id)
+
+    try:
+        created = list(client.create_ports(
+            [port_attrs for _p, port_attrs, _u, _s in requests]))
+    except openstack_exc.OpenStackCloudException as e:
+        LOG.warning("Could not create neutron ports for node %(node)s on "
+                    "the neutron network %(net)s in bulk, creating them one "
+                    "by one. %(exc)s",
+                    {'node': node.uuid, 'net': network_uuid, 'exc': e})
+        created = []
+        for ironic_port, port_attrs, _u, _s in requests:
+            try:
+                created.append(client.create_port(**port_attrs))
+            except openstack_exc.OpenStackCloudException as e:
+                failures.append(ironic_port.uuid)
+                created.append(None)
+                LOG.warning("Could not create neutron port for node's "
+                            "%(node)s port %(ir_port)s on the neutron "
+                            "network %(net)s. %(exc)s",
+                            {'net': network_uuid, 'node': node.uuid,
+                             'ir_port': ironic_port.uuid, 'exc': e})
+    else:
+        LOG.debug('Created %(count)d neutron ports for node %(node)s on '
+                  'network %(net)s in bulk',
+                  {'count': len(created), 'node': node.uuid,
+                   'net': network_uuid})
+
+    # The visibility check done by update_neutron_port is not needed for
+    # ports which have just been created with the user's client.
+    admin_client = get_client(context=task.context, auth_from_config=True)
+    ports = {}
+    to_wait = {}
+    for (ironic_port, _a, update_port_attrs, is_smart_nic), port in zip(
+            requests, created):
+        if port is None:
+            continue
+        try:
+            port = update_neutron_port(task.context, port.id,
+                                       update_port_attrs,
+                                       client=admin_client)
+            if CONF.neutron.dhcpv6_stateful_address_count > 1:
+                _add_ip_addresses_for_ipv6_stateful(task.context, port, client)
+        except openstack_exc.OpenStackCloudException as e:
+            failures.append(ironic_port.uuid)
+            LOG.warning("Could not create neutron port for node's "
+                        "%(node)s port %(ir_port)s on the neutron "
+                        "network %(net)s. %(exc)s",
+                        {'net': network_uuid, 'node': node.uuid,
+                         'ir_port': ironic_port.uuid, 'exc': e})
+            continue
+
+        ports[ironic_port.uuid] = port.id
+        if _fail_on_binding_failure(node, is_smart_nic):
+            to_wait[port.id] = ironic_port.uuid
+
+    if to_wait:
+        binding_failed = wait_for_ports_status(
+            client, list(to_wait), 'ACTIVE', fail_on_binding_failure=True)
+        for port_id in binding_failed:
+            ironic_port_uuid = to_wait[port_id]
+            del ports[ironic_port_uuid]
+            failures.append(ironic_port_uuid)
+
+    return ports, failures
+
+
+def _invalidate_network_cache(network_uuid, security_groups):
+    # The network or the security groups may have changed since they were
+    # validated.
+    invalidate_cache(network_uuid)
+    for security_group in security_groups or ():
+        invalidate_cache(security_group)
+
+
 def add_ports_to_network(task, network_uuid, security_groups=None):
     """Create neutron ports to boot the ramdisk.
 
@@ -302,6 +573,14 @@ def add_ports_to_network(task, network_uuid, security_groups=None):
     :raises: NetworkError
     :returns: a dictionary in the form {port.uuid: neutron_port['id']}
     """
+    try:
+        return _add_ports_to_network(task, network_uuid, security_groups)
+    except exception.NetworkError:
+        _invalidate_network_cache(network_uuid, security_groups)
+        raise
+
+
+def _add_ports_to_network(task, network_uuid, security_groups):
     client = get_client(context=task.context)
     node = task.node
     pxe_capability = 'pxe_boot' in task.driver.boot.capabilities
@@ -334,6 +613,7 @@ def add_ports_to_network(task, network_uuid, security_groups=None):
 
     ports = {}
     failures = []
+    bulk_requests = []
     portmap = get_node_portmap(task)
 
     if not add_all_ports:
@@ -398,6 +678,11 @@ def add_ports_to_network(task, network_uuid, security_groups=None):
                 {'opt_name': DHCP_CLIENT_ID, 'opt_value': client_id})
             port_attrs['extra_dhcp_opts'] = extra_dhcp_opts
 
+        if CONF.neutron.bulk_port_operations:
+            bulk_requests.append((ironic_port, port_attrs, update_port_attrs,
+                                  is_smart_nic))
+            continue
+
         try:
             if is_smart_nic:
                 wait_for_host_agent(
@@ -408,17 +693,8 @@ def add_ports_to_network(task, network_uuid, security_groups=None):
             if CONF.neutron.dhcpv6_stateful_address_count > 1:
                 _add_ip_addresses_for_ipv6_stateful(task.context, port, client)
 
-            binding_fail_fatal = False
-            is_neutron_iface = node.network_interface == 'neutron'
-
-            if is_neutron_iface:
-                binding_fail_fatal = getattr(
-                    CONF.neutron, 'fail_on_port_binding_failure', False)
-
-            default_failure_behavior = is_smart_nic or binding_fail_fatal
-
-            fail_on_binding_failure = node.driver_info.get(
-                'fail_on_binding_failure', default_failure_behavior)
+            fail_on_binding_failure = _fail_on_binding_failure(node,
+                                                               is_smart_nic)
 
             # NOTE(cid): Only check port status if it's a smart NIC or if we're
             # configured to fail on binding failures. This avoids unnecessary
@@ -438,6 +714,12 @@ def add_ports_to_network(task, network_uuid, security_groups=None):
         else:
             ports[ironic_port.uuid] = port.id
 
+    if bulk_requests:
+        bulk_ports, bulk_failures = _create_ports_in_bulk(
+            task, client, network_uuid, bulk_requests)
+        ports.update(bulk_ports)
+        failures.extend(bulk_failures)
+
     if failures:
         if len(failures) == len(ports_to_create):
             rollback_ports(task, network_uuid)
@@ -445,6 +727,7 @@ def add_ports_to_network(task, network_uuid, security_groups=None):
                 "Failed to create neutron ports for node's %(node)s ports "
                 "%(ports)s.") % {'node': node.uuid, 'ports': ports_to_create})
         else:
+            _invalidate_network_cache(network_uuid, security_groups)
             LOG.warning("Some errors were encountered when updating "
                         "vif_port_id for node %(node)s on "
                         "the following ports: %(ports)s.",
@@ -525,13 +808,16 @@ def remove_neutron_ports(task, params):
         LOG.debug('No ports to remove for node %s', node_uuid)
         return
 
+    checked_hosts = set()
     for port in ports:
         LOG.debug('Deleting neutron port %(vif_port_id)s of node '
                   '%(node_id)s.',
                   {'vif_port_id': port['id'], 'node_id': node_uuid})
 
-        if is_smartnic_port(port):
+        if (is_smartnic_port(port)
+                and port['binding:host_id'] not in checked_hosts):
             wait_for_host_agent(client, port['binding:host_id'])
+            checked_hosts.add(port['binding:host_id'])
         try:
             client.delete_port(port)
         # NOTE(mgoddard): Ignore if the port was deleted by nova.
@@ -947,7 +1233,12 @@ def _get_network_by_uuid_or_name(client, uuid_or_name, net_type=_('network')):
     :raises: NetworkError on failure to contact Neutron
     :raises: InvalidParameterValue for missing or duplicated network
     """
+    return _cached_lookup(
+        'network', client, uuid_or_name,
+        lambda: _find_network(client, uuid_or_name, net_type))
+
 
+def _find_network(client, uuid_or_name, net_type):
     try:
         network = client.find_network(uuid_or_name, ignore_missing=False)
     except openstack_exc.DuplicateResource:
@@ -1000,6 +1291,12 @@ def _get_segment_by_subnet_uuid(client, subnet_uuid):
     :raises: InvalidParameterValue if the subnet or segment does not exist.
     :raises: NetworkError on failure to contact Neutron.
     """
+    return _cached_lookup(
+        'segment', client, subnet_uuid,
+        lambda: _find_segment_by_subnet_uuid(client, subnet_uuid))
+
+
+def _find_segment_by_subnet_uuid(client, subnet_uuid):
     try:
         subnet = client.get_subnet(subnet_uuid)
     except openstack_exc.ResourceNotFound:
@@ -1157,6 +1454,67 @@ def wait_for_port_status(client, port_id, status,
             'port_id': port_id, 'status': status})
 
 
+@retry(
+    retry=tenacity.retry_if_exception_type(exception.NetworkError),
+    stop=tenacity.stop_after_attempt(CONF.agent.neutron_agent_max_attempts),
+    wait=tenacity.wait_fixed(CONF.agent.neutron_agent_status_retry_interval),
+    reraise=True)
+def wait_for_ports_status(client, port_ids, status,
+                          fail_on_binding_failure=None):
+    """Wait for the status of several ports to be the desired status
+
+    Unlike :func:`wait_for_port_status`, the ports are fetched with a
+    single list request on each attempt.
+
+    :param client: A Neutron client object.
+    :param port_ids: A list of Neutron port IDs.
+    :param status: Ports' target status, can be ACTIVE, DOWN ... etc.
+    :param fail_on_binding_failure: Whether to stop waiting for the ports
+        whose binding fails.
+    :returns: a set of the IDs of the ports whose binding failed, only
+        populated if fail_on_binding_failure is set.
+    :raises: InvalidParameterValue if some of the ports do not exist.
+    :raises: exception.NetworkError if the status of some of the ports
+        didn't match the required status after max retry attempts.
+    """
+    LOG.debug('Validating Ports %(port_ids)s status is %(status)s',
+              {'port_ids': port_ids, 'status': status})
+    try:
+        ports = list(client.ports(id=list(port_ids)))
+    except openstack_exc.OpenStackCloudException as exc:
+        raise exception.NetworkError(
+            _('Could not retrieve neutron ports: %s') % exc)
+
+    missing = set(port_ids) - {port.id for port in ports}
+    if missing:
+        raise exception.InvalidParameterValue(
+            _('Neutron ports %(port_uuids)s were not found') %
+            {'port_uuids': ', '.join(sorted(missing))})
+
+    binding_failed = set()
+    pending = []
+    for port in ports:
+        LOG.debug('Port %(port_id)s status is: %(status)s',
+                  {'port_id': port.id, 'status': port.status})
+        if port.status == status:
+            continue
+
+        if port.get('binding:vif_type') == 'binding_failed':
+            msg = "Binding failed for neutron port %s" % port.id
+            if fail_on_binding_failure:
+                LOG.error(msg)
+                binding_failed.add(port.id)
+                continue
+            LOG.warning(msg)
+        pending.append(port.id)
+
+    if pending:
+        raise exception.NetworkError(
+            'Ports %(port_ids)s failed to reach status %(status)s' % {
+                'port_ids': ', '.join(pending), 'status': status})
+    return binding_failed
+
+
 class NeutronNetworkInterfaceMixin(object):
 
     def get_cleaning_network_uuid(self, task):
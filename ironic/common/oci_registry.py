@@ -18,17 +18,25 @@
 # https://github.com/openstack-archive/tripleo-common/blame/stable/wallaby/tripleo_common/image/image_uploader.py
 
 import base64
+import copy
+import hashlib
 import json
+import os
 import re
 import requests
 from requests import auth as requests_auth
+import shutil
 import tenacity
 from urllib import parse
 
+from oslo_concurrency import lockutils
 from oslo_log import log as logging
+from oslo_utils import units
 
 from ironic.common import checksum_utils
 from ironic.common import exception
+from ironic.common import image_info_cache
+from ironic.common import utils
 from ironic.conf import CONF
 
 LOG = logging.getLogger(__name__)
@@ -52,6 +60,17 @@ LOG = logging.getLogger(__name__)
     'application/vnd.oci.image.index.v1+json',
 )
 
+# NOTE: blobs in the local blob store are stored under their digest,
+# only digests of these algorithms in lower case hexadecimal are accepted.
+_BLOB_DIGEST_RE = re.compile(r'^(sha256|sha512):([a-f0-9]{64}|[a-f0-9]{128})$')
+
+_BLOB_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Errors after which the download of a blob into the blob store is resumed.
+_RESUMABLE_ERRORS = (requests.ConnectionError,
+                     requests.exceptions.ChunkedEncodingError,
+                     requests.Timeout)
+
 
 class MakeSession(object):
     """Class method to uniformly create sessions.
@@ -143,7 +162,7 @@ class RegistrySessionHelper(object):
 
     @staticmethod
     def check_redirect_trusted(request_response, request_session,
-                               stream=True, timeout=60):
+                               stream=True, timeout=60, headers=None):
         """Check if we've been redirected to a trusted source
 
         Because we may be using auth, we may not want to leak authentication
@@ -157,6 +176,7 @@ class RegistrySessionHelper(object):
         :param: request_session: Session to use when redirecting
         :param: stream: Should we stream the response of the redirect
         :param: timeout: Timeout for the redirect request
+        :param: headers: Additional headers of the redirect request
         """
         # we're not a redirect, just return the original response
         if not (request_response.status_code >= 300
@@ -169,6 +189,7 @@ class RegistrySessionHelper(object):
         auth_header = request_session.headers.pop('Authorization', None)
         # ok we got a redirect, let's check where we are going
         secure_cdn = CONF.oci.secure_cdn_registries
+        kwargs = {'headers': headers} if headers else {}
         # TODO(TheJulia): Consider breaking the session calls below into
         # a helper method, because as-is, this is basically impossible
         # to unit test the delienation in behavior.
@@ -178,13 +199,15 @@ class RegistrySessionHelper(object):
             request_session.headers.update({'Authorization': auth_header})
             request_response = request_session.get(redir_url.geturl(),
                                                    stream=stream,
-                                                   timeout=timeout)
+                                                   timeout=timeout,
+                                                   **kwargs)
         else:
             # we didn't trust the place we're going, request without auth but
             # add the auth back to the request session afterwards
             request_response = request_session.get(redir_url.geturl(),
                                                    stream=stream,
-                                                   timeout=timeout)
+                                                   timeout=timeout,
+                                                   **kwargs)
             request_session.headers.update({'Authorization': auth_header})
 
         request_response.encoding = 'utf-8'
@@ -356,6 +379,12 @@ class OciClient(object):
     # directly handle credentials to IPA.
     _cached_auth = None
 
+    # Manifests and artifact indexes shared by all clients, see the
+    # image_info_cache module. The entries are keyed by the authorization
+    # of the client, so that they are only reused with the same credentials.
+    _manifest_cache = {}
+    _index_cache = {}
+
     def __init__(self, verify):
         """Initialize the OCI container registry client class.
 
@@ -485,6 +514,10 @@ class OciClient(object):
         scheme = 'https'
         return '%s://%s/v2%s' % (scheme, netloc, path)
 
+    def _cache_key(self, image_url, image, reference):
+        return (image_url.netloc, image, reference,
+                self.session.headers.get('Authorization'))
+
     def _get_manifest(self, image_url, digest=None):
 
         if not digest:
@@ -493,6 +526,13 @@ class OciClient(object):
             digest = image_url.path.split('@')[1]
         image_path = image_url.path.split(':')[0]
 
+        cache_key = self._cache_key(image_url, image_path, digest)
+        cached = image_info_cache.get(self._manifest_cache, cache_key)
+        if cached is not None:
+            LOG.debug('Using the cached manifest %(digest)s of %(image)s',
+                      {'digest': digest, 'image': image_url.geturl()})
+            return copy.deepcopy(cached.info)
+
         manifest_url = self._build_url(
             image_url, CALL_MANIFEST % {'image': image_path,
                                         'tag': digest})
@@ -519,9 +559,17 @@ class OciClient(object):
             raise
         manifest_str = self._get_response_text(manifest_r)
         checksum_utils.validate_text_checksum(manifest_str, digest)
-        return json.loads(manifest_str)
+        manifest = json.loads(manifest_str)
+        image_info_cache.put(self._manifest_cache, cache_key, manifest)
+        return manifest
 
     def _get_artifact_index(self, image_url):
+        cache_key = self._cache_key(image_url,
+                                    *self._image_tag_from_url(image_url))
+        cached = image_info_cache.get(self._index_cache, cache_key)
+        if cached is not None:
+            LOG.debug('Using the cached artifact index for: %s', image_url)
+            return copy.deepcopy(cached.info)
         LOG.debug('Attempting to get the artifact index for: %s',
                   image_url)
         parts = self._resolve_tag(image_url)
@@ -552,7 +600,9 @@ class OciClient(object):
         index_str = self._get_response_text(index_r)
         # Return a dictionary to the caller so it can house the
         # filtering/sorting application logic.
-        return json.loads(index_str)
+        index = json.loads(index_str)
+        image_info_cache.put(self._index_cache, cache_key, index)
+        return index
 
     def _resolve_tag(self, image_url):
         """Attempts to resolve tags from a container URL."""
@@ -700,42 +750,32 @@ class OciClient(object):
         blob_digest = layers[0].get('digest')
         blob_url = self.get_blob_url(manifest_url, blob_digest)
         LOG.debug('Identified download url for blob: %s', blob_url)
-        # One which is an OCI URL with a manifest.
+        store_path = self._blob_store_path(blob_digest)
         try:
-            resp = RegistrySessionHelper.get(
-                self.session,
-                blob_url,
-                stream=True,
-                timeout=CONF.webserver_connection_timeout
-            )
-            resp = RegistrySessionHelper.check_redirect_trusted(
-                resp, self.session, stream=True)
-            if resp.status_code != 200:
-                raise exception.ImageRefValidationFailed(
-                    image_href=blob_url,
-                    reason=("Got HTTP code %s instead of 200 in response "
-                            "to GET request.") % resp.status_code)
-            # Reminder: image_file, is a file object handler.
-            split_digest = blob_digest.split(':')
-
-            # Invoke the transfer helper so the checksum can be calculated
-            # in transfer.
-            download_helper = checksum_utils.TransferHelper(
-                resp, split_digest[0], split_digest[1])
-            # NOTE(TheJuila): If we *ever* try to have retry logic here,
-            # remember to image_file.seek(0) to reset position.
-            for chunk in download_helper:
-                # write the desired file out
-                image_file.write(chunk)
-            LOG.debug('Download of %(manifest)s has completed. Transferred '
-                      '%(bytes)s of %(total)s total bytes.',
-                      {'manifest': manifest_url,
-                       'bytes': download_helper.bytes_transferred,
-                       'total': download_helper.content_length})
-            if download_helper.checksum_matches:
-                return blob_digest
-            else:
-                raise exception.ImageChecksumError()
+            if store_path is None:
+                return self._download_blob(manifest_url, blob_url,
+                                           blob_digest, image_file)
+
+            # NOTE: concurrent downloads of the same blob wait for the first
+            # one to store it, downloads of different blobs are independent.
+            with lockutils.lock('oci-blob-%s' % blob_digest):
+                if os.path.exists(store_path):
+                    LOG.debug('Using blob %(digest)s from the blob store '
+                              'for %(manifest)s',
+                              {'digest': blob_digest,
+                               'manifest': manifest_url})
+                    # Record the use of the blob for the clean up.
+                    os.utime(store_path)
+                else:
+                    self._download_blob_to_store(blob_url, blob_digest,
+                                                 store_path)
+                    self._clean_up_blob_store(keep=store_path)
+                # NOTE: the open file stays readable even if the blob is
+                # removed from the store by a concurrent clean up.
+                blob_file = open(store_path, 'rb')
+            with blob_file:
+                shutil.copyfileobj(blob_file, image_file, _BLOB_CHUNK_SIZE)
+            return blob_digest
 
         except requests.exceptions.HTTPError as e:
             LOG.debug('Encountered error while attempting to download %s',
@@ -758,6 +798,165 @@ class OciClient(object):
             raise exception.ImageDownloadFailed(image_href=blob_url,
                                                 reason=str(e))
 
+    def _get_blob(self, blob_url, headers=None):
+        """Request a blob, following redirects to trusted locations."""
+        kwargs = {'headers': headers} if headers else {}
+        resp = RegistrySessionHelper.get(
+            self.session,
+            blob_url,
+            stream=True,
+            timeout=CONF.webserver_connection_timeout,
+            **kwargs
+        )
+        return RegistrySessionHelper.check_redirect_trusted(
+            resp, self.session, stream=True, headers=headers)
+
+    def _download_blob(self, manifest_url, blob_url, blob_digest,
+                       image_file):
+        # One which is an OCI URL with a manifest.
+        resp = self._get_blob(blob_url)
+        if resp.status_code != 200:
+            raise exception.ImageRefValidationFailed(
+                image_href=blob_url,
+                reason=("Got HTTP code %s instead of 200 in response "
+                        "to GET request.") % resp.status_code)
+        # Reminder: image_file, is a file object handler.
+        split_digest = blob_digest.split(':')
+
+        # Invoke the transfer helper so the checksum can be calculated
+        # in transfer.
+        download_helper = checksum_utils.TransferHelper(
+            resp, split_digest[0], split_digest[1])
+        # NOTE(TheJuila): If we *ever* try to have retry logic here,
+        # remember to image_file.seek(0) to reset position.
+        for chunk in download_helper:
+            # write the desired file out
+            image_file.write(chunk)
+        LOG.debug('Download of %(manifest)s has completed. Transferred '
+                  '%(bytes)s of %(total)s total bytes.',
+                  {'manifest': manifest_url,
+                   'bytes': download_helper.bytes_transferred,
+                   'total': download_helper.content_length})
+        if download_helper.checksum_matches:
+            return blob_digest
+        else:
+            raise exception.ImageChecksumError()
+
+    @staticmethod
+    def _blob_store_path(blob_digest):
+        """Path of a blob in the blob store, None if it cannot be stored."""
+        if not CONF.oci.blob_cache_path:
+            return None
+        match = _BLOB_DIGEST_RE.match(blob_digest or '')
+        if not match:
+            LOG.debug('Not using the blob store for blob %s, its digest '
+                      'is not supported', blob_digest)
+            return None
+        return os.path.join(CONF.oci.blob_cache_path, *match.groups())
+
+    def _download_blob_to_store(self, blob_url, blob_digest, path):
+        """Download a blob into the blob store.
+
+        The blob is downloaded into a partial file next to its final
+        location, which is kept when the download fails, so that the next
+        download of the blob resumes where the previous one stopped. The
+        blob is only moved to its final location once its digest has been
+        verified.
+        """
+        algo, expected = blob_digest.split(':')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = path + '.part'
+        hasher = hashlib.new(algo)
+        failures = 0
+        with open(part_path, 'ab+') as part:
+            part.seek(0)
+            for chunk in iter(lambda: part.read(_BLOB_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+            offset = part.tell()
+            if offset:
+                LOG.info('Resuming the download of blob %(blob)s with '
+                         '%(offset)d bytes already received',
+                         {'blob': blob_url, 'offset': offset})
+            # NOTE: a download may have been interrupted right before the
+            # verified blob has been moved to its location.
+            while not offset or hasher.hexdigest() != expected:
+                headers = {'Range': 'bytes=%d-' % offset} if offset else None
+                try:
+                    resp = self._get_blob(blob_url, headers=headers)
+                    if offset and resp.status_code == 416:
+                        # NOTE: the partial file is as large as the blob,
+                        # but its digest does not match, it is corrupted.
+                        LOG.warning('The partial download of blob %(blob)s '
+                                    'has %(offset)d bytes, which is not a '
+                                    'part of the blob, downloading it again',
+                                    {'blob': blob_url, 'offset': offset})
+                        resp.close()
+                        part.truncate(0)
+                        hasher = hashlib.new(algo)
+                        offset = 0
+                        continue
+                    if offset and resp.status_code == 200:
+                        LOG.debug('The registry does not accept range '
+                                  'requests for blob %s, downloading it '
+                                  'again', blob_url)
+                        part.truncate(0)
+                        hasher = hashlib.new(algo)
+                    elif resp.status_code != (206 if offset else 200):
+                        raise exception.ImageRefValidationFailed(
+                            image_href=blob_url,
+                            reason=("Got HTTP code %s in response to GET "
+                                    "request.") % resp.status_code)
+                    with resp:
+                        for chunk in resp.iter_content(_BLOB_CHUNK_SIZE):
+                            part.write(chunk)
+                            hasher.update(chunk)
+                    break
+                except _RESUMABLE_ERRORS as e:
+                    failures += 1
+                    if failures > CONF.image_download_retries:
+                        raise
+                    offset = part.tell()
+                    LOG.warning('Download of blob %(blob)s failed, resuming '
+                                'from byte %(offset)d. Error: %(error)s',
+                                {'blob': blob_url, 'offset': offset,
+                                 'error': e})
+        if hasher.hexdigest() != expected:
+            utils.unlink_without_raise(part_path)
+            raise exception.ImageChecksumError()
+        os.rename(part_path, path)
+        LOG.debug('Stored blob %(digest)s of %(size)d bytes in the blob '
+                  'store', {'digest': blob_digest,
+                            'size': os.path.getsize(path)})
+
+    @staticmethod
+    @lockutils.synchronized('oci-blob-store')
+    def _clean_up_blob_store(keep=None):
+        """Remove the least recently used blobs above the store size."""
+        limit = CONF.oci.blob_cache_size * units.Mi
+        if not limit:
+            return
+        blobs = []
+        for root, _dirs, files in os.walk(CONF.oci.blob_cache_path):
+            for name in files:
+                if name.endswith('.part'):
+                    # Downloads in progress or to resume.
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _mtime, size, _path in blobs)
+        for _mtime, size, path in sorted(blobs):
+            if total <= limit:
+                break
+            if path == keep:
+                continue
+            LOG.debug('Removing blob %s from the blob store', path)
+            utils.unlink_without_raise(path)
+            total -= size
+
     @classmethod
     def _image_tag_from_url(cls, image_url):
         """Identify image and tag from image_url.
@@ -51,11 +51,23 @@ def _retry_on_res_temp_unavailable(exc):
     reraise=True)
 def convert_image(source, dest, out_format, run_as_root=False, cache=None,
                   out_of_order=False, sparse_size=None,
-                  source_format='qcow2'):
+                  source_format='qcow2', io_class=None, io_priority=None):
     # NOTE(TheJulia): If you make *any* chance to this code, you may need
     # to make an identitical or similar change to ironic-python-agent.
-    """Convert image to other format."""
-    cmd = ['qemu-img', 'convert', '-f', source_format, '-O', out_format]
+    """Convert image to other format.
+
+    :param io_class: optional I/O scheduling class for "ionice"
+        ('best-effort' or 'idle').
+    :param io_priority: optional I/O priority for the best-effort class.
+    """
+    cmd = []
+    if io_class == 'idle':
+        cmd += ['ionice', '-c', '3']
+    elif io_class == 'best-effort':
+        cmd += ['ionice', '-c', '2']
+        if io_priority is not None:
+            cmd += ['-n', str(io_priority)]
+    cmd += ['qemu-img', 'convert', '-f', source_format, '-O', out_format]
     if cache is not None:
         cmd += ['-t', cache]
     if sparse_size is not None:
@@ -677,6 +677,46 @@ def remove_large_keys(var):
         return var
 
 
+class LazyLogValue(object):
+    """A logging argument that is only computed when actually formatted.
+
+    Logging calls format their arguments only if the message is going to be
+    emitted. Wrapping an expensive transformation (such as masking passwords
+    in a large payload) in this object defers it until that point, so that it
+    costs nothing when the corresponding log level is disabled.
+
+    :param func: Callable producing the value to log.
+    :param args: Positional arguments for ``func``.
+    """
+
+    __slots__ = ('_func', '_args')
+
+    def __init__(self, func, *args):
+        self._func = func
+        self._args = args
+
+    @property
+    def value(self):
+        """Compute and return the value to log."""
+        return self._func(*self._args)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return repr(self.value)
+
+
+def mask_password_lazy(message):
+    """Mask passwords in a string only when it is logged."""
+    return LazyLogValue(strutils.mask_password, message)
+
+
+def mask_dict_password_lazy(dictionary):
+    """Mask passwords in a dictionary only when it is logged."""
+    return LazyLogValue(strutils.mask_dict_password, dictionary)
+
+
 def fast_track_enabled(node):
     is_enabled = node.driver_info.get('fast_track')
     if is_enabled is None:
@@ -13,6 +13,7 @@
 """Base conductor manager functionality."""
 
 import copy
+import functools
 import inspect
 import threading
 import time
@@ -37,6 +38,8 @@ from ironic.common import rpc
 from ironic.common import states
 from ironic.common import utils as common_utils
 from ironic.conductor import allocations
+from ironic.conductor import bmc_io
+from ironic.conductor import hooks
 from ironic.conductor import notification_utils as notify_utils
 from ironic.conductor import task_manager
 from ironic.conductor import utils
@@ -62,6 +65,7 @@ class BaseConductorManager(object):
         self._started = False
         self._shutdown = None
         self._zeroconf = None
+        self._bmc_engine = None
         self.dbapi = None
 
     def prepare_host(self):
@@ -151,6 +155,12 @@ class BaseConductorManager(object):
         self._init_executors(CONF.conductor.workers_pool_size,
                              CONF.conductor.reserved_workers_pool_percentage)
 
+        if CONF.conductor.bmc_io_max_requests:
+            self._bmc_engine = bmc_io.BMCRequestEngine(
+                CONF.conductor.bmc_io_max_requests,
+                CONF.conductor.bmc_io_max_requests_per_bmc,
+                deadline=CONF.conductor.bmc_io_deadline)
+
         # TODO(jroll) delete the use_groups argument and use the default
         # in Stein.
         self.ring_manager = hash_ring.HashRingManager(
@@ -207,6 +217,10 @@ class BaseConductorManager(object):
                 LOG.error('Failed to register hardware types. %s', e)
                 self.del_host()
 
+        # Start the services of the drivers, e.g. receiving power state
+        # events, before the periodic tasks using them
+        self._start_hooks()
+
         # Start periodic tasks
         self._periodic_tasks_worker = self._executor.submit(
             self._periodic_tasks.start, allow_empty=True)
@@ -340,6 +354,16 @@ class BaseConductorManager(object):
         # This is only used in tests currently. Delete it?
         self._periodic_task_callables = periodic_task_callables
 
+    def _start_hooks(self):
+        """Start the services registered by the drivers."""
+        try:
+            hooks.start(functools.partial(self._handle_power_event,
+                                          ironic_context.get_admin_context()))
+        except Exception as e:
+            with excutils.save_and_reraise_exception():
+                LOG.error('Failed to start the conductor hooks. %s', e)
+                self.del_host()
+
     def keepalive_halt(self):
         if not hasattr(self, '_keepalive_evt'):
             return
@@ -377,9 +401,15 @@ class BaseConductorManager(object):
         # having work complete normally.
         self._periodic_tasks.stop()
         self._periodic_tasks.wait()
+        if self._bmc_engine is not None:
+            self._bmc_engine.stop(wait=True)
+            self._bmc_engine = None
+        hooks.stop()
         if self._reserved_executor is not None:
             self._reserved_executor.shutdown(wait=True)
         self._executor.shutdown(wait=True)
+        # Write out the history records buffered by the finished workers.
+        utils.flush_node_history()
 
         if self._zeroconf is not None:
             self._zeroconf.close()
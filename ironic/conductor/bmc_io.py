@@ -0,0 +1,311 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Execution of BMC-bound requests issued by periodic tasks.
+
+Periodic tasks like the power state synchronization spend most of their
+time waiting for BMCs. Running them on the conductor workers ties up one
+worker per outstanding request, so that a few slow BMCs starve the pool.
+The engine in this module runs such requests in a dedicated pool of green
+threads instead, with a limit of concurrent requests per BMC and a
+deadline for each request to start.
+"""
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+from urllib import parse as urlparse
+
+import futurist
+from futurist import waiters
+from oslo_log import log
+
+from ironic.common import exception
+from ironic.common import metrics_utils
+
+LOG = log.getLogger(__name__)
+METRICS = metrics_utils.get_metrics_logger(__name__)
+
+
+def bmc_key(driver_info, default=None):
+    """Guess the BMC of a node from its driver_info.
+
+    :param driver_info: The driver_info of a node.
+    :param default: The value to return if no BMC address is found,
+        e.g. the node UUID, so that the node is not grouped with others.
+    :returns: The host name or address of the BMC.
+    """
+    for field in sorted(driver_info or ()):
+        value = driver_info[field]
+        if not field.endswith('_address') or not isinstance(value, str):
+            continue
+        if '://' in value:
+            host = urlparse.urlsplit(value).hostname
+        else:
+            host = value.strip()
+        if host:
+            return host
+    return default
+
+
+_Request = collections.namedtuple(
+    '_Request', ['bmc', 'key', 'future', 'submitted', 'func', 'args',
+                 'kwargs'])
+
+
+class _BMCQueue(object):
+    """The requests waiting for a BMC.
+
+    Requests whose previous attempt was cancelled are started first, those
+    cancelled for the longest time first. Other requests are started in
+    order of submission.
+    """
+
+    def __init__(self):
+        # A heap of (first cancellation time, sequence, request)
+        self.retried = []
+        self.waiting = collections.deque()
+        # The number of requests running against the BMC
+        self.running = 0
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.retried) + len(self.waiting)
+
+    def append(self, request, cancelled_at=None):
+        if cancelled_at is None:
+            self.waiting.append(request)
+        else:
+            heapq.heappush(self.retried,
+                           (cancelled_at, next(self._sequence), request))
+
+    def popleft(self):
+        if self.retried:
+            return heapq.heappop(self.retried)[2]
+        return self.waiting.popleft()
+
+    def pop_expired(self, deadline):
+        """Remove the requests submitted before the deadline."""
+        expired = [item[2] for item in self.retried
+                   if item[2].submitted < deadline]
+        if expired:
+            self.retried = [item for item in self.retried
+                            if item[2].submitted >= deadline]
+            heapq.heapify(self.retried)
+        while self.waiting and self.waiting[0].submitted < deadline:
+            expired.append(self.waiting.popleft())
+        return expired
+
+
+class BMCRequestEngine(object):
+    """Runs BMC-bound requests with per-BMC concurrency limits.
+
+    Requests wait in a queue per BMC and are only handed over to the pool
+    when their BMC has a free slot, so that the requests to a slow BMC do
+    not hold threads of the pool while waiting for it. A request whose
+    previous attempt was cancelled is started before the other requests to
+    its BMC, so that the same requests are not cancelled on every run when
+    a BMC cannot serve all of its requests within the deadline.
+
+    :param max_requests: The maximum number of requests running at once.
+    :param max_requests_per_bmc: The maximum number of requests running at
+        once against the same BMC.
+    :param deadline: The number of seconds within which a request has to
+        start, otherwise it is cancelled. 0 means no deadline.
+    """
+
+    def __init__(self, max_requests, max_requests_per_bmc, deadline=0):
+        self._executor = futurist.GreenThreadPoolExecutor(
+            max_workers=max_requests)
+        self._max_requests_per_bmc = max_requests_per_bmc
+        self._deadline = deadline
+        self._lock = threading.Lock()
+        # Maps BMCs to the queues of their requests
+        self._bmcs = {}
+        # Maps the keys of the outstanding requests to their futures
+        self._outstanding = {}
+        # Maps the keys of the requests whose last attempt was cancelled to
+        # the time of the first cancellation since they last ran
+        self._cancelled = {}
+        self._stopped = False
+
+    @property
+    def outstanding(self):
+        """The number of submitted requests that have not finished yet."""
+        return len(self._outstanding)
+
+    def submit(self, bmc, key, func, *args, **kwargs):
+        """Submit a request to a BMC.
+
+        :param bmc: The BMC the request is sent to, see bmc_key.
+        :param key: A key identifying the request, e.g. a node UUID. A
+            request is not submitted while another one with the same key
+            is outstanding.
+        :param func: The callable sending the request.
+        :returns: A future, or None if a request with the same key is
+            outstanding or if the engine is stopped.
+        """
+        future = futurist.Future()
+        request = _Request(bmc, key, future, time.monotonic(), func, args,
+                           kwargs)
+        with self._lock:
+            if self._stopped or key in self._outstanding:
+                return None
+            self._bmcs.setdefault(bmc, _BMCQueue()).append(
+                request, self._cancelled.get(key))
+            self._outstanding[key] = future
+            expired = self._dispatch(bmc)
+        future.add_done_callback(lambda fut: self._done(key))
+        self._cancel(expired)
+        return future
+
+    def _done(self, key):
+        with self._lock:
+            self._outstanding.pop(key, None)
+
+    def _expired(self, request, now):
+        return self._stopped or bool(
+            self._deadline and now - request.submitted > self._deadline)
+
+    def _dispatch(self, bmc):
+        """Start the requests to a BMC it has free slots for.
+
+        Must be called with the lock held.
+
+        :returns: The requests to cancel, since their deadline has passed.
+        """
+        bmc_queue = self._bmcs[bmc]
+        expired = []
+        now = time.monotonic()
+        while bmc_queue and bmc_queue.running < self._max_requests_per_bmc:
+            request = bmc_queue.popleft()
+            if self._expired(request, now):
+                expired.append(request)
+                self._cancelled.setdefault(request.key, now)
+            elif not request.future.cancelled():
+                bmc_queue.running += 1
+                self._cancelled.pop(request.key, None)
+                self._executor.submit(self._run, request)
+        if not bmc_queue and not bmc_queue.running:
+            del self._bmcs[bmc]
+        return expired
+
+    def _cancel(self, requests):
+        for request in requests:
+            # NOTE: the future is still pending unless the engine has been
+            # stopped meanwhile.
+            if request.future.set_running_or_notify_cancel():
+                METRICS.send_counter('BMCRequestEngine.cancelled', 1)
+                request.future.set_exception(
+                    exception.BMCRequestCancelled(bmc=request.bmc))
+
+    def _expire(self):
+        """Cancel the waiting requests whose deadline has passed."""
+        if not self._deadline:
+            return
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for bmc_queue in self._bmcs.values():
+                expired.extend(bmc_queue.pop_expired(now - self._deadline))
+            for request in expired:
+                self._cancelled.setdefault(request.key, now)
+        self._cancel(expired)
+
+    def _run(self, request):
+        # NOTE: the future only starts running once a thread of the pool is
+        # available, it can be cancelled by stop until then.
+        started = request.future.set_running_or_notify_cancel()
+        exc = result = None
+        if started and self._expired(request, time.monotonic()):
+            # All threads of the pool have been busy for too long
+            METRICS.send_counter('BMCRequestEngine.cancelled', 1)
+            exc = exception.BMCRequestCancelled(bmc=request.bmc)
+        elif started:
+            METRICS.send_timer('BMCRequestEngine.queued',
+                               (time.monotonic() - request.submitted) * 1000)
+            try:
+                result = request.func(*request.args, **request.kwargs)
+            except Exception as e:
+                exc = e
+
+        # Free the slot before reporting the result
+        with self._lock:
+            if isinstance(exc, exception.BMCRequestCancelled):
+                self._cancelled.setdefault(request.key, time.monotonic())
+            self._bmcs[request.bmc].running -= 1
+            expired = self._dispatch(request.bmc)
+        self._cancel(expired)
+        if not started:
+            return
+        if exc is not None:
+            request.future.set_exception(exc)
+        else:
+            request.future.set_result(result)
+
+    def wait(self, futures, timeout=None):
+        """Wait for submitted requests to finish.
+
+        Requests that are still running when the timeout expires are left
+        running, since the BMC is processing them anyway. Their results are
+        not reported. Requests waiting for their BMC past the deadline are
+        cancelled.
+
+        :param futures: The futures returned by submit. None values are
+            ignored.
+        :param timeout: The maximum number of seconds to wait, None to wait
+            for all requests.
+        :returns: A tuple of the sets of done and not done futures.
+        """
+        futures = [future for future in futures if future is not None]
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # Wake up at least once per deadline to cancel the requests
+            # waiting for their BMC for too long.
+            step = self._deadline or None
+            if end is not None:
+                remaining = max(0, end - time.monotonic())
+                step = remaining if step is None else min(step, remaining)
+            not_done = waiters.wait_for_all(futures, timeout=step).not_done
+            self._expire()
+            if not not_done or (end is not None
+                                and time.monotonic() >= end):
+                break
+        done = {future for future in futures if future.done()}
+        not_done = set(futures) - done
+
+        for future in done:
+            exc = future.exception()
+            if isinstance(exc, exception.BMCRequestCancelled):
+                LOG.warning('%s', exc)
+            elif exc is not None:
+                LOG.error('Unexpected error in a BMC request: %s', exc,
+                          exc_info=exc)
+        if not_done:
+            LOG.warning('%(count)d BMC requests are still running after '
+                        '%(timeout)s seconds, not waiting for them',
+                        {'count': len(not_done), 'timeout': timeout})
+        return done, not_done
+
+    def stop(self, wait=True):
+        """Stop the engine, cancelling the requests that have not started.
+
+        :param wait: Whether to wait for the running requests to finish.
+        """
+        self._stopped = True
+        with self._lock:
+            futures = list(self._outstanding.values())
+        for future in futures:
+            future.cancel()
+        self._executor.shutdown(wait=wait)
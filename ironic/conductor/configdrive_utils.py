@@ -10,8 +10,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import base64
-import gzip
+import io
 import json
 import os
 import tempfile
@@ -21,6 +20,7 @@ from oslo_config import cfg
 from oslo_log import log
 import pycdlib
 
+from ironic.common import configdrive as cd_images
 from ironic.common import exception
 from ironic.common import neutron
 
@@ -83,7 +83,7 @@ def check_and_patch_configdrive(task, configdrive):
         with tempfile.NamedTemporaryFile(dir=CONF.tempdir,
                                          mode="wb+") as fileobj:
             # We have a file, we need to extract it and get it to an temp file
-            fileobj.write(gzip.decompress(base64.b64decode(configdrive)))
+            cd_images.decode_configdrive(configdrive, fileobj)
             fileobj.flush()
             # Reset the position back to the start.
             fileobj.seek(0)
@@ -162,8 +162,9 @@ def _read_config_drive(file):
     # of the unit test code path, with the goal of just keeping things a bit
     # more simple as well.
     with open(file, "rb") as new_iso:
-        return base64.b64encode(
-            gzip.compress(new_iso.read())).decode()
+        encoded = io.StringIO()
+        cd_images.encode_configdrive(new_iso, encoded)
+        return encoded.getvalue()
 
 
 def regenerate_iso(source, dest, override_files, node_uuid=None):
@@ -529,10 +529,6 @@ def _store_configdrive(node, configdrive):
 
     """
     if CONF.deploy.configdrive_use_object_store:
-        # Don't store the JSON source in swift.
-        if isinstance(configdrive, dict):
-            configdrive = utils.build_configdrive(node, configdrive)
-
         # NOTE(lucasagomes): No reason to use a different timeout than
         # the one used for deploying the node
         timeout = (CONF.conductor.configdrive_swift_temp_url_duration
@@ -546,7 +542,12 @@ def _store_configdrive(node, configdrive):
 
         with tempfile.NamedTemporaryFile(dir=CONF.tempdir,
                                          mode="wt") as fileobj:
-            fileobj.write(configdrive)
+            # Don't store the JSON source in swift, build the configdrive
+            # straight into the uploaded file instead.
+            if isinstance(configdrive, dict):
+                utils.build_configdrive(node, configdrive, fileobj=fileobj)
+            else:
+                fileobj.write(configdrive)
             fileobj.flush()
 
             swift_api = swift.SwiftAPI()
@@ -0,0 +1,95 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Services of drivers running for the lifetime of the conductor.
+
+Some drivers need a service running as long as the conductor does rather
+than for a task, e.g. a server receiving the events of BMCs or a poller
+shared by their periodic tasks. Their modules register a ConductorHook
+when they are imported. The conductor starts the registered hooks once
+its hardware interfaces are loaded, and stops them when it stops.
+"""
+
+from oslo_log import log
+
+LOG = log.getLogger(__name__)
+
+# Maps the names of the registered hooks to the hooks, in order of
+# registration
+_HOOKS = {}
+
+
+class ConductorHook(object):
+    """A service of a driver started and stopped with the conductor."""
+
+    def start(self, power_event_handler):
+        """Start the service.
+
+        :param power_event_handler: a callable recording the power state of
+            a node reported outside of the power state sync, e.g. by an
+            event of its BMC. It accepts the node UUID, the power state,
+            None if it has to be synchronized, and an optional ``check``
+            callable, which is passed the node and returns False if the
+            power state must not be trusted for it.
+        :raises: any exception to prevent the conductor from starting.
+        """
+
+    def stop(self):
+        """Stop the service, waiting for its running work to finish.
+
+        Called even if the service has not been started.
+        """
+
+    def power_event_nodes(self):
+        """Return the UUIDs of the nodes reporting their power state changes.
+
+        The power state of these nodes is synchronized less often, see
+        ``[conductor]sync_power_state_event_interval``.
+        """
+        return frozenset()
+
+
+def register(name, hook):
+    """Register a hook, replacing any hook with the same name.
+
+    :param name: the name of the hook, e.g. the one of the driver module.
+    :param hook: a ConductorHook instance.
+    """
+    _HOOKS[name] = hook
+
+
+def start(power_event_handler):
+    """Start the registered hooks.
+
+    :param power_event_handler: see ConductorHook.start.
+    :raises: the exception of the first hook failing to start.
+    """
+    for name, hook in list(_HOOKS.items()):
+        LOG.debug('Starting conductor hook %s', name)
+        hook.start(power_event_handler)
+
+
+def stop():
+    """Stop the registered hooks, in the reverse order."""
+    for name, hook in reversed(list(_HOOKS.items())):
+        try:
+            hook.stop()
+        except Exception:
+            LOG.exception('Failed to stop conductor hook %s', name)
+
+
+def power_event_nodes():
+    """Return the UUIDs of the nodes reporting their power state changes."""
+    nodes = set()
+    for hook in list(_HOOKS.values()):
+        nodes.update(hook.power_event_nodes())
+    return frozenset(nodes)
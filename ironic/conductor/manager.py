@@ -48,6 +48,7 @@ from futurist import waiters
 from oslo_log import log
 import oslo_messaging as messaging
 from oslo_utils import excutils
+from oslo_utils import strutils
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
@@ -60,15 +61,19 @@ from ironic.common.i18n import _
 from ironic.common import metrics_utils
 from ironic.common import network
 from ironic.common import nova
+from ironic.common import pxe_utils
 from ironic.common import rpc
 from ironic.common import states
 from ironic.conductor import allocations
 from ironic.conductor import base_manager
+from ironic.conductor import bmc_io
 from ironic.conductor import cleaning
 from ironic.conductor import deployments
+from ironic.conductor import hooks
 from ironic.conductor import inspection
 from ironic.conductor import notification_utils as notify_utils
 from ironic.conductor import periodics
+from ironic.conductor import power_sync
 from ironic.conductor import servicing
 from ironic.conductor import steps as conductor_steps
 from ironic.conductor import task_manager
@@ -91,6 +96,14 @@ METRICS = metrics_utils.get_metrics_logger(__name__)
 SYNC_EXCLUDED_STATES = (states.DEPLOYWAIT, states.CLEANWAIT, states.ENROLL,
                         states.ADOPTFAIL)
 
+# The fields of a node needed to decide if a heartbeat has to be processed.
+_HeartbeatNodeView = collections.namedtuple(
+    '_HeartbeatNodeView', ['uuid', 'provision_state', 'reservation',
+                           'driver_internal_info'])
+
+# Number of nodes above which the expired heartbeat records are pruned.
+_HEARTBEAT_RECORDS_PRUNE_SIZE = 1024
+
 
 class ConductorManager(base_manager.BaseConductorManager):
     """Ironic Conductor manager main class."""
@@ -107,6 +120,10 @@ class ConductorManager(base_manager.BaseConductorManager):
         # NOTE(TheJulia): This is less a metric-able count, but a means to
         # sort out nodes and prioritise a subset (of non-responding nodes).
         self.power_state_sync_count = collections.defaultdict(int)
+        self._power_sync_scheduler = power_sync.PowerSyncScheduler()
+        # Node UUID to the time and arguments of the last heartbeat for
+        # which a task was taken, used to coalesce repeated heartbeats.
+        self._heartbeat_records = {}
 
     @METRICS.timer('ConductorManager._clean_up_caches')
     @periodics.periodic(spacing=CONF.conductor.cache_clean_up_interval,
@@ -114,6 +131,64 @@ class ConductorManager(base_manager.BaseConductorManager):
     def _clean_up_caches(self, context):
         image_cache.clean_up_all()
 
+    @METRICS.timer('ConductorManager._prewarm_image_caches')
+    @periodics.periodic(spacing=CONF.conductor.image_prewarm_interval,
+                        enabled=CONF.conductor.image_prewarm_interval > 0)
+    def _prewarm_image_caches(self, context):
+        """Periodic task to download commonly used images in advance."""
+        images_queue = queue.Queue()
+        deploy_images = set(
+            [CONF.conductor.deploy_kernel, CONF.conductor.deploy_ramdisk]
+            + list(CONF.conductor.deploy_kernel_by_arch.values())
+            + list(CONF.conductor.deploy_ramdisk_by_arch.values()))
+        # NOTE: the images have to be converted exactly as the deployments
+        # do, otherwise they would miss the pre-warmed master copies.
+        tftp_cache = pxe_utils.TFTPImageCache()
+        for href in sorted(filter(None, deploy_images)):
+            images_queue.put((tftp_cache, href, CONF.force_raw_images))
+        # NOTE: instance images are only cached by the direct deploy, see
+        # deploy_utils.direct_deploy_should_convert_raw_image. Should the
+        # conversion ever depend on the node, they could not be pre-warmed.
+        instance_cache = deploy_utils.InstanceImageCache()
+        instance_force_raw = (CONF.force_raw_images
+                              and CONF.agent.stream_raw_images)
+        for href in CONF.conductor.image_prewarm_images:
+            images_queue.put((instance_cache, href, instance_force_raw))
+
+        total = images_queue.qsize()
+        number_of_workers = min(CONF.conductor.image_prewarm_workers,
+                                CONF.conductor.periodic_max_workers,
+                                total)
+        futures = []
+        start = time.monotonic()
+        for worker_number in range(max(0, number_of_workers - 1)):
+            try:
+                futures.append(
+                    self._spawn_worker(image_cache.prewarm_images,
+                                       context, images_queue))
+            except exception.NoFreeConductorWorker:
+                LOG.warning("There are no more conductor workers for "
+                            "image pre-warming. %(workers)d workers have "
+                            "been already spawned.",
+                            {'workers': worker_number})
+                break
+
+        try:
+            results = [image_cache.prewarm_images(context, images_queue)]
+        finally:
+            waiters.wait_for_all(futures)
+        results.extend(f.result() for f in futures if not f.exception())
+
+        fetched = sum(r[0] for r in results)
+        size = sum(r[1] for r in results)
+        elapsed = max(time.monotonic() - start, 0.001)
+        LOG.debug('Completed image cache pre-warming: %(fetched)d of '
+                  '%(total)d image(s) fetched, %(size)d bytes in '
+                  '%(elapsed).1f seconds (%(rate).1f MiB/s)',
+                  {'fetched': fetched, 'total': total, 'size': size,
+                   'elapsed': elapsed,
+                   'rate': size / elapsed / 1024 / 1024})
+
     @METRICS.timer('ConductorManager.create_node')
     # No need to add these since they are subclasses of InvalidParameterValue:
     #     InterfaceNotFoundInEntrypoint
@@ -1538,10 +1613,33 @@ class ConductorManager(base_manager.BaseConductorManager):
     def _sync_power_states(self, context):
         """Periodic task to sync power states for the nodes."""
         filters = {'maintenance': False}
+        fields = ['id']
+        if self._bmc_engine is not None:
+            fields.append('driver_info')
+        subscribed = hooks.power_event_nodes()
+        adaptive = self._power_sync_scheduler.enabled or bool(subscribed)
+        if adaptive:
+            fields.append('updated_at')
+
+        nodes = list(self.iter_nodes(fields=fields, filters=filters))
+        node_count = len(nodes)
+        if adaptive:
+            due = self._power_sync_scheduler.due_nodes(
+                ((node_info[0], node_info[-1]) for node_info in nodes),
+                subscribed=subscribed)
+            nodes = [node_info for node_info in nodes if node_info[0] in due]
+            METRICS.send_gauge('ConductorManager.PowerSyncDueNodesCount',
+                               len(nodes))
+
+        if self._bmc_engine is not None:
+            self._sync_power_states_with_engine(context, nodes)
+            METRICS.send_gauge('ConductorManager.PowerSyncNodesCount',
+                               node_count)
+            return
 
         # NOTE(etingof): prioritize non-responding nodes to fail them fast
         nodes = sorted(
-            self.iter_nodes(fields=['id'], filters=filters),
+            nodes,
             key=lambda n: -self.power_state_sync_count.get(n[0], 0)
         )
 
@@ -1576,11 +1674,42 @@ class ConductorManager(base_manager.BaseConductorManager):
         # report a count of the nodes
         METRICS.send_gauge(
             'ConductorManager.PowerSyncNodesCount',
-            len(nodes))
+            node_count)
 
         LOG.debug('Completed power state sync operation, evaluated %s '
                   'nodes.', len(futures))
 
+    def _sync_power_states_with_engine(self, context, nodes):
+        """Sync power states of nodes through the BMC request engine.
+
+        Unlike the conductor workers, each of which handles a share of the
+        nodes one after another, the engine runs a request per node with a
+        limit of concurrent requests per BMC, so that a slow BMC only
+        delays its own nodes.
+
+        :param context: an admin context.
+        :param nodes: a list of tuples (node UUID, driver, conductor group,
+            node ID, driver_info, ...) as returned by iter_nodes.
+        """
+        nodes = sorted(nodes,
+                       key=lambda n: -self.power_state_sync_count.get(n[0], 0))
+        futures = []
+        for node_info in nodes:
+            if self._shutdown:
+                break
+            node_uuid, driver_info = node_info[0], node_info[4]
+            futures.append(self._bmc_engine.submit(
+                bmc_io.bmc_key(driver_info, default=node_uuid), node_uuid,
+                self._sync_power_state_node, context, node_uuid))
+
+        # Requests still outstanding at the next run are not submitted
+        # again, so there is no point in waiting longer than the interval.
+        timeout = CONF.conductor.sync_power_state_interval or None
+        done, not_done = self._bmc_engine.wait(futures, timeout=timeout)
+        LOG.debug('Completed power state sync operation through the BMC '
+                  'request engine, %(done)d nodes evaluated, %(left)d still '
+                  'in progress.', {'done': len(done), 'left': len(not_done)})
+
     def _sync_power_state_nodes_task(self, context, nodes):
         """Invokes power state sync on nodes from synchronized queue.
 
@@ -1615,51 +1744,150 @@ class ConductorManager(base_manager.BaseConductorManager):
         while not self._shutdown:
             try:
                 (node_uuid, driver, conductor_group,
-                 node_id) = nodes.get_nowait()
+                 node_id, *_) = nodes.get_nowait()
             except queue.Empty:
                 break
 
             try:
-                # NOTE(dtantsur): start with a shared lock, upgrade if needed
-                with task_manager.acquire(context, node_uuid,
-                                          purpose='power state sync',
-                                          shared=True) as task:
-                    # NOTE(tenbrae): we should not acquire a lock on a node in
-                    #             DEPLOYWAIT/CLEANWAIT, as this could cause
-                    #             an error within a deploy ramdisk POSTing back
-                    #             at the same time.
-                    # NOTE(dtantsur): it's also pointless (and dangerous) to
-                    # sync power state when a power action is in progress
-                    if (task.node.provision_state in SYNC_EXCLUDED_STATES
-                            or task.node.maintenance
-                            or task.node.target_power_state
-                            or task.node.reservation):
-                        continue
-                    count = do_sync_power_state(
-                        task, self.power_state_sync_count[node_uuid])
-                    if count:
-                        self.power_state_sync_count[node_uuid] = count
-                    else:
-                        # don't bloat the dict with non-failing nodes
-                        del self.power_state_sync_count[node_uuid]
-            except exception.NodeNotFound:
-                LOG.info("During sync_power_state, node %(node)s was not "
-                         "found and presumed deleted by another process.",
-                         {'node': node_uuid})
-                # TODO(TheJulia): The chance exists that we orphan a node
-                # in power_state_sync_count, albeit it is not much data,
-                # it could eventually cause the memory footprint to grow
-                # on an exceptionally large ironic deployment. We should
-                # make sure we clean it up at some point, but overall given
-                # minimal impact, it is definite low hanging fruit.
-            except exception.NodeLocked:
-                LOG.info("During sync_power_state, node %(node)s was "
-                         "already locked by another process. Skip.",
-                         {'node': node_uuid})
+                self._sync_power_state_node(context, node_uuid)
             finally:
                 # Yield on every iteration
                 time.sleep(0)
 
+    def _sync_power_state_node(self, context, node_uuid):
+        """Invokes power state sync on a single node.
+
+        See _sync_power_state_nodes_task for the conditions.
+
+        :param context: an admin context.
+        :param node_uuid: the UUID of the node.
+        """
+        try:
+            # NOTE(dtantsur): start with a shared lock, upgrade if needed
+            with task_manager.acquire(context, node_uuid,
+                                      purpose='power state sync',
+                                      shared=True) as task:
+                # NOTE(tenbrae): we should not acquire a lock on a node in
+                #             DEPLOYWAIT/CLEANWAIT, as this could cause
+                #             an error within a deploy ramdisk POSTing back
+                #             at the same time.
+                # NOTE(dtantsur): it's also pointless (and dangerous) to
+                # sync power state when a power action is in progress
+                if (task.node.provision_state in SYNC_EXCLUDED_STATES
+                        or task.node.maintenance
+                        or task.node.target_power_state
+                        or task.node.reservation):
+                    self._power_sync_scheduler.record(
+                        node_uuid, False, task.node.updated_at)
+                    return
+                power_state = task.node.power_state
+                count = do_sync_power_state(
+                    task, self.power_state_sync_count[node_uuid])
+                if count:
+                    self.power_state_sync_count[node_uuid] = count
+                else:
+                    # don't bloat the dict with non-failing nodes
+                    del self.power_state_sync_count[node_uuid]
+                self._power_sync_scheduler.record(
+                    node_uuid,
+                    not count and power_state is not None
+                    and task.node.power_state == power_state,
+                    task.node.updated_at)
+        except exception.NodeNotFound:
+            LOG.info("During sync_power_state, node %(node)s was not "
+                     "found and presumed deleted by another process.",
+                     {'node': node_uuid})
+            # TODO(TheJulia): The chance exists that we orphan a node
+            # in power_state_sync_count, albeit it is not much data,
+            # it could eventually cause the memory footprint to grow
+            # on an exceptionally large ironic deployment. We should
+            # make sure we clean it up at some point, but overall given
+            # minimal impact, it is definite low hanging fruit.
+        except exception.NodeLocked:
+            LOG.info("During sync_power_state, node %(node)s was "
+                     "already locked by another process. Skip.",
+                     {'node': node_uuid})
+
+    def _handle_power_event(self, context, node_uuid, power_state,
+                            check=None):
+        """Record the power state reported by an event of a node's BMC.
+
+        Events which do not report a power state, which may require
+        changing the power state of the hardware or which cannot be trusted
+        for the node, e.g. because they originate from another system than
+        the node's, trigger a regular power state sync of the node. The same
+        conditions as for the sync apply.
+
+        :param context: an admin context.
+        :param node_uuid: the UUID of the node.
+        :param power_state: the reported power state, None if unknown.
+        :param check: an optional callable, which is passed the node and
+            returns False if the power state must not be trusted for it.
+        """
+        if (power_state is None
+                or CONF.conductor.force_power_state_during_sync):
+            self._sync_power_state_node(context, node_uuid)
+            return
+
+        try:
+            with task_manager.acquire(context, node_uuid,
+                                      purpose='power state event',
+                                      shared=True) as task:
+                if check is None or check(task.node):
+                    self._record_power_event(task, power_state)
+                    return
+        except (exception.NodeNotFound, exception.NodeLocked) as e:
+            # A power action holding the lock records the new power state
+            # itself, other changes are caught by the sync.
+            LOG.debug("Ignoring the power state event of node %(node)s: "
+                      "%(error)s", {'node': node_uuid, 'error': e})
+            return
+
+        # NOTE: e.g. a BMC managing several systems reports the events of
+        # all of them.
+        LOG.debug("Power state event of node %(node)s cannot be trusted for "
+                  "it, syncing its power state instead.", {'node': node_uuid})
+        self._sync_power_state_node(context, node_uuid)
+
+    def _record_power_event(self, task, power_state):
+        """Record the power state reported by an event under a lock.
+
+        :param task: a TaskManager instance with a shared lock, upgraded if
+            the power state has to be recorded.
+        :param power_state: the reported power state.
+        :raises: NodeLocked if the lock cannot be upgraded.
+        """
+        node = task.node
+        if (node.provision_state in SYNC_EXCLUDED_STATES
+                or node.maintenance
+                or node.target_power_state
+                or node.reservation
+                or node.power_state == power_state):
+            return
+
+        task.upgrade_lock()
+        node = task.node
+        # Repeat the checks with the exclusive lock
+        if (node.provision_state in SYNC_EXCLUDED_STATES
+                or node.maintenance
+                or node.target_power_state
+                or node.power_state == power_state):
+            return
+
+        LOG.info("Node %(node)s reported power state '%(actual)s' "
+                 "through an event, updating recorded state "
+                 "'%(state)s'.",
+                 {'node': node.uuid, 'actual': power_state,
+                  'state': node.power_state})
+        old_power_state = node.power_state
+        node.power_state = power_state
+        node.save()
+        if node.instance_uuid:
+            nova.power_update(
+                task.context, node.instance_uuid, node.power_state)
+        notify_utils.emit_power_state_corrected_notification(
+            task, old_power_state)
+
     @METRICS.timer('ConductorManager._power_failure_recovery')
     @periodics.node_periodic(
         purpose='power failure recovery',
@@ -3339,6 +3567,12 @@ class ConductorManager(base_manager.BaseConductorManager):
                 _('Agent did not transmit a version, and a version is '
                   'required. Please update the agent being used.'))
 
+        arguments = (callback_url, agent_version, agent_verify_ca,
+                     agent_status, agent_status_message)
+        if not self._heartbeat_needs_task(context, node_id, agent_token,
+                                          arguments):
+            return
+
         # NOTE(dtantsur): we acquire a shared lock to begin with, drivers are
         # free to promote it to an exclusive one.
         with task_manager.acquire(context, node_id, shared=True,
@@ -3373,6 +3607,93 @@ class ConductorManager(base_manager.BaseConductorManager):
                 # NOTE(dtantsur): heartbeats are not that critical to allow
                 # them to potentially overload the conductor.
                 _allow_reserved_pool=False)
+            node_uuid = task.node.uuid
+            provision_state = task.node.provision_state
+
+        # NOTE: only heartbeats handed over to a worker are recorded, so
+        # that a heartbeat failing with NodeLocked or NoFreeConductorWorker
+        # does not suppress the next one.
+        self._record_heartbeat(node_uuid, provision_state, arguments)
+
+    def _heartbeat_needs_task(self, context, node_id, agent_token,
+                              arguments):
+        """Check if a heartbeat has to be processed with a task.
+
+        The node is loaded without its driver, and heartbeats which would
+        not cause any action are suppressed before acquiring it: heartbeats
+        for nodes locked by another task and, if
+        [conductor]heartbeat_coalesce_window is set, repeated heartbeats
+        with the same arguments in the same provision state. Whether the
+        provision state accepts heartbeats is left to the deploy interface.
+
+        :param context: request context.
+        :param node_id: node id or uuid.
+        :param agent_token: the agent token of the heartbeat.
+        :param arguments: a tuple with the other arguments of the heartbeat.
+        :raises: InvalidParameterValue if the agent token is invalid.
+        :returns: False if the heartbeat is suppressed, otherwise True.
+        """
+        if uuidutils.is_uuid_like(node_id):
+            filters = {'uuid': node_id}
+        elif strutils.is_int_like(node_id):
+            filters = {'id': int(node_id)}
+        else:
+            return True
+        nodes = self.dbapi.get_nodeinfo_list(
+            columns=list(_HeartbeatNodeView._fields), filters=filters)
+        if not nodes:
+            # NOTE: acquiring the node raises NodeNotFound.
+            return True
+        node = _HeartbeatNodeView(*nodes[0])
+
+        if not utils.is_agent_token_valid(node, agent_token):
+            LOG.error('Invalid or missing agent_token received for '
+                      'node %(node)s', {'node': node_id})
+            raise exception.InvalidParameterValue(
+                'Invalid or missing agent token received.')
+
+        reason = None
+        window = CONF.conductor.heartbeat_coalesce_window
+        if node.reservation:
+            LOG.debug('Node %s is currently locked, skipping heartbeat '
+                      'processing (will retry on the next heartbeat)',
+                      node.uuid)
+            reason = 'locked'
+        elif window:
+            now = time.monotonic()
+            last = self._heartbeat_records.get(node.uuid)
+            if (last is not None
+                    and last[1] == (node.provision_state,) + tuple(arguments)
+                    and now - last[0] < window):
+                LOG.debug('Coalescing heartbeat from node %(node)s with the '
+                          'heartbeat processed %(age).1f seconds ago',
+                          {'node': node.uuid, 'age': now - last[0]})
+                reason = 'coalesced'
+
+        if reason is not None:
+            METRICS.send_counter(
+                'ConductorManager.heartbeat.suppressed.%s' % reason, 1)
+            return False
+        return True
+
+    def _record_heartbeat(self, node_uuid, provision_state, arguments):
+        """Record a heartbeat handed over to a worker for coalescing.
+
+        :param node_uuid: the UUID of the node.
+        :param provision_state: the provision state the heartbeat was
+            processed in.
+        :param arguments: a tuple with the other arguments of the heartbeat.
+        """
+        window = CONF.conductor.heartbeat_coalesce_window
+        if not window:
+            return
+        now = time.monotonic()
+        if len(self._heartbeat_records) > _HEARTBEAT_RECORDS_PRUNE_SIZE:
+            for uuid, record in list(self._heartbeat_records.items()):
+                if now - record[0] >= window:
+                    self._heartbeat_records.pop(uuid, None)
+        self._heartbeat_records[node_uuid] = (
+            now, (provision_state,) + tuple(arguments))
 
     @METRICS.timer('ConductorManager.vif_list')
     @messaging.expected_exceptions(exception.NetworkError,
@@ -3780,6 +4101,14 @@ class ConductorManager(base_manager.BaseConductorManager):
             LOG.error('Encountered error while cleaning node '
                       'history records: %s', e)
 
+    @METRICS.timer('ConductorManager._flush_node_history')
+    @periodics.periodic(
+        spacing=CONF.conductor.node_history_flush_interval,
+        enabled=CONF.conductor.node_history_buffer_size > 0)
+    def _flush_node_history(self, context):
+        """Periodic task to write buffered node history records."""
+        utils.flush_node_history()
+
     def _manage_node_history(self, context):
         """Periodic task to keep the node history tidy."""
         max_batch = CONF.conductor.node_history_cleanup_batch_count
@@ -0,0 +1,149 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Scheduling of the power state synchronization of nodes.
+
+When ``[conductor]sync_power_state_max_interval`` is larger than
+``[conductor]sync_power_state_interval``, nodes whose power state is
+stable are synchronized less and less often, skipping up to the maximum
+interval. Nodes which are new to the conductor, were updated since their
+last synchronization, failed it, or had their power state corrected are
+synchronized on every run.
+
+Nodes whose BMC sends power state events to the conductor are synchronized
+as a safety net only, their interval growing up to
+``[conductor]sync_power_state_event_interval`` instead.
+
+Intervals are counted in runs of the power state synchronization rather
+than in seconds, so that a node is never delayed by a run happening a bit
+earlier than the previous one plus its interval.
+"""
+
+import heapq
+import threading
+
+from ironic.conf import CONF
+
+
+def _normalize(updated_at):
+    # Node objects have timezone-aware timestamps, database rows do not
+    if updated_at is not None and updated_at.tzinfo is not None:
+        updated_at = updated_at.replace(tzinfo=None)
+    return updated_at
+
+
+class _Entry(object):
+
+    __slots__ = ('due', 'interval', 'updated_at', 'subscribed')
+
+    def __init__(self, due, updated_at):
+        self.due = due
+        self.interval = 1
+        self.updated_at = updated_at
+        self.subscribed = False
+
+
+class PowerSyncScheduler(object):
+    """Selects the nodes due for a power state synchronization."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._run = 0
+        # Maps node UUIDs to entries
+        self._entries = {}
+        # Heap of (due run, node UUID), entries whose due run has changed
+        # since they were pushed are skipped when popped.
+        self._queue = []
+
+    @property
+    def enabled(self):
+        """Whether nodes are synchronized on an adaptive interval."""
+        return (CONF.conductor.sync_power_state_max_interval
+                > CONF.conductor.sync_power_state_interval > 0)
+
+    def _max_interval(self, subscribed):
+        max_interval = CONF.conductor.sync_power_state_max_interval
+        if subscribed:
+            max_interval = max(max_interval,
+                               CONF.conductor.sync_power_state_event_interval)
+        return max(1, max_interval // CONF.conductor.sync_power_state_interval)
+
+    def _schedule(self, node_uuid, entry, due):
+        entry.due = due
+        heapq.heappush(self._queue, (due, node_uuid))
+
+    def due_nodes(self, nodes, subscribed=frozenset()):
+        """Start a run and return the nodes due for a synchronization.
+
+        :param nodes: an iterable of tuples (node UUID, updated_at) for all
+            nodes of the conductor which are candidates for a
+            synchronization. Entries of nodes not in it are forgotten.
+        :param subscribed: a set of UUIDs of nodes whose power state
+            changes are reported by events.
+        :returns: a set of node UUIDs.
+        """
+        with self._lock:
+            self._run += 1
+            current = {node_uuid: _normalize(updated_at)
+                       for node_uuid, updated_at in nodes}
+            for node_uuid in list(self._entries):
+                if node_uuid not in current:
+                    del self._entries[node_uuid]
+
+            for node_uuid, updated_at in current.items():
+                entry = self._entries.get(node_uuid)
+                if entry is None:
+                    entry = self._entries[node_uuid] = _Entry(self._run,
+                                                              updated_at)
+                    self._schedule(node_uuid, entry, self._run)
+                elif (entry.updated_at != updated_at
+                        or (entry.subscribed and node_uuid not in subscribed)):
+                    # Updated, e.g. by a power action, or no longer reporting
+                    # events, poll it at the base rate again.
+                    entry.updated_at = updated_at
+                    entry.interval = 1
+                    if entry.due > self._run:
+                        self._schedule(node_uuid, entry, self._run)
+                entry.subscribed = node_uuid in subscribed
+
+            due = set()
+            while self._queue and self._queue[0][0] <= self._run:
+                due_run, node_uuid = heapq.heappop(self._queue)
+                entry = self._entries.get(node_uuid)
+                if (entry is None or entry.due != due_run
+                        or node_uuid in due):
+                    continue
+                due.add(node_uuid)
+                # Until the result is recorded, e.g. if the node is locked
+                self._schedule(node_uuid, entry, self._run + 1)
+            return due
+
+    def record(self, node_uuid, stable, updated_at):
+        """Record the result of the synchronization of a node.
+
+        :param node_uuid: the node UUID.
+        :param stable: whether the power state was fetched and matched the
+            recorded one.
+        :param updated_at: the updated_at field of the node after the
+            synchronization.
+        """
+        with self._lock:
+            entry = self._entries.get(node_uuid)
+            if entry is None:
+                return
+            entry.updated_at = _normalize(updated_at)
+            if stable:
+                entry.interval = min(entry.interval * 2,
+                                     self._max_interval(entry.subscribed))
+            else:
+                entry.interval = 1
+            self._schedule(node_uuid, entry, self._run + entry.interval)
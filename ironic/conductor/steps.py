@@ -11,6 +11,7 @@
 #    under the License.
 
 import collections
+import copy
 import time
 
 from oslo_config import cfg
@@ -18,11 +19,13 @@ from oslo_log import log
 
 from ironic.common import exception
 from ironic.common.i18n import _
+from ironic.common import metrics_utils
 from ironic.common import states
 from ironic.conductor import utils
 from ironic.objects import deploy_template
 
 LOG = log.getLogger(__name__)
+METRICS = metrics_utils.get_metrics_logger(__name__)
 CONF = cfg.CONF
 
 
@@ -143,6 +146,26 @@ def find_step(steps, step):
     return next((x for x in steps if is_equivalent(x, step)), None)
 
 
+def _apply_priority_overrides(steps, prio_overrides):
+    """Return copies of the steps with priority overrides applied.
+
+    :param steps: An iterable of step dictionaries.
+    :param prio_overrides: An optional dictionary of priority overrides in
+        the form {'<interface>.<step>': '<priority>'}.
+    :returns: A list of new step dictionaries.
+    """
+    result = []
+    for step in steps:
+        step = dict(step)
+        if prio_overrides:
+            override_key = '%(interface)s.%(step)s' % step
+            override_value = prio_overrides.get(override_key)
+            if override_value:
+                step['priority'] = int(override_value)
+        result.append(step)
+    return result
+
+
 def _get_steps(task, interfaces, get_method, enabled=False,
                sort_step_key=None, prio_overrides=None):
     """Get steps for task.node.
@@ -174,16 +197,11 @@ def _get_steps(task, interfaces, get_method, enabled=False,
         if interface:
             # NOTE(janders) get all steps to start with, regardless of whether
             # enabled is True and priority is zero or not; we need to apply
-            # priority overrides prior to filtering out disabled steps
-            interface_steps = [x for x in getattr(interface, get_method)(task)]
-            steps.extend(interface_steps)
-    # Iterate over steps to apply prio overrides if set
-    if prio_overrides is not None:
-        for step in steps:
-            override_key = '%(interface)s.%(step)s' % step
-            override_value = prio_overrides.get(override_key)
-            if override_value:
-                step["priority"] = int(override_value)
+            # priority overrides prior to filtering out disabled steps.
+            # The overrides are applied to copies, the interfaces return the
+            # lists they store.
+            steps.extend(_apply_priority_overrides(
+                getattr(interface, get_method)(task), prio_overrides))
     # NOTE(janders) If enabled is set to True, we filter out steps with zero
     # priority now, after applying priority overrides
     if enabled:
@@ -344,6 +362,118 @@ def set_node_cleaning_steps(task, disable_ramdisk=False,
     node.save()
 
 
+_CleaningPlan = collections.namedtuple(
+    '_CleaningPlan', ['internal_info', 'steps', 'stored_at'])
+
+# Automated cleaning plans shared by similar nodes, keyed by (hardware type,
+# interfaces, agent version, priority overrides). The cache is bounded, the
+# least recently stored plans are dropped first.
+_CLEANING_PLANS = {}
+_CLEANING_PLANS_SIZE = 256
+
+# The driver_internal_info fields which, together with the clean steps,
+# make up a cleaning plan.
+_CLEANING_PLAN_FIELDS = ('agent_cached_clean_steps',
+                         'hardware_manager_version')
+
+
+def _cleaning_plan_key(task):
+    node = task.node
+    agent_version = node.driver_internal_info.get('agent_version')
+    if not agent_version:
+        return None
+    overrides = {}
+    for element in CONF.conductor.clean_step_priority_override or ():
+        overrides.update(element)
+    return (node.driver,
+            tuple(node.get_interface(iface)
+                  for iface in sorted(CLEANING_INTERFACE_PRIORITY)),
+            agent_version,
+            frozenset(overrides.items()))
+
+
+def save_cleaning_plan(task):
+    """Cache the automated cleaning plan of a node for similar nodes.
+
+    Must be called once the in-band steps have been cached and the clean
+    steps have been set by set_node_cleaning_steps for automated cleaning.
+    Does nothing unless [conductor]cleaning_plan_cache_ttl is set.
+
+    :param task: A TaskManager object
+    """
+    if not CONF.conductor.cleaning_plan_cache_ttl:
+        return
+    key = _cleaning_plan_key(task)
+    info = task.node.driver_internal_info
+    if key is None or not info.get('agent_cached_clean_steps'):
+        return
+
+    _CLEANING_PLANS.pop(key, None)
+    _CLEANING_PLANS[key] = _CleaningPlan(
+        {field: copy.deepcopy(info.get(field))
+         for field in _CLEANING_PLAN_FIELDS},
+        copy.deepcopy(info.get('clean_steps')), time.monotonic())
+    while len(_CLEANING_PLANS) > _CLEANING_PLANS_SIZE:
+        # NOTE: dictionaries keep the insertion order.
+        del _CLEANING_PLANS[next(iter(_CLEANING_PLANS))]
+    LOG.debug('Cached the automated cleaning plan of node %(node)s for '
+              'hardware type %(hw_type)s and agent version %(version)s',
+              {'node': task.node.uuid, 'hw_type': key[0],
+               'version': key[2]})
+    METRICS.send_gauge('CleaningPlan.cached', len(_CLEANING_PLANS))
+
+
+def restore_cleaning_plan(task):
+    """Set up a node for automated cleaning with the plan of a similar node.
+
+    A plan cached by save_cleaning_plan less than
+    [conductor]cleaning_plan_cache_ttl seconds ago is looked up for the
+    hardware type, interfaces, agent version and clean step priority
+    overrides of the node. If one is found, its in-band steps and clean
+    steps are set on the node, so that neither the agent nor the driver
+    interfaces have to be asked for their steps.
+
+    :param task: A TaskManager object
+    :returns: True if the node has been set up with a cached plan, False
+        if the steps have to be set up as usual.
+    """
+    ttl = CONF.conductor.cleaning_plan_cache_ttl
+    if not ttl:
+        return False
+    key = _cleaning_plan_key(task)
+    plan = _CLEANING_PLANS.get(key) if key is not None else None
+    if plan is None or time.monotonic() - plan.stored_at > ttl:
+        METRICS.send_counter('CleaningPlan.miss', 1)
+        return False
+
+    node = task.node
+    for field, value in plan.internal_info.items():
+        node.set_driver_internal_info(field, copy.deepcopy(value))
+    node.timestamp_driver_internal_info('agent_cached_clean_steps_refreshed')
+    node.clean_step = {}
+    node.set_driver_internal_info('clean_steps', copy.deepcopy(plan.steps))
+    node.set_driver_internal_info('clean_step_index', None)
+    node.save()
+    LOG.debug('Using the cached automated cleaning plan for node %(node)s: '
+              '%(steps)s', {'node': node.uuid, 'steps': plan.steps})
+    METRICS.send_counter('CleaningPlan.hit', 1)
+    return True
+
+
+def discard_cleaning_plan(task):
+    """Discard the cached automated cleaning plan matching a node.
+
+    :param task: A TaskManager object
+    """
+    key = _cleaning_plan_key(task)
+    if key is not None and _CLEANING_PLANS.pop(key, None) is not None:
+        LOG.info('Discarded the cached automated cleaning plan for hardware '
+                 'type %(hw_type)s and agent version %(version)s after a '
+                 'mismatch on node %(node)s',
+                 {'node': task.node.uuid, 'hw_type': key[0],
+                  'version': key[2]})
+
+
 def _get_deployment_templates(task):
     """Get deployment templates for task.node.
 
@@ -15,11 +15,13 @@
 import contextlib
 import datetime
 import functools
+import io
 import os
 import secrets
+import tempfile
+import threading
 import time
 
-from openstack.baremetal import configdrive as os_configdrive
 from oslo_config import cfg
 from oslo_log import log
 from oslo_serialization import jsonutils
@@ -31,10 +33,12 @@ from oslo_utils import timeutils
 
 from ironic.common import async_steps
 from ironic.common import boot_devices
+from ironic.common import configdrive as cd_images
 from ironic.common import exception
 from ironic.common import faults
 from ironic.common.i18n import _
 from ironic.common import images
+from ironic.common import metrics_utils
 from ironic.common import network
 from ironic.common import nova
 from ironic.common import states
@@ -46,6 +50,7 @@ from ironic.objects import node_history
 
 LOG = log.getLogger(__name__)
 CONF = cfg.CONF
+METRICS = metrics_utils.get_metrics_logger(__name__)
 
 
 PASSWORD_HASH_FORMAT = {
@@ -1166,8 +1171,8 @@ def power_state_for_network_configuration(task):
 
 
 # NOTE(TheJulia): Move this to configdrive_utils at some point in the future.
-def build_configdrive(node, configdrive):
-    """Build a configdrive from provided meta_data, network_data and user_data.
+def build_configdrive_image(node, configdrive, dest):
+    """Write a configdrive ISO image from the provided data.
 
     If uuid or name are not provided in the meta_data, they're defaulted to the
     node's uuid and name accordingly.
@@ -1175,7 +1180,8 @@ def build_configdrive(node, configdrive):
     :param node: an Ironic node object.
     :param configdrive: A configdrive as a dict with keys ``meta_data``,
         ``network_data``, ``user_data`` and ``vendor_data`` (all optional).
-    :returns: A gzipped and base64 encoded configdrive as a string.
+    :param dest: The path of the file to write the image to.
+    :raises: ImageCreationFailed if the image cannot be created.
     """
     meta_data = configdrive.setdefault('meta_data', {})
     meta_data.setdefault('uuid', node.uuid)
@@ -1189,9 +1195,37 @@ def build_configdrive(node, configdrive):
         user_data = user_data.encode('utf-8')
 
     LOG.debug('Building a configdrive for node %s', node.uuid)
-    return os_configdrive.build(meta_data, user_data=user_data,
-                                network_data=configdrive.get('network_data'),
-                                vendor_data=configdrive.get('vendor_data'))
+    cd_images.write_configdrive_image(
+        dest, meta_data, user_data=user_data,
+        network_data=configdrive.get('network_data'),
+        vendor_data=configdrive.get('vendor_data'))
+
+
+def build_configdrive(node, configdrive, fileobj=None):
+    """Build a configdrive from provided meta_data, network_data and user_data.
+
+    The image is built in a temporary file and encoded in chunks, so that
+    only the encoded result is held in memory, or nothing at all if it is
+    written to ``fileobj``.
+
+    :param node: an Ironic node object.
+    :param configdrive: A configdrive as a dict with keys ``meta_data``,
+        ``network_data``, ``user_data`` and ``vendor_data`` (all optional).
+    :param fileobj: A text file object to write the configdrive to instead
+        of returning it.
+    :raises: ImageCreationFailed if the image cannot be created.
+    :returns: A gzipped and base64 encoded configdrive as a string or None
+        if ``fileobj`` is provided.
+    """
+    with tempfile.NamedTemporaryFile(dir=CONF.tempdir,
+                                     suffix='.iso') as image_file:
+        build_configdrive_image(node, configdrive, image_file.name)
+        if fileobj is not None:
+            cd_images.encode_configdrive(image_file, fileobj)
+            return
+        encoded = io.StringIO()
+        cd_images.encode_configdrive(image_file, encoded)
+        return encoded.getvalue()
 
 
 # NOTE(TheJulia): Move this to configdrive_utils at some point in the future.
@@ -1797,13 +1831,83 @@ def node_history_record(node, conductor=None, event=None,
         # then we should record the entry.
         # NOTE(TheJulia): DB API automatically adds in a uuid.
         # TODO(TheJulia): At some point, we should allow custom severity.
-        node_history.NodeHistory(
+        record = node_history.NodeHistory(
             node_id=node.id,
             conductor=CONF.host,
             user=user,
             severity=error and "ERROR" or "INFO",
             event=event,
-            event_type=event_type or "UNKNOWN").create()
+            event_type=event_type or "UNKNOWN")
+        if CONF.conductor.node_history_buffer_size:
+            # The record is written later, preserve the time of the event.
+            record.created_at = timeutils.utcnow()
+            _NODE_HISTORY_BUFFER.add(record)
+        else:
+            record.create()
+
+
+class NodeHistoryBuffer(object):
+    """In-memory buffer of node history records.
+
+    Records are written to the database with a single multi-row INSERT when
+    the buffer reaches ``[conductor]node_history_buffer_size`` entries, or
+    when :meth:`flush` is called by the conductor periodic task or on
+    shutdown. This keeps history writes out of the critical sections which
+    record them, e.g. while holding exclusive node locks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = []
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, record):
+        """Add a record to the buffer, flushing it when full.
+
+        :param record: A NodeHistory object which has not been created yet.
+        """
+        with self._lock:
+            self._records.append(record)
+            depth = len(self._records)
+        METRICS.send_gauge('NodeHistoryBuffer.depth', depth)
+        if depth >= CONF.conductor.node_history_buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered records to the database."""
+        with self._lock:
+            records, self._records = self._records, []
+        if not records:
+            return
+        METRICS.send_gauge('NodeHistoryBuffer.depth', len(self._records))
+        try:
+            node_history.NodeHistory.create_bulk(None, records)
+        except Exception as exc:
+            # One invalid record (e.g. for a node deleted in
+            # the meantime) must not cause the others to be lost.
+            LOG.warning('Unable to write %(count)d node history records in '
+                        'one batch, writing them one by one. Error: %(err)s',
+                        {'count': len(records), 'err': exc})
+            for record in records:
+                try:
+                    record.create()
+                except Exception as exc:
+                    LOG.error('Unable to write node history record '
+                              '"%(event)s" for node %(node)s: %(err)s',
+                              {'event': record.event,
+                               'node': record.node_id, 'err': exc})
+        else:
+            LOG.debug('Wrote %d buffered node history records', len(records))
+
+
+_NODE_HISTORY_BUFFER = NodeHistoryBuffer()
+
+
+def flush_node_history():
+    """Write all buffered node history records to the database."""
+    _NODE_HISTORY_BUFFER.flush()
 
 
 def update_image_type(context, node):
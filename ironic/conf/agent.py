@@ -124,6 +124,15 @@ opts = [
                       'in progress, which prevents new requests from being '
                       'acted upon for the impacted nodes until the issue '
                       'has been resolved.')),
+    cfg.IntOpt('connection_idle_timeout',
+               default=120, min=0,
+               mutable=True,
+               help=_('Number of seconds after which the connections of a '
+                      'conductor to an agent ramdisk are closed if no '
+                      'request has been sent to the agent. Until then, the '
+                      'connections are kept alive and reused by all the '
+                      'requests of the conductor to the agent, sparing a '
+                      'TLS handshake for each of them.')),
     cfg.IntOpt('max_command_attempts',
                default=3,
                help=_('This is the maximum number of attempts that will be '
@@ -51,10 +51,63 @@ opts = [
                help=_('Maximum time (in seconds) since the last check-in '
                       'of a conductor. A conductor is considered inactive '
                       'when this time has been exceeded.')),
+    cfg.IntOpt('heartbeat_coalesce_window',
+               default=0, min=0,
+               mutable=True,
+               help=_('Number of seconds during which a heartbeat from an '
+                      'agent is ignored if the previous heartbeat from the '
+                      'same node, with the same arguments and in the same '
+                      'provision state, has been processed less than this '
+                      'time ago. This spares the conductor from acquiring '
+                      'nodes for heartbeats which are unlikely to cause any '
+                      'action, but may delay the detection of a finished '
+                      'agent command by up to the next heartbeat. Set to 0 '
+                      'to process every heartbeat.')),
+    cfg.IntOpt('cleaning_plan_cache_ttl',
+               default=0, min=0,
+               mutable=True,
+               help=_('Number of seconds during which the automated '
+                      'cleaning plan of a node, i.e. the in-band steps '
+                      'reported by its agent and the resulting ordered '
+                      'clean steps, is reused for other nodes with the '
+                      'same hardware type, interfaces, agent version and '
+                      'clean step priority overrides, without asking their '
+                      'agents for their steps. Only enable it if such nodes '
+                      'have identical hardware. If an agent reports a '
+                      'different hardware manager version when a step is '
+                      'executed, its steps are refreshed and the plan is '
+                      'discarded. Set to 0 to disable the cache.')),
     cfg.IntOpt('sync_power_state_interval',
                default=60,
                help=_('Interval between syncing the node power state to the '
                       'database, in seconds. Set to 0 to disable syncing.')),
+    cfg.IntOpt('sync_power_state_max_interval',
+               default=0, min=0,
+               mutable=True,
+               help=_('When larger than `sync_power_state_interval`, the '
+                      'power state of nodes found in the same state on '
+                      'consecutive synchronizations is synchronized less '
+                      'and less often, the interval doubling up to this '
+                      'number of seconds. Nodes which are new to the '
+                      'conductor, were updated, e.g. by a power action, '
+                      'since their last synchronization, failed it or had '
+                      'their power state corrected are still synchronized '
+                      'every `sync_power_state_interval` seconds. Power '
+                      'state changes made outside of ironic may take up to '
+                      'this number of seconds to be noticed. Set to 0 to '
+                      'synchronize all nodes every '
+                      '`sync_power_state_interval` seconds (the default).')),
+    cfg.IntOpt('sync_power_state_event_interval',
+               default=3600, min=0,
+               mutable=True,
+               help=_('The maximum number of seconds between two power '
+                      'state synchronizations of nodes whose BMC sends '
+                      'power state events to the conductor, see '
+                      '`[redfish]event_receiver_port`. Their power state is '
+                      'still synchronized as a safety net against lost '
+                      'events, the interval doubling as described for '
+                      '`sync_power_state_max_interval`. Set to 0 to use '
+                      '`sync_power_state_max_interval` for them as well.')),
     cfg.IntOpt('check_provision_state_interval',
                default=60,
                min=0,
@@ -74,6 +127,28 @@ opts = [
                default=3600, min=0,
                help=_('Interval between cleaning up image caches, in seconds. '
                       'Set to 0 to disable periodic clean-up.')),
+    cfg.IntOpt('image_prewarm_interval',
+               default=0, min=0,
+               help=_('Interval between pre-warming the image caches, in '
+                      'seconds. The default deploy kernels and ramdisks '
+                      'and the images from [conductor]image_prewarm_images '
+                      'are downloaded into the caches in the background, '
+                      'so that the first deployments using them do not '
+                      'have to wait for the download. Set to 0 to disable '
+                      'pre-warming (the default).')),
+    cfg.ListOpt('image_prewarm_images',
+                default=[],
+                mutable=True,
+                help=_('A list of Glance IDs, http:// or file:// URLs of '
+                       'instance images to pre-warm in the instance image '
+                       'cache. Only used when [conductor]'
+                       'image_prewarm_interval is set.')),
+    cfg.IntOpt('image_prewarm_workers',
+               default=4, min=1,
+               mutable=True,
+               help=_('Number of images to pre-warm in parallel. The '
+                      'downloads are further limited by '
+                      '[DEFAULT]image_download_concurrency.')),
     cfg.IntOpt('deploy_callback_timeout',
                default=1800,
                min=0,
@@ -97,6 +172,30 @@ opts = [
                help=_('The maximum number of worker threads that can be '
                       'started simultaneously to sync nodes power states from '
                       'the periodic task.')),
+    cfg.IntOpt('bmc_io_max_requests',
+               default=0, min=0,
+               help=_('The maximum number of requests to BMCs the power '
+                      'state synchronization can have running at once. '
+                      'When set, the power state of each node is '
+                      'synchronized by a green thread of a dedicated pool '
+                      'of this size rather than by the conductor workers, '
+                      'so that slow BMCs do not starve the workers pool. '
+                      'The default of 0 disables this pool, the power '
+                      'states are then synchronized by up to '
+                      '`sync_power_state_workers` conductor workers.')),
+    cfg.IntOpt('bmc_io_max_requests_per_bmc',
+               default=2, min=1,
+               help=_('The maximum number of requests to the same BMC the '
+                      'pool enabled by `bmc_io_max_requests` runs at once. '
+                      'Nodes are assumed to share a BMC if their '
+                      'driver_info has the same address.')),
+    cfg.IntOpt('bmc_io_deadline',
+               default=60, min=0,
+               help=_('The number of seconds within which a request '
+                      'submitted to the pool enabled by '
+                      '`bmc_io_max_requests` has to start, otherwise it is '
+                      'cancelled until the next power state '
+                      'synchronization. Set to 0 to disable.')),
     cfg.IntOpt('periodic_max_workers',
                default=8,
                help=_('Maximum number of worker threads that can be started '
@@ -404,6 +503,26 @@ opts = [
                       'node_history_max_entries setting as users of '
                       'this setting are anticipated to need to retain '
                       'history by policy.')),
+    cfg.IntOpt('node_history_buffer_size',
+               min=0,
+               default=0,
+               mutable=False,
+               help=_('Maximum number of node history entries the conductor '
+                      'keeps in memory before writing them to the database '
+                      'with a single multi-row INSERT. Buffered entries are '
+                      'also written every '
+                      '[conductor]node_history_flush_interval seconds and '
+                      'when the conductor stops. This reduces database load '
+                      'and time spent holding node locks during mass '
+                      'failure events. Setting to 0 (the default) disables '
+                      'buffering, every entry is written immediately.')),
+    cfg.IntOpt('node_history_flush_interval',
+               min=1,
+               default=10,
+               mutable=False,
+               help=_('Interval in seconds at which buffered node history '
+                      'entries are written to the database. Only used when '
+                      '[conductor]node_history_buffer_size is not 0.')),
     cfg.MultiOpt('verify_step_priority_override',
                  item_type=types.Dict(),
                  default={},
@@ -584,6 +703,18 @@ opts = [
                        'functionality by setting this option to True will '
                        'create a more secure environment, however it may '
                        'break users in an unexpected fashion.')),
+    cfg.BoolOpt('stream_image_ingest',
+                default=False,
+                mutable=True,
+                help=_('Process images downloaded by the conductor in a '
+                       'single pass: the checksum is computed, the format '
+                       'is detected and Zstandard compressed data is '
+                       'decompressed (if the zstandard Python library is '
+                       'installed) while the image is being written, '
+                       'instead of reading the downloaded file again for '
+                       'each of these steps. Only applies to images '
+                       'downloaded from HTTP(S) servers, OCI container '
+                       'registries and Glance.')),
     cfg.BoolOpt('disable_zstandard_decompression',
                 default=False,
                 mutable=False,
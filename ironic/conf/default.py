@@ -282,6 +282,64 @@ img_cache_opts = [
                default=20, min=1,
                help=_('How many image downloads and raw format conversions '
                       'to run in parallel. Only affects image caches.')),
+    cfg.IntOpt('image_convert_concurrency',
+               default=0, min=0,
+               help=_('How many conversions of images to raw format to run '
+                      'in parallel. The default of 0 only limits '
+                      'conversions with [DEFAULT]image_download_concurrency '
+                      'for image caches.')),
+    cfg.StrOpt('image_convert_io_class',
+               choices=[('best-effort', _('Best effort I/O scheduling '
+                                          'class, with the priority set by '
+                                          '[DEFAULT]image_convert_io_'
+                                          'priority')),
+                        ('idle', _('Idle I/O scheduling class, conversions '
+                                   'only use the disk when no other '
+                                   'process needs it'))],
+               help=_('I/O scheduling class used to convert images to raw '
+                      'format with "ionice". Unset by default, which keeps '
+                      'the I/O scheduling class of the conductor.')),
+    cfg.IntOpt('image_convert_io_priority',
+               default=7, min=0, max=7,
+               help=_('I/O priority used to convert images to raw format '
+                      'with the best-effort I/O scheduling class, from 0 '
+                      '(highest) to 7 (lowest).')),
+    cfg.IntOpt('image_convert_progress_interval',
+               default=30, min=0,
+               help=_('Interval (in seconds) between log messages reporting '
+                      'the progress of conversions of images to raw format. '
+                      'Set to 0 to only log the throughput of finished '
+                      'conversions.')),
+    cfg.IntOpt('image_download_segments',
+               default=1, min=1, max=64,
+               help=_('Maximum number of parallel range requests used to '
+                      'download a large image from an HTTP(S) server which '
+                      'accepts range requests. The default of 1 downloads '
+                      'every image in a single stream.')),
+    cfg.IntOpt('image_download_segment_size',
+               default=256, min=1,
+               help=_('Minimum size (in MiB) of each segment of an image '
+                      'downloaded in parallel segments. Images smaller than '
+                      'twice this size are downloaded in a single stream.')),
+    cfg.IntOpt('image_download_retries',
+               default=3, min=0,
+               help=_('How many times a segment of an image downloaded in '
+                      'parallel segments is resumed from the last received '
+                      'byte after its connection fails.')),
+    cfg.IntOpt('image_info_cache_ttl',
+               default=0, min=0,
+               help=_('For how many seconds the properties of an image '
+                      'returned by the HTTP(S) and Glance image services, '
+                      'as well as the manifests and artifact indexes of '
+                      'OCI container registries, are cached and shared by '
+                      'all image caches of a conductor. Once expired, the '
+                      'properties of HTTP(S) images are revalidated with a '
+                      'conditional request using their ETag or '
+                      'Last-Modified headers, the other properties are '
+                      'fetched again, so changes to a Glance image, e.g. '
+                      'its deactivation or a new checksum, may not be seen '
+                      'before the entry expires. Set to 0 to disable '
+                      'caching (the default).')),
 ]
 
 netconf_opts = [
@@ -28,6 +28,16 @@ opts = [
     cfg.StrOpt('http_root',
                default='/httpboot',
                help=_("ironic-conductor node's HTTP root path.")),
+    cfg.BoolOpt('content_addressed_publishing',
+                default=False,
+                help=_("Whether images published on the local HTTP server, "
+                       "such as virtual media ISOs, floppy and configdrive "
+                       "images, are stored once per unique content. Each "
+                       "unique image is kept in a hidden .store "
+                       "subdirectory named after its SHA256 checksum, and "
+                       "the per-node names are hard links to it. Unused "
+                       "images are removed when they are unpublished. "
+                       "Does not apply when Swift is used.")),
     cfg.StrOpt('image_server_auth_strategy',
                default='noauth',
                choices=[('noauth', _('No authentication')),
@@ -246,6 +256,21 @@ opts = [
                default=10080,
                help=_('Maximum TTL (in minutes) for old master ISO images in '
                       'cache.')),
+    cfg.StrOpt('iso_template_path',
+               default='',
+               help=_('On the ironic-conductor node, directory where boot '
+                      'ISO templates are stored on disk. When set, the '
+                      'deploy, rescue and cleaning boot ISOs are built once '
+                      'for each combination of kernel, ramdisk, bootloader '
+                      'and boot mode, and the ISO of each node is a copy of '
+                      'this template with only the boot configuration and '
+                      'the publisher ID replaced. Setting to the empty '
+                      'string (the default) disables boot ISO templates.')),
+    cfg.IntOpt('iso_template_count',
+               default=16, min=1,
+               help=_('Maximum number of boot ISO templates kept in '
+                      '[deploy]iso_template_path. The least recently used '
+                      'templates are removed first.')),
 ]
 
 
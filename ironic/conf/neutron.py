@@ -156,6 +156,40 @@ opts = [
                        'because during tear-down they will be left with the '
                        'instance image still running. Set this option to '
                        'True to disable this validation.')),
+    cfg.BoolOpt('bulk_port_operations',
+                default=False,
+                mutable=True,
+                help=_('Whether to create all neutron ports of a node in a '
+                       'single bulk request when the node is moved to the '
+                       'provisioning, cleaning, rescuing, inspection or '
+                       'servicing network, and to wait for their status '
+                       'with a single list request per attempt. If the '
+                       'bulk request is rejected, the ports are created one '
+                       'by one. This reduces the number of requests to '
+                       'Neutron for nodes with many ports.')),
+    cfg.IntOpt('cache_ttl',
+               default=0,
+               min=0,
+               mutable=True,
+               help=_('Time (in seconds) during which neutron clients, '
+                      'as well as the networks, subnet segments and '
+                      'security groups looked up to validate nodes and to '
+                      'move them between networks, are cached by the '
+                      'conductor. Clients are cached per user token, '
+                      'metadata per project. Networks, segments and '
+                      'security groups deleted or changed in Neutron may '
+                      'then still be used for up to this time plus '
+                      '`cache_stale_period`. Set to 0 to disable caching '
+                      '(the default).')),
+    cfg.IntOpt('cache_stale_period',
+               default=0,
+               min=0,
+               mutable=True,
+               help=_('Time (in seconds) after the expiration of a cached '
+                      'network, subnet segment or security group lookup '
+                      'during which the cached value is still used while '
+                      'it is refreshed in the background. Set to 0 to '
+                      'always refresh expired values before using them.')),
 ]
 
 
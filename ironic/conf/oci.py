@@ -55,6 +55,19 @@ opts = [
                       'and the file can be updated as Ironic operates '
                       'in the event pre-shared tokens need to be '
                       'regenerated.')),
+    cfg.StrOpt('blob_cache_path',
+               help=_('Path of a local directory where the blobs of the '
+                      'artifacts downloaded from container registries are '
+                      'stored by their digest, so that an artifact is only '
+                      'downloaded once regardless of the tag or manifest '
+                      'referencing it. An interrupted download of a blob '
+                      'is resumed from the data already stored. Unset by '
+                      'default, which disables the blob store.')),
+    cfg.IntOpt('blob_cache_size',
+               default=20480, min=0,
+               help=_('Maximum size (in MiB) of the blob store. The least '
+                      'recently used blobs are removed once it is '
+                      'exceeded. Set to 0 to disable the limit.')),
 ]
 
 
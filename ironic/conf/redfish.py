@@ -120,6 +120,88 @@ opts = [
                default=60,
                help=_('Number of seconds to wait between checking for '
                       'failed raid config tasks')),
+    cfg.IntOpt('task_monitor_max_requests',
+               min=0,
+               default=0,
+               help=_('The maximum number of requests to BMCs to poll task '
+                      'monitors the conductor can have running at once. '
+                      'When set, the periodic tasks checking asynchronous '
+                      'RAID configuration and firmware update tasks poll '
+                      'the task monitors in the background and only lock '
+                      'a node once one of its tasks is finished, instead '
+                      'of locking every node with an outstanding task and '
+                      'polling its task monitor on each run. Finished '
+                      'tasks are then handled by the run following their '
+                      'completion. Set to 0 to disable (the default).')),
+    cfg.IntOpt('task_monitor_max_requests_per_bmc',
+               min=1,
+               default=2,
+               help=_('The maximum number of requests to poll task '
+                      'monitors the conductor sends at once to the same '
+                      'BMC. Only used when `task_monitor_max_requests` is '
+                      'set.')),
+    cfg.IntOpt('task_monitor_max_interval',
+               min=1,
+               default=300,
+               mutable=True,
+               help=_('The maximum number of seconds between two polls of '
+                      'the same task monitor when `task_monitor_max_requests` '
+                      'is set. The interval doubles after each poll finding '
+                      'the task still processing, unless the BMC requests a '
+                      'longer one through the Retry-After header.')),
+    cfg.PortOpt('event_receiver_port',
+                default=0,
+                help=_('The port on which the conductor receives power state '
+                       'events from the Redfish EventService of BMCs. When '
+                       'set, the conductor subscribes to the events of the '
+                       'nodes using the redfish power interface, records '
+                       'the power states they report and only synchronizes '
+                       'the power state of subscribed nodes as a safety net, '
+                       'see `[conductor]sync_power_state_event_interval`. '
+                       'Requires `event_receiver_url` and '
+                       '`event_receiver_token`. Set to 0 to disable (the '
+                       'default).')),
+    cfg.HostAddressOpt('event_receiver_host_ip',
+                       default='::',
+                       help=_('The IP address or hostname on which the '
+                              'conductor receives Redfish events.')),
+    cfg.URIOpt('event_receiver_url',
+               schemes=('http', 'https'),
+               help=_('The URL BMCs send events to, i.e. the destination of '
+                      'the subscriptions. It must reach the conductor on '
+                      '`event_receiver_port`, possibly through a proxy.')),
+    cfg.StrOpt('event_receiver_token',
+               secret=True,
+               help=_('A secret the tokens of the nodes are derived from. '
+                      'BMCs pass the token of the subscribed node to the '
+                      'conductor with every event in the '
+                      'X-Ironic-Event-Token header, as requested in the '
+                      'subscriptions. Events without the token of their '
+                      'node are rejected. Changing it requires recreating '
+                      'the subscriptions.')),
+    cfg.BoolOpt('event_receiver_use_ssl',
+                default=False,
+                help=_('Whether to use TLS when receiving Redfish events.')),
+    cfg.StrOpt('event_receiver_cert_file',
+               help=_('Certificate file the Redfish event receiver presents '
+                      'to BMCs when `event_receiver_use_ssl` is True.')),
+    cfg.StrOpt('event_receiver_key_file',
+               help=_('Private key file matching '
+                      '`event_receiver_cert_file`.')),
+    cfg.IntOpt('event_receiver_workers',
+               min=1,
+               default=4,
+               help=_('The number of threads recording the received power '
+                      'states. Events received for a node while a previous '
+                      'one is waiting are merged, only the latest one is '
+                      'recorded.')),
+    cfg.IntOpt('event_subscription_interval',
+               min=0,
+               default=600,
+               help=_('Number of seconds between two checks of the event '
+                      'subscriptions of nodes, creating missing ones. Only '
+                      'used when `event_receiver_port` is set. Set to 0 to '
+                      'disable the subscriptions.')),
     cfg.IntOpt('boot_mode_config_timeout',
                min=0,
                default=900,
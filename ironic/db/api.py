@@ -1459,6 +1459,14 @@ class Connection(object, metaclass=abc.ABCMeta):
         :param values: Dict of values.
         """
 
+    @abc.abstractmethod
+    def create_node_history_bulk(self, values_list):
+        """Create several history records with a single query.
+
+        :param values_list: List of dicts of values, one per record. All
+                            dicts must have the same keys.
+        """
+
     @abc.abstractmethod
     def destroy_node_history_by_uuid(self, history_uuid):
         """Destroy a history record.
@@ -2872,6 +2872,20 @@ class Connection(api.Connection):
                 raise exception.NodeHistoryAlreadyExists(uuid=values['uuid'])
         return history
 
+    @oslo_db_api.retry_on_deadlock
+    def create_node_history_bulk(self, values_list):
+        if not values_list:
+            return
+        rows = []
+        for values in values_list:
+            values = dict(values)
+            values['uuid'] = uuidutils.generate_uuid()
+            rows.append(values)
+        with _session_for_write() as session:
+            # NOTE: a single multi-row INSERT statement, bypassing the ORM
+            # unit of work since nothing is read back from the records.
+            session.execute(sa.insert(models.NodeHistory).values(rows))
+
     @oslo_db_api.retry_on_deadlock
     def destroy_node_history_by_uuid(self, history_uuid):
         with _session_for_write() as session:
@@ -568,13 +568,18 @@ class HeartbeatMixin(object):
                           node.uuid, kind)
                 msg = _('Node failed to start the first cleaning step')
                 task.resume_cleaning()
-                # First, cache the clean steps
-                self.refresh_clean_steps(task)
                 use_existing_steps = node.driver_internal_info.get(
                     'declarative_cleaning', False)
-                # Then set/verify node clean steps and start cleaning
-                conductor_steps.set_node_cleaning_steps(
-                    task, use_existing_steps=use_existing_steps)
+                # Automated cleaning may reuse the plan of a similar node
+                if (use_existing_steps
+                        or not conductor_steps.restore_cleaning_plan(task)):
+                    # First, cache the clean steps
+                    self.refresh_clean_steps(task)
+                    # Then set/verify node clean steps and start cleaning
+                    conductor_steps.set_node_cleaning_steps(
+                        task, use_existing_steps=use_existing_steps)
+                    if not use_existing_steps:
+                        conductor_steps.save_cleaning_plan(task)
                 cleaning.continue_node_clean(task)
             else:
                 msg = _('Node failed to check cleaning progress')
@@ -1005,6 +1010,9 @@ class AgentBaseMixin(object):
 
     def _process_version_mismatch(self, task, step_type):
         node = task.node
+        if step_type == 'clean':
+            # The cached plan of similar nodes may be outdated as well
+            conductor_steps.discard_cleaning_plan(task)
         # For manual clean, the target provision state is MANAGEABLE, whereas
         # for automated cleaning, it is (the default) AVAILABLE.
         manual_clean = node.target_provision_state == states.MANAGEABLE
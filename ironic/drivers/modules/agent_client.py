@@ -15,7 +15,9 @@
 from http import client as http_client
 import os
 import ssl
+import threading
 import time
+from urllib import parse as urlparse
 
 from oslo_log import log
 from oslo_serialization import jsonutils
@@ -38,6 +40,131 @@ DEFAULT_IPA_PORTAL_PORT = 3260
 
 REBOOT_COMMAND = 'run_image'
 
+# Maximum number of agents whose commands are cached, the least recently
+# polled agents are dropped first.
+_COMMANDS_CACHE_SIZE = 1024
+
+
+class AgentSessionPool(object):
+    """HTTP sessions to the agents, shared by all the clients of a conductor.
+
+    A session, and thus its keep-alive connections, is kept for every agent
+    endpoint and TLS verification setting, and closed once it has not been
+    used for [agent]connection_idle_timeout seconds. The pool exposes the
+    same request methods as a requests session.
+    """
+
+    headers = {'Content-Type': 'application/json'}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    @staticmethod
+    def _key(url, verify):
+        url = urlparse.urlsplit(url)
+        return (url.scheme, url.netloc, verify)
+
+    def _evict_idle(self, now):
+        """Close the idle sessions. Called with the lock held."""
+        timeout = CONF.agent.connection_idle_timeout
+        for key, entry in list(self._sessions.items()):
+            if not entry['in_use'] and now - entry['last_used'] >= timeout:
+                del self._sessions[key]
+                entry['session'].close()
+                LOG.debug('Closed the idle connections to the agent at '
+                          '%(agent)s after %(requests)d requests, '
+                          '%(reused)d of them on a reused connection',
+                          {'agent': '%s://%s' % key[:2],
+                           'requests': entry['requests'],
+                           'reused': entry['reused']})
+
+    def _checkout(self, url, verify):
+        key = self._key(url, verify)
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            entry = self._sessions.get(key)
+            if entry is None:
+                session = requests.Session()
+                session.headers.update(self.headers)
+                entry = self._sessions[key] = {
+                    'session': session, 'in_use': 0, 'last_used': 0,
+                    'requests': 0, 'reused': 0, 'latency': 0.0}
+            entry['in_use'] += 1
+        return entry
+
+    @staticmethod
+    def _opened_connections(session):
+        count = 0
+        for adapter in session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                count += getattr(pool, 'num_connections', 0) if pool else 0
+        return count
+
+    def request(self, method, url, verify=True, **kwargs):
+        """Send a request to an agent.
+
+        :param method: HTTP method.
+        :param url: URL of the request.
+        :param verify: TLS verification argument for the requests library.
+        :param kwargs: Other arguments for the requests library.
+        :returns: A requests.Response object.
+        """
+        entry = self._checkout(url, verify)
+        session = entry['session']
+        opened = self._opened_connections(session)
+        start = time.monotonic()
+        try:
+            return session.request(method, url, verify=verify, **kwargs)
+        finally:
+            now = time.monotonic()
+            reused = self._opened_connections(session) == opened
+            with self._lock:
+                entry['in_use'] -= 1
+                entry['last_used'] = now
+                entry['requests'] += 1
+                entry['reused'] += int(reused)
+                entry['latency'] += now - start
+            METRICS.send_timer('AgentClient.request', (now - start) * 1000)
+            METRICS.send_counter('AgentClient.connection.%s'
+                                 % ('reused' if reused else 'new'), 1)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Statistics of the requests to the agents with an open session.
+
+        :returns: A dictionary with the agent endpoints as keys and
+            dictionaries with the number of requests, the number of
+            requests on a reused connection and the average request latency
+            (in seconds) as values.
+        """
+        stats = {}
+        with self._lock:
+            for key, entry in self._sessions.items():
+                stats['%s://%s' % key[:2]] = {
+                    'requests': entry['requests'],
+                    'reused': entry['reused'],
+                    'latency': (entry['latency'] / entry['requests']
+                                if entry['requests'] else 0.0)}
+        return stats
+
+    def close(self):
+        """Close all the sessions."""
+        with self._lock:
+            for entry in self._sessions.values():
+                entry['session'].close()
+            self._sessions.clear()
+
+
+_SESSION_POOL = AgentSessionPool()
+
 
 def get_client(task):
     """Get client for this node."""
@@ -66,6 +193,14 @@ def get_command_error(command):
         return error
 
 
+def _commands_summary(commands):
+    return '; '.join('%(cmd)s: result "%(res)s", error "%(err)s"' %
+                     {'cmd': r.get('command_name'),
+                      'res': _sanitize_for_logging(r.get('command_result')),
+                      'err': r.get('command_error')}
+                     for r in commands)
+
+
 def _sanitize_for_logging(var):
     if not var:
         return var
@@ -77,10 +212,15 @@ def _sanitize_for_logging(var):
 
 class AgentClient(object):
     """Client for interacting with nodes via a REST API."""
+
+    # The last known commands of the agents, shared by all the clients and
+    # keyed by the agent URL and token, so that only the commands which may
+    # have changed since the previous request are fetched from the agents.
+    _commands_cache = {}
+
     @METRICS.timer('AgentClient.__init__')
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({'Content-Type': 'application/json'})
+        self.session = _SESSION_POOL
 
     def _get_command_url(self, node):
         """Get URL endpoint for agent command request"""
@@ -201,7 +341,8 @@ class AgentClient(object):
         LOG.debug('Executing agent command %(method)s for node %(node)s '
                   'with params %(params)s',
                   {'node': node.uuid, 'method': method,
-                   'params': _sanitize_for_logging(request_params)})
+                   'params': utils.LazyLogValue(_sanitize_for_logging,
+                                                request_params)})
 
         try:
             response = self.session.post(
@@ -238,7 +379,8 @@ class AgentClient(object):
         LOG.debug('Agent command %(method)s for node %(node)s returned '
                   'result %(res)s, error %(error)s, HTTP status code %(code)s',
                   {'node': node.uuid, 'method': method,
-                   'res': _sanitize_for_logging(result.get('command_result')),
+                   'res': utils.LazyLogValue(_sanitize_for_logging,
+                                             result.get('command_result')),
                    'error': error,
                    'code': response.status_code if response is not None
                    else 'unknown'})
@@ -290,7 +432,9 @@ class AgentClient(object):
         :param expect_errors: If True, do not log connection problems as
             errors.
         :return: A list of command results, each result is related to a
-            command been issued to agent. A typical result can be:
+            command been issued to agent. If the agent supports it, only
+            the commands which may have changed since the previous call
+            are fetched from it. A typical result can be:
 
             ::
 
@@ -320,8 +464,20 @@ class AgentClient(object):
 
         request_params = {}
         agent_token = node.driver_internal_info.get('agent_secret_token')
+        cache_key = cached = since = None
         if agent_token:
             request_params['agent_token'] = agent_token
+            # NOTE: a new token is generated for every boot of the agent,
+            # so the cached commands always come from the same agent.
+            cache_key = (url, agent_token)
+            cached = self._commands_cache.get(cache_key)
+        if cached is not None:
+            # Finished commands do not change any more, only ask for the
+            # commands from the first one still running.
+            since = next((i for i, c in enumerate(cached)
+                          if c.get('command_status') == 'RUNNING'),
+                         len(cached))
+            request_params['since'] = since
 
         def _get():
             try:
@@ -346,16 +502,29 @@ class AgentClient(object):
                     CONF.agent.max_command_attempts),
                 reraise=True)(_get)
 
-        result = _get().json()['commands']
-        status = '; '.join('%(cmd)s: result "%(res)s", error "%(err)s"' %
-                           {'cmd': r.get('command_name'),
-                            'res': _sanitize_for_logging(
-                                r.get('command_result')),
-                            'err': r.get('command_error')}
-                           for r in result)
+        response = _get().json()
+        result = response['commands']
+        # NOTE: agents which do not support the since parameter ignore it
+        # and return all the commands without echoing it.
+        if since is not None and response.get('since') == since:
+            result = cached[:since] + result
+        if cache_key is not None:
+            self._cache_commands(cache_key, result)
         LOG.debug('Status of agent commands for node %(node)s: %(status)s',
-                  {'node': node.uuid, 'status': status})
-        return result
+                  {'node': node.uuid,
+                   'status': utils.LazyLogValue(_commands_summary, result)})
+        return list(result)
+
+    @classmethod
+    def _cache_commands(cls, key, commands):
+        cls._commands_cache.pop(key, None)
+        cls._commands_cache[key] = commands
+        while len(cls._commands_cache) > _COMMANDS_CACHE_SIZE:
+            # NOTE: dictionaries keep the insertion order.
+            try:
+                del cls._commands_cache[next(iter(cls._commands_cache))]
+            except (KeyError, StopIteration, RuntimeError):
+                break
 
     def _status_if_last_command_matches(self, node, method, params):
         """Return the status of the given command if it's the last running."""
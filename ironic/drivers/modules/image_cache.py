@@ -19,6 +19,7 @@ Utility for caching master images.
 """
 
 import os
+import queue
 import tempfile
 import threading
 import time
@@ -28,17 +29,22 @@ from oslo_concurrency import lockutils
 from oslo_log import log as logging
 from oslo_utils import fileutils
 
+from ironic.common import checksum_utils
 from ironic.common import exception
+from ironic.common import file_copy
 from ironic.common.glance_service import service_utils
 from ironic.common.i18n import _
 from ironic.common import image_service
 from ironic.common import images
+from ironic.common import metrics_utils
 from ironic.common import utils
 from ironic.conf import CONF
 
 
 LOG = logging.getLogger(__name__)
 
+METRICS = metrics_utils.get_metrics_logger(__name__)
+
 # This would contain a sorted list of instances of ImageCache to be
 # considered for cleanup. This list will be kept sorted in non-increasing
 # order of priority.
@@ -126,18 +132,8 @@ class ImageCache(object):
 
         # TODO(ghe): have hard links and counts the same behaviour in all fs
 
-        # NOTE(vdrok): File name is converted to UUID if it's not UUID already,
-        # so that two images with same file names do not collide
-        if service_utils.is_glance_image(href):
-            master_file_name = service_utils.parse_image_id(href)
-        else:
-            master_file_name = str(uuid.uuid5(uuid.NAMESPACE_URL, href))
-        # NOTE(kaifeng) The ".converted" suffix acts as an indicator that the
-        # image cached has gone through the conversion logic.
-        if force_raw:
-            master_file_name = master_file_name + '.converted'
-
-        master_path = os.path.join(self.master_dir, master_file_name)
+        master_path = self._get_master_path(href, force_raw)
+        master_file_name = os.path.basename(master_path)
 
         if CONF.parallel_image_downloads:
             img_download_lock_name = 'download-image:%s' % master_file_name
@@ -162,18 +158,19 @@ class ImageCache(object):
                 LOG.debug("Destination %(dest)s already exists "
                           "for image %(href)s",
                           {'href': href, 'dest': dest_path})
+                self._send_hit_metric(True)
                 return
 
             if cache_up_to_date:
-                # NOTE(dtantsur): ensure we're not in the middle of clean up
-                with lockutils.lock('master_image'):
-                    os.link(master_path, dest_path)
+                self._copy_from_master(master_path, dest_path)
                 LOG.debug("Master cache hit for image %(href)s",
                           {'href': href})
+                self._send_hit_metric(True)
                 return
 
             LOG.info("Master cache miss for image %(href)s, will download",
                      {'href': href})
+            self._send_hit_metric(False)
             self._download_image(
                 href, master_path, dest_path, img_info,
                 ctx=ctx, force_raw=force_raw,
@@ -185,6 +182,110 @@ class ImageCache(object):
         # NOTE(dtantsur): we increased cache size - time to clean up
         self.clean_up()
 
+    def _copy_from_master(self, master_path, dest_path):
+        """Link or copy the master copy of an image to the destination.
+
+        Only hard links are made under the global lock. A destination on
+        another file system is copied from a temporary hard link, which
+        keeps the master copy from being cleaned up meanwhile.
+        """
+        # NOTE(dtantsur): ensure we're not in the middle of clean up
+        with lockutils.lock('master_image'):
+            try:
+                file_copy.link_file(master_path, dest_path,
+                                    'ImageCache.fetch_image')
+                return
+            except OSError as exc:
+                LOG.debug('Could not link %(src)s to %(dest)s, copying it. '
+                          'Error: %(exc)s',
+                          {'src': master_path, 'dest': dest_path,
+                           'exc': exc})
+            tmp_dir = tempfile.mkdtemp(dir=self.master_dir)
+            tmp_path = os.path.join(tmp_dir, os.path.basename(master_path))
+            try:
+                os.link(master_path, tmp_path)
+            except OSError:
+                utils.rmtree_without_raise(tmp_dir)
+                raise
+
+        try:
+            file_copy.copy_file(tmp_path, dest_path, 'ImageCache.fetch_image',
+                                hardlink=False)
+        finally:
+            utils.rmtree_without_raise(tmp_dir)
+
+    def _send_hit_metric(self, hit):
+        """Count master cache hits and misses, per cache class."""
+        METRICS.send_counter('%s.%s' % (type(self).__name__,
+                                        'hit' if hit else 'miss'), 1)
+
+    def _get_master_path(self, href, force_raw):
+        """Get the path of the master copy of an image in the cache.
+
+        :param href: image UUID or href
+        :param force_raw: boolean value, whether the image is converted to
+                          raw format
+        :returns: the path of the master copy.
+        """
+        # NOTE(vdrok): File name is converted to UUID if it's not UUID already,
+        # so that two images with same file names do not collide
+        if service_utils.is_glance_image(href):
+            master_file_name = service_utils.parse_image_id(href)
+        else:
+            master_file_name = str(uuid.uuid5(uuid.NAMESPACE_URL, href))
+        # NOTE(kaifeng) The ".converted" suffix acts as an indicator that the
+        # image cached has gone through the conversion logic.
+        if force_raw:
+            master_file_name = master_file_name + '.converted'
+
+        return os.path.join(self.master_dir, master_file_name)
+
+    def prewarm(self, href, ctx=None, force_raw=None, image_auth_data=None):
+        """Make sure the master copy of an image is in the cache.
+
+        The image is downloaded (and converted and validated if required)
+        exactly as done by fetch_image, but no destination link is kept,
+        so that the image can later be picked by the normal clean up.
+        Unless validation is disabled for the cache, the image is verified
+        with the checksum published by its image service, if any.
+
+        :param href: image UUID or href to fetch
+        :param ctx: context
+        :param force_raw: boolean value, whether to convert the image to raw
+                          format
+        :param image_auth_data: Dictionary with credential details which may be
+                                required to download the file.
+        :returns: the number of bytes fetched, 0 if the image was already
+            cached.
+        """
+        if self.master_dir is None:
+            LOG.debug("Not pre-warming image %s, caching is disabled", href)
+            return 0
+
+        force_raw = force_raw if force_raw is not None else self._force_raw
+        master_path = self._get_master_path(href, force_raw)
+        try:
+            cached_inode = os.stat(master_path).st_ino
+        except FileNotFoundError:
+            cached_inode = None
+        checksum = checksum_algo = None
+        if not self._disable_validation:
+            checksum, checksum_algo = _published_checksum(
+                href, images.image_show(ctx, href,
+                                        image_auth_data=image_auth_data))
+        tmp_dir = tempfile.mkdtemp(dir=self.master_dir)
+        try:
+            dest_path = os.path.join(tmp_dir, os.path.basename(master_path))
+            self.fetch_image(href, dest_path, ctx=ctx, force_raw=force_raw,
+                             expected_checksum=checksum,
+                             expected_checksum_algo=checksum_algo,
+                             image_auth_data=image_auth_data)
+            stat = os.stat(dest_path)
+            # NOTE: a stale cached copy is replaced by a new file
+            return 0 if stat.st_ino == cached_inode else stat.st_size
+        finally:
+            utils.rmtree_without_raise(tmp_dir)
+
     def _download_image(self, href, master_path, dest_path, img_info,
                         ctx=None, force_raw=None, expected_format=None,
                         expected_checksum=None, expected_checksum_algo=None,
@@ -225,12 +326,16 @@ class ImageCache(object):
             if img_info.get('no_cache'):
                 LOG.debug("Caching is disabled for image %s", href)
                 # Cache disabled, link directly to destination
-                os.link(tmp_path, dest_path)
+                file_copy.copy_file(tmp_path, dest_path,
+                                    'ImageCache.fetch_image')
             else:
                 # NOTE(dtantsur): no need for global lock here - master_path
                 # will have link count >1 at any moment, so won't be cleaned up
                 os.link(tmp_path, master_path)
-                os.link(master_path, dest_path)
+                # NOTE: a destination on another file system is cloned or
+                # copied, it is then considered stale on the next fetch.
+                file_copy.copy_file(master_path, dest_path,
+                                    'ImageCache.fetch_image')
         except OSError as exc:
             msg = (_("Could not link image %(img_href)s from %(src_path)s "
                      "to %(dst_path)s, error: %(exc)s") %
@@ -394,10 +499,11 @@ def _fetch(context, image_href, path, force_raw=False,
     if os.path.exists(path_tmp):
         LOG.warning("%s exist, assuming it's stale", path_tmp)
         os.remove(path_tmp)
-    images.fetch(context, image_href, path_tmp, force_raw=False,
-                 checksum=expected_checksum,
-                 checksum_algo=expected_checksum_algo,
-                 image_auth_data=image_auth_data)
+    image_class = images.fetch(context, image_href, path_tmp,
+                               force_raw=False,
+                               checksum=expected_checksum,
+                               checksum_algo=expected_checksum_algo,
+                               image_auth_data=image_auth_data)
     # By default, the image format is unknown
     image_format = None
     disable_dii = (disable_validation
@@ -413,7 +519,8 @@ def _fetch(context, image_href, path, force_raw=False,
                 image_auth_data=image_auth_data).get('disk_format')
         else:
             remote_image_format = expected_format
-        image_format = images.safety_check_image(path_tmp)
+        image_format = images.safety_check_image(path_tmp,
+                                                 image_class=image_class)
         images.check_if_image_format_is_permitted(
             image_format, remote_image_format)
 
@@ -447,7 +554,9 @@ def _fetch(context, image_href, path, force_raw=False,
                           '[DEFAULT]raw_image_growth_factor=%s',
                           CONF.raw_image_growth_factor)
                 raise
-        images.image_to_raw(image_href, path, path_tmp)
+        # NOTE: the image has already been safety checked above
+        images.image_to_raw(image_href, path, path_tmp,
+                            source_format=image_format)
     else:
         os.rename(path_tmp, path)
 
@@ -504,6 +613,78 @@ def clean_up_caches(ctx, directory, images_info, image_auth_data=None):
     _clean_up_caches(directory, total_size)
 
 
+def _published_checksum(href, img_info):
+    """Get the checksum of an image as deployments get it from Glance.
+
+    :param href: image UUID or href.
+    :param img_info: image properties returned by the image service.
+    :returns: a tuple (checksum, algorithm), (None, None) if the image
+        service publishes no checksum.
+    :raises: ImageChecksumAlgorithmFailure if the checksum is MD5, which
+        is disabled by configuration.
+    """
+    if img_info.get('os_hash_value'):
+        instance_info = {'image_os_hash_value': img_info['os_hash_value'],
+                         'image_os_hash_algo': img_info.get('os_hash_algo')}
+    elif img_info.get('checksum'):
+        instance_info = {'image_source': href,
+                         'image_checksum': img_info['checksum']}
+    else:
+        return None, None
+    return checksum_utils.get_checksum_and_algo(instance_info)
+
+
+def prewarm_images(ctx, images_queue):
+    """Pre-warm image caches with images from a queue.
+
+    Runs until the queue is empty, so that several workers can share the
+    same queue to fetch images in parallel. Failures are logged and do not
+    stop the processing of the remaining images.
+
+    :param ctx: context
+    :param images_queue: a queue.Queue of tuples (ImageCache instance,
+                         image href, whether to convert the image to raw
+                         format).
+    :returns: a tuple (number of images fetched, number of bytes fetched).
+    """
+    fetched = 0
+    total_size = 0
+    while True:
+        try:
+            cache, href, force_raw = images_queue.get_nowait()
+        except queue.Empty:
+            break
+
+        start = time.monotonic()
+        try:
+            size = cache.prewarm(href, ctx=ctx, force_raw=force_raw)
+        except Exception as exc:
+            LOG.warning('Failed to pre-warm image %(href)s in cache '
+                        '%(cache)s: %(exc)s',
+                        {'href': href, 'cache': cache.master_dir,
+                         'exc': exc})
+            continue
+
+        if not size:
+            LOG.debug('Image %(href)s is already in cache %(cache)s',
+                      {'href': href, 'cache': cache.master_dir})
+            continue
+
+        elapsed = max(time.monotonic() - start, 0.001)
+        fetched += 1
+        total_size += size
+        METRICS.send_gauge('ImageCache.prewarm_bytes_per_second',
+                           int(size / elapsed))
+        LOG.info('Pre-warmed image %(href)s in cache %(cache)s: '
+                 '%(size)d bytes in %(elapsed).1f seconds '
+                 '(%(rate).1f MiB/s), %(left)d image(s) left',
+                 {'href': href, 'cache': cache.master_dir, 'size': size,
+                  'elapsed': elapsed,
+                  'rate': size / elapsed / 1024 / 1024,
+                  'left': images_queue.qsize()})
+    return fetched, total_size
+
+
 def clean_up_all():
     """Clean up all entries from all caches."""
     caches_to_clean = [x[1]() for x in _cache_cleanup_list]
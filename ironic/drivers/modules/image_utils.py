@@ -13,18 +13,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import base64
 import functools
-import gzip
+import glob
+import hashlib
 import json
 import os
-import shutil
 import tempfile
 from urllib import parse as urlparse
 
+from oslo_concurrency import lockutils
 from oslo_log import log
+from oslo_utils import fileutils
 from oslo_utils import uuidutils
 
+from ironic.common import configdrive as cd_images
 from ironic.common import exception
 from ironic.common.glance_service import service_utils
 from ironic.common.i18n import _
@@ -32,6 +34,7 @@ from ironic.common import image_publisher
 from ironic.common import images
 from ironic.common import states
 from ironic.common import utils
+from ironic.conductor import utils as manager_utils
 from ironic.conf import CONF
 from ironic.drivers.modules import boot_mode_utils
 from ironic.drivers.modules import deploy_utils
@@ -251,38 +254,45 @@ def prepare_configdrive_image(task, content):
 
     Decodes base64 contents and writes it into a disk image that can be
     attached e.g. to a virtual USB device. Images stored in Swift are
-    downloaded first.
+    downloaded first. A configdrive provided as JSON is built directly into
+    the disk image. The contents are decoded in chunks, so that the image is
+    never held in memory as a whole.
 
     :param task: a TaskManager instance containing the node to act on.
-    :param content: Config drive as a base64-encoded string.
+    :param content: Config drive as a base64-encoded string, a URL or
+        a dictionary with the configdrive contents.
     :raises: ImageCreationFailed, if it failed while creating the image.
     :raises: SwiftOperationError, if any operation with Swift fails.
     :returns: image URL for the image.
     """
-    with tempfile.TemporaryFile(dir=CONF.tempdir) as comp_tmpfile_obj:
+    if isinstance(content, dict):
+        with tempfile.NamedTemporaryFile(
+                dir=CONF.tempdir, suffix='.img') as image_tmpfile_obj:
+            manager_utils.build_configdrive_image(task.node, content,
+                                                  image_tmpfile_obj.name)
+            return prepare_disk_image(task, image_tmpfile_obj.name,
+                                      prefix='configdrive')
+
+    with tempfile.NamedTemporaryFile(
+            dir=CONF.tempdir, suffix='.img') as image_tmpfile_obj:
         if '://' in content:
             with tempfile.NamedTemporaryFile(dir=CONF.tempdir) as tmpfile2:
                 images.fetch_into(task.context, content, tmpfile2)
                 tmpfile2.flush()
 
-                if utils.file_mime_type(tmpfile2.name) == "text/plain":
-                    tmpfile2.seek(0)
-                    base64.decode(tmpfile2, comp_tmpfile_obj)
-                else:
+                if utils.file_mime_type(tmpfile2.name) != "text/plain":
                     # A binary image, use it as it is.
                     return prepare_disk_image(task, tmpfile2.name,
                                               prefix='configdrive')
+
+                tmpfile2.seek(0)
+                cd_images.decode_configdrive(tmpfile2, image_tmpfile_obj)
         else:
-            comp_tmpfile_obj.write(base64.b64decode(content))
-        comp_tmpfile_obj.seek(0)
+            cd_images.decode_configdrive(content, image_tmpfile_obj)
 
-        gz = gzip.GzipFile(fileobj=comp_tmpfile_obj, mode='rb')
-        with tempfile.NamedTemporaryFile(
-                dir=CONF.tempdir, suffix='.img') as image_tmpfile_obj:
-            shutil.copyfileobj(gz, image_tmpfile_obj)
-            image_tmpfile_obj.flush()
-            return prepare_disk_image(task, image_tmpfile_obj.name,
-                                      prefix='configdrive')
+        image_tmpfile_obj.flush()
+        return prepare_disk_image(task, image_tmpfile_obj.name,
+                                  prefix='configdrive')
 
 
 def prepare_disk_image(task, content, prefix=None):
@@ -390,9 +400,137 @@ def cleanup_remote_image(task, file_name):
     ImageHandler(task.node.driver).unpublish_image(file_name)
 
 
+def _get_boot_iso_template_key(task, kernel_href, ramdisk_href,
+                               bootloader_href, boot_mode, inject_files):
+    """Get the key identifying a boot ISO template.
+
+    :returns: the key or None if the template cannot be cached, because the
+        modification time of an image is not known.
+    """
+    sources = []
+    for href in (kernel_href, ramdisk_href, bootloader_href):
+        version = None
+        if href and not service_utils.is_glance_image(href):
+            # NOTE: the contents of non-Glance images can change, like for
+            # the master images of the image caches.
+            version = images.image_show(task.context, href).get('updated_at')
+            if not version:
+                return None
+        sources.append([href, str(version) if version else None])
+
+    files = []
+    for src, dest in (inject_files or {}).items():
+        if isinstance(src, bytes):
+            files.append([dest, hashlib.sha256(src).hexdigest()])
+        else:
+            files.append([dest, src, os.path.getmtime(src)])
+
+    key_data = [boot_mode, sources, sorted(files), CONF.isolinux_bin,
+                CONF.isolinux_config_template, CONF.grub_config_template,
+                CONF.grub_config_path, CONF.esp_image, CONF.ldlinux_c32]
+    return hashlib.sha256(json.dumps(key_data).encode()).hexdigest()
+
+
+def _get_boot_iso_template_mtime(template):
+    try:
+        return os.path.getmtime(template)
+    except FileNotFoundError:
+        # NOTE: removed meanwhile by another conductor sharing the path
+        return 0
+
+
+def _clean_up_boot_iso_templates():
+    """Remove the least recently used boot ISO templates."""
+    templates = glob.glob(os.path.join(CONF.deploy.iso_template_path,
+                                       '*.iso'))
+    templates.sort(key=_get_boot_iso_template_mtime, reverse=True)
+    for template in templates[CONF.deploy.iso_template_count:]:
+        key = os.path.basename(template)[:-len('.iso')]
+        with lockutils.lock('boot-iso-template-%s' % key):
+            LOG.debug('Removing boot ISO template %s', template)
+            utils.unlink_without_raise(template)
+            utils.unlink_without_raise(template[:-len('.iso')] + '.json')
+
+
+def _create_boot_iso_from_template(task, output_filename, kernel_href,
+                                   ramdisk_href, bootloader_href=None,
+                                   root_uuid=None, kernel_params=None,
+                                   boot_mode=None, inject_files=None,
+                                   publisher_id=None):
+    """Create a boot ISO from a template, building the template if needed.
+
+    :returns: True if the ISO has been created, False if templates cannot be
+        used for this ISO.
+    """
+    try:
+        key = _get_boot_iso_template_key(task, kernel_href, ramdisk_href,
+                                         bootloader_href, boot_mode,
+                                         inject_files)
+    except (exception.ImageRefValidationFailed, OSError) as e:
+        LOG.debug('Cannot use a boot ISO template for node %(node)s: '
+                  '%(error)s', {'node': task.node.uuid, 'error': e})
+        return False
+    if key is None:
+        LOG.debug('Cannot use a boot ISO template for node %s, the '
+                  'modification time of its images is unknown',
+                  task.node.uuid)
+        return False
+
+    template = os.path.join(CONF.deploy.iso_template_path, key + '.iso')
+    metadata_file = os.path.join(CONF.deploy.iso_template_path,
+                                 key + '.json')
+    created = False
+    with lockutils.lock('boot-iso-template-%s' % key):
+        if os.path.exists(template):
+            with open(metadata_file) as f:
+                config_path = json.load(f)['config_path']
+            # NOTE: the modification time is used to find the least
+            # recently used templates.
+            os.utime(template)
+        else:
+            LOG.info('Creating %(boot_mode)s boot ISO template %(key)s for '
+                     'kernel %(kernel)s and ramdisk %(ramdisk)s',
+                     {'boot_mode': boot_mode, 'key': key,
+                      'kernel': kernel_href, 'ramdisk': ramdisk_href})
+            fileutils.ensure_tree(CONF.deploy.iso_template_path)
+            tmp_template = template + '.part'
+            with fileutils.remove_path_on_error(tmp_template):
+                config_path = images.create_boot_iso(
+                    task.context, tmp_template, kernel_href, ramdisk_href,
+                    esp_image_href=bootloader_href, boot_mode=boot_mode,
+                    inject_files=inject_files,
+                    publisher_id=images.BOOT_ISO_TEMPLATE_PUBLISHER_ID,
+                    config_size=images.BOOT_ISO_TEMPLATE_CONFIG_SIZE,
+                    image_cache=ISOImageCache())
+                with open(metadata_file, 'w') as f:
+                    json.dump({'config_path': config_path}, f)
+                os.rename(tmp_template, template)
+            created = True
+
+        try:
+            images.create_boot_iso_from_template(
+                template, output_filename, config_path, root_uuid=root_uuid,
+                kernel_params=kernel_params, boot_mode=boot_mode,
+                publisher_id=publisher_id)
+        except exception.ImageCreationFailed as e:
+            LOG.warning('Unable to use boot ISO template %(template)s for '
+                        'node %(node)s, removing it and falling back to '
+                        'building a new ISO. Error: %(error)s',
+                        {'template': template, 'node': task.node.uuid,
+                         'error': e})
+            utils.unlink_without_raise(template)
+            utils.unlink_without_raise(metadata_file)
+            return False
+
+    if created:
+        _clean_up_boot_iso_templates()
+    return True
+
+
 def _prepare_iso_image(task, kernel_href, ramdisk_href,
                        bootloader_href=None, root_uuid=None, params=None,
-                       base_iso=None, inject_files=None):
+                       base_iso=None, inject_files=None,
+                       node_specific_files=False):
     """Prepare an ISO to boot the node.
 
     Build bootable ISO out of `kernel_href` and `ramdisk_href` (and
@@ -409,6 +547,8 @@ def _prepare_iso_image(task, kernel_href, ramdisk_href,
         mapping to be passed to kernel command line.
     :param inject_files: Mapping of local source file paths to their location
         on the final ISO image.
+    :param node_specific_files: Whether some of inject_files are specific to
+        the node, in which case boot ISO templates are not used.
     :returns: bootable ISO HTTP URL.
     :raises: MissingParameterValue, if any of the required parameters are
         missing.
@@ -492,9 +632,17 @@ def _prepare_iso_image(task, kernel_href, ramdisk_href,
                 root_uuid=root_uuid,
                 kernel_params=kernel_params,
                 boot_mode=boot_mode,
-                inject_files=inject_files)
-
-        else:
+                inject_files=inject_files,
+                image_cache=ISOImageCache())
+
+        elif not (CONF.deploy.iso_template_path
+                  and not node_specific_files
+                  and _create_boot_iso_from_template(
+                      task, boot_iso_tmp_file, kernel_href, ramdisk_href,
+                      bootloader_href=bootloader_href, root_uuid=root_uuid,
+                      kernel_params=kernel_params, boot_mode=boot_mode,
+                      inject_files=inject_files,
+                      publisher_id=publisher_id)):
             images.create_boot_iso(
                 task.context, boot_iso_tmp_file,
                 kernel_href, ramdisk_href,
@@ -503,7 +651,8 @@ def _prepare_iso_image(task, kernel_href, ramdisk_href,
                 kernel_params=kernel_params,
                 boot_mode=boot_mode,
                 inject_files=inject_files,
-                publisher_id=publisher_id)
+                publisher_id=publisher_id,
+                image_cache=ISOImageCache())
 
         node_http_url = task.node.driver_info.get("external_http_url")
         image_url = img_handler.publish_image(
@@ -598,7 +747,10 @@ def prepare_deploy_iso(task, params, mode, d_info):
             'openstack/latest/network_data.json'
         )
 
-    return prepare_iso_image(inject_files=inject_files)
+    # NOTE: the network data is specific to the node, an ISO template built
+    # with it could not be shared.
+    return prepare_iso_image(inject_files=inject_files,
+                             node_specific_files=bool(network_data))
 
 
 def prepare_boot_iso(task, d_info, root_uuid=None):
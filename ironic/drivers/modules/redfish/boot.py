@@ -888,8 +888,10 @@ class RedfishVirtualMediaBoot(base.BootInterface):
                                  'device': boot_devices.CDROM})
 
     def _attach_configdrive(self, task, managers):
-        configdrive = manager_utils.get_configdrive_image(task.node)
-        if not configdrive:
+        # NOTE: a configdrive provided as JSON is built by
+        # prepare_configdrive_image, without encoding it first.
+        configdrive = task.node.instance_info.get('configdrive')
+        if not configdrive and not isinstance(configdrive, dict):
             return
 
         if 'ramdisk_boot_configdrive' not in self.capabilities:
@@ -0,0 +1,410 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Power state events from the Redfish EventService.
+
+When ``[redfish]event_receiver_port`` is set, the conductor runs a small
+HTTP server receiving the events of the BMCs, and the redfish power
+interface subscribes each node to them, passing the node UUID as the
+context of the subscription and a token derived from it and
+``[redfish]event_receiver_token`` as a header. Events reporting that the
+system of the node was powered on or off are recorded as the power state of
+the node, other power and reset events trigger a synchronization of the
+power state of the node. Events received for a node while a previous one is
+waiting to be recorded are merged. The receiver is started and stopped with
+the conductor through a conductor hook.
+"""
+
+import hashlib
+import hmac
+import json
+import queue
+import threading
+import types
+from urllib import parse as urlparse
+
+from oslo_log import log
+from oslo_utils import uuidutils
+import sushy
+import webob
+
+from ironic.common import exception
+from ironic.common.i18n import _
+from ironic.common import metrics_utils
+from ironic.common import states
+from ironic.common import wsgi_service
+from ironic.conductor import hooks
+from ironic.conf import CONF
+from ironic.drivers.modules.redfish import utils as redfish_utils
+
+LOG = log.getLogger(__name__)
+METRICS = metrics_utils.get_metrics_logger(__name__)
+
+TOKEN_HEADER = 'X-Ironic-Event-Token'
+"""The header BMCs pass the token of the subscribed node in."""
+
+SUBSCRIPTION_INFO = 'redfish_event_subscription'
+"""The driver_internal_info field with the ID of the subscription."""
+
+# Messages of the ResourceEvent registry reporting a new power state
+_POWER_STATES = {
+    'ResourcePoweredOn': states.POWER_ON,
+    'ResourcePoweredOff': states.POWER_OFF,
+}
+
+# Event types carrying power and reset events
+_EVENT_TYPES = ('StatusChange', 'ResourceUpdated', 'Alert')
+
+# UUIDs of the nodes subscribed to events by this conductor
+_SUBSCRIBED = set()
+
+
+def _origin(record):
+    origin = record.get('OriginOfCondition') or ''
+    if isinstance(origin, dict):
+        origin = origin.get('@odata.id') or ''
+    return origin
+
+
+def parse_event(payload):
+    """Extract the power state changes from a Redfish event.
+
+    :param payload: the deserialized body of an event.
+    :raises: InvalidParameterValue if the payload is not a Redfish event.
+    :returns: a dict mapping node UUIDs to tuples (power state, origin).
+        The power state is None when it has to be synchronized, the origin
+        is the URI of the resource which has reported it.
+    """
+    if not isinstance(payload, dict):
+        raise exception.InvalidParameterValue(
+            _('A Redfish event must be a JSON object'))
+    records = payload.get('Events') or []
+    if not isinstance(records, list):
+        raise exception.InvalidParameterValue(
+            _('Events of a Redfish event must be a list'))
+
+    result = {}
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        # Before Event v1.1 the context is only set on the records
+        node_uuid = payload.get('Context') or record.get('Context')
+        if not uuidutils.is_uuid_like(node_uuid):
+            continue
+        message = str(record.get('MessageId') or '').rsplit('.', 1)[-1]
+        origin = _origin(record)
+        if message in _POWER_STATES and '/Systems/' in origin:
+            power_state = _POWER_STATES[message]
+        elif 'Power' in message or 'Reset' in message:
+            # Either a transition, a power supply or chassis event or a
+            # vendor message, let the synchronization find out.
+            power_state = None
+        else:
+            continue
+        # The latest record wins
+        result[node_uuid] = (power_state, origin)
+    return result
+
+
+def _node_token(node_uuid):
+    """Derive the token of a node from ``[redfish]event_receiver_token``.
+
+    Each BMC only knows the tokens of its own nodes, so it cannot send
+    events on behalf of the nodes of other BMCs.
+    """
+    return hmac.new(CONF.redfish.event_receiver_token.encode(),
+                    node_uuid.encode(), hashlib.sha256).hexdigest()
+
+
+def _resource_path(uri):
+    return urlparse.urlsplit(uri).path.rstrip('/')
+
+
+def is_system_origin(node, origin):
+    """Check whether an event originates from the system of a node.
+
+    :param node: the node the event has been received for.
+    :param origin: the origin of the event, as returned by parse_event.
+    :returns: True if the origin is ``driver_info/redfish_system_id`` of
+        the node or, without it, any system of its BMC, which then has a
+        single one.
+    """
+    system_id = node.driver_info.get('redfish_system_id')
+    if not system_id:
+        return '/Systems/' in origin
+    return _resource_path(origin) == _resource_path(system_id)
+
+
+class EventReceiver(wsgi_service.BaseWSGIService):
+    """Receives Redfish events and hands the power states over."""
+
+    def __init__(self, handler):
+        """Create the receiver, without starting it.
+
+        :param handler: a callable accepting a node UUID, the power state
+            reported for it, None if it has to be synchronized, and the
+            origin of the event. It is called from
+            ``[redfish]event_receiver_workers`` threads, never for the same
+            node at once.
+        :raises: ConfigInvalid if the receiver is not fully configured.
+        """
+        if (not CONF.redfish.event_receiver_url
+                or not CONF.redfish.event_receiver_token):
+            raise exception.ConfigInvalid(
+                error_msg=_('[redfish]event_receiver_url and '
+                            '[redfish]event_receiver_token are required '
+                            'when [redfish]event_receiver_port is set'))
+        self._handler = handler
+        self._lock = threading.Lock()
+        # Maps node UUIDs to the latest (power state, origin) reported for
+        # them
+        self._pending = {}
+        # Nodes being handled, their new events wait in _pending
+        self._handling = set()
+        self._queue = queue.Queue()
+        self._workers = []
+        conf = types.SimpleNamespace(
+            host_ip=CONF.redfish.event_receiver_host_ip,
+            port=CONF.redfish.event_receiver_port,
+            unix_socket=None,
+            use_ssl=CONF.redfish.event_receiver_use_ssl,
+            cert_file=CONF.redfish.event_receiver_cert_file,
+            key_file=CONF.redfish.event_receiver_key_file)
+        super().__init__('ironic-redfish-events', self._application, conf)
+
+    def start(self):
+        """Start receiving events and the threads handling them."""
+        super().start()
+        for _i in range(CONF.redfish.event_receiver_workers):
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """Stop receiving events, handle the pending ones."""
+        super().stop()
+        for _worker in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def ingest(self, power_states):
+        """Queue power states for their handler.
+
+        :param power_states: a dict as returned by parse_event.
+        """
+        merged = 0
+        with self._lock:
+            for node_uuid, event in power_states.items():
+                if node_uuid in self._pending:
+                    merged += 1
+                elif node_uuid not in self._handling:
+                    self._queue.put(node_uuid)
+                self._pending[node_uuid] = event
+        if merged:
+            METRICS.send_counter('EventReceiver.merged', merged)
+
+    def _work(self):
+        while True:
+            node_uuid = self._queue.get()
+            if node_uuid is None:
+                return
+            with self._lock:
+                power_state, origin = self._pending.pop(node_uuid)
+                self._handling.add(node_uuid)
+            try:
+                self._handler(node_uuid, power_state, origin)
+            except Exception:
+                LOG.exception('Unable to handle the power event of node %s',
+                              node_uuid)
+            finally:
+                with self._lock:
+                    self._handling.discard(node_uuid)
+                    if node_uuid in self._pending:
+                        self._queue.put(node_uuid)
+
+    def _error(self, environment, start_response, code, message):
+        body = {'error': {'code': code, 'message': message}}
+        return webob.Response(status_code=code, json_body=body)(
+            environment, start_response)
+
+    def _application(self, environment, start_response):
+        """WSGI application receiving Redfish events."""
+        request = webob.Request(environment)
+        if request.method != 'POST':
+            return self._error(environment, start_response, 405,
+                               _('Only POST method can be used'))
+
+        token = request.headers.get(TOKEN_HEADER, '')
+        if not token:
+            LOG.debug('Rejecting an event from %s without a token',
+                      request.remote_addr)
+            return self._error(environment, start_response, 401,
+                               _('Unauthorized'))
+
+        try:
+            power_states = parse_event(json.loads(request.body))
+        except (ValueError, exception.InvalidParameterValue) as e:
+            LOG.debug('Rejecting an invalid event from %(addr)s: %(error)s',
+                      {'addr': request.remote_addr, 'error': e})
+            return self._error(environment, start_response, 400, str(e))
+
+        # The token is only valid for the node of the subscription, the
+        # context of every record has to match it.
+        for node_uuid in power_states:
+            if not hmac.compare_digest(token.encode(),
+                                       _node_token(node_uuid).encode()):
+                LOG.debug('Rejecting an event from %(addr)s without a valid '
+                          'token for node %(node)s',
+                          {'addr': request.remote_addr, 'node': node_uuid})
+                return self._error(environment, start_response, 401,
+                                   _('Unauthorized'))
+
+        METRICS.send_counter('EventReceiver.received', 1)
+        subscribed = _SUBSCRIBED.intersection(power_states)
+        if len(subscribed) < len(power_states):
+            LOG.debug('Ignoring the events of nodes %s, which are not '
+                      'subscribed by this conductor',
+                      ', '.join(set(power_states) - subscribed))
+        self.ingest({node_uuid: power_states[node_uuid]
+                     for node_uuid in subscribed})
+        return webob.Response(status_code=204)(environment, start_response)
+
+
+def subscribed_nodes():
+    """Return the UUIDs of the nodes subscribed to events."""
+    return frozenset(_SUBSCRIBED)
+
+
+def prune_subscribed_nodes(node_uuids):
+    """Forget the subscribed nodes which are not managed anymore.
+
+    The events of nodes deleted or taken over by another conductor are
+    then ignored, and their power state is not recorded by this conductor.
+
+    :param node_uuids: the UUIDs of the nodes mapped to this conductor.
+    """
+    stale = _SUBSCRIBED.difference(node_uuids)
+    if stale:
+        _SUBSCRIBED.difference_update(stale)
+        LOG.debug('Forgot the event subscriptions of nodes %s, which are '
+                  'not mapped to this conductor anymore', ', '.join(stale))
+
+
+class _ReceiverHook(hooks.ConductorHook):
+    """Runs the event receiver while the conductor runs."""
+
+    def __init__(self):
+        self._receiver = None
+
+    def start(self, power_event_handler):
+        if not CONF.redfish.event_receiver_port:
+            return
+
+        def handler(node_uuid, power_state, origin):
+            power_event_handler(
+                node_uuid, power_state,
+                check=lambda node: is_system_origin(node, origin))
+
+        receiver = EventReceiver(handler)
+        receiver.start()
+        self._receiver = receiver
+
+    def stop(self):
+        receiver, self._receiver = self._receiver, None
+        if receiver is not None:
+            receiver.stop()
+
+    def power_event_nodes(self):
+        if self._receiver is None:
+            return frozenset()
+        return subscribed_nodes()
+
+
+hooks.register('redfish-events', _ReceiverHook())
+
+
+def _create_subscription(node, event_service):
+    allowed = {event_type.value for event_type
+               in event_service.get_event_types_for_subscription()}
+    event_types = [event_type for event_type in _EVENT_TYPES
+                   if event_type in allowed] or ['Alert']
+    # NOTE: a BMC may manage several systems, only those of the node matter
+    system_id = (node.driver_info.get('redfish_system_id')
+                 or redfish_utils.get_system(node).path)
+    payload = {
+        'Destination': CONF.redfish.event_receiver_url,
+        'Protocol': 'Redfish',
+        'Context': node.uuid,
+        'EventTypes': event_types,
+        'OriginResources': [{'@odata.id': system_id}],
+        'HttpHeaders': [{TOKEN_HEADER: _node_token(node.uuid)}],
+    }
+    subscription = event_service.subscriptions.create(payload)
+    if subscription is None:
+        raise exception.RedfishError(
+            error=_('the BMC did not return the new subscription'))
+    return subscription
+
+
+def check_subscription(task):
+    """Make sure the BMC of a node sends its events to this conductor.
+
+    Creates the subscription of the node if it is missing or does not
+    point to ``[redfish]event_receiver_url``, e.g. because the node was
+    previously managed by another conductor.
+
+    :param task: a TaskManager instance with a shared lock, upgraded if
+        the node has to be updated.
+    :raises: NodeLocked if the lock cannot be upgraded.
+    :returns: True if the node is subscribed, False otherwise.
+    """
+    node = task.node
+    subscription_id = node.driver_internal_info.get(SUBSCRIPTION_INFO)
+    try:
+        event_service = redfish_utils.get_event_service(node)
+        if subscription_id:
+            subscriptions = event_service.subscriptions
+            separator = '' if subscriptions.path.endswith('/') else '/'
+            try:
+                subscription = subscriptions.get_member(
+                    subscriptions.path + separator + subscription_id)
+            except sushy.exceptions.ResourceNotFoundError:
+                subscription = None
+            if (subscription is not None
+                    and subscription.context == node.uuid
+                    and subscription.destination
+                    == CONF.redfish.event_receiver_url):
+                _SUBSCRIBED.add(node.uuid)
+                return True
+            if subscription is not None:
+                subscription.delete()
+
+        subscription = _create_subscription(node, event_service)
+    except (exception.RedfishError, exception.RedfishConnectionError,
+            sushy.exceptions.SushyError) as e:
+        LOG.warning('Unable to subscribe to the power events of node '
+                    '%(node)s, its power state is synchronized on every run. '
+                    'Error: %(error)s', {'node': node.uuid, 'error': e})
+        _SUBSCRIBED.discard(node.uuid)
+        return False
+
+    task.upgrade_lock()
+    task.node.set_driver_internal_info(SUBSCRIPTION_INFO,
+                                       subscription.identity)
+    task.node.save()
+    _SUBSCRIBED.add(node.uuid)
+    LOG.info('Subscribed to the power events of node %(node)s, '
+             'subscription %(id)s', {'node': node.uuid,
+                                     'id': subscription.identity})
+    return True
@@ -360,8 +360,9 @@ class RedfishFirmware(base.FirmwareInterface):
         spacing=CONF.redfish.firmware_update_fail_interval,
         filters={'reserved': False, 'provision_state_in': [states.CLEANWAIT,
                  states.DEPLOYWAIT, states.SERVICEWAIT]},
-        predicate_extra_fields=['driver_internal_info'],
-        predicate=lambda n: n.driver_internal_info.get('redfish_fw_updates'),
+        predicate_extra_fields=['driver_internal_info', 'driver_info'],
+        predicate=lambda n: firmware_utils.update_needs_attention(
+            n, n.driver_internal_info.get('redfish_fw_updates')),
     )
     def _query_update_status(self, task, manager, context):
         """Periodic job to check firmware update tasks."""
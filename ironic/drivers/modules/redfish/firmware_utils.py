@@ -25,6 +25,7 @@ from ironic.common.i18n import _
 from ironic.common import image_service
 from ironic.common import swift
 from ironic.conf import CONF
+from ironic.drivers.modules.redfish import task_poller
 from ironic.drivers.modules.redfish import utils as redfish_utils
 
 LOG = log.getLogger(__name__)
@@ -126,6 +127,26 @@ def validate_firmware_interface_update_args(settings):
             % {'settings': settings, 'err': err})
 
 
+def update_needs_attention(node, updates):
+    """Check whether the firmware updates of a node have to be handled.
+
+    :param node: the node as passed to a node_periodic predicate, with at
+        least the ``uuid`` and ``driver_info`` fields.
+    :param updates: the list of firmware updates of the node as stored in
+        its driver_internal_info.
+    :returns: False if there are no updates or the current one is still
+        processing, True otherwise.
+    """
+    if not updates:
+        return False
+    current_update = updates[0]
+    if current_update.get('wait_start_time'):
+        return True
+    return task_poller.needs_attention(
+        node, [current_update['task_monitor']]
+        if current_update.get('task_monitor') else [])
+
+
 def get_swift_temp_url(parsed_url):
     """Gets Swift temporary URL
 
@@ -993,8 +993,9 @@ class RedfishManagement(base.ManagementInterface):
         purpose='checking async firmware update tasks',
         spacing=CONF.redfish.firmware_update_status_interval,
         filters={'reserved': False, 'provision_state': states.CLEANWAIT},
-        predicate_extra_fields=['driver_internal_info'],
-        predicate=lambda n: n.driver_internal_info.get('firmware_updates'),
+        predicate_extra_fields=['driver_internal_info', 'driver_info'],
+        predicate=lambda n: firmware_utils.update_needs_attention(
+            n, n.driver_internal_info.get('firmware_updates')),
     )
     def _query_firmware_update_status(self, task, manager, context):
         """Periodic job to check firmware update tasks."""
@@ -21,9 +21,12 @@ import sushy
 from ironic.common import exception
 from ironic.common.i18n import _
 from ironic.common import states
+from ironic.conductor import periodics
 from ironic.conductor import task_manager
 from ironic.conductor import utils as cond_utils
+from ironic.conf import CONF
 from ironic.drivers import base
+from ironic.drivers.modules.redfish import events as redfish_events
 from ironic.drivers.modules.redfish import management as redfish_mgmt
 from ironic.drivers.modules.redfish import utils as redfish_utils
 
@@ -178,3 +181,23 @@ class RedfishPower(base.PowerInterface):
                   in :mod:`ironic.common.states`.
         """
         return list(SET_POWER_STATE_MAP)
+
+    @periodics.node_periodic(
+        purpose='checking Redfish event subscriptions',
+        spacing=CONF.redfish.event_subscription_interval,
+        enabled=bool(CONF.redfish.event_receiver_port
+                     and CONF.redfish.event_subscription_interval),
+        filters={'reserved': False, 'maintenance': False},
+    )
+    def _check_event_subscription(self, task, manager, context):
+        """Periodic job to subscribe to the power events of nodes."""
+        redfish_events.check_subscription(task)
+
+    @periodics.periodic(
+        spacing=CONF.redfish.event_subscription_interval,
+        enabled=bool(CONF.redfish.event_receiver_port
+                     and CONF.redfish.event_subscription_interval))
+    def _prune_event_subscriptions(self, manager, context):
+        """Periodic job to forget the nodes this conductor lost."""
+        redfish_events.prune_subscribed_nodes(
+            {node_info[0] for node_info in manager.iter_nodes()})
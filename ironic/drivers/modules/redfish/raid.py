@@ -30,6 +30,7 @@ from ironic.conductor import utils as manager_utils
 from ironic.conf import CONF
 from ironic.drivers import base
 from ironic.drivers.modules import deploy_utils
+from ironic.drivers.modules.redfish import task_poller
 from ironic.drivers.modules.redfish import utils as redfish_utils
 
 LOG = log.getLogger(__name__)
@@ -109,6 +110,20 @@ def convert_drive_units(logical_disks, node):
         del disk['size_gb']
 
 
+def _raid_config_needs_attention(node):
+    """Check whether the RAID configuration of a node has to be handled.
+
+    :param node: the node as passed to a node_periodic predicate.
+    :returns: False if there is no RAID configuration in progress or all
+        its tasks are still processing, True otherwise.
+    """
+    raid_configs = node.driver_internal_info.get('raid_configs')
+    if not raid_configs:
+        return False
+    return task_poller.needs_attention(
+        node, raid_configs.get('task_monitor_uri') or [])
+
+
 def get_physical_disks(node):
     """Get the physical drives of the node for RAID controllers.
 
@@ -970,8 +985,8 @@ class RedfishRAID(base.RAIDInterface):
         spacing=CONF.redfish.raid_config_status_interval,
         filters={'reserved': False, 'provision_state_in': {
             states.CLEANWAIT, states.DEPLOYWAIT}},
-        predicate_extra_fields=['driver_internal_info'],
-        predicate=lambda n: n.driver_internal_info.get('raid_configs'),
+        predicate_extra_fields=['driver_internal_info', 'driver_info'],
+        predicate=_raid_config_needs_attention,
     )
     def _query_raid_config_status(self, task, manager, context):
         """Periodic job to check RAID config tasks."""
@@ -0,0 +1,178 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Shared polling of Redfish task monitors.
+
+The periodic tasks checking asynchronous RAID and firmware update tasks
+lock every node with an outstanding task and poll its task monitor on each
+run. When ``[redfish]task_monitor_max_requests`` is set, their predicates
+register the task monitors here instead. The monitors are polled in the
+background with a limit of requests per BMC and a per-monitor backoff
+which honours the Retry-After hints of the BMCs, and nodes are only locked
+once one of their tasks is no longer processing.
+"""
+
+import threading
+import time
+
+from oslo_log import log
+
+from ironic.common import metrics_utils
+from ironic.conductor import bmc_io
+from ironic.conductor import hooks
+from ironic.conf import CONF
+from ironic.drivers.modules.redfish import utils as redfish_utils
+
+LOG = log.getLogger(__name__)
+METRICS = metrics_utils.get_metrics_logger(__name__)
+
+# Monitors not reported by any predicate for this number of seconds are
+# dropped, e.g. because their node left the wait state.
+_FORGET_AFTER = 3600
+
+
+class _Monitor(object):
+    """An outstanding task monitor of a node."""
+
+    __slots__ = ('node', 'uri', 'bmc', 'processing', 'polling', 'delay',
+                 'next_poll', 'seen')
+
+    def __init__(self, node, uri, now):
+        self.node = node
+        self.uri = uri
+        self.bmc = bmc_io.bmc_key(node.driver_info, default=node.uuid)
+        # None until polled, then whether the task is still processing
+        self.processing = None
+        self.polling = False
+        self.delay = 0
+        self.next_poll = now
+        self.seen = now
+
+
+class TaskMonitorPoller(hooks.ConductorHook):
+    """A registry of task monitors polled in the background."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Maps (node UUID, task monitor URI) to monitors
+        self._monitors = {}
+        self._engine = None
+
+    def _get_engine(self):
+        if self._engine is None:
+            self._engine = bmc_io.BMCRequestEngine(
+                CONF.redfish.task_monitor_max_requests,
+                CONF.redfish.task_monitor_max_requests_per_bmc)
+        return self._engine
+
+    def stop(self):
+        """Stop polling, waiting for the running requests to finish."""
+        with self._lock:
+            engine, self._engine = self._engine, None
+            self._monitors = {}
+        if engine is not None:
+            engine.stop(wait=True)
+
+    def needs_attention(self, node, uris):
+        """Check whether the tasks of a node have to be handled.
+
+        :param node: the node as passed to a node_periodic predicate, with
+            at least the ``uuid`` and ``driver_info`` fields.
+        :param uris: the URIs of the task monitors of the outstanding tasks
+            of the node.
+        :returns: True if one of the tasks is no longer processing or its
+            status could not be fetched, False while they are processing or
+            their status is being fetched.
+        """
+        if not uris:
+            return True
+
+        now = time.monotonic()
+        result = False
+        due = []
+        with self._lock:
+            for key, monitor in list(self._monitors.items()):
+                if ((key[0] == node.uuid and key[1] not in uris)
+                        or monitor.seen < now - _FORGET_AFTER):
+                    del self._monitors[key]
+
+            for uri in uris:
+                monitor = self._monitors.get((node.uuid, uri))
+                if monitor is None:
+                    monitor = _Monitor(node, uri, now)
+                    self._monitors[(node.uuid, uri)] = monitor
+                else:
+                    # Pick up updated credentials or addresses
+                    monitor.node = node
+                    monitor.seen = now
+
+                if monitor.processing is False:
+                    result = True
+                elif not monitor.polling and monitor.next_poll <= now:
+                    monitor.polling = True
+                    due.append(monitor)
+
+        if due:
+            engine = self._get_engine()
+            for monitor in due:
+                if engine.submit(monitor.bmc, (node.uuid, monitor.uri),
+                                 self._poll, monitor) is None:
+                    monitor.polling = False
+        return result
+
+    def _poll(self, monitor):
+        try:
+            task_monitor = redfish_utils.get_task_monitor(monitor.node,
+                                                          monitor.uri)
+            processing = task_monitor.is_processing
+            sleep_for = float(task_monitor.sleep_for) if processing else 0
+        except Exception as e:
+            # Let the periodic task deal with the error under a lock
+            LOG.debug('Unable to get the status of task %(uri)s of node '
+                      '%(node)s: %(error)s',
+                      {'uri': monitor.uri, 'node': monitor.node.uuid,
+                       'error': e})
+            processing = False
+        finally:
+            monitor.polling = False
+
+        if processing:
+            monitor.delay = min(CONF.redfish.task_monitor_max_interval,
+                                max(sleep_for, monitor.delay * 2, 1))
+            monitor.next_poll = time.monotonic() + monitor.delay
+            LOG.debug('Task %(uri)s of node %(node)s is still processing, '
+                      'polling it again in %(delay).0f seconds',
+                      {'uri': monitor.uri, 'node': monitor.node.uuid,
+                       'delay': monitor.delay})
+        else:
+            METRICS.send_counter('TaskMonitorPoller.finished', 1)
+        monitor.processing = processing
+
+
+_POLLER = TaskMonitorPoller()
+hooks.register('redfish-task-monitors', _POLLER)
+
+
+def needs_attention(node, uris):
+    """Check whether the tasks of a node have to be handled.
+
+    Always True when the shared polling is disabled, see
+    TaskMonitorPoller.needs_attention otherwise.
+
+    :param node: the node as passed to a node_periodic predicate, with at
+        least the ``uuid`` and ``driver_info`` fields.
+    :param uris: the URIs of the task monitors of the outstanding tasks of
+        the node.
+    """
+    if not CONF.redfish.task_monitor_max_requests:
+        return True
+    return _POLLER.needs_attention(node, uris)
@@ -18,6 +18,7 @@ from oslo_log import log
 from oslo_utils import versionutils
 from oslo_versionedobjects import base as object_base
 from oslo_versionedobjects import exception as ovo_exception
+from oslo_versionedobjects import fields as ovo_fields
 
 from ironic.common import release_mappings as versions
 from ironic.conf import CONF
@@ -26,6 +27,43 @@ from ironic.objects import fields as object_fields
 
 LOG = log.getLogger(__name__)
 
+# Field types whose coercion returns values of the given Python type
+# unchanged. Only exact types are listed, since subclasses (e.g. Enum) may
+# add validation.
+_NATIVE_FIELD_TYPES = {
+    ovo_fields.String: str,
+    ovo_fields.UUID: str,
+    ovo_fields.Integer: int,
+    ovo_fields.Float: float,
+    ovo_fields.Boolean: bool,
+}
+
+# Cache of field plans, see _get_db_field_plan.
+_DB_FIELD_PLANS = {}
+
+
+def _get_db_field_plan(cls):
+    """Return how the fields of an object class are loaded from the DB.
+
+    :param cls: the VersionedObject class.
+    :returns: a dictionary mapping field names to tuples (attribute name,
+              native type, nullable). The native type is None for fields
+              that always need to be coerced.
+    """
+    try:
+        return _DB_FIELD_PLANS[cls]
+    except KeyError:
+        pass
+    plan = {}
+    for name, field in cls.fields.items():
+        native = None
+        if isinstance(field, ovo_fields.Field):
+            native = _NATIVE_FIELD_TYPES.get(type(field._type))
+        plan[name] = (object_base._get_attrname(name), native,
+                      getattr(field, 'nullable', False))
+    _DB_FIELD_PLANS[cls] = plan
+    return plan
+
 
 def max_version(versions):
     """Return the maximum version in the list.
@@ -249,8 +287,18 @@ class IronicObject(object_base.VersionedObject):
         :param fields: list of fields to set on obj from values from db_object.
         """
         fields = fields or self.fields
+        plan = _get_db_field_plan(self.__class__)
         for field in fields:
-            setattr(self, field, db_object[field])
+            value = db_object[field]
+            attrname, native, nullable = plan.get(field, (None, None, False))
+            # NOTE: values which already have the right type (as returned by
+            # SQLAlchemy) are stored directly, skipping the coercion. The
+            # changes are reset by the callers after loading the object.
+            if native is not None and (type(value) is native
+                                       or (value is None and nullable)):
+                setattr(self, attrname, value)
+            else:
+                setattr(self, field, value)
 
     @staticmethod
     def _from_db_object(context, obj, db_object, fields=None):
@@ -312,8 +360,32 @@ class IronicObject(object_base.VersionedObject):
                        objects.
         :returns: A list of objects corresponding to the database entities
         """
-        return [cls._from_db_object(context, cls(), db_obj, fields=fields)
-                for db_obj in db_objects]
+        result = []
+        latest_version = cls.VERSION
+        # The versions are checked only once for all objects, most of the
+        # time they all have the same version.
+        compatible_versions = set()
+        for db_obj in db_objects:
+            db_version = db_obj['version']
+            if db_version not in compatible_versions:
+                if not versionutils.is_compatible(db_version,
+                                                  latest_version):
+                    raise ovo_exception.IncompatibleObjectVersion(
+                        objname=cls.obj_name(), objver=db_version,
+                        supported=latest_version)
+                compatible_versions.add(db_version)
+
+            obj = cls()
+            obj._set_from_db_object(context, db_obj, fields)
+            obj._context = context
+            obj.obj_reset_changes()
+            if db_version != latest_version:
+                # convert to the latest version
+                obj.VERSION = db_version
+                obj.convert_to_version(latest_version,
+                                       remove_unavailable_fields=False)
+            result.append(obj)
+        return result
 
     def do_version_changes_for_db(self):
         """Change the object to the version needed for the database.
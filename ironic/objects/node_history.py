@@ -165,6 +165,25 @@ class NodeHistory(base.IronicObject, object_base.VersionedObjectDictCompat):
         db_history = self.dbapi.create_node_history(values)
         self._from_db_object(self._context, self, db_history)
 
+    # NOTE(xek): We don't want to enable RPC on this call just yet. Remotable
+    # methods can be used in the future to replace current explicit RPC calls.
+    # Implications of calling new remote procedures should be thought through.
+    # @object_base.remotable_classmethod
+    @classmethod
+    def create_bulk(cls, context, histories):
+        """Create several NodeHistory records in the DB with one query.
+
+        Unlike :meth:`create`, the objects are not refreshed from the
+        database, so their ``id`` and ``uuid`` fields stay unset.
+
+        :param context: Security context.
+        :param histories: A list of :class:`NodeHistory` objects, all with
+                          the same fields set.
+        """
+        values = [history.do_version_changes_for_db()
+                  for history in histories]
+        cls.dbapi.create_node_history_bulk(values)
+
     # NOTE(xek): We don't want to enable RPC on this call just yet. Remotable
     # methods can be used in the future to replace current explicit RPC calls.
     # Implications of calling new remote procedures should be thought through.
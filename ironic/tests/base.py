@@ -203,6 +203,11 @@ class TestCase(oslo_test_base.BaseTestCase):
         self.config(enabled_hardware_types=['fake-hardware',
                                             'manual-management'])
         self.config(initial_grub_template=None, group='pxe')
+        # NOTE: image properties are cached across image service instances,
+        # tests which exercise the cache enable it explicitly.
+        self.config(image_info_cache_ttl=0)
+        # NOTE: the same goes for neutron clients and network metadata.
+        self.config(cache_ttl=0, group='neutron')
         for iface in drivers_base.ALL_INTERFACES:
             default = None
 
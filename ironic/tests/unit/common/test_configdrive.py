@@ -0,0 +1,119 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import binascii
+import gzip
+import io
+import os
+from unittest import mock
+
+from oslo_concurrency import processutils
+
+from ironic.common import configdrive as cd_images
+from ironic.common import exception
+from ironic.tests import base
+
+
+class EncodeDecodeTestCase(base.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Spans several chunks and does not end on a chunk boundary
+        self.image = os.urandom(cd_images._CHUNK_SIZE * 2 + 1234)
+
+    def _decode(self, configdrive):
+        decoded = io.BytesIO()
+        cd_images.decode_configdrive(configdrive, decoded)
+        return decoded.getvalue()
+
+    def test_encode(self):
+        encoded = io.StringIO()
+        cd_images.encode_configdrive(io.BytesIO(self.image), encoded)
+        self.assertEqual(
+            self.image,
+            gzip.decompress(base64.b64decode(encoded.getvalue())))
+
+    def test_decode(self):
+        configdrive = base64.b64encode(gzip.compress(self.image)).decode()
+        self.assertEqual(self.image, self._decode(configdrive))
+
+    def test_decode_with_line_breaks(self):
+        configdrive = base64.encodebytes(gzip.compress(self.image)).decode()
+        self.assertIn('\n', configdrive)
+        self.assertEqual(self.image, self._decode(configdrive))
+
+    def test_decode_file(self):
+        configdrive = base64.encodebytes(gzip.compress(self.image))
+        self.assertEqual(self.image, self._decode(io.BytesIO(configdrive)))
+
+    def test_decode_multiple_members(self):
+        configdrive = base64.b64encode(
+            gzip.compress(b'foo') + gzip.compress(b'bar')).decode()
+        self.assertEqual(b'foobar', self._decode(configdrive))
+
+    def test_round_trip(self):
+        encoded = io.StringIO()
+        cd_images.encode_configdrive(io.BytesIO(self.image), encoded)
+        self.assertEqual(self.image, self._decode(encoded.getvalue()))
+
+    def test_decode_invalid_base64(self):
+        self.assertRaises(binascii.Error, self._decode, 'abc')
+
+    def test_decode_invalid_gzip(self):
+        self.assertRaises(gzip.BadGzipFile, self._decode,
+                          base64.b64encode(b'not gzip').decode())
+
+
+@mock.patch.object(processutils, 'execute', autospec=True)
+class WriteConfigdriveImageTestCase(base.TestCase):
+
+    def _assert_files(self, mock_exec, tool):
+        path = mock_exec.call_args[0][-1]
+        self.assertEqual(tool, mock_exec.call_args[0][0])
+        with open(os.path.join(path, 'openstack', 'latest',
+                               'meta_data.json')) as fp:
+            self.assertEqual('{"uuid": "1234"}', fp.read())
+        with open(os.path.join(path, 'openstack', 'latest',
+                               'user_data'), 'rb') as fp:
+            self.assertEqual(b'data', fp.read())
+
+    def test_write(self, mock_exec):
+        mock_exec.side_effect = lambda *args, **kwargs: self._assert_files(
+            mock_exec, 'genisoimage')
+        cd_images.write_configdrive_image('/tmp/cd.iso', {'uuid': '1234'},
+                                          user_data=b'data')
+        mock_exec.assert_called_once_with(
+            'genisoimage', '-o', '/tmp/cd.iso', '-ldots', '-allow-lowercase',
+            '-allow-multidot', '-l', '-publisher', 'Ironic', '-quiet', '-J',
+            '-r', '-V', 'config-2', mock.ANY, attempts=1)
+
+    def test_write_fallback(self, mock_exec):
+        mock_exec.side_effect = [FileNotFoundError(), FileNotFoundError(),
+                                 ('', '')]
+        cd_images.write_configdrive_image('/tmp/cd.iso', {'uuid': '1234'})
+        self.assertEqual(['genisoimage', 'mkisofs', 'xorrisofs'],
+                         [c[0][0] for c in mock_exec.call_args_list])
+
+    def test_write_no_tools(self, mock_exec):
+        mock_exec.side_effect = FileNotFoundError()
+        self.assertRaises(exception.ImageCreationFailed,
+                          cd_images.write_configdrive_image,
+                          '/tmp/cd.iso', {'uuid': '1234'})
+        self.assertEqual(3, mock_exec.call_count)
+
+    def test_write_fails(self, mock_exec):
+        mock_exec.side_effect = processutils.ProcessExecutionError()
+        self.assertRaises(exception.ImageCreationFailed,
+                          cd_images.write_configdrive_image,
+                          '/tmp/cd.iso', {'uuid': '1234'})
+        mock_exec.assert_called_once()
@@ -0,0 +1,112 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import fcntl
+import os
+import shutil
+from unittest import mock
+
+import fixtures
+
+from ironic.common import file_copy
+from ironic.tests import base
+
+
+class CopyFileTestCase(base.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        self.source = os.path.join(self.tempdir, 'source')
+        self.dest = os.path.join(self.tempdir, 'dest')
+        self.content = os.urandom(256 * 1024)
+        with open(self.source, 'wb') as f:
+            f.write(self.content)
+        self.mock_counter = self.useFixture(fixtures.MockPatchObject(
+            file_copy.METRICS, 'send_counter', autospec=True)).mock
+
+    def _read_dest(self):
+        with open(self.dest, 'rb') as f:
+            return f.read()
+
+    def test_hardlink(self):
+        result = file_copy.copy_file(self.source, self.dest, 'op')
+        self.assertEqual(file_copy.HARDLINK, result)
+        self.assertEqual(os.stat(self.source).st_ino,
+                         os.stat(self.dest).st_ino)
+        self.mock_counter.assert_called_once_with('op.hardlink', 1)
+
+    @mock.patch.object(fcntl, 'ioctl', autospec=True)
+    def test_reflink(self, mock_ioctl):
+        result = file_copy.copy_file(self.source, self.dest, 'op',
+                                     hardlink=False)
+        self.assertEqual(file_copy.REFLINK, result)
+        mock_ioctl.assert_called_once_with(mock.ANY, file_copy._FICLONE,
+                                           mock.ANY)
+        self.assertNotEqual(os.stat(self.source).st_ino,
+                            os.stat(self.dest).st_ino)
+        self.mock_counter.assert_called_once_with('op.reflink', 1)
+
+    @mock.patch.object(fcntl, 'ioctl', autospec=True)
+    @mock.patch.object(os, 'link', autospec=True)
+    def test_copy_file_range(self, mock_link, mock_ioctl):
+        mock_link.side_effect = OSError(errno.EXDEV, 'cross-device link')
+        mock_ioctl.side_effect = OSError(errno.EOPNOTSUPP, 'not supported')
+        result = file_copy.copy_file(self.source, self.dest, 'op')
+        self.assertEqual(file_copy.COPY_FILE_RANGE, result)
+        self.assertEqual(self.content, self._read_dest())
+        self.mock_counter.assert_called_once_with('op.copy_file_range', 1)
+
+    @mock.patch.object(shutil, 'copyfile', autospec=True)
+    @mock.patch.object(os, 'copy_file_range', autospec=True, create=True)
+    @mock.patch.object(fcntl, 'ioctl', autospec=True)
+    def test_copy(self, mock_ioctl, mock_copy_range, mock_copy):
+        mock_ioctl.side_effect = OSError(errno.EOPNOTSUPP, 'not supported')
+        mock_copy_range.side_effect = OSError(errno.EXDEV, 'not supported')
+        result = file_copy.copy_file(self.source, self.dest, 'op',
+                                     hardlink=False)
+        self.assertEqual(file_copy.COPY, result)
+        mock_copy.assert_called_once_with(self.source, self.dest)
+        # The partial destinations of the failed strategies are removed
+        self.assertFalse(os.path.exists(self.dest))
+        self.mock_counter.assert_called_once_with('op.copy', 1)
+
+    @mock.patch.object(os, 'copy_file_range', autospec=True, create=True)
+    @mock.patch.object(fcntl, 'ioctl', autospec=True)
+    def test_copy_file_range_short(self, mock_ioctl, mock_copy_range):
+        mock_ioctl.side_effect = OSError(errno.EOPNOTSUPP, 'not supported')
+        mock_copy_range.side_effect = [4096, 0]
+        result = file_copy.copy_file(self.source, self.dest, 'op',
+                                     hardlink=False)
+        self.assertEqual(file_copy.COPY, result)
+        self.assertEqual(self.content, self._read_dest())
+
+    def test_missing_source(self):
+        self.assertRaises(FileNotFoundError, file_copy.copy_file,
+                          os.path.join(self.tempdir, 'missing'), self.dest,
+                          'op')
+        self.assertFalse(os.path.exists(self.dest))
+        self.mock_counter.assert_not_called()
+
+    def test_link_file(self):
+        file_copy.link_file(self.source, self.dest, 'op')
+        self.assertEqual(os.stat(self.source).st_ino,
+                         os.stat(self.dest).st_ino)
+        self.mock_counter.assert_called_once_with('op.hardlink', 1)
+
+    @mock.patch.object(os, 'link', autospec=True)
+    def test_link_file_fails(self, mock_link):
+        mock_link.side_effect = OSError(errno.EXDEV, 'cross-device link')
+        self.assertRaises(OSError, file_copy.link_file, self.source,
+                          self.dest, 'op')
+        self.mock_counter.assert_not_called()
@@ -184,6 +184,30 @@ class TestGlanceImageService(base.TestCase):
             self.assertRaises(exception.ImageUnacceptable,
                               self.service.show, image_id)
 
+    def test_show_info_cache(self):
+        self.config(image_info_cache_ttl=60)
+        self.addCleanup(image_service.GlanceImageService._info_cache.clear)
+        image_id = uuidutils.generate_uuid()
+        image = self._make_fixture(name='image1', id=image_id)
+        with mock.patch.object(image_service.GlanceImageService, 'call',
+                               autospec=True) as mock_call:
+            mock_call.return_value = image
+            image_meta = self.service.show(image_id)
+            # Another instance with the same requester uses the cache
+            other = image_service.GlanceImageService(self.client,
+                                                     self.context)
+            self.assertEqual(image_meta, other.show(image_id))
+            mock_call.assert_called_once_with(self.service, 'get_image',
+                                              image_id)
+
+            # A different requester does not
+            other_context = context.RequestContext(auth_token=True)
+            other_context.project_id = 'other'
+            other = image_service.GlanceImageService(self.client,
+                                                     other_context)
+            self.assertEqual(image_meta, other.show(image_id))
+            self.assertEqual(2, mock_call.call_count)
+
     def test_download_with_retries(self):
         tries = [0]
 
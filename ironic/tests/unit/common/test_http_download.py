@@ -0,0 +1,161 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+from http import server as http_server
+import os
+import re
+import threading
+
+import fixtures
+from oslo_utils import units
+
+from ironic.common import exception
+from ironic.common import image_service
+from ironic.tests import base
+
+
+class _RangeRequestHandler(http_server.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _send_headers(self, status, length, content_range=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        if self.server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"v1"')
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._send_headers(200, len(self.server.data))
+
+    def do_GET(self):
+        data = self.server.data
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if not match or not self.server.accept_ranges:
+            self.server.requests.append(None)
+            self._send_headers(200, len(data))
+            self.wfile.write(data)
+            return
+
+        start, end = int(match.group(1)), int(match.group(2))
+        self.server.requests.append((start, end))
+        self._send_headers(206, end - start + 1,
+                           'bytes %d-%d/%d' % (start, end, len(data)))
+        if self.server.drop_after and start == 0:
+            # Drop the first segment once, in the middle of the transfer.
+            self.server.drop_after, drop_after = None, self.server.drop_after
+            self.wfile.write(data[start:start + drop_after])
+            self.close_connection = True
+            return
+        self.wfile.write(data[start:end + 1])
+
+
+class SegmentedDownloadTestCase(base.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(4 * units.Mi + 123)
+        self.server = http_server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), _RangeRequestHandler)
+        self.server.data = self.data
+        self.server.accept_ranges = True
+        self.server.drop_after = None
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d/image.qcow2' % (
+            self.server.server_address[1])
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'image.qcow2')
+        self.config(image_download_segments=4,
+                    image_download_segment_size=1)
+
+    def _download(self, checksum=None):
+        service = image_service.HttpImageService()
+        if checksum:
+            service.set_expected_checksum(checksum)
+        with open(self.path, 'wb') as f:
+            service.download(self.url, f)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+        self.assertEqual([os.path.basename(self.path)],
+                         os.listdir(os.path.dirname(self.path)))
+        return service
+
+    def test_download_segments(self):
+        checksum = 'sha256:%s' % hashlib.sha256(self.data).hexdigest()
+
+        service = self._download(checksum)
+
+        self.assertEqual(4, len(self.server.requests))
+        self.assertEqual(len(self.data) - 1,
+                         max(end for _start, end in self.server.requests))
+        self.assertEqual(hashlib.sha256(self.data).hexdigest(),
+                         service.transfer_verified_checksum)
+
+    def test_download_segments_checksum_mismatch(self):
+        service = image_service.HttpImageService()
+        service.set_expected_checksum('sha256:' + '0' * 64)
+        with open(self.path, 'wb') as f:
+            self.assertRaises(exception.ImageChecksumError,
+                              service.download, self.url, f)
+        self.assertIsNone(service.transfer_verified_checksum)
+
+    def test_download_resumes_dropped_segment(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.common.http_download.CHUNK_SIZE', 64 * units.Ki))
+        self.server.drop_after = 300 * units.Ki
+
+        self._download(hashlib.md5(self.data).hexdigest())
+
+        # The data received in full chunks before the connection was dropped
+        # is not requested again.
+        self.assertEqual(5, len(self.server.requests))
+        self.assertIn((256 * units.Ki, len(self.data) // 4 - 1),
+                      self.server.requests)
+
+    def test_download_dropped_segment_no_retries(self):
+        self.config(image_download_retries=0)
+        self.server.drop_after = 300 * units.Ki
+        service = image_service.HttpImageService()
+
+        with open(self.path, 'wb') as f:
+            self.assertRaises(exception.ImageDownloadFailed,
+                              service.download, self.url, f)
+
+        # Nothing is left next to the image for another attempt.
+        self.assertEqual([os.path.basename(self.path)],
+                         os.listdir(os.path.dirname(self.path)))
+
+    def test_download_no_accept_ranges(self):
+        self.server.accept_ranges = False
+        checksum = hashlib.sha256(self.data).hexdigest()
+
+        service = self._download('sha256:%s' % checksum)
+
+        self.assertEqual([None], self.server.requests)
+        self.assertEqual(checksum, service.transfer_verified_checksum)
+
+    def test_download_small_image(self):
+        self.config(image_download_segment_size=3)
+
+        self._download()
+
+        self.assertEqual([None], self.server.requests)
@@ -10,10 +10,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import os
 import shutil
+import tempfile
+import time
 from unittest import mock
 
+import fixtures
+from oslo_concurrency import lockutils
+
+from ironic.common import file_copy
 from ironic.common import image_publisher
 from ironic.common import utils
 from ironic.tests.unit.db import base as db_base
@@ -180,3 +187,123 @@ class LocalPublisherTestCase(db_base.DbTestCase):
         self.publisher.unpublish(object_name)
 
         mock_unlink.assert_called_once_with(expected_file)
+
+
+class LocalPublisherStoreTestCase(db_base.DbTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.http_root = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, self.http_root)
+        self.config(http_url='http://localhost', http_root=self.http_root,
+                    content_addressed_publishing=True, group='deploy')
+        self.publisher = image_publisher.LocalPublisher('redfish')
+        self.public_dir = os.path.join(self.http_root, 'redfish')
+        self.store_dir = os.path.join(self.public_dir, '.store')
+        self.useFixture(fixtures.MockPatchObject(
+            utils, 'execute', autospec=True))
+
+    def _create_image(self, content):
+        fd, path = tempfile.mkstemp(dir=self.http_root)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        return path
+
+    def _publish(self, content, file_name):
+        source = self._create_image(content)
+        url = self.publisher.publish(source, file_name)
+        os.unlink(source)
+        return url
+
+    def test_publish_deduplicates(self):
+        url1 = self._publish(b'image', 'boot-1.iso')
+        url2 = self._publish(b'image', 'boot-2.iso')
+        self._publish(b'other image', 'boot-3.iso')
+
+        self.assertEqual('http://localhost/redfish/boot-1.iso', url1)
+        self.assertEqual('http://localhost/redfish/boot-2.iso', url2)
+        blob = os.path.join(self.store_dir,
+                            hashlib.sha256(b'image').hexdigest())
+        self.assertEqual(2, len(os.listdir(self.store_dir)))
+        self.assertEqual(3, os.stat(blob).st_nlink)
+        self.assertTrue(os.path.samefile(
+            blob, os.path.join(self.public_dir, 'boot-1.iso')))
+        self.assertTrue(os.path.samefile(
+            blob, os.path.join(self.public_dir, 'boot-2.iso')))
+        self.assertEqual(0o644, os.stat(blob).st_mode & 0o777)
+
+    def test_publish_replaces(self):
+        self._publish(b'image', 'boot-1.iso')
+        self._publish(b'new image', 'boot-1.iso')
+
+        with open(os.path.join(self.public_dir, 'boot-1.iso'), 'rb') as f:
+            self.assertEqual(b'new image', f.read())
+
+    @mock.patch.object(os, 'link', autospec=True)
+    def test_publish_copy(self, mock_link):
+        mock_link.side_effect = [OSError(), None]
+        source = self._create_image(b'image')
+
+        self.publisher.publish(source, 'boot-1.iso')
+
+        blob = os.path.join(self.store_dir,
+                            hashlib.sha256(b'image').hexdigest())
+        mock_link.assert_called_with(
+            blob, os.path.join(self.public_dir, 'boot-1.iso'))
+        self.assertEqual(1, os.stat(source).st_nlink)
+        with open(blob, 'rb') as f:
+            self.assertEqual(b'image', f.read())
+
+    def test_unpublish_garbage_collects(self):
+        self._publish(b'image', 'boot-1.iso')
+        self._publish(b'image', 'boot-2.iso')
+        self._publish(b'other image', 'boot-3.iso')
+
+        self.publisher.unpublish('boot-1.iso')
+        self.publisher.unpublish('boot-3.iso')
+        self.assertEqual([hashlib.sha256(b'image').hexdigest()],
+                         os.listdir(self.store_dir))
+
+        self.publisher.unpublish('boot-2.iso')
+        self.assertEqual([], os.listdir(self.store_dir))
+        self.assertEqual(['.store'], os.listdir(self.public_dir))
+
+    def test_publish_copy_unlocked(self):
+        locked = []
+        copy_file = file_copy.copy_file
+
+        def copy(source, dest, operation):
+            lock = lockutils.internal_lock('image_publisher_store')
+            if lock.acquire(blocking=False):
+                lock.release()
+                locked.append(False)
+            else:
+                locked.append(True)
+            self.assertTrue(dest.endswith('.part'))
+            return copy_file(source, dest, operation)
+
+        with mock.patch.object(file_copy, 'copy_file', autospec=True,
+                               side_effect=copy):
+            self._publish(b'image', 'boot-1.iso')
+            self._publish(b'image', 'boot-2.iso')
+
+        # The image is copied once, without holding the lock
+        self.assertEqual([False], locked)
+        self.assertEqual([hashlib.sha256(b'image').hexdigest()],
+                         os.listdir(self.store_dir))
+
+    def test_unpublish_part_files(self):
+        self._publish(b'image', 'boot-1.iso')
+        blob = os.path.join(self.store_dir,
+                            hashlib.sha256(b'image').hexdigest())
+        copying = blob + '.1.part'
+        left_over = blob + '.2.part'
+        for path in (copying, left_over):
+            open(path, 'w').close()
+        old = time.time() - image_publisher._PART_MAX_AGE - 1
+        os.utime(left_over, (old, old))
+
+        self.publisher.unpublish('boot-1.iso')
+
+        self.assertEqual([os.path.basename(copying)],
+                         os.listdir(self.store_dir))
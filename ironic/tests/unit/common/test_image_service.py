@@ -15,6 +15,7 @@ from http import client as http_client
 import io
 import os
 import shutil
+import time
 from unittest import mock
 
 from oslo_config import cfg
@@ -368,6 +369,80 @@ class HttpImageServiceTestCase(base.TestCase):
         self._test_show_with_cache(
             cache_control='no-store', no_cache=True)
 
+    @mock.patch.object(time, 'monotonic', autospec=True)
+    @mock.patch.object(requests, 'head', autospec=True)
+    def test_show_info_cache(self, head_mock, mock_time):
+        self.config(image_info_cache_ttl=60)
+        self.addCleanup(image_service.HttpImageService._info_cache.clear)
+        mock_time.return_value = 1000
+        head_mock.return_value.status_code = http_client.OK
+        head_mock.return_value.headers = {
+            'Content-Length': 100,
+            'Last-Modified': 'Tue, 15 Nov 2014 08:12:31 GMT',
+            'ETag': '"v1"',
+        }
+        expected = {'size': 100,
+                    'updated_at': datetime.datetime(2014, 11, 15, 8, 12, 31),
+                    'properties': {}, 'no_cache': False}
+        self.assertEqual(expected, self.service.show(self.href))
+        # Another instance, e.g. of another image cache, within the TTL
+        mock_time.return_value = 1060
+        result = image_service.HttpImageService().show(self.href)
+        self.assertEqual(expected, result)
+        head_mock.assert_called_once_with(self.href, verify=True,
+                                          timeout=60, auth=None)
+        # The returned properties are copies
+        result['properties']['foo'] = 'bar'
+
+        # Revalidated once expired
+        mock_time.return_value = 1061
+        head_mock.reset_mock()
+        head_mock.return_value.status_code = http_client.NOT_MODIFIED
+        head_mock.return_value.headers = {}
+        self.assertEqual(expected, self.service.show(self.href))
+        head_mock.assert_called_once_with(
+            self.href, verify=True, timeout=60, auth=None,
+            headers={'If-None-Match': '"v1"',
+                     'If-Modified-Since': 'Tue, 15 Nov 2014 08:12:31 GMT'})
+
+        # Fresh again after the revalidation
+        mock_time.return_value = 1100
+        self.assertEqual(expected, self.service.show(self.href))
+        self.assertEqual(1, head_mock.call_count)
+
+    @mock.patch.object(time, 'monotonic', autospec=True)
+    @mock.patch.object(requests, 'head', autospec=True)
+    def test_show_info_cache_modified(self, head_mock, mock_time):
+        self.config(image_info_cache_ttl=60)
+        self.addCleanup(image_service.HttpImageService._info_cache.clear)
+        mock_time.return_value = 1000
+        head_mock.return_value.status_code = http_client.OK
+        head_mock.return_value.headers = {'Content-Length': 100,
+                                          'ETag': '"v1"'}
+        self.assertEqual(100, self.service.show(self.href)['size'])
+
+        mock_time.return_value = 1100
+        head_mock.return_value.headers = {'Content-Length': 200,
+                                          'ETag': '"v2"'}
+        self.assertEqual(200, self.service.show(self.href)['size'])
+        head_mock.assert_called_with(self.href, verify=True, timeout=60,
+                                     auth=None,
+                                     headers={'If-None-Match': '"v1"'})
+
+    @mock.patch.object(requests, 'head', autospec=True)
+    def test_show_info_cache_no_store(self, head_mock):
+        self.config(image_info_cache_ttl=60)
+        self.addCleanup(image_service.HttpImageService._info_cache.clear)
+        head_mock.return_value.status_code = http_client.OK
+        head_mock.return_value.headers = {'Content-Length': 100,
+                                          'ETag': '"v1"',
+                                          'Cache-Control': 'no-store'}
+        self.service.show(self.href)
+        self.service.show(self.href)
+        self.assertEqual(2, head_mock.call_count)
+        self.assertNotIn(self.href,
+                         image_service.HttpImageService._info_cache)
+
     @mock.patch.object(requests, 'head', autospec=True)
     def test_show_no_content_length(self, head_mock):
         head_mock.return_value.status_code = http_client.OK
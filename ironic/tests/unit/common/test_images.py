@@ -16,15 +16,20 @@
 #    under the License.
 
 import builtins
+import hashlib
 import io
 import os
 import shutil
+import threading
+import unittest
 from unittest import mock
 
+import fixtures
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_utils import fileutils
 from oslo_utils.imageutils import format_inspector
+import pycdlib
 
 from ironic.common import exception
 from ironic.common.glance_service import service_utils as glance_utils
@@ -252,6 +257,27 @@ class IronicImagesTestCase(base.TestCase):
         # Do not disclose the actual error message to evil hackers
         self.assertNotIn("I'm a teapot", str(e))
 
+    @mock.patch.object(os, 'rename', autospec=True)
+    @mock.patch.object(os, 'unlink', autospec=True)
+    @mock.patch.object(qemu_img, 'convert_image', autospec=True)
+    @mock.patch.object(images, 'detect_file_format', autospec=True)
+    def test_image_to_raw_source_format(self, detect_format_mock,
+                                        convert_image_mock, unlink_mock,
+                                        rename_mock):
+        info = mock.MagicMock()
+        info.__str__.return_value = 'raw'
+        detect_format_mock.return_value = info
+
+        images.image_to_raw('image_href', 'path', 'path_tmp',
+                            source_format='qcow2')
+
+        convert_image_mock.assert_called_once_with(
+            'path_tmp', 'path.converted', 'raw', source_format='qcow2')
+        # Only the converted image is inspected
+        detect_format_mock.assert_called_once_with('path.converted')
+        unlink_mock.assert_called_once_with('path_tmp')
+        rename_mock.assert_called_once_with('path.converted', 'path')
+
     @mock.patch.object(os, 'rename', autospec=True)
     @mock.patch.object(os, 'unlink', autospec=True)
     @mock.patch.object(qemu_img, 'convert_image', autospec=True)
@@ -715,6 +741,220 @@ class IronicImagesTestCase(base.TestCase):
         mock_exec.assert_not_called()
 
 
+class ConvertToRawTestCase(base.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'ironic.common.images._conversion_semaphore', None))
+        self.dest = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'image.converted')
+
+    def _convert(self, source, dest, out_format, **kwargs):
+        with open(dest, 'wb') as f:
+            f.write(b'x' * 8192)
+
+    @mock.patch.object(images.METRICS, 'send_gauge', autospec=True)
+    @mock.patch.object(qemu_img, 'convert_image', autospec=True)
+    def test__convert_to_raw(self, mock_convert, mock_gauge):
+        mock_convert.side_effect = self._convert
+
+        images._convert_to_raw('image_href', 'path_tmp', self.dest, 'qcow2')
+
+        mock_convert.assert_called_once_with('path_tmp', self.dest, 'raw',
+                                             source_format='qcow2')
+        mock_gauge.assert_called_once_with(
+            'images.image_to_raw.bytes_per_second', mock.ANY)
+        self.assertIsNone(images._conversion_semaphore)
+
+    @mock.patch.object(qemu_img, 'convert_image', autospec=True)
+    def test__convert_to_raw_io_class(self, mock_convert):
+        self.config(image_convert_io_class='best-effort',
+                    image_convert_io_priority=5)
+        mock_convert.side_effect = self._convert
+
+        images._convert_to_raw('image_href', 'path_tmp', self.dest, 'qcow2')
+
+        mock_convert.assert_called_once_with('path_tmp', self.dest, 'raw',
+                                             source_format='qcow2',
+                                             io_class='best-effort',
+                                             io_priority=5)
+
+    @mock.patch.object(qemu_img, 'convert_image', autospec=True)
+    def test__convert_to_raw_concurrency(self, mock_convert):
+        self.config(image_convert_concurrency=1)
+
+        def _convert(source, dest, out_format, **kwargs):
+            self.assertFalse(
+                images._conversion_semaphore.acquire(blocking=False))
+            raise exception.ImageConvertFailed(image_id='image_href',
+                                               reason='boom')
+
+        mock_convert.side_effect = _convert
+
+        self.assertRaises(exception.ImageConvertFailed,
+                          images._convert_to_raw, 'image_href', 'path_tmp',
+                          self.dest, 'qcow2')
+        # The slot is released after a failure.
+        self.assertTrue(images._conversion_semaphore.acquire(blocking=False))
+
+    @mock.patch.object(images.LOG, 'info', autospec=True)
+    @mock.patch.object(qemu_img, 'convert_image', autospec=True)
+    def test__convert_to_raw_progress(self, mock_convert, mock_log):
+        self.config(image_convert_progress_interval=1)
+        reported = threading.Event()
+        mock_log.side_effect = lambda *args: reported.set()
+
+        def _convert(source, dest, out_format, **kwargs):
+            self._convert(source, dest, out_format)
+            self.assertTrue(reported.wait(10))
+
+        mock_convert.side_effect = _convert
+
+        images._convert_to_raw('image_href', 'path_tmp', self.dest, 'qcow2')
+
+        self.assertIn('raw format: %(written)d MiB written',
+                      mock_log.call_args_list[0][0][0])
+        self.assertIn('Converted image', mock_log.call_args_list[-1][0][0])
+
+
+class ImageIngestHelperTestCase(base.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.image_file = io.BytesIO()
+        self.data = b'\x00' * 65536 + b'raw image data'
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+
+    def _ingest(self, helper, data, chunk_size=4096):
+        for i in range(0, len(data), chunk_size):
+            helper.write(data[i:i + chunk_size])
+        helper.finish()
+
+    def test_ingest(self):
+        helper = images.ImageIngestHelper(self.image_file, 'href',
+                                          checksum=self.sha256,
+                                          checksum_algo='sha256')
+        self._ingest(helper, self.data)
+        helper.verify_checksum()
+        self.assertEqual(self.data, self.image_file.getvalue())
+        self.assertFalse(helper.zstd_compressed)
+        self.assertEqual('raw', str(helper.image_format))
+
+    def test_ingest_prefixed_checksum(self):
+        helper = images.ImageIngestHelper(self.image_file, 'href',
+                                          checksum='sha256:' + self.sha256)
+        self._ingest(helper, self.data, chunk_size=3)
+        helper.verify_checksum()
+        self.assertEqual(self.data, self.image_file.getvalue())
+
+    def test_ingest_checksum_mismatch(self):
+        helper = images.ImageIngestHelper(self.image_file, 'href',
+                                          checksum='f' * 64,
+                                          checksum_algo='sha256')
+        self._ingest(helper, self.data)
+        self.assertRaises(exception.ImageChecksumError,
+                          helper.verify_checksum)
+
+    def test_ingest_invalid_checksum_algo(self):
+        self.assertRaises(exception.ImageChecksumAlgorithmFailure,
+                          images.ImageIngestHelper, self.image_file, 'href',
+                          checksum='1234', checksum_algo='foobar')
+
+    def test_ingest_format_not_finished(self):
+        helper = images.ImageIngestHelper(self.image_file, 'href')
+        helper.write(self.data)
+        self.assertIsNone(helper.image_format)
+
+    @mock.patch.object(images, 'zstandard', None)
+    def test_ingest_zstd_no_library(self):
+        data = images.ZSTD_MAGIC + b'compressed'
+        helper = images.ImageIngestHelper(self.image_file, 'href')
+        self._ingest(helper, data, chunk_size=2)
+        self.assertEqual(data, self.image_file.getvalue())
+        self.assertTrue(helper.zstd_compressed)
+        self.assertIsNone(helper.image_format)
+
+    @mock.patch.object(images, 'zstandard', autospec=False)
+    def test_ingest_zstd(self, mock_zstd):
+        data = images.ZSTD_MAGIC + b'compressed'
+        decompressor = (
+            mock_zstd.ZstdDecompressor.return_value.decompressobj.return_value)
+        decompressor.decompress.side_effect = [self.data[:100],
+                                               self.data[100:]]
+        decompressor.flush.return_value = b''
+        helper = images.ImageIngestHelper(self.image_file, 'href',
+                                          checksum=hashlib.sha256(
+                                              data).hexdigest(),
+                                          checksum_algo='sha256')
+        helper.write(data[:8])
+        helper.write(data[8:])
+        helper.finish()
+        # The checksum is computed on the downloaded data
+        helper.verify_checksum()
+        self.assertEqual(self.data, self.image_file.getvalue())
+        self.assertFalse(helper.zstd_compressed)
+        self.assertEqual('raw', str(helper.image_format))
+        decompressor.decompress.assert_has_calls([mock.call(data[:8]),
+                                                  mock.call(data[8:])])
+
+    @unittest.skipIf(images.zstandard is None, 'zstandard is not installed')
+    def test_ingest_zstd_frames(self):
+        # Large images are compressed as several frames, e.g. by pzstd
+        compressor = images.zstandard.ZstdCompressor()
+        data = (compressor.compress(self.data[:30000])
+                + compressor.compress(self.data[30000:]))
+        helper = images.ImageIngestHelper(self.image_file, 'href')
+        self._ingest(helper, data, chunk_size=1000)
+        self.assertEqual(self.data, self.image_file.getvalue())
+        self.assertFalse(helper.zstd_compressed)
+        self.assertEqual('raw', str(helper.image_format))
+
+    @mock.patch.object(images, '_handle_zstd_compression', autospec=True)
+    @mock.patch.object(image_service, 'get_image_service', autospec=True)
+    def test_fetch_streaming(self, image_service_mock, mock_zstd):
+        CONF.set_override('stream_image_ingest', True, group='conductor')
+        svc = image_service_mock.return_value
+        svc.is_auth_set_needed = False
+        svc.transfer_verified_checksum = None
+        svc.download.side_effect = (
+            lambda href, image_file: image_file.write(self.data))
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path, 'img')
+
+        image_class = images.fetch('context', 'http://image', path,
+                                   checksum=self.sha256,
+                                   checksum_algo='sha256')
+
+        self.assertEqual('raw', str(image_class))
+        with open(path, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+        mock_zstd.assert_not_called()
+
+    @mock.patch.object(image_service, 'get_image_service', autospec=True)
+    def test_fetch_streaming_checksum_mismatch(self, image_service_mock):
+        CONF.set_override('stream_image_ingest', True, group='conductor')
+        svc = image_service_mock.return_value
+        svc.is_auth_set_needed = False
+        svc.transfer_verified_checksum = None
+        svc.download.side_effect = (
+            lambda href, image_file: image_file.write(self.data))
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path, 'img')
+
+        self.assertRaises(exception.ImageChecksumError, images.fetch,
+                          'context', 'http://image', path,
+                          checksum='f' * 64, checksum_algo='sha256')
+        self.assertFalse(os.path.exists(path))
+
+    def test__can_stream_ingest(self):
+        self.assertTrue(images._can_stream_ingest('https://image'))
+        self.assertTrue(images._can_stream_ingest('oci://image'))
+        self.assertTrue(images._can_stream_ingest('glance://image'))
+        self.assertFalse(images._can_stream_ingest('file:///image'))
+        CONF.set_override('allowed_direct_url_schemes', ['file'],
+                          group='glance')
+        self.assertFalse(images._can_stream_ingest('glance://image'))
+
+
 class ImageDetectFileFormatTestCase(base.TestCase):
 
     def setUp(self):
@@ -768,6 +1008,84 @@ class ImageDetectFileFormatTestCase(base.TestCase):
         self.mock_open.assert_called_once_with("foo", "rb")
 
 
+class BootIsoTemplateTestCase(base.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.template = os.path.join(self.tmpdir, 'template.iso')
+        self.output = os.path.join(self.tmpdir, 'boot.iso')
+        config = images._pad_boot_config(
+            'placeholder', images.BOOT_ISO_TEMPLATE_CONFIG_SIZE)
+        iso = pycdlib.PyCdlib()
+        iso.new(interchange_level=3, rock_ridge='1.09', joliet=3,
+                pub_ident_str=images.BOOT_ISO_TEMPLATE_PUBLISHER_ID)
+        iso.add_directory('/ISOLINUX', rr_name='isolinux',
+                          joliet_path='/isolinux')
+        for name, data in (('isolinux.cfg', config.encode()),
+                           ('vmlinuz', b'kernel')):
+            iso.add_fp(io.BytesIO(data), len(data),
+                       '/ISOLINUX/%s;1' % name.upper().replace('.', '_'),
+                       rr_name=name, joliet_path='/isolinux/%s' % name)
+        iso.write(self.template)
+        iso.close()
+
+    def _read_iso(self):
+        iso = pycdlib.PyCdlib()
+        iso.open(self.output)
+        try:
+            config = io.BytesIO()
+            iso.get_file_from_iso_fp(config,
+                                     rr_path='/isolinux/isolinux.cfg')
+            kernel = io.BytesIO()
+            iso.get_file_from_iso_fp(kernel, rr_path='/isolinux/vmlinuz')
+            return (config.getvalue().decode(), kernel.getvalue(),
+                    iso.pvd.publisher_identifier.text.decode().strip(),
+                    iso.joliet_vd.publisher_identifier.text.decode(
+                        'utf-16_be').strip())
+        finally:
+            iso.close()
+
+    def test_create_boot_iso_from_template(self):
+        images.create_boot_iso_from_template(
+            self.template, self.output, 'isolinux/isolinux.cfg',
+            root_uuid='root-uuid', kernel_params='nofb ir_pub_id=1-23-4',
+            boot_mode='bios', publisher_id='1-23-4')
+
+        config, kernel, publisher, joliet_publisher = self._read_iso()
+        self.assertEqual(images.BOOT_ISO_TEMPLATE_CONFIG_SIZE, len(config))
+        self.assertIn('root=UUID=root-uuid nofb ir_pub_id=1-23-4', config)
+        self.assertEqual(b'kernel', kernel)
+        self.assertEqual('1-23-4', publisher)
+        self.assertEqual('1-23-4', joliet_publisher)
+        self.assertEqual(os.path.getsize(self.template),
+                         os.path.getsize(self.output))
+
+    def test_create_boot_iso_from_template_config_too_large(self):
+        self.assertRaises(exception.ImageCreationFailed,
+                          images.create_boot_iso_from_template,
+                          self.template, self.output,
+                          'isolinux/isolinux.cfg',
+                          kernel_params='x' * 10000, boot_mode='bios')
+
+    def test_create_boot_iso_from_template_wrong_publisher(self):
+        images.create_boot_iso_from_template(
+            self.template, self.template + '.copy', 'isolinux/isolinux.cfg',
+            boot_mode='bios', publisher_id='1-23-4')
+
+        self.assertRaises(exception.ImageCreationFailed,
+                          images.create_boot_iso_from_template,
+                          self.template + '.copy', self.output,
+                          'isolinux/isolinux.cfg', boot_mode='bios',
+                          publisher_id='5-67-8')
+
+    def test_create_boot_iso_from_template_not_found(self):
+        self.assertRaises(exception.ImageCreationFailed,
+                          images.create_boot_iso_from_template,
+                          self.template, self.output,
+                          'EFI/BOOT/grub.cfg', boot_mode='uefi')
+
+
 class FsImageTestCase(base.TestCase):
 
     @mock.patch.object(builtins, 'open', autospec=True)
@@ -1225,7 +1543,7 @@ class FsImageTestCase(base.TestCase):
             'output_file', 'tmpdir/kernel', 'tmpdir/ramdisk',
             deploy_iso='tmpdir/iso',
             esp_image=None, kernel_params=params, inject_files=None,
-            publisher_id=None)
+            publisher_id=None, config_size=None)
 
     @mock.patch.object(images, 'create_esp_image_for_uefi', autospec=True)
     @mock.patch.object(images, 'fetch', autospec=True)
@@ -1254,7 +1572,7 @@ class FsImageTestCase(base.TestCase):
             'output_file', 'tmpdir/kernel', 'tmpdir/ramdisk',
             deploy_iso=None, esp_image='tmpdir/esp',
             kernel_params=params, inject_files=None,
-            publisher_id=None)
+            publisher_id=None, config_size=None)
 
     @mock.patch.object(images, 'create_esp_image_for_uefi', autospec=True)
     @mock.patch.object(images, 'fetch', autospec=True)
@@ -1283,7 +1601,7 @@ class FsImageTestCase(base.TestCase):
             'output_file', 'tmpdir/kernel', 'tmpdir/ramdisk',
             deploy_iso='tmpdir/iso',
             esp_image=None, kernel_params=params, inject_files=None,
-            publisher_id=None)
+            publisher_id=None, config_size=None)
 
     @mock.patch.object(images, 'create_esp_image_for_uefi', autospec=True)
     @mock.patch.object(images, 'fetch', autospec=True)
@@ -1312,7 +1630,7 @@ class FsImageTestCase(base.TestCase):
             'output_file', 'tmpdir/kernel', 'tmpdir/ramdisk',
             deploy_iso=None, esp_image='tmpdir/esp',
             kernel_params=params, inject_files=None,
-            publisher_id='1-23-4')
+            publisher_id='1-23-4', config_size=None)
 
     @mock.patch.object(images, 'create_isolinux_image_for_bios', autospec=True)
     @mock.patch.object(images, 'fetch', autospec=True)
@@ -1345,7 +1663,37 @@ class FsImageTestCase(base.TestCase):
         create_isolinux_mock.assert_called_once_with(
             'output_file', 'tmpdir/kernel', 'tmpdir/ramdisk',
             kernel_params=params, inject_files=None,
-            publisher_id='1-23-4')
+            publisher_id='1-23-4', config_size=None)
+
+    @mock.patch.object(images, 'create_esp_image_for_uefi', autospec=True)
+    @mock.patch.object(images, 'fetch', autospec=True)
+    @mock.patch.object(utils, 'tempdir', autospec=True)
+    def test_create_boot_iso_with_image_cache(
+            self, tempdir_mock, fetch_images_mock, create_esp_mock):
+        mock_file_handle = mock.MagicMock(spec=io.BytesIO)
+        mock_file_handle.__enter__.return_value = 'tmpdir'
+        tempdir_mock.return_value = mock_file_handle
+        cache = mock.Mock(master_dir='/master')
+
+        images.create_boot_iso(
+            'ctx', 'output_file', 'http://kernel-href', 'http://ramdisk-href',
+            esp_image_href='http://efiboot-href', boot_mode='uefi',
+            image_cache=cache)
+
+        tempdir_mock.assert_called_once_with(dir='/master')
+        fetch_images_mock.assert_not_called()
+        cache.fetch_image.assert_has_calls([
+            mock.call('http://kernel-href', 'tmpdir/kernel', ctx='ctx',
+                      force_raw=False),
+            mock.call('http://ramdisk-href', 'tmpdir/ramdisk', ctx='ctx',
+                      force_raw=False),
+            mock.call('http://efiboot-href', 'tmpdir/esp', ctx='ctx',
+                      force_raw=False),
+        ])
+        create_esp_mock.assert_called_once_with(
+            'output_file', 'tmpdir/kernel', 'tmpdir/ramdisk',
+            deploy_iso=None, esp_image='tmpdir/esp', kernel_params=mock.ANY,
+            inject_files=None, publisher_id=None, config_size=None)
 
     @mock.patch.object(images, 'create_isolinux_image_for_bios', autospec=True)
     @mock.patch.object(images, 'fetch', autospec=True)
@@ -1371,7 +1719,7 @@ class FsImageTestCase(base.TestCase):
         create_isolinux_mock.assert_called_once_with(
             'output_file', 'tmpdir/kernel', 'tmpdir/ramdisk',
             kernel_params=params, inject_files=None,
-            publisher_id=None)
+            publisher_id=None, config_size=None)
 
     @mock.patch.object(image_service, 'get_image_service', autospec=True)
     def test_get_glance_image_properties_no_such_prop(self,
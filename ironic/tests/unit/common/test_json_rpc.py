@@ -17,6 +17,7 @@ from unittest import mock
 
 import fixtures
 import oslo_messaging
+from oslo_utils import strutils
 import webob
 
 from ironic.common import exception
@@ -327,16 +328,26 @@ class TestService(TestCase):
         body = self._request('copy', {'context': self.ctx, 'data': data})
         self.assertIsNone(body.get('error'))
         node = self.serializer.deserialize_entity(self.ctx, body['result'])
-        logged_params = mock_log.call_args_list[0][0][2]
+        logged_params = mock_log.call_args_list[0][0][2].value
         logged_node = logged_params['data']
         self.assertEqual({'ipmi_username': 'admin', 'ipmi_password': '***'},
                          logged_node)
-        logged_resp = mock_log.call_args_list[1][0][2]
+        logged_resp = mock_log.call_args_list[1][0][2].value
         self.assertEqual({'ipmi_username': 'admin', 'ipmi_password': '***'},
                          logged_resp)
         # The result is not affected, only logging
         self.assertEqual(data, node)
 
+    @mock.patch.object(server.LOG, 'debug', autospec=True)
+    @mock.patch.object(strutils, 'mask_dict_password', autospec=True)
+    def test_mask_secrets_lazy(self, mock_mask, mock_log):
+        data = {'ipmi_username': 'admin', 'ipmi_password': 'secret'}
+        body = self._request('copy', {'context': self.ctx, 'data': data})
+        self.assertIsNone(body.get('error'))
+        self.assertEqual(2, mock_log.call_count)
+        # Nothing is masked unless the log message is formatted
+        mock_mask.assert_not_called()
+
 
 @mock.patch.object(client, '_get_session', autospec=True)
 class TestClient(TestCase):
@@ -659,12 +670,26 @@ class TestClient(TestCase):
                   'method': 'do_something',
                   'params': {'node': request, 'context': self.ctx_json}})
         self.assertEqual(2, mock_log.call_count)
-        node = mock_log.call_args_list[0][0][3]['params']['node']
+        node = mock_log.call_args_list[0][0][3].value['params']['node']
         self.assertEqual(node, {'redfish_username': 'admin',
                                 'redfish_password': '***'})
-        resp_text = mock_log.call_args_list[1][0][3]
+        resp_text = mock_log.call_args_list[1][0][3].value
         self.assertEqual(body.replace('passw0rd', '***'), resp_text)
 
+    @mock.patch.object(client.LOG, 'debug', autospec=True)
+    @mock.patch.object(strutils, 'mask_password', autospec=True)
+    @mock.patch.object(strutils, 'mask_dict_password', autospec=True)
+    def test_mask_secrets_lazy(self, mock_mask_dict, mock_mask, mock_log,
+                               mock_session):
+        response = mock_session.return_value.post.return_value
+        response.text = '{"jsonrpc": "2.0", "result": 42}'
+        cctx = self.client.prepare('foo.example.com')
+        cctx.cast(self.context, 'do_something', node={'password': 'x'})
+        self.assertEqual(2, mock_log.call_count)
+        # Nothing is masked unless the log message is formatted
+        mock_mask_dict.assert_not_called()
+        mock_mask.assert_not_called()
+
 
 @mock.patch('ironic.common.json_rpc.client.keystone', autospec=True)
 class TestSession(TestCase):
@@ -116,6 +116,37 @@ class TestNeutronClient(base.TestCase):
             [mock.call('neutron', timeout=10),
              mock.call('neutron', auth=mock.sentinel.auth, timeout=10)])
 
+    def test_get_neutron_client_cached(self, mock_client_init, mock_session,
+                                       mock_adapter, mock_auth, mock_sauth):
+        self.config(cache_ttl=300, group='neutron')
+        self.addCleanup(neutron.invalidate_cache)
+        user_context = context.RequestContext(global_request_id='global',
+                                              auth_token='test-token-123',
+                                              project_id='project')
+        for _i in range(3):
+            client = neutron.get_client(context=self.context)
+            self.assertIsNone(client.ironic_cache_scope)
+            client = neutron.get_client(context=user_context)
+            self.assertEqual('project', client.ironic_cache_scope)
+        # One connection with the service credentials, one with the user's
+        self.assertEqual(2, mock_client_init.call_count)
+        mock_sauth.assert_called_once()
+        conn = mock_client_init.return_value
+        conn.global_request.assert_called_with('global')
+        self.assertEqual(6, conn.global_request.call_count)
+
+    def test_get_neutron_client_cache_expired(self, mock_client_init,
+                                              mock_session, mock_adapter,
+                                              mock_auth, mock_sauth):
+        self.config(cache_ttl=300, group='neutron')
+        self.addCleanup(neutron.invalidate_cache)
+        neutron.get_client(context=self.context)
+        element = neutron._CONNECTIONS[None]
+        neutron._CONNECTIONS[None] = element._replace(
+            stored_at=element.stored_at - 301)
+        neutron.get_client(context=self.context)
+        self.assertEqual(2, mock_client_init.call_count)
+
 
 class TestUpdateNeutronPort(base.TestCase):
     def setUp(self):
@@ -464,8 +495,10 @@ class TestNeutronNetworkActions(db_base.DbTestCase):
                                                 expected_update_body)
         self.assertTrue(vpi_mock.called)
 
+    @mock.patch.object(neutron, 'invalidate_cache', autospec=True)
     @mock.patch.object(neutron, 'rollback_ports', autospec=True)
-    def test_add_network_all_ports_fail(self, rollback_mock):
+    def test_add_network_all_ports_fail(self, rollback_mock,
+                                        invalidate_mock):
         # Check that if creating a port fails, the ports are cleaned up
         self.client_mock.create_port.side_effect = \
             openstack_exc.OpenStackCloudException
@@ -475,10 +508,26 @@ class TestNeutronNetworkActions(db_base.DbTestCase):
                 exception.NetworkError, neutron.add_ports_to_network, task,
                 self.network_uuid)
             rollback_mock.assert_called_once_with(task, self.network_uuid)
+        invalidate_mock.assert_called_once_with(self.network_uuid)
+
+    @mock.patch.object(neutron, 'invalidate_cache', autospec=True)
+    @mock.patch.object(neutron, 'update_neutron_port', autospec=True)
+    def test_add_network_port_update_fails(self, update_mock,
+                                           invalidate_mock):
+        self.client_mock.create_port.return_value = self.neutron_port
+        update_mock.side_effect = exception.NetworkError('not found')
+
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            self.assertRaises(
+                exception.NetworkError, neutron.add_ports_to_network, task,
+                self.network_uuid)
+        invalidate_mock.assert_called_once_with(self.network_uuid)
 
+    @mock.patch.object(neutron, 'invalidate_cache', autospec=True)
     @mock.patch.object(neutron, 'update_neutron_port', autospec=True)
     @mock.patch.object(neutron, 'LOG', autospec=True)
-    def test_add_network_create_some_ports_fail(self, log_mock, update_mock):
+    def test_add_network_create_some_ports_fail(self, log_mock, update_mock,
+                                                invalidate_mock):
         object_utils.create_test_port(
             self.context, node_id=self.node.id,
             uuid=uuidutils.generate_uuid(),
@@ -494,6 +543,7 @@ class TestNeutronNetworkActions(db_base.DbTestCase):
                           log_mock.warning.call_args_list[0][0][0])
             self.assertIn("Some errors were encountered when updating",
                           log_mock.warning.call_args_list[1][0][0])
+        invalidate_mock.assert_called_once_with(self.network_uuid)
 
     def test_add_network_no_port(self):
         # No port registered
@@ -1122,6 +1172,167 @@ class TestNeutronNetworkActions(db_base.DbTestCase):
         is_smartnic_mock.assert_called_once_with(self.neutron_port)
         wait_agent_mock.assert_called_once_with(self.client_mock, 'hostname')
 
+    @mock.patch.object(neutron, 'is_smartnic_port', autospec=True)
+    @mock.patch.object(neutron, 'wait_for_host_agent', autospec=True)
+    def test_remove_neutron_smartnic_ports_same_host(
+            self, wait_agent_mock, is_smartnic_mock):
+        is_smartnic_mock.return_value = True
+        self.neutron_port['binding:host_id'] = 'hostname'
+        other_port = stubs.FakeNeutronPort(
+            id=uuidutils.generate_uuid(), mac_address='52:54:00:cf:2d:33',
+            **{'binding:host_id': 'hostname'})
+        self.client_mock.ports.return_value = iter([self.neutron_port,
+                                                    other_port])
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            neutron.remove_neutron_ports(task, {'param': 'value'})
+        self.assertEqual(2, self.client_mock.delete_port.call_count)
+        wait_agent_mock.assert_called_once_with(self.client_mock, 'hostname')
+
+
+@mock.patch.object(time, 'sleep', autospec=True)
+class TestBulkPortOperations(db_base.DbTestCase):
+
+    def setUp(self):
+        super(TestBulkPortOperations, self).setUp()
+        self.config(bulk_port_operations=True, group='neutron')
+        self.node = object_utils.create_test_node(
+            self.context, network_interface='neutron')
+        self.ports = [
+            object_utils.create_test_port(
+                self.context, node_id=self.node.id,
+                uuid=uuidutils.generate_uuid(),
+                address='52:54:00:cf:2d:3%d' % i,
+                local_link_connection={'switch_id': '0a:1b:2c:3d:4e:5f',
+                                       'port_id': 'Ethernet3/%d' % i,
+                                       'switch_info': 'switch1'})
+            for i in range(4)]
+        self.network_uuid = uuidutils.generate_uuid()
+        self.client = stubs.StubNeutronClient()
+        patcher = mock.patch.object(neutron, 'get_client', autospec=True,
+                                    return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _add_ports(self):
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            return neutron.add_ports_to_network(task, self.network_uuid)
+
+    def _fail_binding(self, address):
+        update_port = self.client.update_port
+
+        def _update_port(port_id, **attrs):
+            port = update_port(port_id, **attrs)
+            if attrs.get('mac_address') == address:
+                port.status = 'DOWN'
+                port['binding:vif_type'] = 'binding_failed'
+            return port
+
+        self.client.update_port = _update_port
+
+    def test_add_ports_to_network(self, sleep_mock):
+        ports = self._add_ports()
+        self.assertEqual({p.uuid for p in self.ports}, set(ports))
+        self.assertEqual(['create_ports'] + ['update_port'] * 4 + ['ports'],
+                         self.client.requests)
+        for ironic_port in self.ports:
+            neutron_port = self.client.get_port(ports[ironic_port.uuid])
+            self.assertEqual(ironic_port.address, neutron_port.mac_address)
+            self.assertEqual(self.node.uuid, neutron_port['binding:host_id'])
+            self.assertEqual(self.network_uuid, neutron_port.network_id)
+            self.assertEqual(
+                [ironic_port.local_link_connection],
+                neutron_port['binding:profile']['local_link_information'])
+
+    def test_add_ports_to_network_no_status_check(self, sleep_mock):
+        self.config(fail_on_port_binding_failure=False, group='neutron')
+        self.client.port_status = 'DOWN'
+        ports = self._add_ports()
+        self.assertEqual(4, len(ports))
+        self.assertNotIn('ports', self.client.requests)
+
+    def test_add_ports_to_network_wait_for_status(self, sleep_mock):
+        self.client.port_status = 'DOWN'
+        list_ports = self.client.ports
+        calls = []
+
+        def _ports(**filters):
+            calls.append(filters)
+            if len(calls) == 2:
+                for port in list_ports():
+                    port.status = 'ACTIVE'
+            return list_ports(**filters)
+
+        self.client.ports = _ports
+        ports = self._add_ports()
+        self.assertEqual(4, len(ports))
+        self.assertEqual(2, len(calls))
+        self.assertEqual(set(ports.values()), set(calls[0]['id']))
+
+    def test_add_ports_to_network_fallback(self, sleep_mock):
+        self.client.create_ports = mock.Mock(
+            side_effect=openstack_exc.OpenStackCloudException('boom'))
+        ports = self._add_ports()
+        self.assertEqual({p.uuid for p in self.ports}, set(ports))
+        self.assertEqual(4, self.client.requests.count('create_port'))
+
+    def test_add_ports_to_network_fallback_partial(self, sleep_mock):
+        self.client.create_ports = mock.Mock(
+            side_effect=openstack_exc.OpenStackCloudException('boom'))
+        create_port = self.client.create_port
+
+        def _create_port(**attrs):
+            if not self.client.requests:
+                self.client.requests.append('create_port')
+                raise openstack_exc.OpenStackCloudException('boom')
+            return create_port(**attrs)
+
+        self.client.create_port = _create_port
+        ports = self._add_ports()
+        self.assertEqual({p.uuid for p in self.ports[1:]}, set(ports))
+
+    def test_add_ports_to_network_binding_failed(self, sleep_mock):
+        self._fail_binding(self.ports[0].address)
+        ports = self._add_ports()
+        self.assertEqual({p.uuid for p in self.ports[1:]}, set(ports))
+        self.assertEqual(1, self.client.requests.count('ports'))
+
+    def test_add_ports_to_network_all_binding_failed(self, sleep_mock):
+        for ironic_port in self.ports:
+            self._fail_binding(ironic_port.address)
+        self.assertRaises(exception.NetworkError, self._add_ports)
+        # The ports have been rolled back
+        self.assertEqual([], list(self.client.ports()))
+
+    def test_wait_for_ports_status_missing(self, sleep_mock):
+        port = self.client.create_port(network_id=self.network_uuid)
+        self.assertRaises(exception.InvalidParameterValue,
+                          neutron.wait_for_ports_status,
+                          self.client, [port.id, 'missing'], 'ACTIVE')
+
+    @mock.patch.object(neutron.wait_for_ports_status.retry, 'stop',
+                       tenacity.stop_after_attempt(3))
+    def test_wait_for_ports_status_max_retry(self, sleep_mock):
+        self.client.port_status = 'DOWN'
+        port = self.client.create_port(network_id=self.network_uuid)
+        self.assertRaises(exception.NetworkError,
+                          neutron.wait_for_ports_status,
+                          self.client, [port.id], 'ACTIVE')
+        self.assertEqual(3, self.client.requests.count('ports'))
+
+    @mock.patch.object(neutron.wait_for_ports_status.retry, 'stop',
+                       tenacity.stop_after_attempt(2))
+    def test_wait_for_ports_status_binding_failed(self, sleep_mock):
+        self.client.port_status = 'DOWN'
+        port = self.client.create_port(network_id=self.network_uuid)
+        port['binding:vif_type'] = 'binding_failed'
+        self.assertRaises(exception.NetworkError,
+                          neutron.wait_for_ports_status,
+                          self.client, [port.id], 'ACTIVE')
+        self.assertEqual({port.id},
+                         neutron.wait_for_ports_status(
+                             self.client, [port.id], 'ACTIVE',
+                             fail_on_binding_failure=True))
+
 
 @mock.patch.object(neutron, 'get_client', autospec=True)
 class TestValidateNetwork(base.TestCase):
@@ -1669,6 +1880,154 @@ class TestGetPhysnetsByPortUUID(base.TestCase):
         mock_gn.assert_called_once_with(self.client, network_uuid)
 
 
+class TestNeutronCache(base.TestCase):
+
+    def setUp(self):
+        super(TestNeutronCache, self).setUp()
+        self.config(cache_ttl=300, cache_stale_period=300, group='neutron')
+        self.addCleanup(neutron.invalidate_cache)
+        self.client = mock.Mock(ironic_cache_scope='project')
+        self.network_uuid = uuidutils.generate_uuid()
+        self.network = stubs.FakeNeutronNetwork(id=self.network_uuid,
+                                                name='net')
+        self.client.find_network.return_value = self.network
+
+    def _age(self, seconds):
+        for key, element in neutron._METADATA_CACHE.items():
+            neutron._METADATA_CACHE[key] = element._replace(
+                stored_at=element.stored_at - seconds)
+
+    def test_network_cached(self):
+        for _i in range(3):
+            self.assertEqual(self.network,
+                             neutron._get_network_by_uuid_or_name(
+                                 self.client, 'net'))
+        self.client.find_network.assert_called_once_with(
+            'net', ignore_missing=False)
+
+    @mock.patch.object(neutron, 'get_client', autospec=True)
+    def test_validate_network_cached(self, mock_get_client):
+        mock_get_client.return_value = self.client
+        for _i in range(3):
+            self.assertEqual(self.network_uuid,
+                             neutron.validate_network('net'))
+        self.client.find_network.assert_called_once_with(
+            'net', ignore_missing=False)
+
+    def test_network_cached_per_scope(self):
+        other_client = mock.Mock(ironic_cache_scope='other')
+        other_client.find_network.return_value = stubs.FakeNeutronNetwork(
+            id=uuidutils.generate_uuid(), name='net')
+        result = neutron._get_network_by_uuid_or_name(self.client, 'net')
+        other = neutron._get_network_by_uuid_or_name(other_client, 'net')
+        self.assertNotEqual(result.id, other.id)
+        self.client.find_network.assert_called_once_with(
+            'net', ignore_missing=False)
+        other_client.find_network.assert_called_once_with(
+            'net', ignore_missing=False)
+
+    def test_network_disabled(self):
+        self.config(cache_ttl=0, group='neutron')
+        neutron._get_network_by_uuid_or_name(self.client, 'net')
+        neutron._get_network_by_uuid_or_name(self.client, 'net')
+        self.assertEqual(2, self.client.find_network.call_count)
+        self.assertEqual({}, neutron._METADATA_CACHE)
+
+    def test_network_errors_not_cached(self):
+        self.client.find_network.side_effect = [
+            openstack_exc.ResourceNotFound(), self.network]
+        self.assertRaises(exception.InvalidParameterValue,
+                          neutron._get_network_by_uuid_or_name,
+                          self.client, 'net')
+        self.assertEqual(self.network,
+                         neutron._get_network_by_uuid_or_name(
+                             self.client, 'net'))
+        self.assertEqual(2, self.client.find_network.call_count)
+
+    @mock.patch.object(neutron.threading, 'Thread', autospec=True)
+    def test_network_stale_while_revalidate(self, mock_thread):
+        neutron._get_network_by_uuid_or_name(self.client, 'net')
+        self._age(400)
+        new_network = stubs.FakeNeutronNetwork(id=self.network_uuid,
+                                               name='net', status='DOWN')
+        self.client.find_network.return_value = new_network
+        # The stale value is returned, a single refresh is started
+        for _i in range(2):
+            self.assertEqual(self.network,
+                             neutron._get_network_by_uuid_or_name(
+                                 self.client, 'net'))
+        mock_thread.assert_called_once_with(target=mock.ANY, daemon=True)
+        mock_thread.return_value.start.assert_called_once_with()
+        mock_thread.call_args[1]['target']()
+        self.assertEqual(new_network,
+                         neutron._get_network_by_uuid_or_name(
+                             self.client, 'net'))
+        self.assertEqual(2, self.client.find_network.call_count)
+        self.assertEqual(set(), neutron._REFRESHING)
+
+    @mock.patch.object(neutron.threading, 'Thread', autospec=True)
+    def test_network_refresh_failure(self, mock_thread):
+        neutron._get_network_by_uuid_or_name(self.client, 'net')
+        self._age(400)
+        self.client.find_network.side_effect = (
+            openstack_exc.ResourceNotFound())
+        neutron._get_network_by_uuid_or_name(self.client, 'net')
+        mock_thread.call_args[1]['target']()
+        self.assertRaises(exception.InvalidParameterValue,
+                          neutron._get_network_by_uuid_or_name,
+                          self.client, 'net')
+        self.assertEqual(set(), neutron._REFRESHING)
+
+    @mock.patch.object(neutron.threading, 'Thread', autospec=True)
+    def test_network_expired(self, mock_thread):
+        neutron._get_network_by_uuid_or_name(self.client, 'net')
+        self._age(601)
+        neutron._get_network_by_uuid_or_name(self.client, 'net')
+        self.assertEqual(2, self.client.find_network.call_count)
+        mock_thread.assert_not_called()
+
+    def test_invalidate_by_id(self):
+        neutron._get_network_by_uuid_or_name(self.client, 'net')
+        neutron._get_network_by_uuid_or_name(self.client, self.network_uuid)
+        self.assertEqual(2, len(neutron._METADATA_CACHE))
+        neutron.invalidate_cache(self.network_uuid)
+        self.assertEqual({}, neutron._METADATA_CACHE)
+
+    def test_segment_cached(self):
+        self.client.get_subnet.side_effect = [
+            stubs.FakeNeutronSubnet(id='subnet1', segment_id='segment1'),
+            stubs.FakeNeutronSubnet(id='subnet2')]
+        segment = stubs.FakeNeutronSegment(id='segment1')
+        self.client.get_segment.return_value = segment
+        for _i in range(2):
+            self.assertEqual(segment, neutron._get_segment_by_subnet_uuid(
+                self.client, 'subnet1'))
+            self.assertIsNone(neutron._get_segment_by_subnet_uuid(
+                self.client, 'subnet2'))
+        self.assertEqual(2, self.client.get_subnet.call_count)
+        self.client.get_segment.assert_called_once_with('segment1')
+
+    def test_security_groups_cached(self):
+        self.client.security_groups.return_value = [
+            stubs.FakeNeutronSecurityGroup(id='sg1'),
+            stubs.FakeNeutronSecurityGroup(id='sg2')]
+        for _i in range(2):
+            neutron._verify_security_groups(['sg2', 'sg1'], self.client)
+        self.client.security_groups.assert_called_once_with(
+            id=['sg2', 'sg1'])
+        neutron.invalidate_cache('sg1')
+        self.assertEqual({}, neutron._METADATA_CACHE)
+
+    def test_missing_security_groups_not_cached(self):
+        self.client.security_groups.return_value = [
+            stubs.FakeNeutronSecurityGroup(id='sg1')]
+        for _i in range(2):
+            self.assertRaises(exception.NetworkError,
+                              neutron._verify_security_groups,
+                              ['sg1', 'sg2'], self.client)
+        self.assertEqual(2, self.client.security_groups.call_count)
+
+
 class TestNeutronNetworkInterfaceMixin(db_base.DbTestCase):
 
     def setUp(self):
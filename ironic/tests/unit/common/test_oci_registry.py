@@ -15,9 +15,11 @@
 import hashlib
 import io
 import json
+import os
 from unittest import mock
 from urllib import parse
 
+import fixtures
 from oslo_config import cfg
 import requests
 
@@ -122,6 +124,28 @@ class OciClientRequestTestCase(base.TestCase):
             headers={'Accept': 'application/vnd.oci.image.manifest.v1+json'},
             timeout=60)
 
+    def test_get_manifest_cached(self, get_mock):
+        self.config(image_info_cache_ttl=60)
+        self.addCleanup(oci_registry.OciClient._manifest_cache.clear)
+        csum = ('44136fa355b3678a1146ad16f7e8649e94fb4fc21fe77e8310c0'
+                '60f61caaff8a')
+        get_mock.return_value.status_code = 200
+        get_mock.return_value.text = '{}'
+        url = 'oci://localhost/local@sha256:' + csum
+        self.assertEqual({}, self.client.get_manifest(url))
+        # Cached for all the clients with the same authorization
+        res = oci_registry.OciClient(verify=True).get_manifest(url)
+        self.assertEqual({}, res)
+        get_mock.assert_called_once_with(
+            mock.ANY,
+            'https://localhost/v2/local/manifests/sha256:' + csum,
+            headers={'Accept': 'application/vnd.oci.image.manifest.v1+json'},
+            timeout=60)
+        # Not reused with another authorization
+        self.client.session.headers['Authorization'] = 'bearer zoo'
+        self.assertEqual({}, self.client.get_manifest(url))
+        self.assertEqual(2, get_mock.call_count)
+
     def test_get_manifest_auth_required(self, get_mock):
         fake_csum = 'f' * 64
         response = mock.Mock()
@@ -223,6 +247,32 @@ class OciClientRequestTestCase(base.TestCase):
             headers={'Accept': 'application/vnd.oci.image.index.v1+json'},
             timeout=60)
 
+    @mock.patch.object(oci_registry.OciClient, '_resolve_tag',
+                       autospec=True)
+    def test_get_artifact_index_cached(self, resolve_tag_mock, get_mock):
+        self.config(image_info_cache_ttl=60)
+        self.addCleanup(oci_registry.OciClient._index_cache.clear)
+        resolve_tag_mock.return_value = {
+            'image': '/local',
+            'tag': 'tag'
+        }
+        get_mock.return_value.status_code = 200
+        get_mock.return_value.text = '{"manifests": []}'
+        res = self.client.get_artifact_index('oci://localhost/local:tag')
+        res['manifests'].append({})
+        res = self.client.get_artifact_index('oci://localhost/local:tag')
+        self.assertEqual({'manifests': []}, res)
+        resolve_tag_mock.assert_called_once_with(
+            mock.ANY,
+            parse.urlparse('oci://localhost/local:tag'))
+        get_mock.assert_called_once_with(
+            mock.ANY,
+            'https://localhost/v2/local/manifests/tag',
+            headers={'Accept': 'application/vnd.oci.image.index.v1+json'},
+            timeout=60)
+        self.client.get_artifact_index('oci://localhost/local:other')
+        self.assertEqual(2, get_mock.call_count)
+
     @mock.patch.object(oci_registry.OciClient, '_resolve_tag',
                        autospec=True)
     def test_get_artifact_index_not_found(self, resolve_tag_mock, get_mock):
@@ -858,6 +908,147 @@ class OciClientRequestTestCase(base.TestCase):
         self.assertEqual(2, get_mock.call_count)
 
 
+@mock.patch.object(oci_registry.OciClient, '_get_blob', autospec=True)
+@mock.patch.object(oci_registry.OciClient, 'get_manifest', autospec=True)
+class OciBlobStoreTestCase(base.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.store = self.useFixture(fixtures.TempDir()).path
+        self.config(blob_cache_path=self.store, group='oci')
+        self.client = oci_registry.OciClient(verify=True)
+        self.blob = b'some content' * 1000
+        self.digest = 'sha256:' + hashlib.sha256(self.blob).hexdigest()
+        self.path = os.path.join(self.store, 'sha256',
+                                 self.digest.split(':')[1])
+        self.manifest_url = 'oci://localhost/foo/bar@sha256:' + 'f' * 64
+
+    def _response(self, status_code=200, chunks=None):
+        response = mock.MagicMock(spec=requests.Response)
+        response.status_code = status_code
+        response.__enter__.return_value = response
+        response.iter_content.return_value = (
+            [self.blob] if chunks is None else chunks)
+        return response
+
+    def _download(self):
+        image_file = io.BytesIO()
+        res = self.client.download_blob_from_manifest(self.manifest_url,
+                                                      image_file)
+        self.assertEqual(self.digest, res)
+        self.assertEqual(self.blob, image_file.getvalue())
+
+    def test_download(self, manifest_mock, blob_mock):
+        manifest_mock.return_value = {'layers': [{'digest': self.digest}]}
+        blob_mock.return_value = self._response()
+        self._download()
+        blob_mock.assert_called_once_with(
+            self.client, 'https://localhost/v2/foo/bar/blobs/' + self.digest,
+            headers=None)
+        with open(self.path, 'rb') as fp:
+            self.assertEqual(self.blob, fp.read())
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+        # Another image referencing the same blob
+        self.manifest_url = 'oci://localhost/foo/baz@sha256:' + 'e' * 64
+        self._download()
+        blob_mock.assert_called_once()
+
+    def test_blob_store_path_unsupported(self, manifest_mock, blob_mock):
+        self.assertIsNone(
+            self.client._blob_store_path('sha256:../../etc/passwd'))
+        self.assertIsNone(self.client._blob_store_path('md5:' + 'a' * 32))
+
+    def test_download_resume(self, manifest_mock, blob_mock):
+        manifest_mock.return_value = {'layers': [{'digest': self.digest}]}
+        failing = self._response()
+
+        def _chunks(size):
+            yield self.blob[:100]
+            raise requests.exceptions.ChunkedEncodingError()
+
+        failing.iter_content.side_effect = _chunks
+        blob_mock.side_effect = [
+            failing, self._response(206, [self.blob[100:]])]
+        self._download()
+        blob_mock.assert_has_calls([
+            mock.call(self.client, mock.ANY, headers=None),
+            mock.call(self.client, mock.ANY,
+                      headers={'Range': 'bytes=100-'})])
+
+    def test_download_resume_partial_file(self, manifest_mock, blob_mock):
+        manifest_mock.return_value = {'layers': [{'digest': self.digest}]}
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path + '.part', 'wb') as fp:
+            fp.write(self.blob[:100])
+        blob_mock.return_value = self._response(206, [self.blob[100:]])
+        self._download()
+        blob_mock.assert_called_once_with(self.client, mock.ANY,
+                                          headers={'Range': 'bytes=100-'})
+
+    def test_download_resume_not_supported(self, manifest_mock, blob_mock):
+        manifest_mock.return_value = {'layers': [{'digest': self.digest}]}
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path + '.part', 'wb') as fp:
+            fp.write(b'garbage')
+        blob_mock.return_value = self._response(200)
+        self._download()
+
+    def test_download_complete_partial_file(self, manifest_mock, blob_mock):
+        manifest_mock.return_value = {'layers': [{'digest': self.digest}]}
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path + '.part', 'wb') as fp:
+            fp.write(self.blob)
+        self._download()
+        blob_mock.assert_not_called()
+
+    def test_download_corrupted_partial_file(self, manifest_mock, blob_mock):
+        manifest_mock.return_value = {'layers': [{'digest': self.digest}]}
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path + '.part', 'wb') as fp:
+            fp.write(b'x' * len(self.blob))
+        blob_mock.side_effect = [self._response(416), self._response()]
+        self._download()
+        blob_mock.assert_has_calls([
+            mock.call(self.client, mock.ANY,
+                      headers={'Range': 'bytes=%d-' % len(self.blob)}),
+            mock.call(self.client, mock.ANY, headers=None)])
+        with open(self.path, 'rb') as fp:
+            self.assertEqual(self.blob, fp.read())
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_download_checksum_error(self, manifest_mock, blob_mock):
+        manifest_mock.return_value = {'layers': [{'digest': self.digest}]}
+        blob_mock.return_value = self._response(chunks=[b'wrong'])
+        self.assertRaises(exception.ImageChecksumError,
+                          self.client.download_blob_from_manifest,
+                          self.manifest_url, io.BytesIO())
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + '.part'))
+
+    def test_download_too_many_failures(self, manifest_mock, blob_mock):
+        self.config(image_download_retries=1)
+        manifest_mock.return_value = {'layers': [{'digest': self.digest}]}
+        blob_mock.side_effect = requests.ConnectionError()
+        self.assertRaises(exception.ImageDownloadFailed,
+                          self.client.download_blob_from_manifest,
+                          self.manifest_url, io.BytesIO())
+        self.assertEqual(2, blob_mock.call_count)
+
+    def test_clean_up(self, manifest_mock, blob_mock):
+        self.config(blob_cache_size=1, group='oci')
+        os.makedirs(os.path.dirname(self.path))
+        old = os.path.join(self.store, 'sha256', 'a' * 64)
+        with open(old, 'wb') as fp:
+            fp.write(bytes(1024 * 1024))
+        os.utime(old, (1, 1))
+        manifest_mock.return_value = {'layers': [{'digest': self.digest}]}
+        blob_mock.return_value = self._response()
+        self._download()
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(self.path))
+
+
 class TestRegistrySessionHelper(base.TestCase):
 
     def test_get_token_from_config_default(self):
@@ -49,6 +49,29 @@ class ConvertImageTestCase(base.TestCase):
             use_standard_locale=True,
             env_variables={'MALLOC_ARENA_MAX': '3'})
 
+    @mock.patch.object(utils, 'execute', autospec=True)
+    def test_convert_image_ionice(self, execute_mock):
+        qemu_img.convert_image('source', 'dest', 'out_format',
+                               io_class='best-effort', io_priority=7)
+        qemu_img.convert_image('source', 'dest', 'out_format',
+                               io_class='idle', io_priority=7)
+        execute_mock.assert_has_calls([
+            mock.call('ionice', '-c', '2', '-n', '7',
+                      'qemu-img', 'convert', '-f', 'qcow2', '-O',
+                      'out_format', 'source', 'dest',
+                      run_as_root=False,
+                      prlimit=mock.ANY,
+                      use_standard_locale=True,
+                      env_variables={'MALLOC_ARENA_MAX': '3'}),
+            mock.call('ionice', '-c', '3',
+                      'qemu-img', 'convert', '-f', 'qcow2', '-O',
+                      'out_format', 'source', 'dest',
+                      run_as_root=False,
+                      prlimit=mock.ANY,
+                      use_standard_locale=True,
+                      env_variables={'MALLOC_ARENA_MAX': '3'}),
+        ])
+
     @mock.patch.object(utils, 'execute', autospec=True)
     def test_convert_image_retries(self, execute_mock):
         ret_err = 'qemu: qemu_thread_create: Resource temporarily unavailable'
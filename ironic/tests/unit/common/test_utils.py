@@ -1079,3 +1079,23 @@ class GetRouteSourceTestCase(base.TestCase):
 
         source = utils.get_route_source('XXX')
         self.assertIsNone(source)
+
+
+class LazyLogValueTestCase(base.TestCase):
+
+    def test_not_computed_until_formatted(self):
+        func = mock.Mock(return_value={'a': 1})
+        value = utils.LazyLogValue(func, 'arg')
+        func.assert_not_called()
+        self.assertEqual("{'a': 1}", '%s' % value)
+        self.assertEqual("{'a': 1}", '%(v)r' % {'v': value})
+        func.assert_called_with('arg')
+
+    def test_mask_dict_password_lazy(self):
+        value = utils.mask_dict_password_lazy({'user': 'admin',
+                                               'password': 'secret'})
+        self.assertEqual({'user': 'admin', 'password': '***'}, value.value)
+
+    def test_mask_password_lazy(self):
+        value = utils.mask_password_lazy('{"password": "secret"}')
+        self.assertEqual('{"password": "***"}', str(value))
@@ -28,9 +28,12 @@ from ironic.common import mdns
 from ironic.common import states
 from ironic.common import utils as common_utils
 from ironic.conductor import base_manager
+from ironic.conductor import bmc_io
+from ironic.conductor import hooks
 from ironic.conductor import manager
 from ironic.conductor import notification_utils
 from ironic.conductor import task_manager
+from ironic.conductor import utils as conductor_utils
 from ironic.db import api as dbapi
 from ironic.drivers import fake_hardware
 from ironic.drivers import generic
@@ -292,6 +295,43 @@ class StartStopTestCase(mgr_utils.ServiceSetUpMixin, db_base.DbTestCase):
         mock_zc.close.assert_called_once_with()
         self.assertIsNone(self.service._zeroconf)
 
+    @mock.patch.object(conductor_utils, 'flush_node_history', autospec=True)
+    def test_del_host_flushes_node_history(self, mock_flush):
+        self._start_service()
+        self.service.del_host()
+        mock_flush.assert_called_once_with()
+
+    def test_del_host_stops_bmc_engine(self):
+        self._start_service()
+        mock_engine = mock.Mock(spec=bmc_io.BMCRequestEngine)
+        self.service._bmc_engine = mock_engine
+        self.service.del_host()
+        mock_engine.stop.assert_called_once_with(wait=True)
+        self.assertIsNone(self.service._bmc_engine)
+
+    @mock.patch.object(hooks, 'stop', autospec=True)
+    def test_del_host_stops_hooks(self, mock_stop):
+        self._start_service()
+        self.service.del_host()
+        mock_stop.assert_called_once_with()
+
+    @mock.patch.object(hooks, 'start', autospec=True)
+    def test_start_hooks(self, mock_start):
+        self._start_service()
+        self.service._start_hooks()
+        mock_start.assert_called_once_with(mock.ANY)
+        handler = mock_start.call_args[0][0]
+        self.assertEqual(self.service._handle_power_event, handler.func)
+
+    @mock.patch.object(base_manager.BaseConductorManager, 'del_host',
+                       autospec=True)
+    @mock.patch.object(hooks, 'start', autospec=True)
+    def test_start_hooks_failed(self, mock_start, mock_del_host):
+        self._start_service()
+        mock_start.side_effect = exception.ConfigInvalid(error_msg='no')
+        self.assertRaises(exception.ConfigInvalid, self.service._start_hooks)
+        mock_del_host.assert_called_once_with(self.service)
+
     @mock.patch.object(dbapi, 'get_instance', autospec=True)
     def test_start_dbapi_single_call(self, mock_dbapi):
         self._start_service()
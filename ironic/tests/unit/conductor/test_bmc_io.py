@@ -0,0 +1,203 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import time
+from unittest import mock
+
+from ironic.common import exception
+from ironic.conductor import bmc_io
+from ironic.tests import base
+
+
+class BMCKeyTestCase(base.TestCase):
+
+    def test_url(self):
+        self.assertEqual(
+            '192.0.2.1',
+            bmc_io.bmc_key({'redfish_address': 'https://192.0.2.1:8000',
+                            'redfish_system_id': '/redfish/v1/Systems/1'}))
+
+    def test_plain_address(self):
+        self.assertEqual(
+            'bmc.example.com',
+            bmc_io.bmc_key({'ipmi_address': ' bmc.example.com ',
+                            'ipmi_username': 'admin'}))
+
+    def test_first_address(self):
+        self.assertEqual(
+            '192.0.2.1',
+            bmc_io.bmc_key({'redfish_address': '192.0.2.2',
+                            'idrac_address': '192.0.2.1'}))
+
+    def test_no_address(self):
+        self.assertEqual(
+            'default',
+            bmc_io.bmc_key({'ipmi_username': 'admin', 'ipmi_address': ''},
+                           default='default'))
+        self.assertIsNone(bmc_io.bmc_key(None))
+
+
+@mock.patch.object(bmc_io, 'METRICS', autospec=True)
+class BMCRequestEngineTestCase(base.TestCase):
+
+    def setUp(self):
+        super(BMCRequestEngineTestCase, self).setUp()
+        self.running = collections.Counter()
+        self.max_running = collections.Counter()
+
+    def _request(self, bmc, duration=0.01, result=None):
+        self.running[bmc] += 1
+        self.max_running[bmc] = max(self.max_running[bmc], self.running[bmc])
+        try:
+            time.sleep(duration)
+        finally:
+            self.running[bmc] -= 1
+        return result
+
+    def _engine(self, *args, **kwargs):
+        engine = bmc_io.BMCRequestEngine(*args, **kwargs)
+        self.addCleanup(engine.stop, wait=False)
+        return engine
+
+    def test_limit_per_bmc(self, mock_metrics):
+        engine = self._engine(10, 2)
+        futures = [engine.submit(bmc, f'{bmc}-{i}', self._request, bmc,
+                                 result=i)
+                   for bmc in ('bmc1', 'bmc2') for i in range(4)]
+        self.assertEqual(8, engine.outstanding)
+
+        done, not_done = engine.wait(futures)
+
+        self.assertEqual(set(futures), done)
+        self.assertFalse(not_done)
+        self.assertEqual([0, 1, 2, 3] * 2, [f.result() for f in futures])
+        self.assertEqual({'bmc1': 2, 'bmc2': 2}, self.max_running)
+        self.assertEqual(0, engine.outstanding)
+        self.assertEqual({}, engine._bmcs)
+        self.assertEqual(8, mock_metrics.send_timer.call_count)
+        mock_metrics.send_counter.assert_not_called()
+
+    def test_duplicate_key(self, mock_metrics):
+        engine = self._engine(10, 2)
+        future = engine.submit('bmc1', 'node', self._request, 'bmc1')
+        self.assertIsNone(
+            engine.submit('bmc1', 'node', self._request, 'bmc1'))
+
+        engine.wait([future])
+
+        self.assertIsNotNone(
+            engine.submit('bmc1', 'node', self._request, 'bmc1'))
+
+    def test_deadline(self, mock_metrics):
+        engine = self._engine(10, 1, deadline=0.05)
+        slow = engine.submit('bmc1', 'node1', self._request, 'bmc1',
+                             duration=0.2)
+        late = engine.submit('bmc1', 'node2', self._request, 'bmc1')
+        other = engine.submit('bmc2', 'node3', self._request, 'bmc2')
+
+        done, not_done = engine.wait([slow, late, other])
+
+        self.assertEqual({slow, late, other}, done)
+        self.assertIsNone(slow.exception())
+        self.assertIsInstance(late.exception(),
+                              exception.BMCRequestCancelled)
+        self.assertIsNone(other.exception())
+        mock_metrics.send_counter.assert_called_once_with(
+            'BMCRequestEngine.cancelled', 1)
+
+    @mock.patch.object(bmc_io, 'time', autospec=True)
+    def test_busy_bmc(self, mock_time, mock_metrics):
+        # The requests take 20ms of a fake clock, so that the BMC serving
+        # one request at a time starts exactly 3 of its 12 requests within
+        # the deadline on each run, however loaded the test runner is.
+        now = [0.0]
+        mock_time.monotonic.side_effect = lambda: now[0]
+
+        def request(duration, result=None):
+            self.running[result] += 1
+            self.max_running[result] = max(self.max_running[result],
+                                           self.running[result])
+            now[0] += duration
+            time.sleep(0)
+            self.running[result] -= 1
+            return result
+
+        engine = self._engine(4, 1, deadline=0.05)
+        busy = ['node%d' % i for i in range(12)]
+        others = ['other%d' % i for i in range(3)]
+        succeeded = collections.defaultdict(list)
+
+        for run in range(6):
+            futures = {engine.submit('busy', key, request, 0.02,
+                                     result='busy'): key
+                       for key in busy}
+            # Submitted last, they do not wait for the requests to the busy
+            # BMC, which do not hold threads of the pool.
+            futures.update(
+                (engine.submit(key, key, request, 0, result=key), key)
+                for key in others)
+
+            done, not_done = engine.wait(futures)
+
+            self.assertEqual(set(futures), done)
+            for future, key in futures.items():
+                if future.exception() is None:
+                    succeeded[key].append(run)
+                else:
+                    self.assertIsInstance(future.exception(),
+                                          exception.BMCRequestCancelled)
+
+        self.assertEqual(1, self.max_running['busy'])
+        self.assertEqual({key: list(range(6)) for key in others},
+                         {key: succeeded[key] for key in others})
+        # The BMC serves 3 requests per run, the cancelled ones first on the
+        # next run, so that every node gets its turn.
+        self.assertEqual([3] * 6,
+                         [sum(runs.count(run) for key, runs
+                              in succeeded.items() if key in busy)
+                          for run in range(6)])
+        self.assertEqual(set(busy), {key for key in busy if succeeded[key]})
+
+    @mock.patch.object(bmc_io, 'LOG', autospec=True)
+    def test_wait_timeout_and_errors(self, mock_log, mock_metrics):
+        engine = self._engine(10, 2)
+        slow = engine.submit('bmc1', 'node1', self._request, 'bmc1',
+                             duration=0.5)
+        failed = engine.submit('bmc2', 'node2', self._request, 'bmc2',
+                               duration='nope')
+
+        done, not_done = engine.wait([slow, None, failed], timeout=0.1)
+
+        self.assertEqual({failed}, done)
+        self.assertEqual({slow}, not_done)
+        self.assertTrue(mock_log.error.called)
+        self.assertTrue(mock_log.warning.called)
+        # The request is still outstanding, it is not submitted twice
+        self.assertIsNone(
+            engine.submit('bmc1', 'node1', self._request, 'bmc1'))
+
+    def test_stop(self, mock_metrics):
+        engine = self._engine(10, 1)
+        running = engine.submit('bmc1', 'node1', self._request, 'bmc1',
+                                duration=0.05)
+        queued = engine.submit('bmc1', 'node2', self._request, 'bmc1')
+        time.sleep(0.01)
+
+        engine.stop(wait=True)
+
+        self.assertIsNone(running.exception())
+        self.assertTrue(queued.cancelled()
+                        or isinstance(queued.exception(),
+                                      exception.BMCRequestCancelled))
+        self.assertIsNone(
+            engine.submit('bmc1', 'node3', self._request, 'bmc1'))
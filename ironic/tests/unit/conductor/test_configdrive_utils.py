@@ -10,8 +10,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import base64
-import gzip
 import json
 import os
 import tempfile
@@ -22,6 +20,7 @@ from oslo_config import cfg
 from oslo_utils import uuidutils
 import pycdlib
 
+from ironic.common import configdrive as cd_images
 from ironic.common import exception
 from ironic.common import neutron
 from ironic.conductor import configdrive_utils as cd_utils
@@ -427,8 +426,7 @@ class MetadataUtilsTestCase(db_base.DbTestCase):
     @mock.patch.object(cd_utils, '_read_config_drive', autospec=True)
     @mock.patch.object(cd_utils, 'regenerate_iso',
                        autospec=True)
-    @mock.patch.object(base64, 'b64decode', autospec=True)
-    @mock.patch.object(gzip, 'decompress', autospec=True)
+    @mock.patch.object(cd_images, 'decode_configdrive', autospec=True)
     @mock.patch.object(cd_utils, 'is_invalid_network_metadata',
                        autospec=True)
     @mock.patch.object(cd_utils, 'generate_config_metadata',
@@ -442,8 +440,7 @@ class MetadataUtilsTestCase(db_base.DbTestCase):
             mock_pycd, mock_remove,
             mock_temp, mock_mkstemp,
             mock_gen, mock_is_invalid,
-            mock_decomp,
-            mock_b64_decode,
+            mock_decode,
             mock_regen,
             mock_read_iso):
         invalid_nd = json.dumps({'links': [], 'services': [], 'networks': []})
@@ -462,16 +459,15 @@ class MetadataUtilsTestCase(db_base.DbTestCase):
         self.assertTrue(mock_remove.called)
         mock_temp.assert_called_once_with(dir=mock.ANY, mode='wb+')
         mock_mkstemp.assert_called_once_with(dir=mock.ANY)
-        self.assertTrue(mock_b64_decode.called)
-        self.assertTrue(mock_decomp.called)
+        mock_decode.assert_called_once_with(
+            'foo', mock_temp.return_value.__enter__.return_value)
         self.assertTrue(mock_is_invalid.called)
         mock_read_iso.assert_called_once_with(mock.ANY)
 
     @mock.patch.object(cd_utils, '_read_config_drive', autospec=True)
     @mock.patch.object(cd_utils, 'regenerate_iso',
                        autospec=True)
-    @mock.patch.object(base64, 'b64decode', autospec=True)
-    @mock.patch.object(gzip, 'decompress', autospec=True)
+    @mock.patch.object(cd_images, 'decode_configdrive', autospec=True)
     @mock.patch.object(cd_utils, 'is_invalid_network_metadata',
                        autospec=True)
     @mock.patch.object(cd_utils, 'generate_config_metadata',
@@ -485,8 +481,7 @@ class MetadataUtilsTestCase(db_base.DbTestCase):
             mock_pycd, mock_remove,
             mock_temp, mock_mkstemp,
             mock_gen, mock_is_valid,
-            mock_decomp,
-            mock_b64_decode,
+            mock_decode,
             mock_regen,
             mock_read_iso):
         invalid_nd = '{"foo":...'
@@ -504,16 +499,15 @@ class MetadataUtilsTestCase(db_base.DbTestCase):
         self.assertTrue(mock_remove.called)
         mock_temp.assert_called_once_with(dir=mock.ANY, mode='wb+')
         mock_mkstemp.assert_called_once_with(dir=mock.ANY)
-        self.assertTrue(mock_b64_decode.called)
-        self.assertTrue(mock_decomp.called)
+        mock_decode.assert_called_once_with(
+            'foo', mock_temp.return_value.__enter__.return_value)
         self.assertFalse(mock_is_valid.called)
         mock_read_iso.assert_called_once_with(mock.ANY)
 
     @mock.patch.object(cd_utils, '_read_config_drive', autospec=True)
     @mock.patch.object(cd_utils, 'regenerate_iso',
                        autospec=True)
-    @mock.patch.object(base64, 'b64decode', autospec=True)
-    @mock.patch.object(gzip, 'decompress', autospec=True)
+    @mock.patch.object(cd_images, 'decode_configdrive', autospec=True)
     @mock.patch.object(cd_utils, 'is_invalid_network_metadata',
                        autospec=True)
     @mock.patch.object(cd_utils, 'generate_config_metadata',
@@ -527,8 +521,7 @@ class MetadataUtilsTestCase(db_base.DbTestCase):
             mock_pycd, mock_remove,
             mock_temp, mock_mkstemp,
             mock_gen, mock_is_valid,
-            mock_decomp,
-            mock_b64_decode,
+            mock_decode,
             mock_regen,
             mock_read_iso):
         mock_pycd.side_effect = \
@@ -542,16 +535,15 @@ class MetadataUtilsTestCase(db_base.DbTestCase):
         mock_remove.assert_not_called()
         mock_temp.assert_called_once_with(dir=mock.ANY, mode='wb+')
         mock_mkstemp.assert_not_called()
-        self.assertTrue(mock_b64_decode.called)
-        self.assertTrue(mock_decomp.called)
+        mock_decode.assert_called_once_with(
+            'foo', mock_temp.return_value.__enter__.return_value)
         mock_is_valid.assert_not_called()
         mock_read_iso.assert_not_called()
 
     @mock.patch.object(cd_utils, '_read_config_drive', autospec=True)
     @mock.patch.object(cd_utils, 'regenerate_iso',
                        autospec=True)
-    @mock.patch.object(base64, 'b64decode', autospec=True)
-    @mock.patch.object(gzip, 'decompress', autospec=True)
+    @mock.patch.object(cd_images, 'decode_configdrive', autospec=True)
     @mock.patch.object(cd_utils, 'is_invalid_network_metadata',
                        autospec=True)
     @mock.patch.object(cd_utils, 'generate_config_metadata',
@@ -565,8 +557,7 @@ class MetadataUtilsTestCase(db_base.DbTestCase):
             mock_pycd, mock_remove,
             mock_temp, mock_mkstemp,
             mock_gen, mock_is_valid,
-            mock_decomp,
-            mock_b64_decode,
+            mock_decode,
             mock_regen,
             mock_read_iso):
         invalid_nd = json.dumps({'links': [], 'services': [], 'networks': []})
@@ -582,8 +573,8 @@ class MetadataUtilsTestCase(db_base.DbTestCase):
         mock_remove.assert_not_called()
         mock_temp.assert_called_once_with(dir=mock.ANY, mode='wb+')
         mock_mkstemp.assert_not_called()
-        self.assertTrue(mock_b64_decode.called)
-        self.assertTrue(mock_decomp.called)
+        mock_decode.assert_called_once_with(
+            'foo', mock_temp.return_value.__enter__.return_value)
         self.assertTrue(mock_is_valid.called)
         mock_read_iso.assert_not_called()
 
@@ -1299,7 +1299,8 @@ class StoreConfigDriveTestCase(db_base.DbTestCase):
             container_name, expected_obj_name, timeout)
         self.node.refresh()
         self.assertEqual(expected_instance_info, self.node.instance_info)
-        mock_cd.assert_called_once_with(self.node, {'meta_data': {}})
+        mock_cd.assert_called_once_with(self.node, {'meta_data': {}},
+                                        fileobj=mock.ANY)
 
     def test_store_configdrive_swift_no_deploy_timeout(self, mock_swift):
         container_name = 'foo_container'
@@ -0,0 +1,68 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from ironic.conductor import hooks
+from ironic.tests import base
+
+
+class HooksTestCase(base.TestCase):
+
+    def setUp(self):
+        super(HooksTestCase, self).setUp()
+        self.calls = []
+        self.first = self._hook('first', frozenset(['node1']))
+        self.second = self._hook('second', frozenset(['node1', 'node2']))
+        patcher = mock.patch.dict(hooks._HOOKS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        hooks.register('first', self.first)
+        hooks.register('second', self.second)
+
+    def _hook(self, name, nodes):
+        hook = mock.Mock(spec=hooks.ConductorHook)
+        hook.start.side_effect = lambda handler: self.calls.append(
+            ('start', name, handler))
+        hook.stop.side_effect = lambda: self.calls.append(('stop', name))
+        hook.power_event_nodes.return_value = nodes
+        return hook
+
+    def test_start_stop(self):
+        handler = mock.Mock()
+        hooks.start(handler)
+        hooks.stop()
+        self.assertEqual([('start', 'first', handler),
+                          ('start', 'second', handler),
+                          ('stop', 'second'), ('stop', 'first')],
+                         self.calls)
+
+    def test_start_failed(self):
+        self.first.start.side_effect = RuntimeError('boom')
+        self.assertRaises(RuntimeError, hooks.start, mock.Mock())
+        self.assertFalse(self.second.start.called)
+
+    @mock.patch.object(hooks, 'LOG', autospec=True)
+    def test_stop_failed(self, mock_log):
+        self.second.stop.side_effect = RuntimeError('boom')
+        hooks.stop()
+        self.first.stop.assert_called_once_with()
+        self.assertTrue(mock_log.exception.called)
+
+    def test_power_event_nodes(self):
+        self.assertEqual({'node1', 'node2'}, hooks.power_event_nodes())
+
+    def test_default_hook(self):
+        hook = hooks.ConductorHook()
+        hook.start(mock.Mock())
+        hook.stop()
+        self.assertEqual(frozenset(), hook.power_event_nodes())
@@ -28,6 +28,7 @@ from unittest import mock
 from futurist import waiters
 from oslo_config import cfg
 import oslo_messaging as messaging
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 from oslo_versionedobjects import base as ovo_base
 from oslo_versionedobjects import fields
@@ -43,9 +44,12 @@ from ironic.common import images
 from ironic.common import indicator_states
 from ironic.common import metrics as ironic_metrics
 from ironic.common import nova
+from ironic.common import pxe_utils
 from ironic.common import states
+from ironic.conductor import bmc_io
 from ironic.conductor import cleaning
 from ironic.conductor import deployments
+from ironic.conductor import hooks
 from ironic.conductor import inspection
 from ironic.conductor import manager
 from ironic.conductor import notification_utils
@@ -56,7 +60,9 @@ from ironic.conductor import utils as conductor_utils
 from ironic.conductor import verify
 from ironic.db import api as dbapi
 from ironic.drivers import base as drivers_base
+from ironic.drivers.modules import deploy_utils
 from ironic.drivers.modules import fake
+from ironic.drivers.modules import image_cache
 from ironic.drivers.modules import image_utils
 from ironic.drivers.modules import inspect_utils
 from ironic.drivers.modules.network import flat as n_flat
@@ -5992,6 +5998,66 @@ class ManagerSyncPowerStatesTestCase(mgr_utils.CommonMixIn,
                                              shared=True)
         sync_mock.assert_called_once_with(task, mock.ANY)
 
+    def _test_adaptive_interval(self, get_nodeinfo_mock, mapped_mock,
+                                acquire_mock, sync_mock, runs,
+                                max_interval=240):
+        self.config(sync_power_state_max_interval=max_interval,
+                    group='conductor')
+        self.columns.append('updated_at')
+        self.node.updated_at = None
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
+        mapped_mock.return_value = True
+        task = self._create_task(node_attrs=dict(uuid=self.node.uuid,
+                                                 updated_at=None))
+        acquire_mock.side_effect = self._get_acquire_side_effect(
+            [task] * runs)
+
+        synced = []
+        for run in range(1, runs + 1):
+            sync_mock.reset_mock()
+            self.service._sync_power_states(self.context)
+            if sync_mock.called:
+                synced.append(run)
+        get_nodeinfo_mock.assert_called_with(
+            columns=self.columns, filters=self.filters)
+        return task, synced
+
+    def test_adaptive_interval_stable(self, get_nodeinfo_mock,
+                                      mapped_mock, acquire_mock, sync_mock):
+        sync_mock.return_value = 0
+        task, synced = self._test_adaptive_interval(
+            get_nodeinfo_mock, mapped_mock, acquire_mock, sync_mock, 11)
+        # The interval doubles up to 4 runs
+        self.assertEqual([1, 3, 7, 11], synced)
+
+        # An update brings the node back to the base rate
+        task.node.updated_at = timeutils.utcnow()
+        get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response(
+            task.node)
+        acquire_mock.side_effect = self._get_acquire_side_effect(task)
+        sync_mock.reset_mock()
+        self.service._sync_power_states(self.context)
+        sync_mock.assert_called_once_with(task, mock.ANY)
+
+    def test_adaptive_interval_failing(self, get_nodeinfo_mock,
+                                       mapped_mock, acquire_mock, sync_mock):
+        sync_mock.return_value = 1
+        task, synced = self._test_adaptive_interval(
+            get_nodeinfo_mock, mapped_mock, acquire_mock, sync_mock, 3)
+        self.assertEqual([1, 2, 3], synced)
+
+    @mock.patch.object(hooks, 'power_event_nodes', autospec=True)
+    def test_adaptive_interval_subscribed(self, subscribed_mock,
+                                          get_nodeinfo_mock, mapped_mock,
+                                          acquire_mock, sync_mock):
+        self.config(sync_power_state_event_interval=240, group='conductor')
+        subscribed_mock.return_value = frozenset([self.node.uuid])
+        sync_mock.return_value = 0
+        task, synced = self._test_adaptive_interval(
+            get_nodeinfo_mock, mapped_mock, acquire_mock, sync_mock, 11,
+            max_interval=0)
+        self.assertEqual([1, 3, 7, 11], synced)
+
     def test_single_node_adopt_failed(self, get_nodeinfo_mock,
                                       mapped_mock, acquire_mock, sync_mock):
         get_nodeinfo_mock.return_value = self._get_nodeinfo_list_response()
@@ -6663,6 +6729,232 @@ class ParallelPowerSyncTestCase(mgr_utils.CommonMixIn, db_base.DbTestCase):
             queue_mock.return_value.put.assert_has_calls(expected_calls)
 
 
+@mock.patch.object(manager.ConductorManager, '_spawn_worker', autospec=True)
+@mock.patch.object(manager.ConductorManager, '_sync_power_state_node',
+                   autospec=True)
+class EnginePowerSyncTestCase(mgr_utils.CommonMixIn, db_base.DbTestCase):
+
+    def setUp(self):
+        super(EnginePowerSyncTestCase, self).setUp()
+        self.service = manager.ConductorManager('hostname', 'test-topic')
+        self.service._bmc_engine = bmc_io.BMCRequestEngine(10, 1)
+        self.addCleanup(self.service._bmc_engine.stop, wait=False)
+        self.nodes = [
+            ('uuid1', 'fake-hardware', '', 1,
+             {'redfish_address': 'https://192.0.2.1'}),
+            ('uuid2', 'fake-hardware', '', 2,
+             {'redfish_address': 'https://192.0.2.1'}),
+            ('uuid3', 'fake-hardware', '', 3, {}),
+        ]
+
+    def test__sync_power_states(self, sync_mock, spawn_mock):
+        with mock.patch.object(self.service, 'iter_nodes', autospec=True,
+                               return_value=self.nodes) as iter_mock:
+            self.service._sync_power_states(self.context)
+
+        iter_mock.assert_called_once_with(fields=['id', 'driver_info'],
+                                          filters={'maintenance': False})
+        sync_mock.assert_has_calls(
+            [mock.call(self.service, self.context, uuid)
+             for uuid in ('uuid1', 'uuid2', 'uuid3')], any_order=True)
+        self.assertEqual(0, self.service._bmc_engine.outstanding)
+        self.assertFalse(spawn_mock.called)
+
+    def test__sync_power_states_node_prioritization(self, sync_mock,
+                                                    spawn_mock):
+        with mock.patch.object(
+            self.service, 'iter_nodes', autospec=True,
+            return_value=self.nodes
+        ), mock.patch.dict(
+                self.service.power_state_sync_count,
+                {'uuid1': 0, 'uuid3': 2}, clear=True):
+            self.service._bmc_engine = mock.Mock(spec=bmc_io.BMCRequestEngine)
+            self.service._bmc_engine.wait.return_value = (set(), set())
+
+            self.service._sync_power_states(self.context)
+
+        sync_method = self.service._sync_power_state_node
+        self.service._bmc_engine.submit.assert_has_calls([
+            mock.call('uuid3', 'uuid3', sync_method, self.context, 'uuid3'),
+            mock.call('192.0.2.1', 'uuid1', sync_method, self.context,
+                      'uuid1'),
+            mock.call('192.0.2.1', 'uuid2', sync_method, self.context,
+                      'uuid2'),
+        ])
+        self.service._bmc_engine.wait.assert_called_once_with(
+            [mock.ANY] * 3, timeout=CONF.conductor.sync_power_state_interval)
+        self.assertFalse(sync_mock.called)
+
+    def test__sync_power_states_shutdown(self, sync_mock, spawn_mock):
+        self.service._shutdown = True
+        with mock.patch.object(self.service, 'iter_nodes', autospec=True,
+                               return_value=self.nodes):
+            self.service._sync_power_states(self.context)
+
+        self.assertFalse(sync_mock.called)
+
+
+@mock.patch.object(notification_utils,
+                   'emit_power_state_corrected_notification', autospec=True)
+@mock.patch.object(manager.ConductorManager, '_sync_power_state_node',
+                   autospec=True)
+class HandlePowerEventTestCase(mgr_utils.CommonMixIn, db_base.DbTestCase):
+
+    def setUp(self):
+        super(HandlePowerEventTestCase, self).setUp()
+        self.config(force_power_state_during_sync=False, group='conductor')
+        self.service = manager.ConductorManager('hostname', 'test-topic')
+        self.node = obj_utils.create_test_node(
+            self.context, driver='fake-hardware',
+            provision_state=states.ACTIVE, power_state=states.POWER_ON)
+
+    def _handle(self, power_state, check=None):
+        self.service._handle_power_event(self.context, self.node.uuid,
+                                         power_state, check=check)
+        self.node.refresh()
+
+    def test_power_state(self, sync_mock, notify_mock):
+        self._handle(states.POWER_OFF)
+        self.assertEqual(states.POWER_OFF, self.node.power_state)
+        notify_mock.assert_called_once_with(mock.ANY, states.POWER_ON)
+        self.assertFalse(sync_mock.called)
+
+    def test_same_power_state(self, sync_mock, notify_mock):
+        self._handle(states.POWER_ON)
+        self.assertEqual(states.POWER_ON, self.node.power_state)
+        self.assertFalse(notify_mock.called)
+        self.assertFalse(sync_mock.called)
+
+    def test_excluded(self, sync_mock, notify_mock):
+        for field, value in [('target_power_state', states.POWER_OFF),
+                             ('provision_state', states.DEPLOYWAIT),
+                             ('maintenance', True),
+                             ('reservation', 'other-conductor')]:
+            fields = dict(provision_state=states.ACTIVE,
+                          power_state=states.POWER_ON)
+            fields[field] = value
+            self.node = obj_utils.create_test_node(
+                self.context, driver='fake-hardware',
+                uuid=uuidutils.generate_uuid(), **fields)
+            self._handle(states.POWER_OFF)
+            self.assertEqual(states.POWER_ON, self.node.power_state)
+        self.assertFalse(notify_mock.called)
+        self.assertFalse(sync_mock.called)
+
+    def test_unknown_power_state(self, sync_mock, notify_mock):
+        self._handle(None)
+        sync_mock.assert_called_once_with(self.service, self.context,
+                                          self.node.uuid)
+        self.assertEqual(states.POWER_ON, self.node.power_state)
+
+    def test_force_power_state(self, sync_mock, notify_mock):
+        self.config(force_power_state_during_sync=True, group='conductor')
+        self._handle(states.POWER_OFF)
+        sync_mock.assert_called_once_with(self.service, self.context,
+                                          self.node.uuid)
+        self.assertEqual(states.POWER_ON, self.node.power_state)
+
+    def test_verified(self, sync_mock, notify_mock):
+        check = mock.Mock(return_value=True)
+        self._handle(states.POWER_OFF, check)
+        self.assertEqual(states.POWER_OFF, self.node.power_state)
+        self.assertEqual(self.node.uuid, check.call_args[0][0].uuid)
+        self.assertFalse(sync_mock.called)
+
+    def test_not_verified(self, sync_mock, notify_mock):
+        self._handle(states.POWER_OFF, mock.Mock(return_value=False))
+        sync_mock.assert_called_once_with(self.service, self.context,
+                                          self.node.uuid)
+        self.assertEqual(states.POWER_ON, self.node.power_state)
+        self.assertFalse(notify_mock.called)
+
+    def test_node_not_found(self, sync_mock, notify_mock):
+        self.service._handle_power_event(
+            self.context, uuidutils.generate_uuid(), states.POWER_OFF)
+        self.assertFalse(notify_mock.called)
+        self.assertFalse(sync_mock.called)
+
+
+@mock.patch.object(waiters, 'wait_for_all', autospec=True)
+@mock.patch.object(manager.ConductorManager, '_spawn_worker', autospec=True)
+@mock.patch.object(image_cache, 'prewarm_images', autospec=True)
+class PrewarmImageCachesTestCase(mgr_utils.CommonMixIn, db_base.DbTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.service = manager.ConductorManager('hostname', 'test-topic')
+        self.config(deploy_kernel='kernel', deploy_ramdisk='ramdisk',
+                    deploy_kernel_by_arch={'aarch64': 'arm-kernel'},
+                    image_prewarm_images=['image1', 'image2'],
+                    image_prewarm_workers=3,
+                    group='conductor')
+
+    def test__prewarm_image_caches(self, prewarm_mock, spawn_mock,
+                                   waiter_mock):
+        images_queue = []
+
+        def _prewarm(context, queue_):
+            while not queue_.empty():
+                images_queue.append(queue_.get_nowait())
+            return 1, 42
+
+        prewarm_mock.side_effect = _prewarm
+        future = mock.Mock()
+        future.exception.return_value = None
+        future.result.return_value = (1, 10)
+        spawn_mock.return_value = future
+
+        self.service._prewarm_image_caches(self.context)
+
+        self.assertEqual(2, spawn_mock.call_count)
+        spawn_mock.assert_called_with(self.service, prewarm_mock,
+                                      self.context, mock.ANY)
+        prewarm_mock.assert_called_once_with(self.context, mock.ANY)
+        waiter_mock.assert_called_once_with([future, future])
+        self.assertEqual(['arm-kernel', 'kernel', 'ramdisk', 'image1',
+                          'image2'],
+                         [href for _cache, href, _raw in images_queue])
+        self.assertIsInstance(images_queue[0][0], pxe_utils.TFTPImageCache)
+        self.assertIsInstance(images_queue[-1][0],
+                              deploy_utils.InstanceImageCache)
+        self.assertEqual([True] * 5,
+                         [raw for _cache, _href, raw in images_queue])
+
+    def test__prewarm_image_caches_not_streamed_raw(self, prewarm_mock,
+                                                    spawn_mock, waiter_mock):
+        # The direct deploy does not convert the instance images it does
+        # not stream raw, the deploy images are still converted.
+        self.config(stream_raw_images=False, group='agent')
+        self.config(image_prewarm_workers=1, group='conductor')
+        images_queue = []
+
+        def _prewarm(context, queue_):
+            while not queue_.empty():
+                images_queue.append(queue_.get_nowait())
+            return 0, 0
+
+        prewarm_mock.side_effect = _prewarm
+
+        self.service._prewarm_image_caches(self.context)
+
+        self.assertEqual([('arm-kernel', True), ('kernel', True),
+                          ('ramdisk', True), ('image1', False),
+                          ('image2', False)],
+                         [(href, raw) for _cache, href, raw in images_queue])
+
+    def test__prewarm_image_caches_nothing(self, prewarm_mock, spawn_mock,
+                                           waiter_mock):
+        self.config(deploy_kernel=None, deploy_ramdisk=None,
+                    deploy_kernel_by_arch={}, image_prewarm_images=[],
+                    group='conductor')
+        prewarm_mock.return_value = (0, 0)
+
+        self.service._prewarm_image_caches(self.context)
+
+        spawn_mock.assert_not_called()
+        prewarm_mock.assert_called_once_with(self.context, mock.ANY)
+
+
 @mgr_utils.mock_record_keepalive
 @mock.patch.object(task_manager, 'acquire', autospec=True)
 class GetStepsForAutomatedCleaningTestCase(mgr_utils.ServiceSetUpMixin,
@@ -8318,6 +8610,127 @@ class HeartbeatTestCase(mgr_utils.ServiceSetUpMixin, db_base.DbTestCase):
             mock.ANY, mock.ANY, 'https://callback', '6.1.0', '/path/to/crt',
             None, None)
 
+    def _heartbeat_node(self, **kwargs):
+        kwargs.setdefault('provision_state', states.DEPLOYWAIT)
+        return obj_utils.create_test_node(
+            self.context, driver='fake-hardware',
+            target_provision_state=states.ACTIVE,
+            driver_internal_info={'agent_secret_token': 'a secret'},
+            **kwargs)
+
+    @mock.patch.object(manager.METRICS, 'send_counter', autospec=True)
+    @mock.patch.object(task_manager, 'acquire', autospec=True)
+    def test_heartbeat_node_locked(self, mock_acquire, mock_counter):
+        node = self._heartbeat_node(reservation='other-conductor')
+        self._start_service()
+        self.service.heartbeat(self.context, node.uuid, 'https://callback',
+                               '6.1.0', agent_token='a secret')
+        self.assertFalse(mock_acquire.called)
+        mock_counter.assert_called_once_with(
+            'ConductorManager.heartbeat.suppressed.locked', 1)
+
+    @mock.patch.object(task_manager, 'acquire', autospec=True)
+    def test_heartbeat_invalid_agent_token_not_acquired(self, mock_acquire):
+        node = self._heartbeat_node(reservation='other-conductor')
+        self._start_service()
+        exc = self.assertRaises(messaging.rpc.ExpectedException,
+                                self.service.heartbeat, self.context,
+                                node.uuid, 'https://callback',
+                                agent_token='evil', agent_version='6.1.0')
+        self.assertEqual(exception.InvalidParameterValue, exc.exc_info[0])
+        self.assertFalse(mock_acquire.called)
+
+    @mock.patch('ironic.drivers.modules.fake.FakeDeploy.heartbeat',
+                autospec=True)
+    @mock.patch('ironic.conductor.manager.ConductorManager._spawn_worker',
+                autospec=True)
+    def test_heartbeat_any_state(self, mock_spawn, mock_heartbeat):
+        # The deploy interface decides which states accept heartbeats
+        self.config(fast_track=False, group='deploy')
+        node = self._heartbeat_node(provision_state=states.ACTIVE)
+        self._start_service()
+        mock_spawn.reset_mock()
+        mock_spawn.side_effect = self._fake_spawn
+        self.service.heartbeat(self.context, node.uuid, 'https://callback',
+                               '6.1.0', agent_token='a secret')
+        self.assertTrue(mock_heartbeat.called)
+
+    @mock.patch.object(manager.METRICS, 'send_counter', autospec=True)
+    @mock.patch('ironic.drivers.modules.fake.FakeDeploy.heartbeat',
+                autospec=True)
+    @mock.patch('ironic.conductor.manager.ConductorManager._spawn_worker',
+                autospec=True)
+    def test_heartbeat_coalesced(self, mock_spawn, mock_heartbeat,
+                                 mock_counter):
+        self.config(heartbeat_coalesce_window=60, group='conductor')
+        node = self._heartbeat_node()
+        self._start_service()
+        mock_spawn.reset_mock()
+        mock_spawn.side_effect = self._fake_spawn
+        for _ in range(3):
+            self.service.heartbeat(self.context, node.uuid,
+                                   'https://callback', '6.1.0',
+                                   agent_token='a secret')
+        self.assertEqual(1, mock_heartbeat.call_count)
+        self.assertEqual(
+            [mock.call('ConductorManager.heartbeat.suppressed.coalesced', 1)]
+            * 2, mock_counter.call_args_list)
+        # Heartbeats with other arguments or states are not coalesced
+        self.service.heartbeat(self.context, node.uuid, 'https://callback',
+                               '6.1.0', agent_token='a secret',
+                               agent_status='end')
+        node.provision_state = states.CLEANWAIT
+        node.save()
+        self.service.heartbeat(self.context, node.uuid, 'https://callback',
+                               '6.1.0', agent_token='a secret',
+                               agent_status='end')
+        self.assertEqual(3, mock_heartbeat.call_count)
+
+    @mock.patch('ironic.drivers.modules.fake.FakeDeploy.heartbeat',
+                autospec=True)
+    @mock.patch('ironic.conductor.manager.ConductorManager._spawn_worker',
+                autospec=True)
+    def test_heartbeat_not_coalesced_after_failure(self, mock_spawn,
+                                                   mock_heartbeat):
+        self.config(heartbeat_coalesce_window=60, group='conductor')
+        node = self._heartbeat_node()
+        self._start_service()
+        mock_spawn.reset_mock()
+        mock_spawn.side_effect = exception.NoFreeConductorWorker()
+        self.assertRaises(messaging.rpc.ExpectedException,
+                          self.service.heartbeat, self.context, node.uuid,
+                          'https://callback', '6.1.0',
+                          agent_token='a secret')
+        self.assertFalse(mock_heartbeat.called)
+
+        with mock.patch.object(task_manager, 'acquire', autospec=True,
+                               side_effect=exception.NodeLocked(
+                                   node=node.uuid, host='other')):
+            self.assertRaises(exception.NodeLocked, self.service.heartbeat,
+                              self.context, node.uuid, 'https://callback',
+                              '6.1.0', agent_token='a secret')
+
+        mock_spawn.side_effect = self._fake_spawn
+        self.service.heartbeat(self.context, node.uuid, 'https://callback',
+                               '6.1.0', agent_token='a secret')
+        self.assertEqual(1, mock_heartbeat.call_count)
+
+    @mock.patch('ironic.drivers.modules.fake.FakeDeploy.heartbeat',
+                autospec=True)
+    @mock.patch('ironic.conductor.manager.ConductorManager._spawn_worker',
+                autospec=True)
+    def test_heartbeat_not_coalesced_by_default(self, mock_spawn,
+                                                mock_heartbeat):
+        node = self._heartbeat_node()
+        self._start_service()
+        mock_spawn.reset_mock()
+        mock_spawn.side_effect = self._fake_spawn
+        for _ in range(2):
+            self.service.heartbeat(self.context, node.uuid,
+                                   'https://callback', '6.1.0',
+                                   agent_token='a secret')
+        self.assertEqual(2, mock_heartbeat.call_count)
+
 
 @mgr_utils.mock_record_keepalive
 class DestroyVolumeConnectorTestCase(mgr_utils.ServiceSetUpMixin,
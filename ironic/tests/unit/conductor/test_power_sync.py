@@ -0,0 +1,105 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+from ironic.conductor import power_sync
+from ironic.tests import base
+
+
+class PowerSyncSchedulerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(PowerSyncSchedulerTestCase, self).setUp()
+        self.config(sync_power_state_interval=60,
+                    sync_power_state_max_interval=480,
+                    group='conductor')
+        self.scheduler = power_sync.PowerSyncScheduler()
+        self.updated_at = datetime.datetime(2026, 1, 1)
+
+    def _run(self, nodes, stable=True):
+        due = self.scheduler.due_nodes(nodes)
+        for node_uuid, updated_at in nodes:
+            if node_uuid in due:
+                self.scheduler.record(node_uuid, stable, updated_at)
+        return due
+
+    def test_enabled(self):
+        self.assertTrue(self.scheduler.enabled)
+        self.config(sync_power_state_max_interval=60, group='conductor')
+        self.assertFalse(self.scheduler.enabled)
+        self.config(sync_power_state_max_interval=0, group='conductor')
+        self.assertFalse(self.scheduler.enabled)
+
+    def test_stable(self):
+        nodes = [('node1', self.updated_at)]
+        runs = [run for run in range(1, 25) if self._run(nodes)]
+        # The interval doubles up to 8 runs
+        self.assertEqual([1, 3, 7, 15, 23], runs)
+
+    def test_unstable(self):
+        nodes = [('node1', self.updated_at)]
+        runs = [run for run in range(1, 5) if self._run(nodes, stable=False)]
+        self.assertEqual([1, 2, 3, 4], runs)
+
+    def test_subscribed(self):
+        self.config(sync_power_state_max_interval=0,
+                    sync_power_state_event_interval=960, group='conductor')
+        nodes = [('node1', self.updated_at), ('node2', self.updated_at)]
+        subscribed = {'node1'}
+        synced = {'node1': [], 'node2': []}
+        for run in range(1, 33):
+            due = self.scheduler.due_nodes(nodes, subscribed=subscribed)
+            for node_uuid, updated_at in nodes:
+                if node_uuid in due:
+                    synced[node_uuid].append(run)
+                    self.scheduler.record(node_uuid, True, updated_at)
+        # The interval of the subscribed node doubles up to 16 runs
+        self.assertEqual([1, 3, 7, 15, 31], synced['node1'])
+        self.assertEqual(list(range(1, 33)), synced['node2'])
+
+        # Back to the base rate once the subscription is lost
+        self.assertEqual({'node1', 'node2'}, self.scheduler.due_nodes(nodes))
+
+    def test_updated(self):
+        nodes = [('node1', self.updated_at), ('node2', self.updated_at)]
+        for _ in range(3):
+            self._run(nodes)
+        self.assertEqual(set(), self._run(nodes))
+
+        # Timezone-aware timestamps of node objects match database ones
+        self.scheduler.record(
+            'node2', True,
+            self.updated_at.replace(tzinfo=datetime.timezone.utc))
+        nodes[0] = ('node1', self.updated_at + datetime.timedelta(hours=1))
+        self.assertEqual({'node1'}, self._run(nodes))
+        self.assertEqual(set(), self._run(nodes))
+
+    def test_new_and_removed_nodes(self):
+        self.assertEqual({'node1'}, self._run([('node1', None)]))
+        self.assertEqual({'node2'}, self._run([('node1', None),
+                                               ('node2', None)]))
+        self.assertEqual({'node1'}, self._run([('node1', None)]))
+        self.assertEqual(['node1'], list(self.scheduler._entries))
+
+    def test_not_recorded(self):
+        # e.g. the node was locked
+        nodes = [('node1', None)]
+        self.assertEqual({'node1'}, self.scheduler.due_nodes(nodes))
+        self.assertEqual({'node1'}, self.scheduler.due_nodes(nodes))
+        self.scheduler.record('node1', True, None)
+        self.assertEqual(set(), self.scheduler.due_nodes(nodes))
+        self.assertEqual({'node1'}, self.scheduler.due_nodes(nodes))
+
+    def test_record_unknown_node(self):
+        self.scheduler.record('node1', True, None)
+        self.assertEqual({}, self.scheduler._entries)
@@ -827,6 +827,43 @@ class NodeCleaningStepsTestCase(db_base.DbTestCase):
 
         self.assertEqual(expected_step_priorities, steps)
 
+    @mock.patch('ironic.drivers.modules.fake.FakeFirmware.get_clean_steps',
+                lambda self, task: [])
+    @mock.patch('ironic.drivers.modules.fake.FakeBIOS.get_clean_steps',
+                lambda self, task: [])
+    @mock.patch('ironic.drivers.modules.fake.FakeDeploy.get_clean_steps',
+                autospec=True)
+    @mock.patch('ironic.drivers.modules.fake.FakePower.get_clean_steps',
+                autospec=True)
+    def test__get_cleaning_steps_overrides_copied(self, mock_power_steps,
+                                                  mock_deploy_steps):
+        cfg.CONF.set_override('clean_step_priority_override',
+                              ["vendor.log_passthrough:42"],
+                              'conductor')
+        node = obj_utils.create_test_node(
+            self.context, driver='fake-hardware',
+            provision_state=states.CLEANING,
+            target_provision_state=states.AVAILABLE)
+
+        mock_power_steps.return_value = [self.power_update]
+        mock_deploy_steps.return_value = [self.deploy_erase]
+        expected_vendor = dict(self.vendor_action, priority=42)
+
+        with task_manager.acquire(
+                self.context, node.uuid, shared=True) as task:
+            vendor = task.driver.vendor
+            steps = conductor_steps._get_cleaning_steps(task, enabled=True)
+            self.assertEqual([expected_vendor, self.deploy_erase,
+                              self.power_update], steps)
+            # Modifying the result does not affect the interface
+            steps[0]['priority'] = 1
+            steps = conductor_steps._get_cleaning_steps(task, enabled=True)
+            self.assertEqual([expected_vendor, self.deploy_erase,
+                              self.power_update], steps)
+
+        # The overrides are not applied to the steps of the interface
+        self.assertEqual([self.vendor_action], vendor.clean_steps)
+
     @mock.patch.object(conductor_steps, '_validate_user_clean_steps',
                        autospec=True)
     @mock.patch.object(conductor_steps, '_get_cleaning_steps', autospec=True)
@@ -1015,6 +1052,121 @@ class NodeCleaningStepsTestCase(db_base.DbTestCase):
             mock_steps.assert_not_called()
 
 
+class CleaningPlanTestCase(db_base.DbTestCase):
+    def setUp(self):
+        super(CleaningPlanTestCase, self).setUp()
+        self.config(cleaning_plan_cache_ttl=600, group='conductor')
+        self.addCleanup(conductor_steps._CLEANING_PLANS.clear)
+        self.agent_steps = {'deploy': [
+            {'step': 'erase_devices', 'priority': 10, 'interface': 'deploy',
+             'requires_ramdisk': True}]}
+        self.clean_steps = [dict(self.agent_steps['deploy'][0])]
+        self.node = obj_utils.create_test_node(
+            self.context, uuid=uuidutils.generate_uuid(),
+            provision_state=states.CLEANING,
+            target_provision_state=states.AVAILABLE,
+            driver_internal_info={
+                'agent_version': '10.0.0',
+                'agent_cached_clean_steps': self.agent_steps,
+                'hardware_manager_version': {'generic': '1'},
+                'clean_steps': self.clean_steps,
+                'clean_step_index': None})
+        self.other = obj_utils.create_test_node(
+            self.context, uuid=uuidutils.generate_uuid(),
+            provision_state=states.CLEANING,
+            target_provision_state=states.AVAILABLE,
+            driver_internal_info={'agent_version': '10.0.0'})
+
+    def _save(self):
+        with task_manager.acquire(self.context, self.node.uuid) as task:
+            conductor_steps.save_cleaning_plan(task)
+
+    def _restore(self):
+        with task_manager.acquire(self.context, self.other.uuid) as task:
+            return conductor_steps.restore_cleaning_plan(task)
+
+    @mock.patch.object(conductor_steps.METRICS, 'send_counter', autospec=True)
+    def test_save_and_restore(self, mock_counter):
+        self._save()
+        self.assertTrue(self._restore())
+        self.other.refresh()
+        info = self.other.driver_internal_info
+        self.assertEqual(self.agent_steps, info['agent_cached_clean_steps'])
+        self.assertEqual({'generic': '1'}, info['hardware_manager_version'])
+        self.assertEqual(self.clean_steps, info['clean_steps'])
+        self.assertIsNone(info['clean_step_index'])
+        self.assertIn('agent_cached_clean_steps_refreshed', info)
+        self.assertEqual({}, self.other.clean_step)
+        mock_counter.assert_called_once_with('CleaningPlan.hit', 1)
+
+    def test_restore_copies(self):
+        self._save()
+        self.assertTrue(self._restore())
+        self.other.refresh()
+        self.other.driver_internal_info['clean_steps'][0]['priority'] = 1
+        self.assertTrue(self._restore())
+        self.other.refresh()
+        self.assertEqual(self.clean_steps,
+                         self.other.driver_internal_info['clean_steps'])
+
+    @mock.patch.object(conductor_steps.METRICS, 'send_counter', autospec=True)
+    def test_restore_miss(self, mock_counter):
+        self.assertFalse(self._restore())
+        mock_counter.assert_called_once_with('CleaningPlan.miss', 1)
+        self.other.refresh()
+        self.assertNotIn('clean_steps', self.other.driver_internal_info)
+
+    def test_restore_other_agent_version(self):
+        self._save()
+        self.other.set_driver_internal_info('agent_version', '10.1.0')
+        self.other.save()
+        self.assertFalse(self._restore())
+
+    def test_restore_other_interfaces(self):
+        self._save()
+        self.other.deploy_interface = 'direct'
+        self.other.save()
+        self.assertFalse(self._restore())
+
+    def test_restore_other_priority_overrides(self):
+        self._save()
+        self.config(clean_step_priority_override=['deploy.erase_devices:20'],
+                    group='conductor')
+        self.assertFalse(self._restore())
+
+    def test_restore_no_agent_version(self):
+        self._save()
+        self.other.del_driver_internal_info('agent_version')
+        self.other.save()
+        self.assertFalse(self._restore())
+
+    def test_restore_expired(self):
+        self._save()
+        key, plan = next(iter(conductor_steps._CLEANING_PLANS.items()))
+        conductor_steps._CLEANING_PLANS[key] = plan._replace(
+            stored_at=plan.stored_at - 601)
+        self.assertFalse(self._restore())
+
+    def test_disabled(self):
+        self.config(cleaning_plan_cache_ttl=0, group='conductor')
+        self._save()
+        self.assertEqual({}, conductor_steps._CLEANING_PLANS)
+        self.assertFalse(self._restore())
+
+    def test_save_without_agent_steps(self):
+        self.node.del_driver_internal_info('agent_cached_clean_steps')
+        self.node.save()
+        self._save()
+        self.assertEqual({}, conductor_steps._CLEANING_PLANS)
+
+    def test_discard(self):
+        self._save()
+        with task_manager.acquire(self.context, self.other.uuid) as task:
+            conductor_steps.discard_cleaning_plan(task)
+        self.assertEqual({}, conductor_steps._CLEANING_PLANS)
+        self.assertFalse(self._restore())
+
+
 @mock.patch.object(conductor_steps, '_get_deployment_templates',
                    autospec=True)
 @mock.patch.object(conductor_steps, '_get_steps_from_deployment_templates',
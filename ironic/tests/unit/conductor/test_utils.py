@@ -10,6 +10,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import io
 import os
 import tempfile
 import time
@@ -21,6 +22,7 @@ from oslo_utils import uuidutils
 
 from ironic.common import boot_devices
 from ironic.common import boot_modes
+from ironic.common import configdrive as cd_images
 from ironic.common import exception
 from ironic.common import network
 from ironic.common import neutron
@@ -3036,18 +3038,29 @@ class GetConfigDriveImageTestCase(db_base.DbTestCase):
         self.assertEqual('data',
                          conductor_utils.get_configdrive_image(self.node))
 
-    @mock.patch('openstack.baremetal.configdrive.build', autospec=True)
+    def _fake_write(self, dest, meta_data, **kwargs):
+        with open(dest, 'wb') as fp:
+            fp.write(b'image')
+
+    def _assert_configdrive(self, configdrive):
+        decoded = io.BytesIO()
+        cd_images.decode_configdrive(configdrive, decoded)
+        self.assertEqual(b'image', decoded.getvalue())
+
+    @mock.patch.object(cd_images, 'write_configdrive_image', autospec=True)
     def test_build_empty(self, mock_cd):
+        mock_cd.side_effect = self._fake_write
         self.node.instance_info['configdrive'] = {}
-        self.assertEqual(mock_cd.return_value,
-                         conductor_utils.get_configdrive_image(self.node))
-        mock_cd.assert_called_once_with({'uuid': self.node.uuid},
+        self._assert_configdrive(
+            conductor_utils.get_configdrive_image(self.node))
+        mock_cd.assert_called_once_with(mock.ANY, {'uuid': self.node.uuid},
                                         network_data=None,
                                         user_data=None,
                                         vendor_data=None)
 
-    @mock.patch('openstack.baremetal.configdrive.build', autospec=True)
+    @mock.patch.object(cd_images, 'write_configdrive_image', autospec=True)
     def test_build_populated(self, mock_cd):
+        mock_cd.side_effect = self._fake_write
         configdrive = {
             'meta_data': {'uuid': uuidutils.generate_uuid(),
                           'name': 'new-name',
@@ -3056,36 +3069,47 @@ class GetConfigDriveImageTestCase(db_base.DbTestCase):
             'vendor_data': {'foo': 'bar'},
         }
         self.node.instance_info['configdrive'] = configdrive
-        self.assertEqual(mock_cd.return_value,
-                         conductor_utils.get_configdrive_image(self.node))
+        self._assert_configdrive(
+            conductor_utils.get_configdrive_image(self.node))
         mock_cd.assert_called_once_with(
+            mock.ANY,
             configdrive['meta_data'],
             network_data=configdrive['network_data'],
             user_data=None,
             vendor_data=configdrive['vendor_data'])
 
-    @mock.patch('openstack.baremetal.configdrive.build', autospec=True)
+    @mock.patch.object(cd_images, 'write_configdrive_image', autospec=True)
     def test_build_user_data_as_string(self, mock_cd):
+        mock_cd.side_effect = self._fake_write
         self.node.instance_info['configdrive'] = {'user_data': 'abcd'}
-        self.assertEqual(mock_cd.return_value,
-                         conductor_utils.get_configdrive_image(self.node))
-        mock_cd.assert_called_once_with({'uuid': self.node.uuid},
+        self._assert_configdrive(
+            conductor_utils.get_configdrive_image(self.node))
+        mock_cd.assert_called_once_with(mock.ANY, {'uuid': self.node.uuid},
                                         network_data=None,
                                         user_data=b'abcd',
                                         vendor_data=None)
 
-    @mock.patch('openstack.baremetal.configdrive.build', autospec=True)
+    @mock.patch.object(cd_images, 'write_configdrive_image', autospec=True)
     def test_build_user_data_as_dict(self, mock_cd):
+        mock_cd.side_effect = self._fake_write
         self.node.instance_info['configdrive'] = {
             'user_data': {'user': 'data'}
         }
-        self.assertEqual(mock_cd.return_value,
-                         conductor_utils.get_configdrive_image(self.node))
-        mock_cd.assert_called_once_with({'uuid': self.node.uuid},
+        self._assert_configdrive(
+            conductor_utils.get_configdrive_image(self.node))
+        mock_cd.assert_called_once_with(mock.ANY, {'uuid': self.node.uuid},
                                         network_data=None,
                                         user_data=b'{"user": "data"}',
                                         vendor_data=None)
 
+    @mock.patch.object(cd_images, 'write_configdrive_image', autospec=True)
+    def test_build_to_file(self, mock_cd):
+        mock_cd.side_effect = self._fake_write
+        fileobj = io.StringIO()
+        self.assertIsNone(conductor_utils.build_configdrive(
+            self.node, {}, fileobj=fileobj))
+        self._assert_configdrive(fileobj.getvalue())
+
 
 class NodeHistoryRecordTestCase(db_base.DbTestCase):
 
@@ -3144,6 +3168,67 @@ class NodeHistoryRecordTestCase(db_base.DbTestCase):
         mock_create.assert_not_called()
 
 
+class NodeHistoryBufferTestCase(db_base.DbTestCase):
+
+    def setUp(self):
+        super(NodeHistoryBufferTestCase, self).setUp()
+        self.config(node_history_buffer_size=3, group='conductor')
+        self.buffer = conductor_utils.NodeHistoryBuffer()
+        patcher = mock.patch.object(conductor_utils, '_NODE_HISTORY_BUFFER',
+                                    self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.node = obj_utils.create_test_node(
+            self.context,
+            uuid=uuidutils.generate_uuid())
+
+    def _list(self):
+        return objects.NodeHistory.list_by_node_id(self.context,
+                                                   self.node.id)
+
+    def test_record_buffered(self):
+        conductor_utils.node_history_record(self.node, event='meow',
+                                            error=True)
+        self.assertEqual('meow', self.node.last_error)
+        self.assertEqual([], self._list())
+        self.assertEqual(1, len(self.buffer))
+
+        conductor_utils.flush_node_history()
+        entries = self._list()
+        self.assertEqual(1, len(entries))
+        self.assertEqual('meow', entries[0].event)
+        self.assertEqual('ERROR', entries[0].severity)
+        self.assertEqual(CONF.host, entries[0].conductor)
+        self.assertIsNotNone(entries[0].created_at)
+        self.assertEqual(0, len(self.buffer))
+
+    @mock.patch.object(objects.NodeHistory, 'create_bulk', autospec=True)
+    def test_flush_when_full(self, mock_create_bulk):
+        for i in range(3):
+            conductor_utils.node_history_record(self.node, event=str(i))
+        mock_create_bulk.assert_called_once_with(None, mock.ANY)
+        records = mock_create_bulk.call_args[0][1]
+        self.assertEqual(['0', '1', '2'], [r.event for r in records])
+        self.assertEqual(0, len(self.buffer))
+
+    @mock.patch.object(objects.NodeHistory, 'create', autospec=True)
+    @mock.patch.object(objects.NodeHistory, 'create_bulk', autospec=True)
+    def test_flush_falls_back_to_single_records(self, mock_create_bulk,
+                                                mock_create):
+        mock_create_bulk.side_effect = exception.IronicException('boom')
+        mock_create.side_effect = [exception.IronicException('boom'), None]
+        conductor_utils.node_history_record(self.node, event='1')
+        conductor_utils.node_history_record(self.node, event='2')
+        conductor_utils.flush_node_history()
+        self.assertEqual(2, mock_create.call_count)
+        self.assertEqual(0, len(self.buffer))
+
+    @mock.patch.object(objects.NodeHistory, 'create_bulk', autospec=True)
+    def test_flush_empty(self, mock_create_bulk):
+        conductor_utils.flush_node_history()
+        mock_create_bulk.assert_not_called()
+
+
 class GetTokenProjectFromRequestTestCase(db_base.DbTestCase):
 
     def setUp(self):
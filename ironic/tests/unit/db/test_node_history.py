@@ -26,6 +26,23 @@ class DBNodeHistoryTestCase(base.DbTestCase):
             id=0, node_id=self.node.id, conductor='test-conductor',
             user='fake-user', event='Something bad happened but fear not')
 
+    def test_create_node_history_bulk(self):
+        values = [{'node_id': self.node.id, 'conductor': 'test-conductor',
+                   'event': 'event %d' % i, 'severity': 'INFO',
+                   'event_type': 'test'}
+                  for i in range(3)]
+        self.dbapi.create_node_history_bulk(values)
+        res = self.dbapi.get_node_history_by_node_id(self.node.id)
+        events = [r.event for r in res if r.id != self.history.id]
+        self.assertCountEqual(['event 0', 'event 1', 'event 2'], events)
+        self.assertEqual(4, len({r.uuid for r in res}))
+        self.assertTrue(all(r.created_at for r in res))
+
+    def test_create_node_history_bulk_empty(self):
+        self.dbapi.create_node_history_bulk([])
+        res = self.dbapi.get_node_history_by_node_id(self.node.id)
+        self.assertEqual([self.history.id], [r.id for r in res])
+
     def test_destroy_node_history_by_uuid(self):
         self.dbapi.destroy_node_history_by_uuid(self.history.uuid)
         self.assertRaises(exception.NodeHistoryNotFound,
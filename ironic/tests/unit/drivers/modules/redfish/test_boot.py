@@ -1189,8 +1189,6 @@ class RedfishVirtualMediaBootTestCase(db_base.DbTestCase):
 
             mock_boot_mode_utils.sync_boot_mode.assert_called_once_with(task)
 
-    @mock.patch.object(redfish_boot.manager_utils, 'build_configdrive',
-                       autospec=True)
     @mock.patch.object(redfish_boot.RedfishVirtualMediaBoot,
                        '_eject_all', autospec=True)
     @mock.patch.object(image_utils, 'prepare_configdrive_image', autospec=True)
@@ -1207,9 +1205,8 @@ class RedfishVirtualMediaBootTestCase(db_base.DbTestCase):
             self, mock_system, mock_boot_mode_utils, mock_deploy_utils,
             mock_node_set_boot_device, mock__parse_deploy_info,
             mock__insert_vmedia, mock__eject_vmedia, mock_prepare_boot_iso,
-            mock_prepare_disk, mock_clean_up_instance, mock_build_configdrive):
+            mock_prepare_disk, mock_clean_up_instance):
 
-        configdrive = 'Y29udGVudA=='
         managers = mock_system.return_value.managers
         with task_manager.acquire(self.context, self.node.uuid,
                                   shared=True) as task:
@@ -1218,8 +1215,6 @@ class RedfishVirtualMediaBootTestCase(db_base.DbTestCase):
                 'root_uuid_or_disk_id'] = self.node.uuid
             task.node.instance_info['configdrive'] = {'meta_data': {}}
 
-            mock_build_configdrive.return_value = configdrive
-
             mock_deploy_utils.get_boot_option.return_value = 'ramdisk'
 
             d_info = {
@@ -1236,10 +1231,10 @@ class RedfishVirtualMediaBootTestCase(db_base.DbTestCase):
 
             mock_clean_up_instance.assert_called_once_with(mock.ANY, task)
 
-            mock_build_configdrive.assert_called_once_with(
-                task.node, {'meta_data': {}})
             mock_prepare_boot_iso.assert_called_once_with(task, d_info)
-            mock_prepare_disk.assert_called_once_with(task, configdrive)
+            # The JSON configdrive is built directly into the disk image
+            mock_prepare_disk.assert_called_once_with(
+                task, {'meta_data': {}})
 
             mock__eject_vmedia.assert_has_calls([
                 mock.call(task, managers, sushy.VIRTUAL_MEDIA_CD),
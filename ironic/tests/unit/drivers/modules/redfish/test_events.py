@@ -0,0 +1,477 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+from unittest import mock
+
+import requests
+import sushy
+import webob
+
+from ironic.common import exception
+from ironic.common import states
+from ironic.conductor import hooks
+from ironic.conductor import task_manager
+from ironic.drivers.modules.redfish import events
+from ironic.drivers.modules.redfish import utils as redfish_utils
+from ironic.tests import base
+from ironic.tests.unit.db import base as db_base
+from ironic.tests.unit.db import utils as db_utils
+from ironic.tests.unit.objects import utils as obj_utils
+
+NODE1 = '1be26c0b-03f2-4d2e-ae87-c02d7f33c123'
+NODE2 = '2be26c0b-03f2-4d2e-ae87-c02d7f33c123'
+URL = 'https://conductor.example.com:8090/events'
+TOKEN = 'c2VjcmV0'
+SYSTEM = '/redfish/v1/Systems/1'
+
+
+def _record(message, origin=SYSTEM, context=None):
+    record = {'EventType': 'Alert',
+              'MessageId': 'ResourceEvent.1.0.%s' % message,
+              'OriginOfCondition': {'@odata.id': origin}}
+    if context:
+        record['Context'] = context
+    return record
+
+
+def _event(context, *records):
+    return {'@odata.type': '#Event.v1_7_0.Event',
+            'Id': '1',
+            'Name': 'Event',
+            'Context': context,
+            'Events': list(records)}
+
+
+class ParseEventTestCase(base.TestCase):
+
+    def test_power_states(self):
+        self.assertEqual(
+            {NODE1: (states.POWER_OFF, SYSTEM)},
+            events.parse_event(_event(NODE1, _record('ResourcePoweredOff'))))
+        self.assertEqual(
+            {NODE1: (states.POWER_ON, SYSTEM)},
+            events.parse_event(_event(NODE1, _record('ResourcePoweredOff'),
+                                      _record('ResourcePoweredOn'))))
+
+    def test_unknown_power_state(self):
+        for record in (_record('ResourcePoweringOn'),
+                       _record('ResourcePoweredOff',
+                               '/redfish/v1/Chassis/1/PowerSubsystem'),
+                       _record('SystemPowerReset')):
+            origin = record['OriginOfCondition']['@odata.id']
+            self.assertEqual({NODE1: (None, origin)},
+                             events.parse_event(_event(NODE1, record)))
+
+    def test_ignored(self):
+        self.assertEqual(
+            {}, events.parse_event(_event(NODE1, _record('ResourceChanged'))))
+        self.assertEqual(
+            {}, events.parse_event(_event('', _record('ResourcePoweredOn'))))
+        self.assertEqual({}, events.parse_event(_event(NODE1, 'garbage')))
+
+    def test_record_context(self):
+        self.assertEqual(
+            {NODE2: (states.POWER_ON, SYSTEM)},
+            events.parse_event(_event(
+                None, _record('ResourcePoweredOn', context=NODE2))))
+
+    def test_invalid(self):
+        for payload in ([], {'Events': 'nope'}):
+            self.assertRaises(exception.InvalidParameterValue,
+                              events.parse_event, payload)
+
+
+class IsSystemOriginTestCase(base.TestCase):
+
+    def test_system_id(self):
+        node = mock.Mock(driver_info={'redfish_system_id': SYSTEM})
+        self.assertTrue(events.is_system_origin(node, SYSTEM))
+        self.assertTrue(events.is_system_origin(
+            node, 'https://bmc.example.com%s/' % SYSTEM))
+        for origin in ('/redfish/v1/Systems/2', SYSTEM + '/Bios',
+                       '/redfish/v1/Chassis/1', ''):
+            self.assertFalse(events.is_system_origin(node, origin))
+
+    def test_no_system_id(self):
+        node = mock.Mock(driver_info={})
+        self.assertTrue(events.is_system_origin(node, SYSTEM))
+        self.assertFalse(events.is_system_origin(node,
+                                                 '/redfish/v1/Chassis/1'))
+
+
+class _Receiver(base.TestCase):
+
+    port = 8090
+
+    def setUp(self):
+        super(_Receiver, self).setUp()
+        self.config(event_receiver_port=self.port,
+                    event_receiver_host_ip='127.0.0.1',
+                    event_receiver_url=URL,
+                    event_receiver_token=TOKEN,
+                    event_receiver_workers=2,
+                    group='redfish')
+        self.handled = []
+        self.receiver = events.EventReceiver(self._handler)
+        events._SUBSCRIBED.clear()
+        events._SUBSCRIBED.update({NODE1, NODE2})
+        self.addCleanup(events._SUBSCRIBED.clear)
+
+    def _handler(self, node_uuid, power_state, origin):
+        self.handled.append((node_uuid, power_state, origin))
+
+
+class EventReceiverTestCase(_Receiver):
+
+    def _post(self, body, token=None, method='POST'):
+        request = webob.Request.blank('/events', method=method)
+        if token is None:
+            token = events._node_token(NODE1)
+        if token:
+            request.headers[events.TOKEN_HEADER] = token
+        request.body = (body if isinstance(body, bytes)
+                        else json.dumps(body).encode())
+        return request.get_response(self.receiver._application)
+
+    def test_not_configured(self):
+        self.config(event_receiver_token=None, group='redfish')
+        self.assertRaises(exception.ConfigInvalid, events.EventReceiver,
+                          self._handler)
+
+    @mock.patch.object(events.EventReceiver, 'ingest', autospec=True)
+    def test_event(self, mock_ingest):
+        response = self._post(_event(NODE1, _record('ResourcePoweredOn')))
+        self.assertEqual(204, response.status_code)
+        mock_ingest.assert_called_once_with(
+            self.receiver, {NODE1: (states.POWER_ON, SYSTEM)})
+
+    @mock.patch.object(events.EventReceiver, 'ingest', autospec=True)
+    def test_rejected(self, mock_ingest):
+        body = _event(NODE1, _record('ResourcePoweredOn'))
+        self.assertEqual(405, self._post(body, method='PUT').status_code)
+        self.assertEqual(401, self._post(body, token='').status_code)
+        self.assertEqual(401, self._post(body, token='wrong').status_code)
+        self.assertEqual(401, self._post(body, token=TOKEN).status_code)
+        self.assertEqual(400, self._post(b'{"Events":').status_code)
+        self.assertEqual(400, self._post([]).status_code)
+        self.assertFalse(mock_ingest.called)
+
+    @mock.patch.object(events.EventReceiver, 'ingest', autospec=True)
+    def test_other_node(self, mock_ingest):
+        # A valid token of one node does not allow sending events of another
+        for body in (_event(NODE2, _record('ResourcePoweredOn')),
+                     _event(None, _record('ResourcePoweredOff', context=NODE1),
+                            _record('ResourcePoweredOn', context=NODE2))):
+            self.assertEqual(401, self._post(body).status_code)
+        self.assertFalse(mock_ingest.called)
+
+    @mock.patch.object(events.EventReceiver, 'ingest', autospec=True)
+    def test_not_subscribed(self, mock_ingest):
+        events._SUBSCRIBED.discard(NODE2)
+        response = self._post(_event(NODE2, _record('ResourcePoweredOn')),
+                              token=events._node_token(NODE2))
+        self.assertEqual(204, response.status_code)
+        mock_ingest.assert_called_once_with(self.receiver, {})
+
+    def test_node_token(self):
+        self.assertEqual(
+            hmac.new(TOKEN.encode(), NODE1.encode(),
+                     hashlib.sha256).hexdigest(),
+            events._node_token(NODE1))
+        self.assertNotEqual(events._node_token(NODE1),
+                            events._node_token(NODE2))
+
+    def test_merged(self):
+        self.receiver.ingest({NODE1: (states.POWER_OFF, SYSTEM)})
+        self.receiver.ingest({NODE1: (states.POWER_ON, SYSTEM),
+                              NODE2: (None, SYSTEM)})
+        self.receiver._queue.put(None)
+        self.receiver._work()
+
+        self.assertEqual([(NODE1, states.POWER_ON, SYSTEM),
+                          (NODE2, None, SYSTEM)],
+                         self.handled)
+
+    def test_handling(self):
+        queued = []
+
+        def handler(node_uuid, power_state, origin):
+            self.handled.append((node_uuid, power_state, origin))
+            if len(self.handled) == 1:
+                # Received while the first event is being handled, only
+                # queued once it is done.
+                self.receiver.ingest({NODE1: (states.POWER_ON, SYSTEM)})
+                queued.append(self.receiver._queue.qsize())
+            else:
+                self.receiver._queue.put(None)
+
+        self.receiver._handler = handler
+        self.receiver.ingest({NODE1: (states.POWER_OFF, SYSTEM)})
+        self.receiver._work()
+
+        self.assertEqual([(NODE1, states.POWER_OFF, SYSTEM),
+                          (NODE1, states.POWER_ON, SYSTEM)],
+                         self.handled)
+        self.assertEqual([0], queued)
+        self.assertEqual({}, self.receiver._pending)
+        self.assertEqual(set(), self.receiver._handling)
+
+    def test_handler_failure(self):
+        self.receiver._handler = mock.Mock(side_effect=[RuntimeError, None])
+        self.receiver.ingest({NODE1: (None, SYSTEM), NODE2: (None, SYSTEM)})
+        self.receiver._queue.put(None)
+        self.receiver._work()
+        self.assertEqual(2, self.receiver._handler.call_count)
+
+
+class ReceiverHookTestCase(base.TestCase):
+
+    def setUp(self):
+        super(ReceiverHookTestCase, self).setUp()
+        self.hook = events._ReceiverHook()
+        self.addCleanup(self.hook.stop)
+        events._SUBSCRIBED.clear()
+        self.addCleanup(events._SUBSCRIBED.clear)
+
+    def test_registered(self):
+        self.assertIsInstance(hooks._HOOKS['redfish-events'],
+                              events._ReceiverHook)
+
+    @mock.patch.object(events, 'EventReceiver', autospec=True)
+    def test_disabled(self, mock_receiver):
+        events._SUBSCRIBED.add(NODE1)
+        self.hook.start(mock.Mock())
+        self.assertFalse(mock_receiver.called)
+        self.assertEqual(frozenset(), self.hook.power_event_nodes())
+        self.hook.stop()
+
+    @mock.patch.object(events, 'EventReceiver', autospec=True)
+    def test_start_stop(self, mock_receiver):
+        self.config(event_receiver_port=8090, group='redfish')
+        events._SUBSCRIBED.add(NODE1)
+        power_event_handler = mock.Mock()
+
+        self.hook.start(power_event_handler)
+
+        receiver = mock_receiver.return_value
+        receiver.start.assert_called_once_with()
+        self.assertEqual({NODE1}, self.hook.power_event_nodes())
+
+        handler = mock_receiver.call_args[0][0]
+        handler(NODE1, states.POWER_OFF, SYSTEM)
+        power_event_handler.assert_called_once_with(
+            NODE1, states.POWER_OFF, check=mock.ANY)
+        check = power_event_handler.call_args[1]['check']
+        self.assertTrue(check(mock.Mock(driver_info={
+            'redfish_system_id': SYSTEM})))
+        self.assertFalse(check(mock.Mock(driver_info={
+            'redfish_system_id': '/redfish/v1/Systems/2'})))
+
+        self.hook.stop()
+        receiver.stop.assert_called_once_with()
+        self.assertEqual(frozenset(), self.hook.power_event_nodes())
+
+
+class PruneSubscribedNodesTestCase(base.TestCase):
+
+    def test_prune(self):
+        events._SUBSCRIBED.update({NODE1, NODE2})
+        self.addCleanup(events._SUBSCRIBED.clear)
+        events.prune_subscribed_nodes({NODE1, 'other'})
+        self.assertEqual({NODE1}, events.subscribed_nodes())
+
+
+class _EmitterStub(object):
+    """Sends events to a receiver the way a BMC does."""
+
+    def __init__(self, destination, context, headers):
+        self.destination = destination
+        self.context = context
+        self.headers = headers
+
+    def emit(self, *messages):
+        records = [_record(message) for message in messages]
+        headers = dict(self.headers, **{'Content-Type': 'application/json'})
+        return requests.post(self.destination, headers=headers, timeout=10,
+                             data=json.dumps(_event(self.context, *records)))
+
+
+class EventReceiverServerTestCase(_Receiver):
+
+    # Any free port
+    port = 0
+
+    def setUp(self):
+        super(EventReceiverServerTestCase, self).setUp()
+        self.done = threading.Event()
+        self.receiver.start()
+        self.addCleanup(self.receiver.stop)
+        self.destination = 'http://127.0.0.1:%d/events' % (
+            self.receiver.server.bind_addr[1])
+
+    def _handler(self, node_uuid, power_state, origin):
+        super(EventReceiverServerTestCase, self)._handler(node_uuid,
+                                                          power_state, origin)
+        self.done.set()
+
+    def _wait(self, count):
+        deadline = time.monotonic() + 10
+        while len(self.handled) < count and time.monotonic() < deadline:
+            self.done.wait(0.1)
+            self.done.clear()
+
+    def test_emitter(self):
+        emitter = _EmitterStub(
+            self.destination, NODE1,
+            {events.TOKEN_HEADER: events._node_token(NODE1)})
+        response = emitter.emit('ResourcePoweringOff', 'ResourcePoweredOff')
+        self.assertEqual(204, response.status_code)
+        self._wait(1)
+        self.assertEqual([(NODE1, states.POWER_OFF, SYSTEM)], self.handled)
+
+        response = _EmitterStub(self.destination, NODE2, {}).emit(
+            'ResourcePoweredOn')
+        self.assertEqual(401, response.status_code)
+        response = _EmitterStub(
+            self.destination, NODE2,
+            {events.TOKEN_HEADER: events._node_token(NODE1)}).emit(
+                'ResourcePoweredOn')
+        self.assertEqual(401, response.status_code)
+
+        _EmitterStub(self.destination, NODE2,
+                     {events.TOKEN_HEADER: events._node_token(NODE2)}).emit(
+                         'SystemPowerReset')
+        self._wait(2)
+        self.assertEqual([(NODE1, states.POWER_OFF, SYSTEM),
+                          (NODE2, None, SYSTEM)],
+                         self.handled)
+
+
+@mock.patch.object(redfish_utils, 'get_event_service', autospec=True)
+class CheckSubscriptionTestCase(db_base.DbTestCase):
+
+    def setUp(self):
+        super(CheckSubscriptionTestCase, self).setUp()
+        self.config(event_receiver_port=8090,
+                    event_receiver_url=URL,
+                    event_receiver_token=TOKEN,
+                    group='redfish')
+        self.config(enabled_hardware_types=['redfish'],
+                    enabled_power_interfaces=['redfish'],
+                    enabled_boot_interfaces=['redfish-virtual-media'],
+                    enabled_management_interfaces=['redfish'])
+        self.node = obj_utils.create_test_node(
+            self.context, driver='redfish',
+            driver_info=db_utils.get_test_redfish_info())
+        self.event_service = mock.Mock()
+        self.event_service.get_event_types_for_subscription.return_value = {
+            sushy.EventType.ALERT, sushy.EventType.STATUS_CHANGE}
+        subscriptions = self.event_service.subscriptions
+        subscriptions.path = '/redfish/v1/EventService/Subscriptions'
+        subscriptions.create.return_value = mock.Mock(identity='42')
+        events._SUBSCRIBED.clear()
+        self.addCleanup(events._SUBSCRIBED.clear)
+
+    def _check(self):
+        with task_manager.acquire(self.context, self.node.uuid,
+                                  shared=True) as task:
+            return events.check_subscription(task)
+
+    def _subscribe(self, **fields):
+        subscription = mock.Mock(**dict({'context': self.node.uuid,
+                                         'destination': URL}, **fields))
+        self.event_service.subscriptions.get_member.return_value = (
+            subscription)
+        self.node.set_driver_internal_info(events.SUBSCRIPTION_INFO, '41')
+        self.node.save()
+        return subscription
+
+    def _assert_created(self):
+        self.event_service.subscriptions.create.assert_called_once_with({
+            'Destination': URL,
+            'Protocol': 'Redfish',
+            'Context': self.node.uuid,
+            'EventTypes': ['StatusChange', 'Alert'],
+            'OriginResources': [
+                {'@odata.id': '/redfish/v1/Systems/FAKESYSTEM'}],
+            'HttpHeaders': [
+                {events.TOKEN_HEADER: events._node_token(self.node.uuid)}],
+        })
+        self.node.refresh()
+        self.assertEqual(
+            '42', self.node.driver_internal_info[events.SUBSCRIPTION_INFO])
+        self.assertEqual({self.node.uuid}, events.subscribed_nodes())
+
+    def test_create(self, mock_get_event_service):
+        mock_get_event_service.return_value = self.event_service
+        self.assertTrue(self._check())
+        self._assert_created()
+
+    @mock.patch.object(redfish_utils, 'get_system', autospec=True)
+    def test_create_default_system(self, mock_get_system,
+                                   mock_get_event_service):
+        mock_get_event_service.return_value = self.event_service
+        mock_get_system.return_value.path = SYSTEM
+        self.node.driver_info = {
+            k: v for k, v in self.node.driver_info.items()
+            if k != 'redfish_system_id'}
+        self.node.save()
+
+        self.assertTrue(self._check())
+
+        payload = self.event_service.subscriptions.create.call_args[0][0]
+        self.assertEqual([{'@odata.id': SYSTEM}], payload['OriginResources'])
+
+    def test_existing(self, mock_get_event_service):
+        mock_get_event_service.return_value = self.event_service
+        subscription = self._subscribe()
+
+        self.assertTrue(self._check())
+
+        self.event_service.subscriptions.get_member.assert_called_once_with(
+            '/redfish/v1/EventService/Subscriptions/41')
+        self.assertFalse(subscription.delete.called)
+        self.assertFalse(self.event_service.subscriptions.create.called)
+        self.assertEqual({self.node.uuid}, events.subscribed_nodes())
+
+    def test_other_destination(self, mock_get_event_service):
+        mock_get_event_service.return_value = self.event_service
+        subscription = self._subscribe(destination='https://old/events')
+
+        self.assertTrue(self._check())
+
+        subscription.delete.assert_called_once_with()
+        self._assert_created()
+
+    def test_deleted(self, mock_get_event_service):
+        mock_get_event_service.return_value = self.event_service
+        self._subscribe()
+        self.event_service.subscriptions.get_member.side_effect = (
+            sushy.exceptions.ResourceNotFoundError(
+                method='GET', url='/41', response=mock.Mock(status_code=404)))
+
+        self.assertTrue(self._check())
+        self._assert_created()
+
+    def test_failure(self, mock_get_event_service):
+        events._SUBSCRIBED.add(self.node.uuid)
+        mock_get_event_service.side_effect = exception.RedfishError(
+            error='no EventService')
+
+        self.assertFalse(self._check())
+
+        self.assertEqual(frozenset(), events.subscribed_nodes())
@@ -436,9 +436,9 @@ class RedfishFirmwareTestCase(db_base.DbTestCase):
     def _test__query_methods(self, acquire_mock):
         firmware = redfish_fw.RedfishFirmware()
         mock_manager = mock.Mock()
-        node_list = [(self.node.uuid, 'redfish', '',
-                      self.node.driver_internal_info)]
-        mock_manager.iter_nodes.return_value = node_list
+        mock_manager.iter_nodes.side_effect = lambda filters, fields: [
+            (self.node.uuid, 'redfish', '')
+            + tuple(self.node[field] for field in fields)]
         task = mock.Mock(node=self.node,
                          driver=mock.Mock(firmware=firmware))
         acquire_mock.return_value = mock.MagicMock(
@@ -24,6 +24,7 @@ from ironic.common import image_service
 from ironic.common import swift
 from ironic.conf import CONF
 from ironic.drivers.modules.redfish import firmware_utils
+from ironic.drivers.modules.redfish import task_poller
 from ironic.tests import base
 
 
@@ -43,6 +44,22 @@ class FirmwareUtilsTestCase(base.TestCase):
         ]
         firmware_utils.validate_update_firmware_args(firmware_images)
 
+    @mock.patch.object(task_poller, 'needs_attention', autospec=True)
+    def test_update_needs_attention(self, mock_needs_attention):
+        node = mock.Mock()
+        self.assertFalse(firmware_utils.update_needs_attention(node, None))
+        self.assertTrue(firmware_utils.update_needs_attention(
+            node, [{'url': 'url1', 'wait': 10,
+                    'wait_start_time': '2026-01-01T00:00:00.000000'}]))
+        self.assertFalse(mock_needs_attention.called)
+
+        self.assertIs(
+            mock_needs_attention.return_value,
+            firmware_utils.update_needs_attention(
+                node, [{'url': 'url1', 'task_monitor': '/t/1'},
+                       {'url': 'url2'}]))
+        mock_needs_attention.assert_called_once_with(node, ['/t/1'])
+
     def test_validate_update_firmware_args_not_list(self):
         firmware_images = {
             "url": "http://192.0.2.10/BMC_4_22_00_00.EXE",
@@ -985,7 +985,8 @@ class RedfishManagementTestCase(db_base.DbTestCase):
         self.node.save()
         management = redfish_mgmt.RedfishManagement()
         mock_manager = mock.Mock()
-        node_list = [(self.node.uuid, 'redfish', '', driver_internal_info)]
+        node_list = [(self.node.uuid, 'redfish', '', driver_internal_info,
+                      self.node.driver_info)]
         mock_manager.iter_nodes.return_value = node_list
         task = mock.Mock(node=self.node,
                          driver=mock.Mock(management=management))
@@ -1005,7 +1006,8 @@ class RedfishManagementTestCase(db_base.DbTestCase):
         self.node.save()
         management = redfish_mgmt.RedfishManagement()
         mock_manager = mock.Mock()
-        node_list = [(self.node.uuid, 'redfish', '', driver_internal_info)]
+        node_list = [(self.node.uuid, 'redfish', '', driver_internal_info,
+                      self.node.driver_info)]
         mock_manager.iter_nodes.return_value = node_list
         task = mock.Mock(node=self.node,
                          driver=mock.Mock(management=management))
@@ -20,6 +20,7 @@ import sushy
 from ironic.common import exception
 from ironic.common import states
 from ironic.conductor import task_manager
+from ironic.drivers.modules.redfish import events as redfish_events
 from ironic.drivers.modules.redfish import management as redfish_mgmt
 from ironic.drivers.modules.redfish import power as redfish_power
 from ironic.drivers.modules.redfish import utils as redfish_utils
@@ -359,3 +360,32 @@ class RedfishPowerTestCase(db_base.DbTestCase):
                 task.driver.power.get_supported_power_states(task))
             self.assertEqual(list(redfish_power.SET_POWER_STATE_MAP),
                              supported_power_states)
+
+    @mock.patch.object(redfish_events, 'check_subscription', autospec=True)
+    @mock.patch.object(task_manager, 'acquire', autospec=True)
+    def test__check_event_subscription(self, mock_acquire, mock_check):
+        power = redfish_power.RedfishPower()
+        mock_manager = mock.Mock()
+        mock_manager.iter_nodes.return_value = [
+            (self.node.uuid, 'redfish', '')]
+        task = mock.Mock(node=self.node, driver=mock.Mock(power=power))
+        mock_acquire.return_value = mock.MagicMock(
+            __enter__=mock.MagicMock(return_value=task))
+
+        power._check_event_subscription(mock_manager, self.context)
+
+        mock_manager.iter_nodes.assert_called_once_with(
+            fields=(), filters={'reserved': False, 'maintenance': False})
+        mock_check.assert_called_once_with(task)
+
+    @mock.patch.object(redfish_events, 'prune_subscribed_nodes',
+                       autospec=True)
+    def test__prune_event_subscriptions(self, mock_prune):
+        power = redfish_power.RedfishPower()
+        mock_manager = mock.Mock()
+        mock_manager.iter_nodes.return_value = iter([
+            (self.node.uuid, 'redfish', ''), ('other', 'ipmi', 'group')])
+
+        power._prune_event_subscriptions(mock_manager, self.context)
+
+        mock_prune.assert_called_once_with({self.node.uuid, 'other'})
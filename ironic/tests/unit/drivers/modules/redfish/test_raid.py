@@ -24,6 +24,7 @@ from ironic.conductor import utils as manager_utils
 from ironic.drivers.modules import deploy_utils
 from ironic.drivers.modules.redfish import boot as redfish_boot
 from ironic.drivers.modules.redfish import raid as redfish_raid
+from ironic.drivers.modules.redfish import task_poller
 from ironic.drivers.modules.redfish import utils as redfish_utils
 from ironic.tests.unit.db import base as db_base
 from ironic.tests.unit.db import utils as db_utils
@@ -1495,3 +1496,17 @@ class RedfishRAIDTestCase(db_base.DbTestCase):
 
         self.assertEqual([], self.node.raid_config['logical_disks'])
         mock_log.warning.assert_called_once()
+
+    @mock.patch.object(task_poller, 'needs_attention', autospec=True)
+    def test__raid_config_needs_attention(self, mock_needs_attention,
+                                          mock_get_system):
+        node = mock.Mock(driver_internal_info={})
+        self.assertFalse(redfish_raid._raid_config_needs_attention(node))
+        self.assertFalse(mock_needs_attention.called)
+
+        node.driver_internal_info = {
+            'raid_configs': {'operation': 'create', 'pending': {},
+                             'task_monitor_uri': ['/t/1', '/t/2']}}
+        self.assertIs(mock_needs_attention.return_value,
+                      redfish_raid._raid_config_needs_attention(node))
+        mock_needs_attention.assert_called_once_with(node, ['/t/1', '/t/2'])
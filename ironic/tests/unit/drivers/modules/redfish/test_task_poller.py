@@ -0,0 +1,142 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import time
+from unittest import mock
+
+from ironic.common import exception
+from ironic.conductor import bmc_io
+from ironic.drivers.modules.redfish import task_poller
+from ironic.drivers.modules.redfish import utils as redfish_utils
+from ironic.tests import base
+
+
+_Node = collections.namedtuple(
+    'Node', ['uuid', 'driver', 'conductor_group', 'driver_internal_info',
+             'driver_info'])
+
+
+@mock.patch.object(redfish_utils, 'get_task_monitor', autospec=True)
+class TaskMonitorPollerTestCase(base.TestCase):
+
+    def setUp(self):
+        super(TaskMonitorPollerTestCase, self).setUp()
+        self.config(task_monitor_max_requests=10, group='redfish')
+        self.node = _Node('uuid1', 'redfish', '', {},
+                          {'redfish_address': 'https://192.0.2.1'})
+        self.poller = task_poller.TaskMonitorPoller()
+        self.engine = mock.Mock(spec=bmc_io.BMCRequestEngine)
+        # Run the polls synchronously
+        self.engine.submit.side_effect = (
+            lambda bmc, key, func, *args: func(*args) or mock.sentinel.future)
+        self.poller._engine = self.engine
+
+    def _monitor(self, processing, sleep_for=1):
+        return mock.Mock(is_processing=processing, sleep_for=sleep_for)
+
+    def test_processing(self, mock_get_monitor):
+        mock_get_monitor.return_value = self._monitor(True, sleep_for='30')
+
+        # The first call only submits the poll
+        self.assertFalse(self.poller.needs_attention(self.node, ['/t/1']))
+        self.engine.submit.assert_called_once_with(
+            '192.0.2.1', ('uuid1', '/t/1'), self.poller._poll, mock.ANY)
+        mock_get_monitor.assert_called_once_with(self.node, '/t/1')
+
+        # The task monitor is not polled again before the Retry-After
+        self.assertFalse(self.poller.needs_attention(self.node, ['/t/1']))
+        self.assertEqual(1, self.engine.submit.call_count)
+        monitor = self.poller._monitors[('uuid1', '/t/1')]
+        self.assertTrue(monitor.processing)
+        self.assertEqual(30, monitor.delay)
+        self.assertFalse(monitor.polling)
+
+    def test_finished(self, mock_get_monitor):
+        mock_get_monitor.return_value = self._monitor(False)
+
+        self.assertFalse(self.poller.needs_attention(self.node, ['/t/1']))
+        # The node is reported until the task is handled
+        self.assertTrue(self.poller.needs_attention(self.node, ['/t/1']))
+        self.assertTrue(self.poller.needs_attention(self.node,
+                                                    ['/t/1', '/t/2']))
+        self.assertEqual(2, mock_get_monitor.call_count)
+
+        # The handled task is forgotten
+        self.assertTrue(self.poller.needs_attention(self.node, ['/t/2']))
+        self.assertEqual([('uuid1', '/t/2')], list(self.poller._monitors))
+
+    def test_error(self, mock_get_monitor):
+        mock_get_monitor.side_effect = exception.RedfishError(error='boom')
+
+        self.assertFalse(self.poller.needs_attention(self.node, ['/t/1']))
+        self.assertTrue(self.poller.needs_attention(self.node, ['/t/1']))
+
+    def test_no_tasks(self, mock_get_monitor):
+        self.assertTrue(self.poller.needs_attention(self.node, []))
+        self.assertFalse(self.engine.submit.called)
+
+    def test_backoff(self, mock_get_monitor):
+        self.config(task_monitor_max_interval=5, group='redfish')
+        mock_get_monitor.return_value = self._monitor(True)
+        delays = []
+        for _ in range(5):
+            self.poller.needs_attention(self.node, ['/t/1'])
+            monitor = self.poller._monitors[('uuid1', '/t/1')]
+            delays.append(monitor.delay)
+            monitor.next_poll = time.monotonic()
+
+        self.assertEqual([1, 2, 4, 5, 5], delays)
+
+    def test_not_submitted(self, mock_get_monitor):
+        self.engine.submit.side_effect = None
+        self.engine.submit.return_value = None
+
+        self.assertFalse(self.poller.needs_attention(self.node, ['/t/1']))
+        self.assertFalse(self.poller._monitors[('uuid1', '/t/1')].polling)
+
+    def test_forget_stale(self, mock_get_monitor):
+        mock_get_monitor.return_value = self._monitor(True)
+        self.poller.needs_attention(self.node, ['/t/1'])
+        self.poller._monitors[('uuid1', '/t/1')].seen -= (
+            task_poller._FORGET_AFTER + 1)
+
+        self.poller.needs_attention(self.node._replace(uuid='uuid2'),
+                                    ['/t/1'])
+
+        self.assertEqual([('uuid2', '/t/1')], list(self.poller._monitors))
+
+    def test_stop(self, mock_get_monitor):
+        mock_get_monitor.return_value = self._monitor(True)
+        self.poller.needs_attention(self.node, ['/t/1'])
+
+        self.poller.stop()
+
+        self.engine.stop.assert_called_once_with(wait=True)
+        self.assertIsNone(self.poller._engine)
+        self.assertEqual({}, self.poller._monitors)
+        # Nothing to stop anymore
+        self.poller.stop()
+        self.engine.stop.assert_called_once_with(wait=True)
+
+    @mock.patch.object(task_poller, '_POLLER', autospec=True)
+    def test_needs_attention_disabled(self, mock_poller, mock_get_monitor):
+        self.config(task_monitor_max_requests=0, group='redfish')
+        self.assertTrue(task_poller.needs_attention(self.node, ['/t/1']))
+        self.assertFalse(mock_poller.needs_attention.called)
+
+    @mock.patch.object(task_poller, '_POLLER', autospec=True)
+    def test_needs_attention(self, mock_poller, mock_get_monitor):
+        self.assertIs(mock_poller.needs_attention.return_value,
+                      task_poller.needs_attention(self.node, ['/t/1']))
+        mock_poller.needs_attention.assert_called_once_with(self.node,
+                                                            ['/t/1'])
@@ -336,6 +336,59 @@ class HeartbeatMixinTest(AgentDeployMixinBaseTest):
         mock_clean.assert_called_once_with(task)
         mock_set_steps.assert_called_once_with(task, use_existing_steps=False)
 
+    @mock.patch.object(objects.node.Node, 'touch_provisioning', autospec=True)
+    @mock.patch.object(agent_base.HeartbeatMixin,
+                       'refresh_steps', autospec=True)
+    @mock.patch.object(conductor_steps, 'save_cleaning_plan', autospec=True)
+    @mock.patch.object(conductor_steps, 'restore_cleaning_plan',
+                       autospec=True)
+    @mock.patch.object(conductor_steps, 'set_node_cleaning_steps',
+                       autospec=True)
+    @mock.patch.object(cleaning, 'continue_node_clean', autospec=True)
+    def test_heartbeat_resume_clean_plan(self, mock_clean, mock_set_steps,
+                                         mock_restore, mock_save,
+                                         mock_refresh, mock_touch):
+        mock_restore.return_value = False
+        self.node.clean_step = {}
+        self.node.provision_state = states.CLEANWAIT
+        self.node.save()
+        with task_manager.acquire(
+                self.context, self.node.uuid, shared=False) as task:
+            self.deploy.heartbeat(task, 'http://127.0.0.1:8080', '1.0.0')
+
+        mock_restore.assert_called_once_with(task)
+        mock_refresh.assert_called_once_with(mock.ANY, task, 'clean')
+        mock_set_steps.assert_called_once_with(task, use_existing_steps=False)
+        mock_save.assert_called_once_with(task)
+        mock_clean.assert_called_once_with(task)
+
+    @mock.patch.object(objects.node.Node, 'touch_provisioning', autospec=True)
+    @mock.patch.object(agent_base.HeartbeatMixin,
+                       'refresh_steps', autospec=True)
+    @mock.patch.object(conductor_steps, 'save_cleaning_plan', autospec=True)
+    @mock.patch.object(conductor_steps, 'restore_cleaning_plan',
+                       autospec=True)
+    @mock.patch.object(conductor_steps, 'set_node_cleaning_steps',
+                       autospec=True)
+    @mock.patch.object(cleaning, 'continue_node_clean', autospec=True)
+    def test_heartbeat_resume_clean_cached_plan(self, mock_clean,
+                                                mock_set_steps, mock_restore,
+                                                mock_save, mock_refresh,
+                                                mock_touch):
+        mock_restore.return_value = True
+        self.node.clean_step = {}
+        self.node.provision_state = states.CLEANWAIT
+        self.node.save()
+        with task_manager.acquire(
+                self.context, self.node.uuid, shared=False) as task:
+            self.deploy.heartbeat(task, 'http://127.0.0.1:8080', '1.0.0')
+
+        mock_restore.assert_called_once_with(task)
+        mock_refresh.assert_not_called()
+        mock_set_steps.assert_not_called()
+        mock_save.assert_not_called()
+        mock_clean.assert_called_once_with(task)
+
     @mock.patch.object(objects.node.Node, 'touch_provisioning', autospec=True)
     @mock.patch.object(agent_base.HeartbeatMixin,
                        'refresh_steps', autospec=True)
@@ -1158,6 +1211,8 @@ class ContinueCleaningTest(AgentDeployMixinBaseTest):
             collect_logs_mock.assert_called_once_with(task.node,
                                                       label='cleaning')
 
+    @mock.patch.object(conductor_steps, 'discard_cleaning_plan',
+                       autospec=True)
     @mock.patch.object(conductor_steps, 'set_node_cleaning_steps',
                        autospec=True)
     @mock.patch.object(cleaning, 'continue_node_clean', autospec=True)
@@ -1167,7 +1222,7 @@ class ContinueCleaningTest(AgentDeployMixinBaseTest):
                        autospec=True)
     def _test_continue_cleaning_clean_version_mismatch(
             self, status_mock, refresh_steps_mock, clean_mock, steps_mock,
-            manual=False):
+            discard_mock, manual=False):
         status_mock.return_value = [{
             'command_status': 'CLEAN_VERSION_MISMATCH',
             'command_name': 'execute_clean_step',
@@ -1180,6 +1235,7 @@ class ContinueCleaningTest(AgentDeployMixinBaseTest):
                                   shared=False) as task:
             self.deploy.continue_cleaning(task)
             clean_mock.assert_called_once_with(task)
+            discard_mock.assert_called_once_with(task)
             refresh_steps_mock.assert_called_once_with(mock.ANY, task, 'clean')
             if manual:
                 self.assertFalse(
@@ -96,6 +96,10 @@ class TestAgentClient(base.TestCase):
         self.assertEqual('application/json',
                          client.session.headers['Content-Type'])
 
+    def test_session_shared(self):
+        self.assertIs(agent_client.AgentClient().session,
+                      agent_client.AgentClient().session)
+
     def test__get_command_url(self):
         command_url = self.client._get_command_url(self.node)
         expected = ('%s/v1/commands/'
@@ -573,6 +577,79 @@ class TestAgentClient(base.TestCase):
                 'api_version': CONF.agent.agent_api_version},
             params={}, verify=True, timeout=CONF.agent.command_timeout)
 
+    def _command(self, name, status):
+        return {'command_name': name, 'command_status': status,
+                'command_result': None, 'command_error': None}
+
+    def test_get_commands_status_incremental(self):
+        self.addCleanup(agent_client.AgentClient._commands_cache.clear)
+        self.node.driver_internal_info['agent_secret_token'] = 'magical'
+        first = self._command('get_clean_steps', 'SUCCEEDED')
+        second = self._command('execute_clean_step', 'RUNNING')
+        second_done = self._command('execute_clean_step', 'SUCCEEDED')
+        third = self._command('execute_clean_step', 'RUNNING')
+        self.client.session.get.side_effect = [
+            MockResponse({'commands': [first, second]}),
+            MockResponse({'commands': [second_done, third], 'since': 1}),
+            MockResponse({'commands': [third], 'since': 2}),
+        ]
+        self.assertEqual([first, second],
+                         self.client.get_commands_status(self.node))
+        self.assertEqual([first, second_done, third],
+                         self.client.get_commands_status(self.node))
+        # Shared by the clients of the conductor
+        client = agent_client.AgentClient()
+        client.session = self.client.session
+        self.assertEqual([first, second_done, third],
+                         client.get_commands_status(self.node))
+        url = self.client._get_command_url(self.node)
+        self.client.session.get.assert_has_calls([
+            mock.call(url, params={'agent_token': 'magical'}, verify=True,
+                      timeout=60),
+            mock.call(url, params={'agent_token': 'magical', 'since': 1},
+                      verify=True, timeout=60),
+            mock.call(url, params={'agent_token': 'magical', 'since': 2},
+                      verify=True, timeout=60),
+        ])
+
+    def test_get_commands_status_incremental_not_supported(self):
+        self.addCleanup(agent_client.AgentClient._commands_cache.clear)
+        self.node.driver_internal_info['agent_secret_token'] = 'magical'
+        first = self._command('get_clean_steps', 'SUCCEEDED')
+        second = self._command('execute_clean_step', 'SUCCEEDED')
+        self.client.session.get.side_effect = [
+            MockResponse({'commands': [first]}),
+            MockResponse({'commands': [first, second]}),
+        ]
+        self.assertEqual([first], self.client.get_commands_status(self.node))
+        self.assertEqual([first, second],
+                         self.client.get_commands_status(self.node))
+        self.client.session.get.assert_called_with(
+            mock.ANY, params={'agent_token': 'magical', 'since': 1},
+            verify=True, timeout=60)
+
+    def test_get_commands_status_new_agent(self):
+        self.addCleanup(agent_client.AgentClient._commands_cache.clear)
+        self.node.driver_internal_info['agent_secret_token'] = 'magical'
+        first = self._command('get_clean_steps', 'SUCCEEDED')
+        self.client.session.get.side_effect = [
+            MockResponse({'commands': [first]}),
+            MockResponse({'commands': []}),
+        ]
+        self.client.get_commands_status(self.node)
+        self.node.driver_internal_info['agent_secret_token'] = 'new'
+        self.assertEqual([], self.client.get_commands_status(self.node))
+        self.client.session.get.assert_called_with(
+            mock.ANY, params={'agent_token': 'new'}, verify=True, timeout=60)
+
+    @mock.patch.object(agent_client, '_commands_summary', autospec=True)
+    def test_get_commands_status_lazy_summary(self, mock_summary):
+        self.client.session.get.return_value = MockResponse(
+            {'commands': [self._command('get_clean_steps', 'SUCCEEDED')]})
+        with mock.patch.object(agent_client.LOG, 'debug', autospec=True):
+            self.client.get_commands_status(self.node)
+        mock_summary.assert_not_called()
+
     def test_get_commands_status_retries(self):
         res = mock.MagicMock(spec_set=['json'])
         res.json.return_value = {'commands': []}
@@ -800,6 +877,78 @@ class TestAgentClient(base.TestCase):
             verify=True)
 
 
+@mock.patch.object(requests.Session, 'request', autospec=True)
+class TestAgentSessionPool(base.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.pool = agent_client.AgentSessionPool()
+        self.addCleanup(self.pool.close)
+
+    def test_content_type_header(self, mock_request):
+        self.assertEqual('application/json',
+                         self.pool.headers['Content-Type'])
+
+    def test_session_reused(self, mock_request):
+        self.pool.get('https://1.2.3.4:9999/v1/commands/', verify=True,
+                      timeout=60)
+        self.pool.post('https://1.2.3.4:9999/v1/commands/', verify=True,
+                       data='{}', timeout=60)
+        self.assertEqual(1, len(self.pool._sessions))
+        session = mock_request.call_args_list[0][0][0]
+        mock_request.assert_has_calls([
+            mock.call(session, 'GET', 'https://1.2.3.4:9999/v1/commands/',
+                      verify=True, timeout=60),
+            mock.call(session, 'POST', 'https://1.2.3.4:9999/v1/commands/',
+                      verify=True, data='{}', timeout=60)])
+        self.assertEqual('application/json',
+                         session.headers['Content-Type'])
+
+    def test_session_per_agent_and_verify(self, mock_request):
+        self.pool.get('https://1.2.3.4:9999/v1/commands/', verify=True)
+        self.pool.get('https://1.2.3.4:9999/v1/commands/',
+                      verify='/path/to/ca')
+        self.pool.get('https://1.2.3.5:9999/v1/commands/', verify=True)
+        self.assertEqual(3, len(self.pool._sessions))
+        sessions = {c[0][0] for c in mock_request.call_args_list}
+        self.assertEqual(3, len(sessions))
+
+    @mock.patch.object(requests.Session, 'close', autospec=True)
+    def test_evict_idle(self, mock_close, mock_request):
+        self.config(connection_idle_timeout=0, group='agent')
+        self.pool.get('https://1.2.3.4:9999/v1/commands/')
+        self.pool.get('https://1.2.3.5:9999/v1/commands/')
+        self.assertEqual([('https', '1.2.3.5:9999', True)],
+                         list(self.pool._sessions))
+        mock_close.assert_called_once_with(
+            mock_request.call_args_list[0][0][0])
+
+    @mock.patch.object(agent_client.METRICS, 'send_counter', autospec=True)
+    @mock.patch.object(agent_client.METRICS, 'send_timer', autospec=True)
+    @mock.patch.object(agent_client.AgentSessionPool, '_opened_connections',
+                       autospec=True)
+    def test_stats(self, mock_opened, mock_timer, mock_counter,
+                   mock_request):
+        mock_opened.side_effect = [0, 1, 1, 1]
+        self.pool.get('https://1.2.3.4:9999/v1/commands/')
+        self.pool.get('https://1.2.3.4:9999/v1/commands/')
+        stats = self.pool.stats()
+        self.assertEqual(['https://1.2.3.4:9999'], list(stats))
+        self.assertEqual(2, stats['https://1.2.3.4:9999']['requests'])
+        self.assertEqual(1, stats['https://1.2.3.4:9999']['reused'])
+        mock_counter.assert_has_calls([
+            mock.call('AgentClient.connection.new', 1),
+            mock.call('AgentClient.connection.reused', 1)])
+        mock_timer.assert_called_with('AgentClient.request', mock.ANY)
+
+    def test_request_fails(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError()
+        self.assertRaises(requests.ConnectionError, self.pool.get,
+                          'https://1.2.3.4:9999/v1/commands/')
+        entry = self.pool._sessions[('https', '1.2.3.4:9999', True)]
+        self.assertEqual(0, entry['in_use'])
+        self.assertEqual(1, entry['requests'])
+
+
 class TestAgentClientAttempts(base.TestCase):
     def setUp(self):
         super(TestAgentClientAttempts, self).setUp()
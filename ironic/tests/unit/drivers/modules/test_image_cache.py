@@ -17,18 +17,22 @@
 """Tests for ImageCache class and helper functions."""
 
 import datetime
+import errno
 import os
+import queue
 import tempfile
 import time
 from unittest import mock
 import uuid
 
+from oslo_concurrency import lockutils
 from oslo_config import cfg
 from oslo_utils.imageutils import format_inspector as image_format_inspector
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from ironic.common import exception
+from ironic.common import file_copy
 from ironic.common import image_service
 from ironic.common import images
 from ironic.common import utils
@@ -145,6 +149,49 @@ class TestImageCacheFetch(BaseTest):
         self.assertFalse(mock_download.called)
         self.assertFalse(mock_clean_up.called)
 
+    @mock.patch.object(image_cache, '_delete_dest_path_if_stale',
+                       return_value=False, autospec=True)
+    @mock.patch.object(image_cache, '_delete_master_path_if_stale',
+                       return_value=True, autospec=True)
+    def test_fetch_image_dest_cross_device(
+            self, mock_cache_upd, mock_dest_upd, mock_download,
+            mock_clean_up, mock_image_service):
+        with open(self.master_path, 'w') as fp:
+            fp.write('TEST')
+        real_link = os.link
+        locked = []
+
+        def _fake_link(src, dst):
+            if dst == self.dest_path:
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            real_link(src, dst)
+
+        def _fake_copy(src, dst, operation, hardlink=True):
+            # The master copy is kept alive by a temporary link
+            self.assertEqual(2, os.stat(src).st_nlink)
+            lock = lockutils.internal_lock('master_image')
+            if lock.acquire(blocking=False):
+                lock.release()
+                locked.append(False)
+            else:
+                locked.append(True)
+            with open(src) as src_fp, open(dst, 'w') as dst_fp:
+                dst_fp.write(src_fp.read())
+
+        with mock.patch.object(os, 'link', autospec=True,
+                               side_effect=_fake_link), \
+                mock.patch.object(file_copy, 'copy_file', autospec=True,
+                                  side_effect=_fake_copy):
+            self.cache.fetch_image(self.uuid, self.dest_path)
+
+        self.assertEqual([False], locked)
+        with open(self.dest_path) as fp:
+            self.assertEqual('TEST', fp.read())
+        self.assertEqual(1, os.stat(self.master_path).st_nlink)
+        self.assertEqual([os.path.basename(self.master_path)],
+                         os.listdir(self.master_dir))
+        self.assertFalse(mock_download.called)
+
     @mock.patch.object(os, 'link', autospec=True)
     @mock.patch.object(image_cache, '_delete_dest_path_if_stale',
                        return_value=True, autospec=True)
@@ -169,6 +216,21 @@ class TestImageCacheFetch(BaseTest):
         mock_image_service.assert_called_once_with(self.uuid, context=None)
         mock_image_service.return_value.show.assert_called_once_with(self.uuid)
 
+    @mock.patch.object(image_cache.METRICS, 'send_counter', autospec=True)
+    @mock.patch.object(os, 'link', autospec=True)
+    @mock.patch.object(image_cache, '_delete_dest_path_if_stale',
+                       return_value=False, autospec=True)
+    @mock.patch.object(image_cache, '_delete_master_path_if_stale',
+                       autospec=True)
+    def test_fetch_image_hit_miss_metrics(
+            self, mock_cache_upd, mock_dest_upd, mock_link, mock_counter,
+            mock_download, mock_clean_up, mock_image_service):
+        mock_cache_upd.side_effect = [True, False]
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        self.cache.fetch_image(self.uuid, self.dest_path)
+        mock_counter.assert_has_calls([mock.call('ImageCache.hit', 1),
+                                       mock.call('ImageCache.miss', 1)])
+
     @mock.patch.object(os, 'link', autospec=True)
     @mock.patch.object(image_cache, '_delete_dest_path_if_stale',
                        return_value=True, autospec=True)
@@ -282,6 +344,29 @@ class TestImageCacheDownload(BaseTest):
         with open(self.dest_path) as fp:
             self.assertEqual("TEST", fp.read())
 
+    def test__download_image_dest_cross_device(self, mock_fetch):
+        def _fake_fetch(ctx, uuid, tmp_path, *_args, **_kwargs):
+            with open(tmp_path, 'w') as fp:
+                fp.write("TEST")
+
+        real_link = os.link
+
+        def _fake_link(src, dst):
+            if dst == self.dest_path:
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            real_link(src, dst)
+
+        mock_fetch.side_effect = _fake_fetch
+        with mock.patch.object(os, 'link', autospec=True,
+                               side_effect=_fake_link):
+            self.cache._download_image(self.uuid, self.master_path,
+                                       self.dest_path, self.img_info)
+        self.assertTrue(os.path.isfile(self.master_path))
+        self.assertNotEqual(os.stat(self.dest_path).st_ino,
+                            os.stat(self.master_path).st_ino)
+        with open(self.dest_path) as fp:
+            self.assertEqual("TEST", fp.read())
+
     @mock.patch.object(image_cache, 'LOG', autospec=True)
     @mock.patch.object(os, 'link', autospec=True)
     def test__download_image_linkfail(self, mock_link, mock_log, mock_fetch):
@@ -323,6 +408,115 @@ class TestImageCacheDownload(BaseTest):
             self.assertEqual("TEST", fp.read())
 
 
+@mock.patch.object(images, 'image_show', autospec=True,
+                   return_value={'os_hash_algo': 'sha512',
+                                 'os_hash_value': 'f' * 128,
+                                 'checksum': 'a' * 32})
+@mock.patch.object(image_cache.ImageCache, 'fetch_image', autospec=True)
+class TestImageCachePrewarm(BaseTest):
+
+    def _fake_fetch(self, content='TEST'):
+        def _fetch(cache, href, dest_path, ctx=None, force_raw=None,
+                   expected_checksum=None, expected_checksum_algo=None,
+                   image_auth_data=None):
+            if not os.path.exists(self.master_path):
+                with open(self.master_path, 'w') as fp:
+                    fp.write(content)
+            os.link(self.master_path, dest_path)
+        return _fetch
+
+    def test_prewarm(self, mock_fetch, mock_show):
+        mock_fetch.side_effect = self._fake_fetch()
+        self.assertEqual(4, self.cache.prewarm(self.uuid, ctx='ctx'))
+        mock_show.assert_called_once_with('ctx', self.uuid,
+                                          image_auth_data=None)
+        mock_fetch.assert_called_once_with(
+            self.cache, self.uuid, mock.ANY, ctx='ctx', force_raw=True,
+            expected_checksum='f' * 128, expected_checksum_algo='sha512',
+            image_auth_data=None)
+        self.assertTrue(os.path.isfile(self.master_path))
+        # Only the master copy is left
+        self.assertEqual(1, os.stat(self.master_path).st_nlink)
+        self.assertEqual([os.path.basename(self.master_path)],
+                         os.listdir(self.master_dir))
+
+    def test_prewarm_legacy_checksum(self, mock_fetch, mock_show):
+        mock_show.return_value = {'checksum': 'a' * 32}
+        mock_fetch.side_effect = self._fake_fetch()
+        self.cache.prewarm(self.uuid, force_raw=False)
+        mock_fetch.assert_called_once_with(
+            self.cache, self.uuid, mock.ANY, ctx=None, force_raw=False,
+            expected_checksum='a' * 32, expected_checksum_algo=None,
+            image_auth_data=None)
+
+    def test_prewarm_md5_disabled(self, mock_fetch, mock_show):
+        self.config(allow_md5_checksum=False, group='agent')
+        mock_show.return_value = {'checksum': 'a' * 32}
+        self.assertRaises(exception.ImageChecksumAlgorithmFailure,
+                          self.cache.prewarm, self.uuid)
+        mock_fetch.assert_not_called()
+
+    def test_prewarm_no_checksum(self, mock_fetch, mock_show):
+        mock_show.return_value = {'size': 4}
+        mock_fetch.side_effect = self._fake_fetch()
+        self.cache.prewarm(self.uuid)
+        mock_fetch.assert_called_once_with(
+            self.cache, self.uuid, mock.ANY, ctx=None, force_raw=True,
+            expected_checksum=None, expected_checksum_algo=None,
+            image_auth_data=None)
+
+    def test_prewarm_validation_disabled(self, mock_fetch, mock_show):
+        self.cache._disable_validation = True
+        mock_fetch.side_effect = self._fake_fetch()
+        self.cache.prewarm(self.uuid)
+        mock_show.assert_not_called()
+        mock_fetch.assert_called_once_with(
+            self.cache, self.uuid, mock.ANY, ctx=None, force_raw=True,
+            expected_checksum=None, expected_checksum_algo=None,
+            image_auth_data=None)
+
+    def test_prewarm_already_cached(self, mock_fetch, mock_show):
+        touch(self.master_path)
+        mock_fetch.side_effect = self._fake_fetch()
+        self.assertEqual(0, self.cache.prewarm(self.uuid))
+        self.assertEqual(1, os.stat(self.master_path).st_nlink)
+
+    def test_prewarm_no_master_dir(self, mock_fetch, mock_show):
+        self.cache.master_dir = None
+        self.assertEqual(0, self.cache.prewarm(self.uuid))
+        mock_fetch.assert_not_called()
+
+    def test_prewarm_images(self, mock_fetch, mock_show):
+        mock_fetch.side_effect = self._fake_fetch()
+        images_queue = queue.Queue()
+        images_queue.put((self.cache, self.uuid, True))
+        images_queue.put((self.cache, self.uuid, True))
+        self.assertEqual((1, 4),
+                         image_cache.prewarm_images('ctx', images_queue))
+        self.assertTrue(images_queue.empty())
+        self.assertEqual(2, mock_fetch.call_count)
+
+    def test_prewarm_images_force_raw(self, mock_fetch, mock_show):
+        self.master_path = self.master_path[:-len('.converted')]
+        mock_fetch.side_effect = self._fake_fetch()
+        images_queue = queue.Queue()
+        images_queue.put((self.cache, self.uuid, False))
+        self.assertEqual((1, 4),
+                         image_cache.prewarm_images('ctx', images_queue))
+        self.assertEqual(False, mock_fetch.call_args[1]['force_raw'])
+        self.assertEqual([self.uuid], os.listdir(self.master_dir))
+
+    def test_prewarm_images_failure(self, mock_fetch, mock_show):
+        mock_fetch.side_effect = exception.ImageDownloadFailed(
+            image_href=self.uuid, reason='boom')
+        images_queue = queue.Queue()
+        images_queue.put((self.cache, self.uuid, True))
+        images_queue.put((self.cache, 'http://example.com/image', True))
+        self.assertEqual((0, 0),
+                         image_cache.prewarm_images('ctx', images_queue))
+        self.assertEqual(2, mock_fetch.call_count)
+
+
 @mock.patch.object(os, 'unlink', autospec=True)
 class TestUpdateImages(BaseTest):
 
@@ -837,6 +1031,7 @@ class TestFetchCleanup(base.TestCase):
     def test__fetch(
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_remove, mock_show, mock_format_inspector):
+        mock_fetch.return_value = None
         image_check = mock.MagicMock()
         image_check.__str__.side_effect = iter(['qcow2', 'raw'])
         image_check.safety_check.return_value = True
@@ -854,7 +1049,8 @@ class TestFetchCleanup(base.TestCase):
                                            image_auth_data=None)
         mock_clean.assert_called_once_with('/foo', 100)
         mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
-                                         '/foo/bar.part')
+                                         '/foo/bar.part',
+                                         source_format='qcow2')
         mock_remove.assert_not_called()
         mock_show.assert_called_once_with('fake', 'fake-uuid',
                                           image_auth_data=None)
@@ -862,6 +1058,28 @@ class TestFetchCleanup(base.TestCase):
         image_check.safety_check.assert_called_once()
         self.assertEqual(1, image_check.__str__.call_count)
 
+    @mock.patch.object(images, 'detect_file_format', autospec=True)
+    @mock.patch.object(images, 'image_show', autospec=True)
+    @mock.patch.object(images, 'converted_size', autospec=True)
+    @mock.patch.object(images, 'fetch', autospec=True)
+    @mock.patch.object(images, 'image_to_raw', autospec=True)
+    @mock.patch.object(image_cache, '_clean_up_caches', autospec=True)
+    def test__fetch_inspected_while_downloading(
+            self, mock_clean, mock_raw, mock_fetch, mock_size, mock_show,
+            mock_format_inspector):
+        image_check = mock.MagicMock()
+        image_check.__str__.return_value = 'qcow2'
+        mock_fetch.return_value = image_check
+        mock_show.return_value = {}
+        mock_size.return_value = 100
+        image_cache._fetch('fake', 'fake-uuid', '/foo/bar', force_raw=True)
+        mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
+                                         '/foo/bar.part',
+                                         source_format='qcow2')
+        # The downloaded file is not read again
+        mock_format_inspector.assert_not_called()
+        image_check.safety_check.assert_called_once_with()
+
     @mock.patch.object(images, 'detect_file_format', autospec=True)
     @mock.patch.object(images, 'image_show', autospec=True)
     @mock.patch.object(os, 'remove', autospec=True)
@@ -872,6 +1090,7 @@ class TestFetchCleanup(base.TestCase):
     def test__fetch_with_image_auth(
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_remove, mock_show, mock_format_inspector):
+        mock_fetch.return_value = None
         image_check = mock.MagicMock()
         image_check.__str__.side_effect = iter(['qcow2', 'raw'])
         image_check.safety_check.return_value = True
@@ -889,7 +1108,8 @@ class TestFetchCleanup(base.TestCase):
                                            image_auth_data='foo')
         mock_clean.assert_called_once_with('/foo', 100)
         mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
-                                         '/foo/bar.part')
+                                         '/foo/bar.part',
+                                         source_format='qcow2')
         mock_remove.assert_not_called()
         mock_show.assert_called_once_with('fake', 'fake-uuid',
                                           image_auth_data='foo')
@@ -907,6 +1127,7 @@ class TestFetchCleanup(base.TestCase):
     def test__fetch_convert_to_gpt(
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_remove, mock_show, mock_format_inspector):
+        mock_fetch.return_value = None
         image_check = mock.MagicMock()
         image_check.__str__.side_effect = iter(['qcow2', 'gpt'])
         image_check.safety_check.return_value = True
@@ -923,7 +1144,8 @@ class TestFetchCleanup(base.TestCase):
                                            image_auth_data=None)
         mock_clean.assert_called_once_with('/foo', 100)
         mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
-                                         '/foo/bar.part')
+                                         '/foo/bar.part',
+                                         source_format='qcow2')
         mock_remove.assert_not_called()
         mock_show.assert_called_once_with('fake', 'fake-uuid',
                                           image_auth_data=None)
@@ -941,6 +1163,7 @@ class TestFetchCleanup(base.TestCase):
     def test__fetch_deep_inspection_disabled(
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_remove, mock_show, mock_format_inspector):
+        mock_fetch.return_value = None
         cfg.CONF.set_override(
             'disable_deep_image_inspection', True,
             group='conductor')
@@ -957,7 +1180,8 @@ class TestFetchCleanup(base.TestCase):
                                            image_auth_data=None)
         mock_clean.assert_called_once_with('/foo', 100)
         mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
-                                         '/foo/bar.part')
+                                         '/foo/bar.part',
+                                         source_format=None)
         mock_remove.assert_not_called()
         mock_show.assert_not_called()
         mock_format_inspector.assert_called_once_with('/foo/bar.part')
@@ -974,6 +1198,7 @@ class TestFetchCleanup(base.TestCase):
     def test__fetch_disable_validation(
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_remove, mock_show, mock_format_inspector):
+        mock_fetch.return_value = None
         image_check = mock.MagicMock()
         image_check.__str__.side_effect = iter(['qcow2', 'raw'])
         image_check.safety_check.return_value = True
@@ -991,7 +1216,8 @@ class TestFetchCleanup(base.TestCase):
                                            image_auth_data=None)
         mock_clean.assert_called_once_with('/foo', 100)
         mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
-                                         '/foo/bar.part')
+                                         '/foo/bar.part',
+                                         source_format=None)
         mock_remove.assert_not_called()
         mock_show.assert_not_called()
         mock_format_inspector.assert_called_once_with('/foo/bar.part')
@@ -1009,6 +1235,7 @@ class TestFetchCleanup(base.TestCase):
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_exists, mock_remove, mock_image_show,
             mock_format_inspector):
+        mock_fetch.return_value = None
         image_check = mock.MagicMock()
         image_check.__str__.side_effect = iter(['qcow2', 'raw'])
         image_check.safety_check.return_value = True
@@ -1026,7 +1253,8 @@ class TestFetchCleanup(base.TestCase):
                                            image_auth_data=None)
         mock_clean.assert_called_once_with('/foo', 100)
         mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
-                                         '/foo/bar.part')
+                                         '/foo/bar.part',
+                                         source_format='qcow2')
         self.assertEqual(1, mock_exists.call_count)
         self.assertEqual(1, mock_remove.call_count)
         mock_image_show.assert_called_once_with('fake', 'fake-uuid',
@@ -1046,6 +1274,7 @@ class TestFetchCleanup(base.TestCase):
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_show, mock_format_inspector,
             mock_rename):
+        mock_fetch.return_value = None
         mock_show.return_value = {'disk_format': 'raw'}
         image_check = mock.MagicMock()
         image_check.__str__.return_value = 'raw'
@@ -1080,6 +1309,7 @@ class TestFetchCleanup(base.TestCase):
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_show, mock_format_inspector,
             mock_rename):
+        mock_fetch.return_value = None
         mock_show.return_value = {'disk_format': 'raw'}
         image_check = mock.MagicMock()
         image_check.__str__.return_value = 'gpt'
@@ -1112,6 +1342,7 @@ class TestFetchCleanup(base.TestCase):
     def test__fetch_format_does_not_match_glance(
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_show, mock_format_inspector):
+        mock_fetch.return_value = None
         mock_show.return_value = {'disk_format': 'raw'}
         image_check = mock.MagicMock()
         image_check.__str__.return_value = 'qcow2'
@@ -1147,6 +1378,7 @@ class TestFetchCleanup(base.TestCase):
     def test__fetch_not_safe_image(
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_show, mock_format_inspector):
+        mock_fetch.return_value = None
         mock_show.return_value = {'disk_format': 'qcow2'}
         image_check = mock.MagicMock()
         image_check.__str__.return_value = 'qcow2'
@@ -1179,6 +1411,7 @@ class TestFetchCleanup(base.TestCase):
     def test__fetch_estimate_fallback(
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_show, mock_format_inspector):
+        mock_fetch.return_value = None
         mock_show.return_value = {'disk_format': 'qcow2'}
         image_check = mock.MagicMock()
         image_check.__str__.side_effect = iter(['qcow2', 'raw'])
@@ -1201,7 +1434,8 @@ class TestFetchCleanup(base.TestCase):
             mock.call('/foo', 10),
         ])
         mock_raw.assert_called_once_with('fake-uuid', '/foo/bar',
-                                         '/foo/bar.part')
+                                         '/foo/bar.part',
+                                         source_format='qcow2')
         mock_show.assert_called_once_with('fake', 'fake-uuid',
                                           image_auth_data=None)
         mock_format_inspector.assert_called_once_with('/foo/bar.part')
@@ -1220,6 +1454,7 @@ class TestFetchCleanup(base.TestCase):
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_remove, mock_show, mock_format_inspector,
             mock_rename):
+        mock_fetch.return_value = None
         image_check = mock.MagicMock()
         image_check.__str__.return_value = 'raw'
         image_check.safety_check.return_value = True
@@ -1253,6 +1488,7 @@ class TestFetchCleanup(base.TestCase):
             self, mock_clean, mock_raw, mock_fetch,
             mock_size, mock_remove, mock_show, mock_format_inspector,
             mock_rename):
+        mock_fetch.return_value = None
         image_check = mock.MagicMock()
         image_check.__str__.return_value = 'raw'
         image_check.safety_check.return_value = True
@@ -21,6 +21,7 @@ from unittest import mock
 from oslo_config import cfg
 from oslo_utils import uuidutils
 
+from ironic.common import exception
 from ironic.common import image_service
 from ironic.common import images
 from ironic.common import states
@@ -159,6 +160,9 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
         self.node = obj_utils.create_test_node(
             self.context, driver='redfish', driver_info=INFO_DICT,
             provision_state=states.DEPLOYING)
+        iso_master_path = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, iso_master_path)
+        self.config(iso_master_path=iso_master_path, group='deploy')
 
     @mock.patch.object(image_utils.ImageHandler, 'unpublish_image',
                        autospec=True)
@@ -363,6 +367,32 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
             result = image_utils.prepare_configdrive_image(task, encoded)
             self.assertEqual(expected_url, result)
 
+    @mock.patch.object(image_utils.manager_utils, 'build_configdrive_image',
+                       autospec=True)
+    @mock.patch.object(image_utils, 'prepare_disk_image', autospec=True)
+    def test_prepare_configdrive_image_json(self, mock_prepare, mock_build):
+        expected_url = 'https://a.b/c.f?e=f'
+
+        def _build(node, configdrive, dest):
+            with open(dest, 'wb') as fp:
+                fp.write(b'content')
+
+        def _prepare(task, content, prefix):
+            with open(content, 'rb') as fp:
+                self.assertEqual(b'content', fp.read())
+            return expected_url
+
+        mock_build.side_effect = _build
+        mock_prepare.side_effect = _prepare
+
+        with task_manager.acquire(self.context, self.node.uuid,
+                                  shared=True) as task:
+            result = image_utils.prepare_configdrive_image(
+                task, {'meta_data': {}})
+            self.assertEqual(expected_url, result)
+            mock_build.assert_called_once_with(task.node, {'meta_data': {}},
+                                               mock.ANY)
+
     @mock.patch.object(utils, 'execute', autospec=True)
     @mock.patch.object(images, 'fetch_into', autospec=True)
     @mock.patch.object(image_utils, 'prepare_disk_image', autospec=True)
@@ -457,10 +487,204 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 boot_mode='uefi', esp_image_href='http://bootloader/img',
                 kernel_params='nofb vga=normal ir_pub_id=1-23-4',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None, publisher_id='1-23-4')
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
 
             self.assertEqual(expected_url, url)
 
+    def _create_template(self, context, output_file, *args, **kwargs):
+        with open(output_file, 'wb') as f:
+            f.write(b'template')
+        return 'EFI/BOOT/grub.cfg'
+
+    @mock.patch.object(images, 'image_show', autospec=True)
+    @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
+    @mock.patch.object(image_utils.ImageHandler, 'publish_image',
+                       autospec=True)
+    @mock.patch.object(images, 'create_boot_iso_from_template',
+                       autospec=True)
+    @mock.patch.object(images, 'create_boot_iso', autospec=True)
+    def test__prepare_iso_image_template(
+            self, mock_create_boot_iso, mock_from_template,
+            mock_publish_image, mock_generate_uuid, mock_image_show):
+        template_path = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, template_path)
+        self.config(iso_template_path=template_path, group='deploy')
+        mock_generate_uuid.return_value = '1-23-4'
+        mock_image_show.return_value = {'updated_at': '2024-01-01'}
+        mock_create_boot_iso.side_effect = self._create_template
+        with task_manager.acquire(self.context, self.node.uuid,
+                                  shared=True) as task:
+            task.node.instance_info.update(deploy_boot_mode='uefi')
+
+            for _ in range(2):
+                image_utils._prepare_iso_image(
+                    task, 'http://kernel/img', 'http://ramdisk/img',
+                    'http://bootloader/img', root_uuid=task.node.uuid)
+
+            mock_create_boot_iso.assert_called_once_with(
+                mock.ANY, mock.ANY, 'http://kernel/img', 'http://ramdisk/img',
+                esp_image_href='http://bootloader/img', boot_mode='uefi',
+                inject_files=None,
+                publisher_id=images.BOOT_ISO_TEMPLATE_PUBLISHER_ID,
+                config_size=images.BOOT_ISO_TEMPLATE_CONFIG_SIZE,
+                image_cache=mock.ANY)
+            self.assertEqual(2, mock_from_template.call_count)
+            mock_from_template.assert_called_with(
+                mock.ANY, mock.ANY, 'EFI/BOOT/grub.cfg',
+                root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
+                kernel_params='nofb vga=normal ir_pub_id=1-23-4',
+                boot_mode='uefi', publisher_id='1-23-4')
+            template = mock_from_template.call_args[0][0]
+            self.assertEqual(template_path, os.path.dirname(template))
+            self.assertEqual(['%s.iso' % os.path.basename(template)[:-4],
+                              '%s.json' % os.path.basename(template)[:-4]],
+                             sorted(os.listdir(template_path)))
+
+    @mock.patch.object(images, 'image_show', autospec=True)
+    @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
+    @mock.patch.object(image_utils.ImageHandler, 'publish_image',
+                       autospec=True)
+    @mock.patch.object(images, 'create_boot_iso_from_template',
+                       autospec=True)
+    @mock.patch.object(images, 'create_boot_iso', autospec=True)
+    def test__prepare_iso_image_template_no_version(
+            self, mock_create_boot_iso, mock_from_template,
+            mock_publish_image, mock_generate_uuid, mock_image_show):
+        template_path = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, template_path)
+        self.config(iso_template_path=template_path, group='deploy')
+        mock_generate_uuid.return_value = '1-23-4'
+        mock_image_show.return_value = {}
+        with task_manager.acquire(self.context, self.node.uuid,
+                                  shared=True) as task:
+            task.node.instance_info.update(deploy_boot_mode='uefi')
+
+            image_utils._prepare_iso_image(
+                task, 'http://kernel/img', 'http://ramdisk/img',
+                'http://bootloader/img', root_uuid=task.node.uuid)
+
+            mock_create_boot_iso.assert_called_once_with(
+                mock.ANY, mock.ANY, 'http://kernel/img', 'http://ramdisk/img',
+                boot_mode='uefi', esp_image_href='http://bootloader/img',
+                kernel_params='nofb vga=normal ir_pub_id=1-23-4',
+                root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
+            mock_from_template.assert_not_called()
+            self.assertEqual([], os.listdir(template_path))
+
+    @mock.patch.object(images, 'image_show', autospec=True)
+    @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
+    @mock.patch.object(image_utils.ImageHandler, 'publish_image',
+                       autospec=True)
+    @mock.patch.object(images, 'create_boot_iso_from_template',
+                       autospec=True)
+    @mock.patch.object(images, 'create_boot_iso', autospec=True)
+    def test__prepare_iso_image_template_fallback(
+            self, mock_create_boot_iso, mock_from_template,
+            mock_publish_image, mock_generate_uuid, mock_image_show):
+        template_path = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, template_path)
+        self.config(iso_template_path=template_path, group='deploy')
+        mock_generate_uuid.return_value = '1-23-4'
+        mock_image_show.return_value = {'updated_at': '2024-01-01'}
+        mock_create_boot_iso.side_effect = self._create_template
+        mock_from_template.side_effect = exception.ImageCreationFailed(
+            image_type='iso', error='boom')
+        with task_manager.acquire(self.context, self.node.uuid,
+                                  shared=True) as task:
+            task.node.instance_info.update(deploy_boot_mode='uefi')
+
+            image_utils._prepare_iso_image(
+                task, 'http://kernel/img', 'http://ramdisk/img',
+                'http://bootloader/img', root_uuid=task.node.uuid)
+
+            self.assertEqual(2, mock_create_boot_iso.call_count)
+            mock_create_boot_iso.assert_called_with(
+                mock.ANY, mock.ANY, 'http://kernel/img', 'http://ramdisk/img',
+                boot_mode='uefi', esp_image_href='http://bootloader/img',
+                kernel_params='nofb vga=normal ir_pub_id=1-23-4',
+                root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
+            self.assertEqual([], os.listdir(template_path))
+
+    @mock.patch.object(images, 'image_show', autospec=True)
+    @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
+    @mock.patch.object(image_utils.ImageHandler, 'publish_image',
+                       autospec=True)
+    @mock.patch.object(images, 'create_boot_iso_from_template',
+                       autospec=True)
+    @mock.patch.object(images, 'create_boot_iso', autospec=True)
+    def test__prepare_iso_image_template_node_specific_files(
+            self, mock_create_boot_iso, mock_from_template,
+            mock_publish_image, mock_generate_uuid, mock_image_show):
+        template_path = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, template_path)
+        self.config(iso_template_path=template_path, group='deploy')
+        mock_generate_uuid.return_value = '1-23-4'
+        inject_files = {b'{}': 'openstack/latest/network_data.json'}
+        with task_manager.acquire(self.context, self.node.uuid,
+                                  shared=True) as task:
+            task.node.instance_info.update(deploy_boot_mode='uefi')
+
+            image_utils._prepare_iso_image(
+                task, 'http://kernel/img', 'http://ramdisk/img',
+                'http://bootloader/img', root_uuid=task.node.uuid,
+                inject_files=inject_files, node_specific_files=True)
+
+            mock_create_boot_iso.assert_called_once_with(
+                mock.ANY, mock.ANY, 'http://kernel/img', 'http://ramdisk/img',
+                boot_mode='uefi', esp_image_href='http://bootloader/img',
+                kernel_params='nofb vga=normal ir_pub_id=1-23-4',
+                root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
+                inject_files=inject_files, publisher_id='1-23-4',
+                image_cache=mock.ANY)
+            mock_image_show.assert_not_called()
+            mock_from_template.assert_not_called()
+            self.assertEqual([], os.listdir(template_path))
+
+    def test__clean_up_boot_iso_templates(self):
+        template_path = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, template_path)
+        self.config(iso_template_path=template_path, iso_template_count=1,
+                    group='deploy')
+        for mtime, key in enumerate(('old', 'new')):
+            for ext in ('iso', 'json'):
+                path = os.path.join(template_path, '%s.%s' % (key, ext))
+                open(path, 'w').close()
+                os.utime(path, (mtime, mtime))
+
+        image_utils._clean_up_boot_iso_templates()
+
+        self.assertEqual(['new.iso', 'new.json'],
+                         sorted(os.listdir(template_path)))
+
+    @mock.patch.object(os.path, 'getmtime', autospec=True)
+    def test__clean_up_boot_iso_templates_removed(self, mock_getmtime):
+        template_path = tempfile.mkdtemp()
+        self.addCleanup(utils.rmtree_without_raise, template_path)
+        self.config(iso_template_path=template_path, iso_template_count=1,
+                    group='deploy')
+        for key in ('removed', 'new'):
+            for ext in ('iso', 'json'):
+                open(os.path.join(template_path, '%s.%s' % (key, ext)),
+                     'w').close()
+
+        def getmtime(path):
+            if 'removed' in path:
+                # Removed by another conductor after being listed
+                raise FileNotFoundError(path)
+            return 1
+
+        mock_getmtime.side_effect = getmtime
+
+        image_utils._clean_up_boot_iso_templates()
+
+        self.assertEqual(['new.iso', 'new.json'],
+                         sorted(os.listdir(template_path)))
+
     @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
     @mock.patch.object(image_utils.ImageHandler, 'publish_image',
                        autospec=True)
@@ -481,7 +705,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 boot_mode='uefi', esp_image_href=None,
                 kernel_params='nofb vga=normal ir_pub_id=1-23-4',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None, publisher_id='1-23-4')
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
 
     @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
     @mock.patch.object(image_utils.ImageHandler, 'publish_image',
@@ -514,7 +739,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 boot_mode='uefi', esp_image_href='http://bootloader/img',
                 kernel_params='nofb vga=normal ir_pub_id=1-23-4',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None, publisher_id='1-23-4')
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
 
             self.assertEqual(expected_url, url)
 
@@ -548,7 +774,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 boot_mode='bios', esp_image_href=None,
                 kernel_params='nofb vga=normal ir_pub_id=1-23-4',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None, publisher_id='1-23-4')
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
 
             self.assertEqual(expected_url, url)
 
@@ -575,7 +802,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 boot_mode='uefi', esp_image_href=None,
                 kernel_params=f'{kernel_params} ir_pub_id=1-23-4',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None, publisher_id='1-23-4')
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
         self.assertEqual(1, mock_generate_uuid.call_count)
 
     @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
@@ -601,7 +829,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 boot_mode='uefi', esp_image_href=None,
                 kernel_params=f'{kernel_params} ir_pub_id=1-23-4',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None, publisher_id='1-23-4')
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
         self.assertEqual(1, mock_generate_uuid.call_count)
 
     @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
@@ -629,7 +858,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 kernel_params=(f'nofb vga=normal {kernel_params} '
                                'ir_pub_id=1-23-4'),
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None, publisher_id='1-23-4')
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
         self.assertEqual(1, mock_generate_uuid.call_count)
 
     @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
@@ -657,7 +887,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 kernel_params=f'{kernel_params} ir_pub_id=1-23-4',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
                 inject_files=None,
-                publisher_id='1-23-4')
+                publisher_id='1-23-4',
+                image_cache=mock.ANY)
         self.assertEqual(1, mock_generate_uuid.call_count)
 
     @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
@@ -683,7 +914,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 boot_mode='uefi', esp_image_href=None,
                 kernel_params=f'root=/dev/ram0 text {kernel_params}',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None)
+                inject_files=None,
+                image_cache=mock.ANY)
         mock_generate_uuid.assert_not_called()
 
     @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
@@ -711,7 +943,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 boot_mode='bios', esp_image_href=None,
                 kernel_params=f'root=/dev/ram0 text {kernel_params}',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None)
+                inject_files=None,
+                image_cache=mock.ANY)
         mock_generate_uuid.assert_not_called()
 
     @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
@@ -739,7 +972,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 boot_mode='uefi', esp_image_href=None,
                 kernel_params=f'{kernel_params} ir_pub_id=1-23-4',
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None, publisher_id='1-23-4')
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
         self.assertEqual(1, mock_generate_uuid.call_count)
 
     @mock.patch.object(uuidutils, 'generate_uuid', autospec=True)
@@ -767,7 +1001,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
                 kernel_params=(f'{kernel_params} ir_pub_id=1-23-4 '
                                'foo=bar banana'),
                 root_uuid='1be26c0b-03f2-4d2e-ae87-c02d7f33c123',
-                inject_files=None, publisher_id='1-23-4')
+                inject_files=None, publisher_id='1-23-4',
+                image_cache=mock.ANY)
         self.assertEqual(1, mock_generate_uuid.call_count)
         self.assertEqual(1, mock_generate_uuid.call_count)
 
@@ -846,7 +1081,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
 
             mock__prepare_iso_image.assert_called_once_with(
                 task, 'kernel', 'ramdisk', 'bootloader', params={},
-                inject_files={}, base_iso=None)
+                inject_files={}, base_iso=None,
+                node_specific_files=False)
 
     @mock.patch.object(image_utils, '_prepare_iso_image', autospec=True)
     def test_prepare_deploy_iso_bootloader_by_arch(self,
@@ -869,7 +1105,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
 
             mock__prepare_iso_image.assert_called_once_with(
                 task, 'kernel', 'ramdisk', 'bootx64.efi', params={},
-                inject_files={}, base_iso=None)
+                inject_files={}, base_iso=None,
+                node_specific_files=False)
 
     @mock.patch.object(image_utils, '_prepare_iso_image', autospec=True)
     def test_prepare_deploy_iso_existing_iso(self, mock__prepare_iso_image):
@@ -887,7 +1124,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
 
             mock__prepare_iso_image.assert_called_once_with(
                 task, None, None, None, params={},
-                inject_files={}, base_iso='iso')
+                inject_files={}, base_iso='iso',
+                node_specific_files=False)
 
     @mock.patch.object(image_utils, '_prepare_iso_image', autospec=True)
     def test_prepare_deploy_iso_existing_iso_vendor_prefix(
@@ -906,7 +1144,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
 
             mock__prepare_iso_image.assert_called_once_with(
                 task, None, None, None, params={},
-                inject_files={}, base_iso='iso')
+                inject_files={}, base_iso='iso',
+                node_specific_files=False)
 
     @mock.patch.object(image_utils, '_prepare_iso_image', autospec=True)
     def test_prepare_deploy_iso_network_data(self, mock__prepare_iso_image):
@@ -938,7 +1177,8 @@ class RedfishImageUtilsTestCase(db_base.DbTestCase):
 
             mock__prepare_iso_image.assert_called_once_with(
                 task, 'kernel', 'ramdisk', bootloader_href=None,
-                params={}, inject_files=expected_files, base_iso=None)
+                params={}, inject_files=expected_files, base_iso=None,
+                node_specific_files=True)
 
     @mock.patch.object(image_utils, '_prepare_iso_image', autospec=True)
     def test_prepare_deploy_iso_tls(self, mock__prepare_iso_image):
@@ -971,7 +1211,8 @@ cafile = /etc/ironic-python-agent/ironic.crt
 
             mock__prepare_iso_image.assert_called_once_with(
                 task, 'kernel', 'ramdisk', 'bootloader', params={},
-                inject_files=expected_files, base_iso=None)
+                inject_files=expected_files, base_iso=None,
+                node_specific_files=False)
 
     @mock.patch.object(image_utils, '_prepare_iso_image', autospec=True)
     def test_prepare_deploy_iso_external_ip(self, mock__prepare_iso_image):
@@ -993,7 +1234,8 @@ cafile = /etc/ironic-python-agent/ironic.crt
             mock__prepare_iso_image.assert_called_once_with(
                 task, 'kernel', 'ramdisk', 'bootloader',
                 params={'ipa-api-url': 'http://callback'},
-                inject_files={}, base_iso=None)
+                inject_files={}, base_iso=None,
+                node_specific_files=False)
 
     @mock.patch.object(image_utils, '_find_param', autospec=True)
     @mock.patch.object(image_utils, '_prepare_iso_image', autospec=True)
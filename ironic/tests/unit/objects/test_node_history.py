@@ -120,6 +120,19 @@ class TestNodeHistoryObject(db_base.DbTestCase, obj_utils.SchemasTestMixIn):
 
             mock_db_create.assert_called_once_with(self.fake_history)
 
+    def test_create_bulk(self):
+        with mock.patch.object(self.dbapi, 'create_node_history_bulk',
+                               autospec=True) as mock_db_create:
+            histories = [
+                objects.NodeHistory(self.context, node_id=1, event='1'),
+                objects.NodeHistory(self.context, node_id=1, event='2'),
+            ]
+            objects.NodeHistory.create_bulk(self.context, histories)
+
+            mock_db_create.assert_called_once_with(
+                [{'node_id': 1, 'event': '1', 'version': '1.0'},
+                 {'node_id': 1, 'event': '2', 'version': '1.0'}])
+
     def test_destroy(self):
         uuid = self.fake_history['uuid']
         with mock.patch.object(self.dbapi, 'get_node_history_by_uuid',
@@ -527,6 +527,41 @@ class _TestObject(object):
         self.assertRaises(object_exception.IncompatibleObjectVersion,
                           MyObj._from_db_object, self.context, obj, dbobj)
 
+    def test__from_db_object_list(self):
+        now = timeutils.utcnow()
+        dbobjs = [{'created_at': now, 'updated_at': None,
+                   'version': version, 'foo': foo, 'bar': 'test',
+                   'missing': ''}
+                  for foo, version in [(1, '1.5'), (2, '1.4'), (3, '1.5')]]
+        objs = MyObj._from_db_object_list(self.context, dbobjs)
+        self.assertEqual([1, 2, 3], [obj.foo for obj in objs])
+        for obj in objs:
+            self.assertEqual('1.5', obj.VERSION)
+            self.assertEqual('test', obj.bar)
+            self.assertEqual('test', obj.nested_object)
+            self.assertIsNone(obj.updated_at)
+            # Datetime fields are still coerced
+            self.assertIsNotNone(obj.created_at.tzinfo)
+            self.assertEqual(self.context, obj._context)
+        self.assertEqual({}, objs[0].obj_get_changes())
+        self.assertEqual('', objs[0].missing)
+        # Converted to the latest version
+        self.assertEqual({'missing': 'foo'}, objs[1].obj_get_changes())
+        self.assertEqual('foo', objs[1].missing)
+
+    def test__from_db_object_list_coerces_other_types(self):
+        dbobjs = [{'created_at': None, 'updated_at': None, 'version': '1.5',
+                   'foo': '42', 'bar': 42, 'missing': ''}]
+        obj = MyObj._from_db_object_list(self.context, dbobjs)[0]
+        self.assertEqual(42, obj.foo)
+        self.assertEqual('42', obj.bar)
+
+    def test__from_db_object_list_version_bad(self):
+        dbobjs = [{'created_at': None, 'updated_at': None, 'version': '1.99',
+                   'foo': 1, 'bar': 'test', 'missing': ''}]
+        self.assertRaises(object_exception.IncompatibleObjectVersion,
+                          MyObj._from_db_object_list, self.context, dbobjs)
+
     def test_get_target_version_no_pin(self):
         obj = MyObj(self.context)
         self.assertEqual('1.5', obj.get_target_version())
@@ -15,6 +15,7 @@
 import io
 
 from openstack.connection import exceptions as openstack_exc
+from oslo_utils import uuidutils
 
 
 NOW_GLANCE_FORMAT = "2010-10-11T10:30:22"
@@ -98,6 +99,67 @@ class FakeNeutronPort(dict):
             raise AttributeError(key)
 
 
+class StubNeutronClient(object):
+    """An in-memory stand-in for the Neutron client, managing ports only.
+
+    The names of the called methods are recorded in ``requests``, so that
+    tests can check how many requests would have been made to Neutron.
+    """
+
+    port_status = 'ACTIVE'
+
+    def __init__(self):
+        self._ports = {}
+        self.requests = []
+
+    def _create(self, attrs):
+        port = FakeNeutronPort(id=uuidutils.generate_uuid(),
+                               status=self.port_status, **attrs)
+        self._ports[port.id] = port
+        return port
+
+    def create_port(self, **attrs):
+        self.requests.append('create_port')
+        return self._create(attrs)
+
+    def create_ports(self, data):
+        self.requests.append('create_ports')
+        return iter([self._create(attrs) for attrs in data])
+
+    def get_port(self, port_id):
+        self.requests.append('get_port')
+        try:
+            return self._ports[port_id]
+        except KeyError:
+            raise openstack_exc.ResourceNotFound(port_id)
+
+    def update_port(self, port_id, **attrs):
+        self.requests.append('update_port')
+        try:
+            port = self._ports[port_id]
+        except KeyError:
+            raise openstack_exc.ResourceNotFound(port_id)
+        port.update(attrs)
+        return port
+
+    def delete_port(self, port):
+        self.requests.append('delete_port')
+        try:
+            del self._ports[port['id']]
+        except KeyError:
+            raise openstack_exc.ResourceNotFound(port['id'])
+
+    def ports(self, **filters):
+        self.requests.append('ports')
+        for port in list(self._ports.values()):
+            for key, value in filters.items():
+                values = value if isinstance(value, list) else [value]
+                if port.get(key) not in values:
+                    break
+            else:
+                yield port
+
+
 class FakeNeutronSubnet(dict):
     def __init__(self, **attrs):
         SUBNET_ATTRS = ['id',
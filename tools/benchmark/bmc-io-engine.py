@@ -0,0 +1,163 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare polling fake BMCs with conductor workers and the BMC engine.
+
+Usage: bmc-io-engine.py [<nodes> [<BMCs> [<slow BMCs>]]]
+
+Local HTTP servers play the role of BMCs, each of them serving the power
+state of several nodes. Slow BMCs take a second to answer, others 50
+milliseconds. The power state of every node is fetched once by a fixed
+number of workers consuming a queue, like the power state synchronization
+with [conductor]sync_power_state_workers, then by the BMC request engine
+used when [conductor]bmc_io_max_requests is set. The total time and the
+time it took to fetch the power state of the nodes of fast BMCs are
+reported.
+"""
+
+import eventlet
+eventlet.monkey_patch()  # noqa
+
+from http import server  # noqa: E402
+import queue  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+
+import requests  # noqa: E402
+
+# NOTE: the configuration has to be loaded before the engine is imported.
+from ironic.conf import CONF  # noqa To Load Configuration
+from ironic.conductor import bmc_io  # noqa
+
+
+WORKERS = 8
+MAX_REQUESTS = 100
+MAX_REQUESTS_PER_BMC = 2
+
+
+def _add_a_line():
+    print('------------------------------------------------------------')
+
+
+class _FakeBMCHandler(server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        body = b'{"PowerState": "On"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_bmcs(count, slow):
+    bmcs = []
+    for index in range(count):
+        httpd = server.ThreadingHTTPServer(('127.0.0.1', 0), _FakeBMCHandler)
+        httpd.delay = 1.0 if index < slow else 0.05
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        bmcs.append(httpd)
+    return bmcs
+
+
+def _get_power_state(session, address, node, finished):
+    session.get('http://%s/redfish/v1/Systems/%s' % (address, node),
+                timeout=30).raise_for_status()
+    finished[node] = time.monotonic()
+
+
+def _report(name, start, finished, fast_nodes):
+    total = max(finished.values()) - start
+    fast = max(finished[node] for node in fast_nodes) - start
+    print('%s: fetched %d power states in %.2f seconds, the nodes of fast '
+          'BMCs in %.2f seconds.\n' % (name, len(finished), total, fast))
+
+
+def _assess_workers(session, nodes, fast_nodes):
+    print('Phase - Assess %d workers consuming a queue' % WORKERS)
+    _add_a_line()
+    nodes_queue = queue.Queue()
+    for node in nodes:
+        nodes_queue.put(node)
+    finished = {}
+
+    def _worker():
+        while True:
+            try:
+                node, address = nodes_queue.get_nowait()
+            except queue.Empty:
+                return
+            _get_power_state(session, address, node, finished)
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=_worker) for _ in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    _report('Workers', start, finished, fast_nodes)
+
+
+def _assess_engine(session, nodes, fast_nodes):
+    print('Phase - Assess the BMC request engine with up to %d requests, '
+          '%d per BMC' % (MAX_REQUESTS, MAX_REQUESTS_PER_BMC))
+    _add_a_line()
+    engine = bmc_io.BMCRequestEngine(MAX_REQUESTS, MAX_REQUESTS_PER_BMC)
+    finished = {}
+    start = time.monotonic()
+    futures = [
+        engine.submit(bmc_io.bmc_key({'redfish_address': address}), node,
+                      _get_power_state, session, address, node, finished)
+        for node, address in nodes
+    ]
+    engine.wait(futures)
+    engine.stop()
+    _report('Engine', start, finished, fast_nodes)
+
+
+def main():
+    node_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    bmc_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    slow_count = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    bmcs = _start_bmcs(bmc_count, slow_count)
+    nodes = []
+    fast_nodes = []
+    for index in range(node_count):
+        httpd = bmcs[index % bmc_count]
+        node = 'node-%d' % index
+        nodes.append((node, '127.0.0.1:%d' % httpd.server_address[1]))
+        if httpd.delay < 1:
+            fast_nodes.append(node)
+    print('Polling %d nodes behind %d BMCs, %d of them slow.\n'
+          % (node_count, bmc_count, slow_count))
+
+    # NOTE: nodes are sorted by BMC like they would be by UUID, i.e. the
+    # nodes of slow BMCs are spread over the queue.
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=MAX_REQUESTS)
+        session.mount('http://', adapter)
+        _assess_workers(session, nodes, fast_nodes)
+        _assess_engine(session, nodes, fast_nodes)
+
+    for httpd in bmcs:
+        httpd.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
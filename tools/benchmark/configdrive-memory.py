@@ -0,0 +1,93 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the memory used by concurrent configdrive encoding and decoding.
+
+Usage: configdrive-memory.py [<concurrency> [<image size in MiB>]]
+
+Each worker gzips and base64 encodes an image file, then decodes the result
+back into a file, as done when a configdrive is stored and then attached to
+a node. The peak of the memory allocated by Python is reported for the
+in-memory pattern used prior to the streaming helpers and for the helpers.
+"""
+
+import base64
+import gzip
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from ironic.common import configdrive as cd_images
+
+
+def _add_a_line():
+    print('------------------------------------------------------------')
+
+
+def _in_memory(image_path, dest):
+    # The conversion pattern used prior to the streaming helpers,
+    # kept here as a point of reference.
+    with open(image_path, 'rb') as fp:
+        encoded = base64.b64encode(gzip.compress(fp.read())).decode()
+    dest.write(gzip.decompress(base64.b64decode(encoded)))
+
+
+def _streaming(image_path, dest):
+    with tempfile.TemporaryFile(mode='w+t') as encoded:
+        with open(image_path, 'rb') as fp:
+            cd_images.encode_configdrive(fp, encoded)
+        encoded.seek(0)
+        cd_images.decode_configdrive(encoded.buffer, dest)
+
+
+def _assess(name, func, image_path, concurrency):
+    print('Phase - Assess %s configdrive handling' % name)
+    _add_a_line()
+    barrier = threading.Barrier(concurrency)
+
+    def _worker():
+        barrier.wait()
+        with tempfile.TemporaryFile() as dest:
+            func(image_path, dest)
+
+    threads = [threading.Thread(target=_worker) for _ in range(concurrency)]
+    tracemalloc.start()
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('Handled %s configdrives in %.2f seconds, peak memory allocated '
+          '%.1f MiB.\n' % (concurrency, elapsed, peak / 1024 / 1024))
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    with tempfile.NamedTemporaryFile() as image:
+        # Half random data, so that the image is not trivially compressible
+        image.write(os.urandom(size * 1024 * 512))
+        image.write(bytes(size * 1024 * 512))
+        image.flush()
+        _assess('in-memory', _in_memory, image.name, concurrency)
+        _assess('streaming', _streaming, image.name, concurrency)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
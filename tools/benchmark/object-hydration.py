@@ -0,0 +1,64 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sys
+import time
+
+from ironic.common import context
+from ironic.common import service
+from ironic.conf import CONF  # noqa To Load Configuration
+from ironic.db import api as db_api
+from ironic.objects import node
+from ironic.objects import port
+
+
+def _add_a_line():
+    print('------------------------------------------------------------')
+
+
+def _per_object_hydration(cls, ctx, db_objects):
+    # The conversion pattern used prior to the bulk hydration path,
+    # kept here as a point of reference.
+    return [cls._from_db_object(ctx, cls(), obj) for obj in db_objects]
+
+
+def _assess_hydration(name, cls, db_objects):
+    print('Phase - Assess %s object hydration' % name)
+    _add_a_line()
+    ctx = context.get_admin_context()
+    start = time.time()
+    _per_object_hydration(cls, ctx, db_objects)
+    per_object = time.time() - start
+    start = time.time()
+    objs = cls._from_db_object_list(ctx, db_objects)
+    bulk = time.time() - start
+    print('Converted %s %s records one by one in %s seconds.' %
+          (len(db_objects), name, per_object))
+    print('Converted %s %s records in bulk in %s seconds.' %
+          (len(objs), name, bulk))
+    start = time.time()
+    objs = cls.list(ctx)
+    print('%s.list returned %s objects in %s seconds.\n' %
+          (cls.__name__, len(objs), time.time() - start))
+
+
+def main():
+    service.prepare_command()
+    CONF.set_override('debug', False)
+    dbapi = db_api.get_instance()
+    _assess_hydration('node', node.Node, dbapi.get_node_list())
+    _assess_hydration('port', port.Port, dbapi.get_port_list())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
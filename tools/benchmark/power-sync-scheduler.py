@@ -0,0 +1,121 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Simulate the power state synchronization with a fixed and adaptive interval.
+
+Usage: power-sync-scheduler.py [<nodes> [<hours> [<max interval>]]]
+
+Nodes are simulated for the given number of hours, the power state
+synchronization running every 60 seconds. On each run, every node has a
+chance to be changed through ironic (twice a day on average, which updates
+the node), to have its power state changed outside of ironic (once a week on
+average) and to have its BMC failing to answer (1% of the requests). The
+number of requests to BMCs and the time it took to notice the power state
+changes made outside of ironic are reported for a synchronization of all
+nodes on every run and for the adaptive interval enabled by
+[conductor]sync_power_state_max_interval.
+"""
+
+import datetime
+import random
+import statistics
+import sys
+
+from ironic.conductor import power_sync
+from ironic.conf import CONF
+
+
+INTERVAL = 60
+CHANGE_PER_RUN = 1 / (12 * 60)
+DRIFT_PER_RUN = 1 / (7 * 24 * 60)
+BMC_FAILURE = 0.01
+START = datetime.datetime(2026, 1, 1)
+
+
+def _add_a_line():
+    print('------------------------------------------------------------')
+
+
+def _timestamp(run):
+    return START + datetime.timedelta(seconds=run * INTERVAL)
+
+
+def _simulate(name, node_count, runs, max_interval):
+    print('Phase - Simulate %s' % name)
+    _add_a_line()
+    CONF.set_override('sync_power_state_interval', INTERVAL, 'conductor')
+    CONF.set_override('sync_power_state_max_interval', max_interval,
+                      'conductor')
+    scheduler = power_sync.PowerSyncScheduler()
+    # Always the same events for both phases
+    rnd = random.Random(42)
+    updated_at = [START] * node_count
+    # Runs at which the power state of nodes drifted, None if in sync
+    drifted = [None] * node_count
+    requests = 0
+    latencies = []
+
+    for run in range(1, runs + 1):
+        for index in range(node_count):
+            if rnd.random() < CHANGE_PER_RUN:
+                # A power action through ironic fixes the power state too
+                updated_at[index] = _timestamp(run)
+                drifted[index] = None
+            if drifted[index] is None and rnd.random() < DRIFT_PER_RUN:
+                drifted[index] = run
+
+        nodes = [(index, updated_at[index]) for index in range(node_count)]
+        if scheduler.enabled:
+            due = scheduler.due_nodes(nodes)
+        else:
+            due = range(node_count)
+
+        for index in due:
+            requests += 1
+            if rnd.random() < BMC_FAILURE:
+                scheduler.record(index, False, updated_at[index])
+                continue
+            stable = drifted[index] is None
+            if not stable:
+                latencies.append((run - drifted[index]) * INTERVAL)
+                drifted[index] = None
+                updated_at[index] = _timestamp(run)
+            scheduler.record(index, stable, updated_at[index])
+
+    print('%d requests to BMCs, %.1f per node and hour.'
+          % (requests, requests / node_count / (runs * INTERVAL / 3600)))
+    if latencies:
+        print('%d power state changes outside of ironic noticed after %.0f '
+              'seconds on average, %.0f at most.\n'
+              % (len(latencies), statistics.mean(latencies),
+                 max(latencies)))
+    return requests
+
+
+def main():
+    node_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 24
+    max_interval = int(sys.argv[3]) if len(sys.argv) > 3 else 600
+    runs = int(hours * 3600 / INTERVAL)
+    CONF([], project='ironic')
+
+    fixed = _simulate('a synchronization of all nodes every %d seconds'
+                      % INTERVAL, node_count, runs, 0)
+    adaptive = _simulate('an adaptive interval of up to %d seconds'
+                         % max_interval, node_count, runs, max_interval)
+    print('The adaptive interval sends %.1f times fewer requests to BMCs.'
+          % (fixed / adaptive))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
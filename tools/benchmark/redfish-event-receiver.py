@@ -0,0 +1,179 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the event ingestion throughput of the Redfish event receiver.
+
+Usage: redfish-event-receiver.py [<events> [<nodes> [<emitters>]]]
+
+Power events of the given number of nodes are first passed directly to the
+WSGI application of the receiver, which measures the cost of checking,
+parsing and queuing them. They are then posted over HTTP to a receiver
+listening on the loopback interface by several emitters, playing the role
+of BMCs, each of them keeping its connection open. The handler stands for
+recording the power state in the database and takes 10 milliseconds, so
+that events received for a node while a previous one is waiting are
+merged. The number of events per second and the number of times the
+handler was called are reported.
+"""
+
+import eventlet
+eventlet.monkey_patch()  # noqa
+
+import itertools  # noqa: E402
+import json  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+import uuid  # noqa: E402
+
+import requests  # noqa: E402
+import webob  # noqa: E402
+
+# NOTE: the configuration has to be loaded before the receiver is imported.
+from ironic.conf import CONF  # noqa To Load Configuration
+from ironic.drivers.modules.redfish import events  # noqa
+
+
+TOKEN = 'benchmark'
+HANDLER_DELAY = 0.01
+
+
+def _add_a_line():
+    print('------------------------------------------------------------')
+
+
+def _events(count, nodes):
+    """Yield tuples (token, body) of power events."""
+    messages = itertools.cycle(['ResourcePoweredOff', 'ResourcePoweredOn'])
+    node_uuids = itertools.cycle(nodes)
+    tokens = {node_uuid: events._node_token(node_uuid) for node_uuid in nodes}
+    for _i in range(count):
+        node_uuid = next(node_uuids)
+        body = {
+            '@odata.type': '#Event.v1_7_0.Event',
+            'Id': '1',
+            'Name': 'Event',
+            'Context': node_uuid,
+            'Events': [{
+                'EventType': 'Alert',
+                'MessageId': 'ResourceEvent.1.0.%s' % next(messages),
+                'OriginOfCondition': {'@odata.id': '/redfish/v1/Systems/1'},
+            }],
+        }
+        yield tokens[node_uuid], json.dumps(body).encode()
+
+
+class _Handler(object):
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, node_uuid, power_state, origin):
+        if self.delay:
+            time.sleep(self.delay)
+        with self.lock:
+            self.calls += 1
+
+
+def _wait(receiver, handler):
+    while (receiver._pending or receiver._handling
+           or not receiver._queue.empty()):
+        time.sleep(0.01)
+
+
+def _report(name, count, elapsed):
+    print('%(name)s %(count)d events in %(elapsed).2f seconds, %(rate).0f '
+          'events per second.'
+          % {'name': name, 'count': count, 'elapsed': elapsed,
+             'rate': count / elapsed})
+
+
+def _in_process(count, nodes):
+    print('Phase - Pass events to the WSGI application')
+    _add_a_line()
+    handler = _Handler()
+    receiver = events.EventReceiver(handler)
+    bodies = list(_events(count, nodes))
+    start = time.monotonic()
+    for token, body in bodies:
+        request = webob.Request.blank('/', method='POST')
+        request.headers[events.TOKEN_HEADER] = token
+        request.body = body
+        response = request.get_response(receiver._application)
+        assert response.status_code == 204, response.status
+    elapsed = time.monotonic() - start
+    _report('Parsed and queued', count, elapsed)
+    # Without workers, nothing is handled
+    print('%d nodes are waiting for the handler.\n' % len(receiver._pending))
+
+
+def _emit(destination, bodies):
+    session = requests.Session()
+    # Looking up proxies in the environment costs more than the receiver
+    session.trust_env = False
+    session.headers.update({'Content-Type': 'application/json'})
+    for token, body in bodies:
+        response = session.post(destination, data=body, timeout=30,
+                                headers={events.TOKEN_HEADER: token})
+        response.raise_for_status()
+
+
+def _over_http(count, nodes, emitters):
+    print('Phase - Post events over HTTP with %d emitters' % emitters)
+    _add_a_line()
+    handler = _Handler(HANDLER_DELAY)
+    receiver = events.EventReceiver(handler)
+    receiver.start()
+    try:
+        destination = 'http://127.0.0.1:%d/' % receiver.server.bind_addr[1]
+        bodies = list(_events(count, nodes))
+        threads = [threading.Thread(target=_emit,
+                                    args=(destination, bodies[i::emitters]))
+                   for i in range(emitters)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        received = time.monotonic() - start
+        _wait(receiver, handler)
+        handled = time.monotonic() - start
+    finally:
+        receiver.stop()
+    _report('Received', count, received)
+    print('The handler was called %(calls)d times, all events were handled '
+          'after %(handled).2f seconds.\n'
+          % {'calls': handler.calls, 'handled': handled})
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    node_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    emitters = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    CONF([], project='ironic')
+    CONF.set_override('event_receiver_port', 0, 'redfish')
+    CONF.set_override('event_receiver_host_ip', '127.0.0.1', 'redfish')
+    CONF.set_override('event_receiver_url', 'http://127.0.0.1/', 'redfish')
+    CONF.set_override('event_receiver_token', TOKEN, 'redfish')
+    nodes = [str(uuid.uuid4()) for _i in range(node_count)]
+    # Events of nodes not subscribed by the conductor are ignored
+    events._SUBSCRIBED.update(nodes)
+
+    _in_process(count, nodes)
+    _over_http(count, nodes, emitters)
+
+
+if __name__ == '__main__':
+    sys.exit(main())